@@ -84,6 +84,9 @@ if not hasattr(sys,'frozen'):
     sys.meta_path = [UnicodeImporter()]
 
 if __name__ == '__main__':
+    import multiprocessing
+    # Needed by the Bashed Patch plugin loading workers in frozen builds
+    multiprocessing.freeze_support()
     from bash import bash, barg
     opts = barg.parse()
     bash.main(opts)
@@ -163,15 +163,24 @@ def _extract_command(archivePath, outDirPath, recursive, filelist_to_extract):
     if filelist_to_extract: command += (u' @"%s"' % filelist_to_extract)
     return command
 
-def list_archive(archive_path, parse_archive_line, __reList=reListArchive):
-    """Client is responsible for closing the file ! See uses for
-    _parse_archive_line examples."""
+def archive_listing(archive_path):
+    """Return the raw output of 7z listing the specified archive - see
+    list_archive."""
     command = u'"%s" l -slt -sccUTF-8 "%s"' % (exe7z, archive_path.s)
     ins, err = subprocess.Popen(command, stdout=subprocess.PIPE,
                                 stderr=subprocess.STDOUT,
                                 stdin=subprocess.PIPE,
                                 startupinfo=startupinfo).communicate()
-    for line in ins.splitlines(True): # keepends=True
+    return ins
+
+def list_archive(archive_path, parse_archive_line, __reList=reListArchive,
+                 listing=None):
+    """Client is responsible for closing the file ! See uses for
+    _parse_archive_line examples. If listing is not None, it is parsed
+    instead of listing the archive again - it must be the output of
+    archive_listing for archive_path."""
+    if listing is None: listing = archive_listing(archive_path)
+    for line in listing.splitlines(True): # keepends=True
         maList = __reList.match(line)
         if maList:
             parse_archive_line(*(maList.groups()))
@@ -93,6 +93,8 @@ def _init_settings_files(fsName_, root_prefix, mods_folder):
         for settings_file in set(setting_files):
             if settings_file.endswith(u'.dat'): # add corresponding bak file
                 setting_files.add(settings_file + u'.bak')
+                # and journal, see bolt.PickleDict
+                setting_files.add(settings_file + u'.journal')
     return settings_info
 
 #------------------------------------------------------------------------------
@@ -129,6 +131,9 @@ def __init__(self, settings_file, fsName,  root_prefix, mods_folder):
             fpath = dirs['saveBase'].join(*table)
             if fpath.exists(): self.files[tpath] = fpath
             if fpath.backup.exists(): self.files[tpath.backup] = fpath.backup
+            journal = GPath(fpath.s + u'.journal')
+            if journal.exists():
+                self.files[GPath(tpath.s + u'.journal')] = journal
 
     @staticmethod
     def new_bash_version_prompt_backup(balt_, previous_bash_version):
@@ -95,6 +95,41 @@ def arg(group, dashed, descr, dest, action='store', default=None):
     arg(backupGroup, '-q', '--quiet-quit', dest='quietquit',
         action='store_true', default=False)
 
+    ### Bashed Patch Group ###
+    patchGroup = parser.add_argument_group("Bashed Patch Arguments",
+        """These arguments allow you to build a Bashed Patch without starting
+        the GUI, e.g. on a build server. Bash quits once the patch is built.
+        Only the Python mode is supported. Like the other path arguments, all
+        files must be specified by absolute paths.""")
+    # buildPatch #
+    patchGroup.add_argument('--build-patch', dest='buildPatch', default='',
+        help="""Build the specified Bashed Patch (e.g. "Bashed Patch,
+        0.esp"), creating it if it does not exist. Requires --load-order.""")
+    # game #
+    patchGroup.add_argument('--game', dest='game', default='',
+        help="""The game to build the patch for (e.g. Oblivion). Bash
+        refuses to build the patch if it detects a different game.""")
+    # dataPath #
+    patchGroup.add_argument('--data-dir', dest='dataPath', default='',
+        help="""The Data directory of the game, overriding the -o
+        argument.""")
+    # loadOrder #
+    patchGroup.add_argument('--load-order', dest='loadOrder', default='',
+        help="""A text file listing the plugins in load order, one per line.
+        If any line starts with an asterisk only those plugins are active,
+        like in plugins.txt, else all of them are. The load order of the game
+        is left as it is.""")
+    # patchConfig #
+    patchGroup.add_argument('--patch-config', dest='patchConfig',
+        default='', help="""A Bashed Patch configuration exported from the
+        patch dialog. Defaults to the configuration the patch was last built
+        with.""")
+    # timingReport #
+    patchGroup.add_argument('--timing-report', dest='timingReport',
+        default='', help="""Write a json report of how long each phase,
+        patcher and plugin of the build took, the bytes of plugins parsed and
+        the peak memory used to this file.""")
+
     #### Individual Arguments ####
     parser.add_argument('-d', '--debug',
                         action='store_true',
@@ -142,6 +177,8 @@ def arg(group, dashed, descr, dest, action='store', default=None):
         parser.error('You specified both backup and restore')
     elif (args.backup or args.restore) and not args.filename:
         parser.error('You must specify a filename for use with backup/restore')
+    if args.buildPatch and not args.loadOrder:
+        parser.error('You must specify a load order file to build a patch')
     return args
 
 _short_to_long = dict(
@@ -295,6 +295,10 @@ def _main(opts, wx_locale):
         except UnicodeError: print(msg2.encode(bolt.Path.sys_fs_enc))
         return
 
+    # if a Bashed Patch build was requested, build it without any GUI and quit
+    if opts.buildPatch:
+        sys.exit(_build_patch(opts))
+
     # We need the Mopy dirs to initialize restore settings instance
     bash_ini_path, restore_ = u'bash.ini', None
     # import barb that does not import from bosh/balt/bush
@@ -471,6 +475,61 @@ def _import_bush_and_set_game(opts, bashIni):
     bolt.CBash = opts.mode if bush.game.Esp.canCBash else 1 #1 = python mode...
     return bush.game
 
+def _build_patch(opts):
+    """Build the Bashed Patch specified via --build-patch without starting the
+    GUI. Errors are printed instead of shown in dialogs.
+
+    :return: the exit code"""
+    def _print(msg):
+        try: print(msg)
+        except UnicodeError: print(msg.encode(bolt.Path.sys_fs_enc))
+    bashIni = _bash_ini_parser(u'bash.ini')
+    data_path = bolt.GPath(opts.dataPath) if opts.dataPath else None
+    from . import bush
+    ret, _game_icons = bush.detect_and_set_game(
+        data_path.head.s if data_path else opts.oblivionPath, bashIni)
+    if ret is not None:
+        _print(_(u'Could not determine which game to manage. Please use the '
+                 u'--data-dir argument to specify the Data directory.'))
+        return 1
+    game_data = bush.game.gamePath.join(bush.game.mods_dir)
+    if data_path and data_path != game_data:
+        _print(_(u'No known game in the path specified via --data-dir: '
+                 u'%s') % data_path.s)
+        return 1
+    if opts.game and opts.game.lower() not in (
+            bush.game.displayName.lower(), bush.game.fsName.lower()):
+        _print(_(u'Found %(found)s in %(path)s instead of %(game)s.') % {
+            u'found': bush.game.displayName, u'path': game_data.s,
+            u'game': opts.game})
+        return 1
+    if not bush.game.Esp.canBash:
+        _print(_(u'Bashed Patches are not supported for %s.') %
+               bush.game.displayName)
+        return 1
+    bolt.CBash = 1 # Python mode
+    try:
+        game_ini_path, init_warnings = initialization.init_dirs(
+            bashIni, opts.personalPath, opts.localAppDataPath, bush.game)
+        for warning in init_warnings: bolt.deprint(warning)
+        from . import bosh
+        bosh.initBosh(bashIni, game_ini_path)
+        from .basher import patcher_cli
+        patch_name = bolt.GPath(opts.buildPatch)
+        report = patcher_cli.build_patch(patch_name,
+            bolt.GPath(opts.loadOrder),
+            bolt.GPath(opts.patchConfig) if opts.patchConfig else None,
+            bolt.GPath(opts.timingReport) if opts.timingReport else None)
+    except Exception:
+        # Anything a patcher may raise - main would show a wx popup for it,
+        # but we are running headless, so print it and fail instead
+        _print(_(u'Failed to build %s:') % opts.buildPatch)
+        _print(traceback.format_exc())
+        return 1
+    _print(_(u'Built %(patch)s in %(seconds).3f seconds.') % {
+        u'patch': patch_name, u'seconds': report[u'total_seconds']})
+    return 0
+
 def _show_wx_popup(msg, is_critical=True):
     """Shows an error message in a wx window. If is_critical, exit the
     application afterwards."""
@@ -39,6 +39,7 @@
 frames.py         : subclasses of wx.Frame (except BashFrame)
 gui_patchers.py   : the gui patcher classes used by the patcher dialog
 patcher_dialog.py : the patcher dialog
+patcher_cli.py    : builds a bashed patch from the command line, without GUI
 
 The layout is still fluid - there may be a links package, or a package per tab.
 A central global variable is balt.Link.Frame, the BashFrame singleton.
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+
+"""Builds a Bashed Patch from the command line, without showing any GUI, and
+reports how long each part of the build took - see bash.py for the command
+line interface."""
+import StringIO
+import json
+from datetime import timedelta
+
+from . import InitSettings
+from .patcher_dialog import PatchDialog, read_exported_config, \
+    sorted_gui_patchers
+from .. import bass, bolt, bosh
+from ..bolt import GPath, Progress
+from ..exception import BoltError
+from ..mod_files import ModFile
+from ..patcher import configIsCBash, list_patches_dir, patch_files
+from ..patcher.patch_files import ProfiledPatchFile
+
+def read_load_order_file(lo_path):
+    """Read a load order from lo_path, a text file listing one plugin per line
+    in load order. Empty lines and lines starting with '#' are skipped. If
+    any plugin is prefixed with an asterisk, like in plugins.txt, only those
+    are active, else all the listed plugins are.
+
+    :rtype: tuple[list[bolt.Path], list[bolt.Path]]"""
+    with lo_path.open(u'r', encoding=u'utf-8-sig') as ins:
+        lines = [l.strip() for l in ins]
+    lines = [l for l in lines if l and not l.startswith(u'#')]
+    lord = [GPath(l.lstrip(u'*')) for l in lines]
+    if any(l.startswith(u'*') for l in lines):
+        return lord, [GPath(l[1:]) for l in lines if l.startswith(u'*')]
+    return lord, lord[:]
+
+def _get_patch_configs(patch_name, config_path):
+    """Return the (Python mode) configuration exported to config_path, or
+    the one saved for the patch if config_path is None."""
+    if config_path is None:
+        patchConfigs = bosh.modInfos.table.getItem(patch_name,
+                                                   'bash.patch.configs', {})
+        convert = configIsCBash(patchConfigs)
+    else:
+        patchConfigs, convert = read_exported_config(config_path, False)
+    if not patchConfigs:
+        raise BoltError(u'No Bashed Patch configuration found for %s' % (
+            config_path or patch_name))
+    if convert: patchConfigs = PatchDialog.ConvertConfig(patchConfigs)
+    return patchConfigs
+
+def _init_data(patch_name, lo_path):
+    """Load the settings and plugins and set up the load order read from
+    lo_path, creating patch_name if it does not exist yet. Neither the load
+    order of the game nor the settings are saved."""
+    InitSettings()
+    bosh.bsaInfos = bosh.BSAInfos()
+    bosh.bsaInfos.refresh(booting=True)
+    bosh.modInfos = bosh.ModInfos()
+    bosh.modInfos.refresh(booting=True)
+    lord, active = read_load_order_file(lo_path)
+    missing = [m.s for m in lord if m not in bosh.modInfos and
+               m != patch_name]
+    if missing:
+        raise BoltError(u'These plugins are in %s but not in the Data '
+                        u'directory: %s' % (lo_path, u', '.join(missing)))
+    if patch_name not in bosh.modInfos:
+        # bosh.modInfos.create_new_mod would save the load order
+        blank_patch = ModFile(bosh.modInfos.factory(
+            bosh.modInfos.store_dir.join(patch_name)))
+        blank_patch.tes4.author = u'BASHED PATCH'
+        blank_patch.safeSave()
+        bosh.modInfos.new_info(patch_name)
+    if patch_name not in lord: lord.append(patch_name)
+    if patch_name not in active: active.append(patch_name)
+    bosh.modInfos.cached_lo_use(lord, active)
+    if not bosh.modInfos[patch_name].isBP():
+        raise BoltError(u'%s is not a Bashed Patch' % patch_name)
+
+def build_patch(patch_name, lo_path, config_path=None, report_path=None):
+    """Build the Bashed Patch patch_name for the load order in lo_path (see
+    read_load_order_file), using the configuration exported to config_path
+    or the one last used for the patch. Writes the patch and its log to the
+    Data directory and, if report_path is not None, a json report of how long
+    each phase, patcher and plugin took. Returns that report.
+
+    :type patch_name: bolt.Path
+    :type lo_path: bolt.Path
+    :type config_path: bolt.Path | None
+    :type report_path: bolt.Path | None"""
+    _init_data(patch_name, lo_path)
+    patchConfigs = _get_patch_configs(patch_name, config_path)
+    patch_files.executing_patch = patch_name
+    list_patches_dir() # refresh cached dir
+    gui_patchers = sorted_gui_patchers(False)
+    for patcher in gui_patchers:
+        patcher.getConfig(patchConfigs) #--Will set patcher.isEnabled
+    patchFile = ProfiledPatchFile(bosh.modInfos[patch_name])
+    enabled_patchers = [p.get_patcher_instance(patchFile) for p in
+                        gui_patchers if p.isEnabled]
+    log = bolt.LogFile(StringIO.StringIO())
+    patchFile.run_phase(patchFile.init_patchers_data, enabled_patchers,
+                        Progress())
+    patchFile.run_phase(patchFile.initFactories, Progress())
+    patchFile.run_phase(patchFile.scanLoadMods, Progress())
+    patchFile.run_phase(patchFile.buildPatch, log, Progress())
+    patchFile.run_phase(patchFile.safeSave)
+    report = patchFile.get_report()
+    #--Log
+    log.setHeader(None)
+    log(u'{{CSS:wtxt_sand_small.css}}')
+    timerString = unicode(timedelta(seconds=round(
+        report[u'total_seconds'], 3))).rstrip(u'0')
+    logValue = log.out.getvalue().replace(u'TIMEPLACEHOLDER', timerString, 1)
+    log.out.close()
+    readme = bosh.modInfos.store_dir.join(u'Docs', patch_name.sroot + u'.txt')
+    with readme.open(u'w', encoding=u'utf-8-sig') as out:
+        out.write(logValue)
+    bolt.WryeText.genHtml(readme, None,
+                          bass.settings[u'balt.WryeLog.cssDir'])
+    if report_path is not None:
+        with report_path.open(u'w') as out:
+            json.dump(report, out, indent=2, sort_keys=True)
+    return report
@@ -40,13 +40,47 @@
     SaveAsButton, SelectAllButton, Stretch, VLayout, DialogWindow, \
     CheckListBox, HorizontalLine
 from ..patcher import configIsCBash, exportConfig, list_patches_dir
-from ..patcher.patch_files import PatchFile, CBash_PatchFile
+from ..patcher.patch_files import PatchFile, CBash_PatchFile, PatchManifest
 
 # Final lists of gui patcher classes instances, initialized in
 # gui_patchers.InitPatchers() based on game. These must be copied as needed.
 PBash_gui_patchers = [] #--All gui patchers classes for this game
 CBash_gui_patchers = [] #--All gui patchers classes for this game (CBash mode)
 
+def sorted_gui_patchers(doCBash):
+    """Return copies of the gui patchers for the given mode, in the order the
+    patch dialog lists them - the patchers are instantiated in that order."""
+    groupOrder = dict([(group,index) for index,group in
+        enumerate((_(u'General'),_(u'Importers'),_(u'Tweakers'),_(u'Special')))])
+    gui_patchers = [copy.deepcopy(p) for p in (
+        CBash_gui_patchers if doCBash else PBash_gui_patchers)]
+    gui_patchers.sort(key=lambda a: a.__class__.patcher_name)
+    gui_patchers.sort(key=lambda a: groupOrder[a.patcher_type.group]) ##: what does this ordering do??
+    return gui_patchers
+
+_old_config_key = GPath(u'Saved Bashed Patch Configuration')
+_new_config_key = u'Saved Bashed Patch Configuration (%s)'
+def read_exported_config(config_path, doCBash):
+    """Read a Bashed Patch configuration exported to config_path. Returns
+    the configuration found, trying the one for the given mode first, and
+    whether it was saved in the other mode and has to be converted."""
+    table = bolt.DataTable(bolt.PickleDict(config_path))
+    # try the current Bashed Patch mode.
+    patchConfigs = table.getItem(
+        GPath(_new_config_key % ([u'Python', u'CBash'][doCBash])),
+        'bash.patch.configs', {})
+    convert = False
+    if not patchConfigs: # try the non-current Bashed Patch mode
+        patchConfigs = table.getItem(
+            GPath(_new_config_key % ([u'CBash', u'Python'][doCBash])),
+            'bash.patch.configs', {})
+        convert = bool(patchConfigs)
+    if not patchConfigs: # try the old format
+        patchConfigs = table.getItem(_old_config_key, 'bash.patch.configs',
+                                     {})
+        convert = configIsCBash(patchConfigs) != doCBash
+    return patchConfigs, convert
+
 class PatchDialog(DialogWindow):
     """Bash Patch update dialog.
 
@@ -69,8 +103,6 @@ def __init__(self, parent, patchInfo, doCBash, importConfig,
         self.set_min_size(400, 300)
         #--Data
         list_patches_dir() # refresh cached dir
-        groupOrder = dict([(group,index) for index,group in
-            enumerate((_(u'General'),_(u'Importers'),_(u'Tweakers'),_(u'Special')))])
         patchConfigs = bosh.modInfos.table.getItem(patchInfo.name,'bash.patch.configs',{})
         # If the patch config isn't from the same mode (CBash/Python), try converting
         # it over to the current mode
@@ -81,10 +113,7 @@ def __init__(self, parent, patchInfo, doCBash, importConfig,
                 patchConfigs = {}
         isFirstLoad = 0 == len(patchConfigs)
         self.patchInfo = patchInfo
-        self._gui_patchers = [copy.deepcopy(p) for p in (
-            CBash_gui_patchers if doCBash else PBash_gui_patchers)]
-        self._gui_patchers.sort(key=lambda a: a.__class__.patcher_name)
-        self._gui_patchers.sort(key=lambda a: groupOrder[a.patcher_type.group]) ##: what does this ordering do??
+        self._gui_patchers = sorted_gui_patchers(doCBash)
         for patcher in self._gui_patchers:
             patcher.getConfig(patchConfigs) #--Will set patcher.isEnabled
             patcher.SetIsFirstLoad(isFirstLoad)
@@ -187,33 +216,51 @@ def PatchExecute(self): # TODO(ut): needs more work to reduce P/C differences to
                 PatchFile(self.patchInfo)
             enabled_patchers = [p.get_patcher_instance(patchFile) for p in
                                 self._gui_patchers if p.isEnabled] ##: what happens if empty
-            patchFile.init_patchers_data(enabled_patchers, SubProgress(progress, 0, 0.1)) #try to speed this up!
-            if self.doCBash:
-                #try to speed this up!
-                patchFile.buildPatch(SubProgress(progress,0.1,0.9))
-                #no speeding needed/really possible (less than 1/4 second even with large LO)
-                patchFile.buildPatchLog(log, SubProgress(progress, 0.95, 0.99))
-                #--Save
-                progress.setCancel(False, patch_name.s+u'\n'+_(u'Saving...'))
-                progress(0.99)
-                self._save_cbash(patchFile, patch_name)
+            manifest = None
+            reuse_patch = False
+            if not self.doCBash and bass.inisettings['PatchReuseUnchanged']:
+                manifest = PatchManifest(patchFile, enabled_patchers,
+                                         self.__config())
+                reuse_patch = manifest.is_up_to_date()
+            kept_patch = reuse_patch and not bass.inisettings[
+                'PatchVerifyReuse']
+            if kept_patch:
+                # Nothing the patch depends on changed - keep it as it is
+                logValue = manifest.stored_log
+                manifest.save_reused()
             else:
-                patchFile.initFactories(SubProgress(progress,0.1,0.2)) #no speeding needed/really possible (less than 1/4 second even with large LO)
-                patchFile.scanLoadMods(SubProgress(progress,0.2,0.8)) #try to speed this up!
-                patchFile.buildPatch(log,SubProgress(progress,0.8,0.9))#no speeding needed/really possible (less than 1/4 second even with large LO)
-                #--Save
-                progress.setCancel(False, patch_name.s+u'\n'+_(u'Saving...'))
-                progress(0.9)
-                self._save_pbash(patchFile, patch_name)
+                patchFile.init_patchers_data(enabled_patchers, SubProgress(progress, 0, 0.1)) #try to speed this up!
+                if self.doCBash:
+                    #try to speed this up!
+                    patchFile.buildPatch(SubProgress(progress,0.1,0.9))
+                    #no speeding needed/really possible (less than 1/4 second even with large LO)
+                    patchFile.buildPatchLog(log, SubProgress(progress, 0.95, 0.99))
+                    #--Save
+                    progress.setCancel(False, patch_name.s+u'\n'+_(u'Saving...'))
+                    progress(0.99)
+                    self._save_cbash(patchFile, patch_name)
+                else:
+                    patchFile.initFactories(SubProgress(progress,0.1,0.2)) #no speeding needed/really possible (less than 1/4 second even with large LO)
+                    patchFile.scanLoadMods(SubProgress(progress,0.2,0.8)) #try to speed this up!
+                    patchFile.buildPatch(log,SubProgress(progress,0.8,0.9))#no speeding needed/really possible (less than 1/4 second even with large LO)
+                    #--Save
+                    progress.setCancel(False, patch_name.s+u'\n'+_(u'Saving...'))
+                    progress(0.9)
+                    self._save_pbash(patchFile, patch_name)
+                    if reuse_patch: manifest.verify(log)
+                log.setHeader(None)
+                log(u'{{CSS:wtxt_sand_small.css}}')
+                logValue = log.out.getvalue()
+                if manifest: manifest.save(logValue)
             #--Done
             progress.Destroy(); progress = None
             timer2 = time.clock()
             #--Readme and log
-            log.setHeader(None)
-            log(u'{{CSS:wtxt_sand_small.css}}')
-            logValue = log.out.getvalue()
             log.out.close()
             timerString = unicode(timedelta(seconds=round(timer2 - timer1, 3))).rstrip(u'0')
+            if kept_patch:
+                timerString += u' ' + _(u'(nothing changed since the last '
+                                        u'build, the patch was kept as is)')
             logValue = re.sub(u'TIMEPLACEHOLDER', timerString, logValue, 1)
             readme = bosh.modInfos.store_dir.join(u'Docs', patch_name.sroot + u'.txt')
             docsDir = bass.settings.get('balt.WryeLog.cssDir', GPath(u''))
@@ -371,8 +418,6 @@ def ExportConfig(self):
                      isCBash=self.doCBash, win=self.parent,
                      outDir=bass.dirs['patches'])
 
-    __old_key = GPath(u'Saved Bashed Patch Configuration')
-    __new_key = u'Saved Bashed Patch Configuration (%s)'
     def ImportConfig(self):
         """Import the configuration from a user selected dat file."""
         config_dat = self.patchInfo.name + _(u'_Configuration.dat')
@@ -383,21 +428,7 @@ def ImportConfig(self):
                                 _(u'Import Bashed Patch configuration from:'),
                                 textDir, config_dat, u'*.dat', mustExist=True)
         if not textPath: return
-        table = bolt.DataTable(bolt.PickleDict(textPath))
-        # try the current Bashed Patch mode.
-        patchConfigs = table.getItem(
-            GPath(self.__new_key % ([u'Python', u'CBash'][self.doCBash])),
-            'bash.patch.configs', {})
-        convert = False
-        if not patchConfigs: # try the non-current Bashed Patch mode
-            patchConfigs = table.getItem(
-                GPath(self.__new_key % ([u'CBash', u'Python'][self.doCBash])),
-                'bash.patch.configs', {})
-            convert = bool(patchConfigs)
-        if not patchConfigs: # try the old format
-            patchConfigs = table.getItem(self.__old_key, 'bash.patch.configs',
-                                         {})
-            convert = configIsCBash(patchConfigs) != self.doCBash
+        patchConfigs, convert = read_exported_config(textPath, self.doCBash)
         if not patchConfigs:
             balt.showWarning(_(u'No patch config data found in %s') % textPath,
                              _(u'Import Config'))
@@ -26,6 +26,7 @@
 #--Standard
 from __future__ import division, print_function
 import StringIO
+import array
 import cPickle as pickle  # PY3
 import chardet
 import codecs
@@ -44,10 +45,12 @@
 import sys
 import tempfile
 import textwrap
+import threading
 import traceback
 from binascii import crc32
+from collections import deque
 from functools import partial
-from itertools import chain
+from itertools import chain, imap, izip
 # Internal
 from . import exception
 
@@ -360,6 +363,257 @@ class OrderedLowerDict(LowerDict, collections.OrderedDict):
     """LowerDict that inherits from OrdererdDict."""
     __slots__ = () # no __dict__ - that would be redundant
 
+class SizeCrcTable(object):
+    """Compact case insensitive mapping of paths to (size, crc) or (size,
+    crc, date) tuples of ints, for BAIN's tables of millions of files. The
+    paths are stored UTF-8 encoded in a single string pool and the values in
+    parallel arrays, one row per key, found through an open addressing index
+    of the hashes of the lowercase keys - a few dozen bytes per file instead
+    of a few hundred for a LowerDict of tuples. Iterating yields CIstr keys,
+    like a LowerDict. Pickles to a handful of strings, so it loads with a few
+    reads instead of unpickling a tuple per file.
+
+    Supports the parts of the dict API BAIN uses."""
+    __slots__ = ('_ncols', '_names', '_offsets', '_lengths', '_hashes',
+                 '_sizes', '_crcs', '_dates', '_index', '_len', '_used')
+    _DELETED = -1 # in _index, else 0 for empty or row + 1
+    _DEAD = 0xFFFFFFFF # offset of deleted rows
+    # sizes and dates are doubles, exact for any file size/time - longs are
+    # 32 bit on Windows and py2 arrays have no 64 bit int type
+    _typecodes = ('I', 'H', 'I', 'd', 'I', 'd', 'i') # offsets ... index
+    # hash of a known string, to tell if a pickled index is still valid
+    _hash_check = hash(u'Wrye Bash')
+
+    def __init__(self, ncols=3, mapping=()):
+        """:param ncols: 2 for (size, crc) values, 3 for (size, crc, date).
+        :param mapping: a mapping or iterable of (key, value) pairs."""
+        self._ncols = ncols
+        self.clear()
+        if mapping: self.update(mapping)
+
+    def clear(self):
+        self._names = bytearray()
+        (self._offsets, self._lengths, self._hashes, self._sizes,
+         self._crcs, self._dates, _index) = [array.array(t) for t in
+                                             self._typecodes]
+        self._index = array.array('i', [0]) * 8
+        self._len = self._used = 0 # live rows / index slots not empty
+
+    # Internals ---------------------------------------------------------------
+    def _key(self, row):
+        offset = self._offsets[row]
+        return self._names[offset:offset + self._lengths[row]].decode(
+            u'utf-8')
+
+    def _find(self, lower_key, key_hash):
+        """Return the row of lower_key (or -1) and the index slot it is (or
+        should be put) in."""
+        index = self._index
+        mask = len(index) - 1
+        slot = key_hash & mask
+        hash32 = key_hash & 0xFFFFFFFF
+        free_slot = -1
+        while True:
+            row = index[slot]
+            if row == 0: # empty
+                return -1, (slot if free_slot < 0 else free_slot)
+            if row < 0: # deleted
+                if free_slot < 0: free_slot = slot
+            else:
+                row -= 1
+                if self._hashes[row] == hash32 and \
+                        self._key(row).lower() == lower_key:
+                    return row, slot
+            slot = (slot + 1) & mask
+
+    def _rebuild(self):
+        """Drop the deleted rows and rebuild the index, sized for three times
+        the rows."""
+        if self._len != len(self._offsets):
+            live = [r for r, o in enumerate(self._offsets) if o != self._DEAD]
+            names, offsets, lengths = bytearray(), array.array('I'), \
+                                      array.array('H')
+            for row in live:
+                offsets.append(len(names))
+                lengths.append(self._lengths[row])
+                names += self._names[self._offsets[row]:self._offsets[row] +
+                                     self._lengths[row]]
+            self._names, self._offsets, self._lengths = names, offsets, \
+                                                        lengths
+            self._hashes, self._sizes, self._crcs, self._dates = [
+                array.array(t, [col[r] for r in live] if col else ()) for
+                t, col in zip(self._typecodes[2:6], (
+                    self._hashes, self._sizes, self._crcs, self._dates))]
+        size = 8
+        while size < 3 * self._len: size *= 2
+        index = self._index = array.array('i', [0]) * size
+        mask = size - 1
+        for row, key_hash in enumerate(self._hashes):
+            slot = key_hash & mask # same as the full hash, as mask < 2**32
+            while index[slot]: slot = (slot + 1) & mask
+            index[slot] = row + 1
+        self._used = self._len
+
+    def _row_value(self, row):
+        if self._ncols == 3:
+            return (int(self._sizes[row]), self._crcs[row],
+                    int(self._dates[row]))
+        return int(self._sizes[row]), self._crcs[row]
+
+    def _live_rows(self):
+        dead = self._DEAD
+        return (r for r, o in enumerate(self._offsets) if o != dead)
+
+    # Mapping API -------------------------------------------------------------
+    def __len__(self): return self._len
+
+    def __nonzero__(self): return self._len > 0
+
+    def __iter__(self):
+        names, dead = self._names, self._DEAD
+        for offset, length in izip(self._offsets, self._lengths):
+            if offset != dead:
+                yield CIstr(names[offset:offset + length].decode(u'utf-8'))
+
+    iterkeys = __iter__
+
+    def keys(self): return list(self)
+
+    def iteritems(self):
+        names, dead = self._names, self._DEAD
+        if self._ncols == 3:
+            for offset, length, size, crc, date in izip(
+                    self._offsets, self._lengths, self._sizes, self._crcs,
+                    self._dates):
+                if offset != dead:
+                    yield (CIstr(names[offset:offset + length].decode(
+                        u'utf-8')), (int(size), crc, int(date)))
+        else:
+            for offset, length, size, crc in izip(
+                    self._offsets, self._lengths, self._sizes, self._crcs):
+                if offset != dead:
+                    yield (CIstr(names[offset:offset + length].decode(
+                        u'utf-8')), (int(size), crc))
+
+    def items(self): return list(self.iteritems())
+
+    def itervalues(self): return imap(self._row_value, self._live_rows())
+
+    def values(self): return list(self.itervalues())
+
+    def __contains__(self, key):
+        lower_key = key.lower()
+        return self._find(lower_key, hash(lower_key))[0] >= 0
+
+    has_key = __contains__
+
+    def __getitem__(self, key):
+        lower_key = key.lower()
+        row = self._find(lower_key, hash(lower_key))[0]
+        if row < 0: raise KeyError(key)
+        return self._row_value(row)
+
+    def get(self, key, default=None):
+        lower_key = key.lower()
+        row = self._find(lower_key, hash(lower_key))[0]
+        return default if row < 0 else self._row_value(row)
+
+    def __setitem__(self, key, value):
+        lower_key = key.lower()
+        key_hash = hash(lower_key)
+        row, slot = self._find(lower_key, key_hash)
+        if row >= 0:
+            self._sizes[row] = value[0]
+            self._crcs[row] = value[1]
+            if self._ncols == 3: self._dates[row] = value[2]
+            return
+        if self._index[slot] == 0: # reusing a deleted slot keeps _used
+            self._used += 1
+        self._index[slot] = len(self._offsets) + 1
+        encoded = key.encode(u'utf-8')
+        self._offsets.append(len(self._names))
+        self._lengths.append(len(encoded))
+        self._names += encoded
+        self._hashes.append(key_hash & 0xFFFFFFFF)
+        self._sizes.append(value[0])
+        self._crcs.append(value[1])
+        if self._ncols == 3: self._dates.append(value[2])
+        self._len += 1
+        if 3 * self._used > 2 * len(self._index): self._rebuild()
+
+    def __delitem__(self, key):
+        lower_key = key.lower()
+        row, slot = self._find(lower_key, hash(lower_key))
+        if row < 0: raise KeyError(key)
+        self._index[slot] = self._DELETED
+        self._offsets[row] = self._DEAD
+        self._len -= 1
+        if self._len < len(self._offsets) // 2 and len(self._offsets) > 64:
+            self._rebuild()
+
+    __no_default = object()
+    def pop(self, key, default=__no_default):
+        value = self.get(key, self.__no_default)
+        if value is self.__no_default:
+            if default is self.__no_default: raise KeyError(key)
+            return default
+        del self[key]
+        return value
+
+    def setdefault(self, key, default=None):
+        value = self.get(key, self.__no_default)
+        if value is self.__no_default:
+            self[key] = value = default
+        return value
+
+    def update(self, mapping=()):
+        if hasattr(mapping, u'iteritems'): mapping = mapping.iteritems()
+        for key, value in mapping: self[key] = value
+
+    def copy(self):
+        table_copy = SizeCrcTable.__new__(SizeCrcTable)
+        table_copy.__setstate__(self.__getstate__())
+        return table_copy
+
+    def __eq__(self, other):
+        if isinstance(other, (SizeCrcTable, dict)):
+            if len(self) != len(other): return False
+            no_value = self.__no_default
+            return all(other.get(k, no_value) == v for k, v in
+                       self.iteritems())
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return u'%s(%r)' % (type(self).__name__, dict(self.iteritems()))
+
+    # Pickling ----------------------------------------------------------------
+    def __getstate__(self):
+        if self._len != len(self._offsets): self._rebuild() # drop deleted
+        return (self._ncols, self._hash_check, str(self._names)) + tuple(
+            arr.tostring() for arr in (
+                self._offsets, self._lengths, self._hashes, self._sizes,
+                self._crcs, self._dates, self._index))
+
+    def __setstate__(self, state):
+        self._ncols, hash_check, names = state[:3]
+        self._names = bytearray(names)
+        arrays = [array.array(t) for t in self._typecodes]
+        for arr, packed in zip(arrays, state[3:]): arr.fromstring(packed)
+        (self._offsets, self._lengths, self._hashes, self._sizes,
+         self._crcs, self._dates, self._index) = arrays
+        self._len = self._used = len(self._offsets)
+        if hash_check != self._hash_check: # e.g. hash randomization
+            self._hashes = array.array('I', [
+                hash(self._key(r).lower()) & 0xFFFFFFFF for r in
+                xrange(self._len)])
+            self._rebuild()
+
 # sio - StringIO wrapper so it uses the 'with' statement, so they can be used
 #  in the same functions that accept files as input/output as well.  Really,
 #  StringIO objects don't need to 'close' ever, since the data is unallocated
@@ -1385,14 +1639,34 @@ def mainfunc(func):
 #------------------------------------------------------------------------------
 class PickleDict(object):
     """Dictionary saved in a pickle file.
-    Note: self.vdata and self.data are not reassigned! (Useful for some clients.)"""
-    def __init__(self,path,readOnly=False):
+    Note: self.vdata and self.data are not reassigned! (Useful for some clients.)
+
+    A journaled PickleDict saves the keys that changed (see save_keys) by
+    appending them to a journal file next to the pickle file, instead of
+    pickling all of data again. Each batch of changes in the journal is
+    prefixed by its length and crc, so a batch cut short by a crash is
+    ignored, and is tagged with the generation of the pickle file it applies
+    to - so if we crash before a new pickle file replaces the journal, or
+    fall back to the backup file, the stale batches are ignored. Once the
+    journal grows bigger than the pickle file, the next save writes a new
+    pickle file and deletes it."""
+    # (length, crc) of each batch of changes in the journal
+    _journal_head = struct.Struct(u'<II')
+    _min_journal_size = 262144 # journals smaller than this are never merged
+
+    def __init__(self, path, readOnly=False, journaled=False):
         """Initialize."""
         self.path = path
         self.backup = path.backup
         self.readOnly = readOnly
         self.vdata = {}
         self.data = {}
+        self.journal = GPath(path.s + u'.journal')
+        self.journaled = journaled
+        # the generation of the pickle file we loaded or saved last and the
+        # size of the valid part of the journal - None if it must be rewritten
+        self._journal_gen = None
+        self._journal_size = None
 
     def exists(self):
         return self.path.exists() or self.backup.exists()
@@ -1443,12 +1717,47 @@ def load(self):
                             self.data.update(pickle.load(ins))
                         else:
                             raise PickleDict.Mold(path)
+                    self._replay_journal()
                     return 1 + (path == self.backup)
                 except (EOFError, ValueError):
                     pass
         #--No files and/or files are corrupt
+        self._journal_gen = self._journal_size = None
         return 0
 
+    def _replay_journal(self):
+        """Apply the batches of changes in the journal that were made to the
+        pickle file we just loaded, in order."""
+        self._journal_gen = self.vdata.get(u'journal_gen')
+        self._journal_size = None
+        if self._journal_gen is None or not self.journal.exists(): return
+        head_size = self._journal_head.size
+        valid_size = 0
+        with self.journal.open('rb') as ins:
+            while True:
+                head = ins.read(head_size)
+                if len(head) < head_size: break
+                batch_size, batch_crc = self._journal_head.unpack(head)
+                batch = ins.read(batch_size)
+                if len(batch) < batch_size or \
+                        crc32(batch) & 0xFFFFFFFF != batch_crc:
+                    deprint(u'Ignoring the incomplete end of %s' %
+                            self.journal)
+                    break
+                try:
+                    batch_gen, vdata, changed, deleted = pickle.loads(batch)
+                except (EOFError, ValueError, pickle.UnpicklingError):
+                    deprint(u'Unable to load %s' % self.journal,
+                            traceback=True)
+                    break
+                if batch_gen != self._journal_gen: break # stale
+                self.vdata.update(vdata)
+                self.data.update(changed)
+                for key in deleted: self.data.pop(key, None)
+                valid_size += head_size + batch_size
+        # new batches go after the last valid one
+        if valid_size: self._journal_size = valid_size
+
     def save(self):
         """Save to pickle file.
 
@@ -1458,10 +1767,45 @@ def save(self):
         if self.readOnly: return False
         #--Pickle it
         self.vdata['boltPaths'] = True # needed so pre 307 versions don't blow
+        # a new generation, so that the journal no longer applies to it
+        self.vdata[u'journal_gen'] = u'%016x' % struct_unpack(
+            u'Q', os.urandom(8))[0]
         with self.path.temp.open('wb') as out:
             for data in ('VDATA2',self.vdata,self.data):
                 pickle.dump(data,out,-1)
         self.path.untemp(doBackup=True)
+        self._journal_gen = self.vdata[u'journal_gen']
+        self._journal_size = None
+        self.journal.remove()
+        return True
+
+    def save_keys(self, keys):
+        """Save the specified keys of data - the ones no longer in data are
+        deleted. If this PickleDict is journaled, they are appended to the
+        journal, else (or if the journal grew too big) all of data is saved.
+        """
+        if self.readOnly: return False
+        if not self.journaled or self._journal_gen is None or \
+                not self.path.exists() or (self._journal_size or 0) > max(
+                self.path.size, self._min_journal_size):
+            return self.save()
+        data = self.data
+        vdata = {k: v for k, v in self.vdata.iteritems()
+                 if k != u'journal_gen'}
+        batch = pickle.dumps((self._journal_gen, vdata,
+                              {k: data[k] for k in keys if k in data},
+                              [k for k in keys if k not in data]), -1)
+        head = self._journal_head.pack(len(batch), crc32(batch) & 0xFFFFFFFF)
+        if self._journal_size is None: # start a new journal
+            with self.journal.open('wb') as out:
+                out.write(head + batch)
+            self._journal_size = 0
+        else: # drop anything after the last valid batch
+            with self.journal.open('r+b') as out:
+                out.seek(self._journal_size)
+                out.truncate()
+                out.write(head + batch)
+        self._journal_size += len(head) + len(batch)
         return True
 
 #------------------------------------------------------------------------------
@@ -1480,10 +1824,8 @@ class Settings(DataDict):
     def __init__(self, dictFile):
         """Initialize. Read settings from dictFile."""
         self.dictFile = dictFile
-        self.cleanSave = False
         if self.dictFile:
-            res = dictFile.load()
-            self.cleanSave = res == 0 # no data read - do not attempt to read on save
+            dictFile.load()
             self.vdata = dictFile.vdata.copy()
             self.data = dictFile.data.copy()
         else:
@@ -1501,12 +1843,13 @@ def loadDefaults(self, default_settings):
                 self.data[key] = copy.deepcopy(default_settings[key])
 
     def save(self):
-        """Save to pickle file. Only key/values marked as changed are saved."""
+        """Save to pickle file. Only key/values marked as changed are saved -
+        dictFile.data is kept in sync with the file since it was loaded, so
+        if it is journaled only those are written."""
         dictFile = self.dictFile
         if not dictFile or dictFile.readOnly: return
-        # on a clean save ignore BashSettings.dat.bak possibly corrupt
-        if not self.cleanSave: dictFile.load()
-        dictFile.vdata = self.vdata.copy()
+        dictFile.vdata.clear()
+        dictFile.vdata.update(self.vdata)
         for key in self.deleted:
             dictFile.data.pop(key,None)
         for key in self.changed:
@@ -1514,7 +1857,9 @@ def save(self):
                 dictFile.data.pop(key,None)
             else:
                 dictFile.data[key] = self.data[key]
-        dictFile.save()
+        if dictFile.save_keys(self.changed | self.deleted):
+            self.changed.clear()
+            self.deleted.clear()
 
     def setChanged(self,key):
         """Marks given key as having been changed. Use if value is a dictionary, list or other object."""
@@ -1663,13 +2008,36 @@ def __init__(self,dictFile):
         dictFile.load()
         self.vdata = dictFile.vdata
         self.data = dictFile.data
-        self.hasChanged = False ##: move to PickleDict
+        self._has_changed = False ##: move to PickleDict
+        self._changed_rows = set()
+        self._full_save = False
+
+    @property
+    def hasChanged(self): return self._has_changed
+
+    @hasChanged.setter
+    def hasChanged(self, has_changed):
+        """Set directly, e.g. after editing a row in place - so we don't
+        know which rows changed and must save all of them."""
+        self._has_changed = has_changed
+        self._full_save = bool(has_changed)
 
     def save(self):
-        """Saves to pickle file."""
+        """Saves to pickle file - only the rows that changed, if no one set
+        hasChanged directly."""
         dictFile = self.dictFile
-        if self.hasChanged and not dictFile.readOnly:
-            self.hasChanged = not dictFile.save()
+        if self._has_changed and not dictFile.readOnly:
+            if self._changed_rows and not self._full_save:
+                saved = dictFile.save_keys(self._changed_rows)
+            else:
+                saved = dictFile.save()
+            if saved:
+                self._changed_rows.clear()
+                self._has_changed = self._full_save = False
+
+    def _row_changed(self, row):
+        self._changed_rows.add(row)
+        self._has_changed = True
 
     def getItem(self,row,column,default=None):
         """Get item from row, column. Return default if row,column doesn't exist."""
@@ -1689,14 +2057,14 @@ def setItem(self,row,column,value):
         if row not in data:
             data[row] = {}
         data[row][column] = value
-        self.hasChanged = True
+        self._row_changed(row)
 
     def setItemDefault(self,row,column,value):
         """Set value for row, column."""
         data = self.data
         if row not in data:
             data[row] = {}
-        self.hasChanged = True
+        self._row_changed(row)
         return data[row].setdefault(column,value)
 
     def delItem(self,row,column):
@@ -1704,22 +2072,22 @@ def delItem(self,row,column):
         data = self.data
         if row in data and column in data[row]:
             del data[row][column]
-            self.hasChanged = True
+            self._row_changed(row)
 
     def delRow(self,row):
         """Deletes row."""
         data = self.data
         if row in data:
             del data[row]
-            self.hasChanged = True
+            self._row_changed(row)
 
     def delColumn(self,column):
         """Deletes column of data."""
         data = self.data
-        for rowData in data.values():
+        for row, rowData in data.items():
             if column in rowData:
                 del rowData[column]
-                self.hasChanged = True
+                self._row_changed(row)
 
     def moveRow(self,oldRow,newRow):
         """Renames a row of data."""
@@ -1727,29 +2095,76 @@ def moveRow(self,oldRow,newRow):
         if oldRow in data:
             data[newRow] = data[oldRow]
             del data[oldRow]
-            self.hasChanged = True
+            self._row_changed(oldRow)
+            self._row_changed(newRow)
 
     def copyRow(self,oldRow,newRow):
         """Copies a row of data."""
         data = self.data
         if oldRow in data:
             data[newRow] = data[oldRow].copy()
-            self.hasChanged = True
+            self._row_changed(newRow)
 
     #--Dictionary emulation
     def __setitem__(self,key,value):
         self.data[key] = value
-        self.hasChanged = True
+        self._row_changed(key)
     def __delitem__(self,key):
         del self.data[key]
-        self.hasChanged = True
+        self._row_changed(key)
     def setdefault(self,key,default):
-        if key not in self.data: self.hasChanged = True
+        if key not in self.data: self._row_changed(key)
         return self.data.setdefault(key,default)
     def pop(self,key,default=None):
-        self.hasChanged = True
+        self._row_changed(key)
         return self.data.pop(key,default)
 
+#------------------------------------------------------------------------------
+class PersistentCache(object):
+    """Base class of the caches of data read from files (CRCs, headers...)
+    that are kept in a PickleDict between runs. The entries are only loaded
+    once they are needed and the whole cache is dropped when _cache_version
+    changes. Subclasses set _changed when they change the entries."""
+    _cache_version = 1
+    # key of the entries in the data of the PickleDict
+    _entries_key = u'entries'
+
+    def __init__(self, cache_path):
+        """:type cache_path: Path"""
+        self._dict_file = PickleDict(cache_path)
+        self._entries = None # see _load
+        self._changed = False
+
+    def _load(self):
+        """Return the entries of the cache, loading them if needed."""
+        if self._entries is None:
+            self._dict_file.load()
+            if self._dict_file.vdata.get(u'version') == self._cache_version:
+                self._entries = self._dict_file.data.get(self._entries_key,
+                                                         {})
+            else:
+                self._entries = {}
+            self._dict_file.data.clear()
+        return self._entries
+
+    def _drop_entries(self, keep_entry):
+        """Drop the entries whose key keep_entry returns False for."""
+        entries = self._load()
+        for key in [k for k in entries if not keep_entry(k)]:
+            del entries[key]
+            self._changed = True
+
+    def save(self):
+        """Saves the cache if it changed."""
+        if not self._changed: return
+        self._dict_file.vdata[u'version'] = self._cache_version
+        self._dict_file.data[self._entries_key] = self._entries
+        try:
+            self._dict_file.save()
+        finally:
+            self._dict_file.data.clear()
+        self._changed = False
+
 # Util Functions --------------------------------------------------------------
 #------------------------------------------------------------------------------
 def cmp_(x, y):
@@ -1847,6 +2262,72 @@ def winNewLines(inString):
     """Converts unix newlines to windows newlines."""
     return reUnixNewLine.sub(u'\r\n',inString)
 
+def ordered_thread_map(func, items, num_threads, max_ahead=None,
+                       wait_callback=None, discard=None):
+    """Yield func(item) for each of items in order, calling func in a pool
+    of num_threads background threads. An exception raised by func is raised
+    when its item is reached. Once the consumer stops, no more items are
+    started and the threads are waited for.
+
+    :param max_ahead: if not None, at most this many results are calculated
+        ahead of the consumer, so memory (or disk) use does not grow with
+        the number of items.
+    :param wait_callback: called every 0.1 seconds while waiting for a
+        result, e.g. to keep a progress dialog responsive - it may raise to
+        abort.
+    :param discard: if the consumer stops early, the results calculated
+        ahead of it are passed to this."""
+    jobs = deque(enumerate(items)) # popped in order
+    num_items = len(jobs)
+    if not num_items: return
+    results = {} # index -> (True, result) or (False, exception)
+    num_threads = min(max(num_threads, 1), num_items)
+    window = max_ahead and threading.Semaphore(max_ahead)
+    result_ready = threading.Condition()
+    cancelled = threading.Event()
+    def _worker():
+        while True:
+            if window: window.acquire()
+            if cancelled.is_set(): return
+            try:
+                index, item = jobs.popleft()
+            except IndexError:
+                return
+            try:
+                result = (True, func(item))
+            except Exception as e:
+                deprint(u'Failed to process %s' % (item,), traceback=True)
+                result = (False, e)
+            with result_ready:
+                results[index] = result
+                result_ready.notify()
+    threads = [threading.Thread(target=_worker) for _x in xrange(num_threads)]
+    try:
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for index in xrange(num_items):
+            while True:
+                with result_ready:
+                    if index not in results:
+                        result_ready.wait(
+                            None if wait_callback is None else 0.1)
+                    done = results.pop(index, None)
+                if done is not None: break
+                if wait_callback: wait_callback()
+            if window: window.release()
+            ok, result = done
+            if not ok: raise result
+            yield result
+    finally:
+        cancelled.set()
+        if window:
+            for thread in threads: window.release() # wake up waiting workers
+        for thread in threads: thread.join()
+        if discard:
+            for ok, result in results.itervalues():
+                if ok: discard(result)
+
 # Log/Progress ----------------------------------------------------------------
 #------------------------------------------------------------------------------
 class Log(object):
@@ -1972,6 +2453,28 @@ def __call__(self,state,message=u''):
         self.parent(self.baseFrom+self.scale*state/self.full,message)
         self.state = state
 
+class ThreadSubProgress(SubProgress):
+    """SubProgress that may be called from a background thread. The parent
+    (e.g. a progress dialog, which only the main thread may update) is only
+    updated when the thread that owns it calls flush - with the latest state,
+    earlier ones are dropped."""
+    def __init__(self,parent,baseFrom=0.0,baseTo='+1',full=1.0,silent=False):
+        SubProgress.__init__(self, parent, baseFrom, baseTo, full, silent)
+        self._pending = None
+
+    def __call__(self,state,message=u''):
+        """Record the current state for flush."""
+        self._pending = (state, message) # atomic, no lock needed
+        self.state = state
+
+    def flush(self):
+        """Pass the latest state on to the parent, if there is a new one.
+        Returns True if there was."""
+        pending, self._pending = self._pending, None
+        if pending is None: return False
+        SubProgress.__call__(self, *pending)
+        return True
+
 #------------------------------------------------------------------------------
 def readCString(ins, file_path):
     """Read null terminated string, dropping the final null byte."""
@@ -1984,8 +2487,122 @@ def readCString(ins, file_path):
                                   u'Reached end of file while expecting null')
     return ''.join(byte_list)
 
-class StringTable(dict):
-    """For reading .STRINGS, .DLSTRINGS, .ILSTRINGS files."""
+class _StringsFile(object):
+    """The contents of a single .STRINGS, .DLSTRINGS or .ILSTRINGS file. The
+    whole file is kept in memory as one buffer, the id/offset directory is
+    decoded in one go and strings are only sliced out of the buffer and
+    decoded to unicode the first time they are looked up."""
+    __slots__ = (u'_buffer', u'_strings_start', u'_offsets', u'_formatted',
+                 u'_backup_encoding', u'_decoded')
+
+    def __init__(self, buffer_, strings_start, offsets, formatted,
+                 backup_encoding):
+        self._buffer = buffer_
+        self._strings_start = strings_start
+        self._offsets = offsets # id -> offset into the string data block
+        self._formatted = formatted
+        self._backup_encoding = backup_encoding
+        self._decoded = {}
+
+    @classmethod
+    def from_path(cls, path, backup_encoding):
+        """Read and parse the strings file at path. Returns None if the file
+        is empty or unreadable."""
+        try:
+            with open(path.s, u'rb') as ins:
+                buffer_ = ins.read()
+        except (IOError, OSError):
+            deprint(u'Error loading string file:', path.stail, traceback=True)
+            return None
+        eof = len(buffer_)
+        if eof < 8:
+            deprint(u"Warning: Strings file '%s' file size (%d) is less than "
+                    u"8 bytes.  8 bytes are the minimum required by the "
+                    u"expected format, assuming the Strings file is empty."
+                    % (path, eof))
+            return None
+        numIds, dataSize = struct.unpack_from('=2I', buffer_)
+        stringsStart = 8 + (numIds*8)
+        if stringsStart != eof-dataSize:
+            deprint(u"Warning: Strings file '%s' dataSize element (%d) "
+                    u"results in a string start location of %d, but the "
+                    u"expected location is %d"
+                    % (path, dataSize, eof-dataSize, stringsStart))
+        if stringsStart > eof:
+            deprint(u"Error loading string file: '%s' is truncated, its "
+                    u"directory of %d strings does not fit in %d bytes."
+                    % (path, numIds, eof))
+            return None
+        # The directory is numIds pairs of little endian (id, offset)
+        directory = array.array('I')
+        directory.fromstring(buffer_[8:stringsStart])
+        if sys.byteorder != u'little':
+            directory.byteswap()
+        return cls(buffer_, stringsStart,
+                   dict(izip(directory[::2], directory[1::2])),
+                   path.cext != u'.strings', backup_encoding)
+
+    def __len__(self): return len(self._offsets)
+    def __contains__(self, id_): return id_ in self._offsets
+    def iterkeys(self): return self._offsets.iterkeys()
+
+    def lookup(self, id_):
+        """Return the string with the specified id, decoded to unicode, or
+        None if this file does not contain it."""
+        value = self._decoded.get(id_)
+        if value is not None:
+            return value
+        offset = self._offsets.get(id_)
+        if offset is None:
+            return None
+        start = self._strings_start + offset
+        buffer_ = self._buffer
+        if self._formatted:
+            # Length prefixed, but the strings are null terminated too
+            if start + 4 > len(buffer_): return None
+            end = start + 4 + struct.unpack_from('=I', buffer_, start)[0]
+            start += 4
+            null_pos = buffer_.find(b'\0', start, end)
+        else:
+            end = len(buffer_)
+            null_pos = buffer_.find(b'\0', start)
+        value = buffer_[start:end if null_pos == -1 else null_pos]
+        try:
+            value = unicode(value, 'utf-8')
+        except UnicodeDecodeError:
+            value = unicode(value, self._backup_encoding)
+        self._decoded[id_] = value
+        return value
+
+# Strings files are shared by all the StringTables that load them, keyed by
+# path. Each value is a ((size, mtime, backup encoding), _StringsFile) tuple.
+# Once the files add up to more than _strings_files_limit bytes, the least
+# recently used ones are dropped - the tables using them keep them alive
+_strings_files = collections.OrderedDict()
+_strings_files_limit = 64 * 1024 * 1024
+
+def _get_strings_file(path, backup_encoding):
+    try:
+        cache_key = path.size_mtime() + (backup_encoding,)
+    except (IOError, OSError):
+        deprint(u'Error loading string file:', path.stail, traceback=True)
+        return None
+    cached = _strings_files.pop(path, None)
+    if cached is None or cached[0] != cache_key:
+        strings_file = _StringsFile.from_path(path, backup_encoding)
+        if strings_file is None: return None
+        cached = (cache_key, strings_file)
+    _strings_files[path] = cached
+    cached_size = sum(k[0] for k, _f in _strings_files.itervalues())
+    while cached_size > _strings_files_limit and len(_strings_files) > 1:
+        cached_size -= _strings_files.popitem(last=False)[1][0][0]
+    return cached[1]
+
+class StringTable(object):
+    """For reading .STRINGS, .DLSTRINGS, .ILSTRINGS files. Behaves like a
+    read only dict of string id -> unicode string. The files themselves are
+    cached process wide (see _get_strings_file), so loading the strings of
+    the same plugin again is almost free."""
     encodings = {
         # Encoding to fall back to if UTF-8 fails, based on language
         # Default is 1252 (Western European), so only list languages
@@ -1993,6 +2610,11 @@ class StringTable(dict):
         u'russian': 'cp1251',
         }
 
+    def __init__(self):
+        self._files = [] # later files take precedence, as with dict.update
+
+    def clear(self): del self._files[:]
+
     def load(self, modFilePath, lang=u'English', progress=Progress()):
         baseName = modFilePath.tail.body
         baseDir = modFilePath.head.join(u'Strings')
@@ -2006,61 +2628,49 @@ def load(self, modFilePath, lang=u'English', progress=Progress()):
             self.loadFile(file,SubProgress(progress,i,i+1))
 
     def loadFile(self, path, progress, lang=u'english'):
-        formatted = path.cext != u'.strings'
         backupEncoding = self.encodings.get(lang.lower(), 'cp1252')
-        try:
-            with open(path.s, u'rb') as ins:
-                insSeek = ins.seek
-                insTell = ins.tell
-
-                insSeek(0,os.SEEK_END)
-                eof = insTell()
-                insSeek(0)
-                if eof < 8:
-                    deprint(u"Warning: Strings file '%s' file size (%d) is "
-                            u"less than 8 bytes.  8 bytes are the minimum "
-                            u"required by the expected format, assuming the "
-                            u"Strings file is empty." % (path, eof))
-                    return
-
-                numIds,dataSize = unpack_many(ins, '=2I')
-                progress.setFull(max(numIds,1))
-                stringsStart = 8 + (numIds*8)
-                if stringsStart != eof-dataSize:
-                    deprint(u"Warning: Strings file '%s' dataSize element "
-                            u"(%d) results in a string start location of %d, "
-                            u"but the expected location is %d"
-                            % (path, dataSize, eof-dataSize, stringsStart))
-
-                id_ = -1
-                offset = -1
-                for x in xrange(numIds):
-                    try:
-                        progress(x)
-                        id_,offset = unpack_many(ins, '=2I')
-                        pos = insTell()
-                        insSeek(stringsStart+offset)
-                        if formatted:
-                            value = unpack_str32(ins) # TODO(ut): unpack_str32_null
-                            # seems needed, strings are null terminated
-                            value = cstrip(value)
-                        else:
-                            value = readCString(ins, path) #drops the null byte
-                        try:
-                            value = unicode(value,'utf-8')
-                        except UnicodeDecodeError:
-                            value = unicode(value,backupEncoding)
-                        insSeek(pos)
-                        self[id_] = value
-                    except:
-                        deprint(u'Error reading string file:')
-                        deprint(u'id:', id_)
-                        deprint(u'offset:', offset)
-                        deprint(u'filePos:',  insTell())
-                        raise
-        except:
-            deprint(u'Error loading string file:', path.stail, traceback=True)
-            return
+        progress.setFull(1)
+        strings_file = _get_strings_file(path, backupEncoding)
+        if strings_file is not None:
+            self._files.append(strings_file)
+        progress(1)
+
+    #--Dict emulation
+    def get(self, id_, default=None):
+        for strings_file in reversed(self._files):
+            value = strings_file.lookup(id_)
+            if value is not None:
+                return value
+        return default
+
+    def __getitem__(self, id_):
+        value = self.get(id_)
+        if value is None:
+            raise KeyError(id_)
+        return value
+
+    def __contains__(self, id_):
+        return any(id_ in strings_file for strings_file in self._files)
+
+    def __iter__(self):
+        if len(self._files) == 1:
+            return self._files[0].iterkeys()
+        return iter(set(chain.from_iterable(
+            f.iterkeys() for f in self._files)))
+
+    def __len__(self):
+        if len(self._files) == 1:
+            return len(self._files[0])
+        return len(set(self))
+
+    def __nonzero__(self):
+        return any(self._files)
+
+    def keys(self): return list(self)
+    def iterkeys(self): return iter(self)
+    def values(self): return [self[k] for k in self]
+    def items(self): return [(k, self[k]) for k in self]
+    def iteritems(self): return ((k, self[k]) for k in self)
 
 #------------------------------------------------------------------------------
 _digit_re = re.compile(u'([0-9]+)')
@@ -42,15 +42,22 @@
 from functools import wraps, partial
 from itertools import imap
 #--Local
-from ._mergeability import isPBashMergeable, isCBashMergeable, is_esl_capable
+from ._mergeability import isPBashMergeable, isCBashMergeable, \
+    is_esl_capable, merge_load_factory, needs_record_scan
+from .change_journal import ChangeJournal, make_change_journal
+from .bsa_index import BsaIndex
+from .crc_cache import CrcCache
+from .install_cache import InstallCache
+from .loot_conditions import reset_eval_context
 from .mods_metadata import ConfigHelpers
+from .save_header_cache import SaveHeaderCache
 from .. import bass, bolt, balt, bush, env, load_order, archives, \
     initialization
 from .. import patcher # for configIsCBash()
 from ..archives import readExts
 from ..bass import dirs, inisettings, tooldirs
 from ..bolt import GPath, DataDict, deprint, sio, Path, decode, AFile, \
-    GPath_no_norm
+    GPath_no_norm, SubProgress
 from ..brec import ModReader, RecordHeader
 from ..cint import CBashApi
 from ..exception import AbstractError, ArgumentError, BoltError, BSAError, \
@@ -83,6 +90,16 @@
 screen_infos = None # type: ScreenInfos
 #--Config Helper files (LOOT Master List, etc.)
 configHelpers = None # type: mods_metadata.ConfigHelpers
+#--CRCs of the files in the Data folder, shared by ModInfos and BAIN
+crcCache = None # type: CrcCache
+#--Changes made to the Data and Bash Installers folders between refreshes,
+# None if they are not watched
+changeJournal = None # type: ChangeJournal
+#--Files BAIN extracted from archives, None if disabled
+installCache = None # type: InstallCache
+#--Indices of the BSAs, so that their assets are known without reading them
+bsaIndex = None # type: BsaIndex
+saveHeaderCache = None # type: SaveHeaderCache
 
 #--Header tags
 reVersion = re.compile(
@@ -407,6 +424,7 @@ def isInvertedMod(self):
 
     def calculate_crc(self, recalculate=False):
         cached_crc = modInfos.table.getItem(self.name, 'crc')
+        force = recalculate
         if not recalculate:
             cached_mtime = modInfos.table.getItem(self.name, 'crc_mtime')
             cached_size = modInfos.table.getItem(self.name, 'crc_size')
@@ -415,14 +433,19 @@ def calculate_crc(self, recalculate=False):
                           or self._file_size != cached_size
         path_crc = cached_crc
         if recalculate:
-            path_crc = self.abs_path.crc
-            if path_crc != cached_crc:
-                modInfos.table.setItem(self.name,'crc',path_crc)
-                modInfos.table.setItem(self.name,'ignoreDirty',False)
-            modInfos.table.setItem(self.name, 'crc_mtime', self._file_mod_time)
-            modInfos.table.setItem(self.name, 'crc_size', self._file_size)
+            # If we were asked to recalculate, don't trust the shared cache
+            path_crc = crcCache.get_crc(self.abs_path, recalculate=force)
+            self._store_crc(path_crc, cached_crc)
         return path_crc, cached_crc
 
+    def _store_crc(self, path_crc, cached_crc):
+        """Stores the freshly calculated path_crc in the mod table."""
+        if path_crc != cached_crc:
+            modInfos.table.setItem(self.name,'crc',path_crc)
+            modInfos.table.setItem(self.name,'ignoreDirty',False)
+        modInfos.table.setItem(self.name, 'crc_mtime', self._file_mod_time)
+        modInfos.table.setItem(self.name, 'crc_size', self._file_size)
+
     def cached_mod_crc(self): # be sure it's valid before using it!
         return modInfos.table.getItem(self.name, 'crc')
 
@@ -611,6 +634,7 @@ def writeHeader(self):
         #--Remove original and replace with temp
         filePath.untemp()
         self.setmtime(crc_changed=True)
+        modInfos.reset_dependents() # the masters may have been edited
         #--Merge info
         size,canMerge = modInfos.table.getItem(self.name,'mergeInfo',(None,None))
         if size is not None:
@@ -624,6 +648,10 @@ def writeDescription(self,description):
         self.writeHeader()
 
     #--Helpers ----------------------------------------------------------------
+    def _reset_masters(self):
+        super(ModInfo, self)._reset_masters()
+        if modInfos is not None: modInfos.reset_dependents()
+
     def isBP(self):
         return self.header.author == u'BASHED PATCH'
 
@@ -929,6 +957,8 @@ def _status(s):
         match = False
         mismatch = 0
         ini_settings = target_ini.get_ci_settings()
+        if target_ini is infos.ini:
+            infos.check_target_settings(ini_settings)
         self_installer = infos.table.getItem(self.abs_path.tail, 'installer')
         for section_key in tweak_settings:
             if section_key not in ini_settings:
@@ -1046,7 +1076,9 @@ def getStatus(self):
     def readHeader(self):
         """Read header from file and set self.header attribute."""
         try:
-            self.header = get_save_header_type(bush.game.fsName)(self.abs_path)
+            self.header = saveHeaderCache.get_header(
+                get_save_header_type(bush.game.fsName), self.abs_path,
+                self._file_size, self._file_mod_time)
         except SaveHeaderError as e:
             raise SaveFileError, (self.name, e.message), sys.exc_info()[2]
         self._reset_masters()
@@ -1293,7 +1325,7 @@ def _initDB(self, dir_):
         self.data = {} # populated in refresh ()
         # the type of the table keys is always bolt.Path
         self.table = bolt.DataTable(
-            bolt.PickleDict(self.bash_dir.join(u'Table.dat')))
+            bolt.PickleDict(self.bash_dir.join(u'Table.dat'), journaled=True))
         deprint(u' Successfully initialized %s' % self.__class__.__name__)
 
     def __init__(self, dir_, factory=AFile):
@@ -1553,6 +1585,15 @@ def __init__(self):
         super(INIInfos, self).__init__(dirs['ini_tweaks'],
                                        factory=ini_info_factory)
         self._ini = None
+        # The target settings the tweak statuses were computed against, and
+        # the same settings as a (section, setting) -> value table, where
+        # (section, None) entries record the sections
+        self._target_settings = self._target_table = None
+        # (section, setting) -> names of the tweaks that contain it, and
+        # tweak name -> (info, (size, mtime), keys of the tweak) for the
+        # tweaks that are in there
+        self._key_tweaks = collections.defaultdict(set)
+        self._indexed_tweaks = {}
         # Check the list of target INIs, remove any that don't exist
         # if _target_inis is not an OrderedDict choice won't be set correctly
         _target_inis = bass.settings['bash.ini.choices'] # type: OrderedDict
@@ -1609,6 +1650,65 @@ def ini(self, ini_path):
             return # nothing to do
         self._ini = BestIniFile(ini_path)
         for ini_info in self.itervalues(): ini_info.reset_status()
+        self._snapshot_target()
+
+    def _snapshot_target(self):
+        """Remember the settings of the target ini that the tweak statuses
+        will be computed against and return them as a (section, setting) ->
+        value table."""
+        target_settings = self._target_settings = self._ini.get_ci_settings()
+        table = {}
+        for section, settings in target_settings.iteritems():
+            table[(section, None)] = None
+            for setting, (value, _line) in settings.iteritems():
+                table[(section, setting)] = value
+        self._target_table = table
+        return table
+
+    def check_target_settings(self, ini_settings):
+        """Called by the tweaks when computing their status against the
+        target ini. If the target was reread since we took our snapshot we
+        can't know what the statuses were computed against, so the next
+        change to the target will reset them all."""
+        if ini_settings is not self._target_settings:
+            self._target_table = None
+
+    def _tweaks_by_key(self):
+        """Return the (section, setting) -> tweak names index, updating it
+        for the tweaks that were added, changed or removed since last time.
+        (section, None) keys map to the tweaks containing the section."""
+        key_tweaks = self._key_tweaks
+        indexed = self._indexed_tweaks
+        for tweak, (info, stamp, keys) in indexed.items():
+            if self.get(tweak) is info and stamp == (
+                    info._file_size, info._file_mod_time): continue
+            for key in keys: key_tweaks[key].discard(tweak)
+            del indexed[tweak]
+        for tweak, info in self.iteritems():
+            if tweak in indexed: continue
+            keys = []
+            for section, settings in info.get_ci_settings().iteritems():
+                keys.append((section, None))
+                keys.extend((section, setting) for setting in settings)
+            for key in keys: key_tweaks[key].add(tweak)
+            indexed[tweak] = info, (info._file_size, info._file_mod_time), \
+                             keys
+        return key_tweaks
+
+    def _reset_target_statuses(self):
+        """The target ini changed - reset the status of the tweaks that
+        contain sections or settings that were added, removed or changed in
+        it. The status of a tweak does not depend on any other target
+        settings."""
+        old_table = self._target_table
+        new_table = self._snapshot_target()
+        if old_table is None:
+            for ini_info in self.itervalues(): ini_info.reset_status()
+            return
+        key_tweaks = self._tweaks_by_key()
+        for key, _value in old_table.viewitems() ^ new_table.viewitems():
+            for tweak in key_tweaks.get(key, ()):
+                self[tweak].reset_status()
 
     @staticmethod
     def update_targets(targets_dict):
@@ -1681,9 +1781,9 @@ def refresh(self, refresh_infos=True, refresh_target=True):
             _added, _deleted, _updated = self._refresh_ini_tweaks()
         changed = refresh_target and (
             self.ini.updated or self.ini.do_update())
-        if changed: # reset the status of all infos and let RefreshUI set it
+        if changed: # reset the affected statuses and let RefreshUI set them
             self.ini.updated = False
-            for ini_info in self.itervalues(): ini_info.reset_status()
+            self._reset_target_statuses()
         change = bool(_added) or bool(_updated) or bool(_deleted) or changed
         if not change: return change
         return _added, _updated, _deleted, changed
@@ -1840,6 +1940,24 @@ def __init__(self):
     # merged, bashed_patches, imported caches
     def _reset_info_sets(self):
         self._merged = self._imported = self._bashed_patches = self.__calculate
+        self.reset_dependents()
+
+    def reset_dependents(self):
+        """Drop the reverse master index, see get_dependents - call this when
+        the masters of any mod change or mods are added, renamed or deleted.
+        """
+        self._dependents = self.__calculate
+
+    def get_dependents(self, master):
+        """Returns the set of the mods that have master as one of their
+        masters. Backed by a reverse master index, built on first use."""
+        if self._dependents is self.__calculate:
+            self._dependents = {}
+            for mod_name, mod_info in self.iteritems():
+                for mod_master in mod_info.get_masters():
+                    self._dependents.setdefault(mod_master, set()).add(
+                        mod_name)
+        return self._dependents.get(master, frozenset())
 
     @property
     def imported(self):
@@ -1897,6 +2015,12 @@ def cached_lo_save_all(self):
         self._active_wip.sort(key=dex.__getitem__) # order in their load order
         load_order.save_lo(self._lo_wip, acti=self._active_wip)
 
+    @_lo_cache
+    def cached_lo_use(self, lord, active):
+        """Use the given load order and active plugins, without saving them
+        - used when building a patch from the command line."""
+        load_order.use_lo(lord, active)
+
     @_lo_cache
     def undo_load_order(self): load_order.undo_load_order()
 
@@ -2014,14 +2138,20 @@ def refresh(self, refresh_infos=True, booting=False, _modTimesChange=False):
         """
         hasChanged = deleted = False
         # Scan the data dir, getting info on added, deleted and modified files
-        if refresh_infos:
+        if refresh_infos and self._store_dir_changed(booting):
+            if booting: self._prefetch_crcs()
             change = FileInfos.refresh(self, booting=booting)
-            if change: _added, _updated, deleted = change
+            if changeJournal is not None:
+                changeJournal.mark_clean(u'mods', self.store_dir.s)
+            if change:
+                _added, _updated, deleted = change
+                self.reset_dependents()
             hasChanged = bool(change)
         # If refresh_infos is False and mods are added _do_ manually refresh
         _modTimesChange = _modTimesChange and not load_order.using_txt_file()
         lo_changed = self.refreshLoadOrder(
             forceRefresh=hasChanged or _modTimesChange, forceActive=deleted)
+        reset_eval_context() # LOOT conditions may evaluate differently now
         self.reloadBashTags()
         # if active did not change, we must perform the refreshes below
         if lo_changed < 2: # in case ini files were deleted or modified
@@ -2041,6 +2171,13 @@ def refresh(self, refresh_infos=True, booting=False, _modTimesChange=False):
         hasChanged += bool(scanList or difMergeable)
         return bool(hasChanged) or lo_changed
 
+    def _store_dir_changed(self, booting):
+        """Return False if the change journal is sure that nothing changed
+        directly in the Data folder since the last refresh."""
+        if changeJournal is None: return True
+        dirty = changeJournal.dirty_dirs(u'mods', self.store_dir.s)
+        return booting or dirty is None or self.store_dir.s in dirty
+
     _plugin_inis = OrderedDict() # cache active mod inis in active mods order
     def _refresh_mod_inis(self):
         if not bush.game.Ini.supports_mod_inis: return
@@ -2155,6 +2292,23 @@ def _rescanMergeable(self, names, progress, doCBash, return_results):
         else:
             is_mergeable = isPBashMergeable
         mod_mergeInfo = self.table.getColumn('mergeInfo')
+        # Scan the records of the mods first, in parallel - whether a mod is
+        # mergeable depends on the mergeability of its dependents, so the
+        # checks themselves must run in order
+        merge_scans, no_record_scan = {}, set()
+        if not doCBash and bush.game.Esp.canBash:
+            to_scan = [self[n] for n in names if n.cs not in
+                       bush.game.bethDataFiles and not self[n].is_esl()]
+            if is_mergeable is isPBashMergeable:
+                no_record_scan = {m.name for m in to_scan
+                                  if not needs_record_scan(m, return_results)}
+                to_scan = [m for m in to_scan
+                           if m.name not in no_record_scan]
+            progress.setFull(1.0)
+            merge_scans = ModHeaderReader.scan_for_merging(to_scan,
+                merge_load_factory(), inisettings['MergeScanProcesses'],
+                SubProgress(progress, 0, 0.9))
+            progress = SubProgress(progress, 0.9, 1.0)
         progress.setFull(max(len(names),1))
         result, tagged_no_merge = OrderedDict(), set()
         for i,fileName in enumerate(names):
@@ -2172,7 +2326,13 @@ def _rescanMergeable(self, names, progress, doCBash, return_results):
                 canMerge = False
             else:
                 try:
-                    canMerge = is_mergeable(fileInfo, self, reasons)
+                    if fileName in no_record_scan:
+                        canMerge = False
+                    elif fileName in merge_scans:
+                        canMerge = is_mergeable(fileInfo, self, reasons,
+                            merge_scan=merge_scans[fileName])
+                    else:
+                        canMerge = is_mergeable(fileInfo, self, reasons)
                 except Exception as e:
                     # deprint (_(u"Error scanning mod %s (%s)") % (fileName, e))
                     # canMerge = False #presume non-mergeable.
@@ -2207,14 +2367,48 @@ def reloadBashTags(self):
             if autoTag:
                 mod.reloadBashTags()
 
-    def refresh_crcs(self, mods=None): #TODO(ut) progress !
+    def save(self):
+        super(ModInfos, self).save()
+        crcCache.save()
+        bsaIndex.save()
+
+    def refresh_crcs(self, mods=None, progress=None):
+        """Recalculates the crcs of the specified mods (all of them if None)
+        in parallel and returns a dict mapping each mod to a tuple of its new
+        and its previously cached crc."""
         if mods is None: mods = self.keys()
+        infos = [self[mod] for mod in mods]
+        path_crcs = crcCache.get_crcs([inf.abs_path.s for inf in infos],
+            progress, _(u'Calculating CRCs...') + u'\n', recalculate=True)
         pairs = {}
-        for mod in mods:
-            inf = self[mod]
-            pairs[inf.name] = inf.calculate_crc(recalculate=True)
+        for inf in infos:
+            cached_crc = inf.cached_mod_crc()
+            try:
+                path_crc = path_crcs[inf.abs_path.s]
+            except KeyError: # could not be read, let it raise
+                path_crc = inf.abs_path.crc
+            inf._store_crc(path_crc, cached_crc)
+            pairs[inf.name] = path_crc, cached_crc
         return pairs
 
+    def _prefetch_crcs(self):
+        """Calculates the crcs of all plugins whose cached crcs are out of
+        date in parallel, so that creating their infos finds them in the crc
+        cache instead of reading them one by one."""
+        stale_paths = []
+        for mod_name in FileInfos._names(self):
+            mod_path = self.store_dir.join(mod_name)
+            if mod_name.cs[-6:] == u'.ghost': mod_name = GPath(mod_name.s[:-6])
+            try:
+                mod_size, mod_mtime = mod_path.size_mtime()
+            except OSError:
+                continue
+            table_get = partial(self.table.getItem, mod_name)
+            if (table_get('crc') is None or table_get('crc_size') != mod_size
+                    or table_get('crc_mtime') != mod_mtime):
+                stale_paths.append(mod_path.s)
+        crcCache.get_crcs(stale_paths)
+
     #--Refresh File
     def new_info(self, fileName, _in_refresh=False, owner=None,
                  notify_bain=False):
@@ -2602,6 +2796,7 @@ def _rename_operation(self, oldName, newName):
         if isSelected:
             self.lo_deactivate(oldName, doSave=False) # will save later
         super(ModInfos, self)._rename_operation(oldName, newName)
+        self.reset_dependents()
         # rename in load order caches
         oldIndex = self._lo_wip.index(oldName)
         self._lo_caches_remove_mods([oldName])
@@ -2857,7 +3052,7 @@ def __init__(self):
                                         factory=SaveInfo)
         # Save Profiles database
         self.profiles = bolt.DataTable(bolt.PickleDict(
-            dirs['saveBase'].join(u'BashProfiles.dat')))
+            dirs['saveBase'].join(u'BashProfiles.dat'), journaled=True))
         # save profiles used to have a trailing slash, remove it if present
         for row in self.profiles.keys():
             if row.endswith(u'\\'):
@@ -2878,14 +3073,41 @@ def bash_dir(self): return self.store_dir.join(u'Bash')
 
     def refresh(self, refresh_infos=True, booting=False):
         self._refreshLocalSave()
+        if refresh_infos and (booting or not self.data):
+            self._prefetch_headers()
         return refresh_infos and FileInfos.refresh(self, booting=booting)
 
+    def _prefetch_headers(self):
+        """Reads the headers of all saves that are not in the header cache in
+        parallel, so that creating their infos finds them there instead of
+        reading them one by one."""
+        save_stats = []
+        for save_name in self._names():
+            save_path = self.store_dir.join(save_name)
+            try:
+                save_stats.append((save_path,) + save_path.size_mtime())
+            except OSError:
+                continue
+        saveHeaderCache.prefetch(get_save_header_type(bush.game.fsName),
+                                 save_stats)
+
+    def save(self):
+        super(SaveInfos, self).save()
+        # Forget the headers of saves that are gone from this profile
+        saveHeaderCache.retain(self.store_dir,
+                               (inf.abs_path.s for inf in self.itervalues()))
+        saveHeaderCache.save()
+
     def _rename_operation(self, oldName, newName):
         """Renames member file from oldName to newName, update also cosave
         instance names."""
         super(SaveInfos, self)._rename_operation(oldName, newName)
-        for co_type, co_file in self[newName]._co_saves.items():
-            co_file.abs_path = co_type.get_cosave_path(self[newName].abs_path)
+        new_info = self[newName]
+        for co_type, co_file in new_info._co_saves.items():
+            co_file.abs_path = co_type.get_cosave_path(new_info.abs_path)
+        # the screenshot is read lazily, from the save's new path
+        if new_info.header is not None:
+            new_info.header._save_path = new_info.abs_path
 
     def _additional_deletes(self, fileInfo, toDelete):
         # type: (SaveInfo, list) -> None
@@ -3020,6 +3242,9 @@ def do_update(self):
             def readHeader(self):  # just reset the cache
                 self._assets = self.__class__._assets
 
+            def _get_index(self):
+                return bsaIndex.get_index(self)
+
             def _reset_bsa_mtime(self):
                 if bush.game.Bsa.allow_reset_timestamps and inisettings[
                     'ResetBSATimestamps']:
@@ -3043,6 +3268,12 @@ def new_info(self, fileName, _in_refresh=False, owner=None,
     @property
     def bash_dir(self): return dirs['modsBash'].join(u'BSA Data')
 
+    def save(self):
+        super(BSAInfos, self).save()
+        # Forget the indices of archives that are gone from Data
+        bsaIndex.retain(inf.abs_path.s for inf in self.itervalues())
+        bsaIndex.save()
+
     @staticmethod
     def remove_invalidation_file():
         """Removes ArchiveInvalidation.txt, if it exists in the game folder.
@@ -3283,6 +3514,18 @@ def initDefaultSettings():
     inisettings['PromptActivateBashedPatch'] = True
     inisettings['WarnTooManyFiles'] = True
     inisettings['SkippedBashInstallersDirs'] = u''
+    inisettings['PatchPluginCacheSize'] = 256
+    inisettings['PatchLoadWorkers'] = 0
+    inisettings['PatchReuseUnchanged'] = True
+    inisettings['PatchVerifyReuse'] = False
+    inisettings['CrcThreads'] = 4
+    inisettings['WatchFolders'] = True
+    inisettings['ExtractProcesses'] = 2
+    inisettings['InstallCacheSize'] = 4096
+    inisettings['InstallCacheHardLinks'] = False
+    inisettings['BsaThreads'] = 4
+    inisettings['MergeScanProcesses'] = 2
+    inisettings['SaveHeaderThreads'] = 4
 
 def initOptions(bashIni):
     initDefaultTools()
@@ -3345,6 +3588,18 @@ def initBosh(bashIni, game_ini_path):
                     bush.game.iniFiles[1:])
     load_order.initialize_load_order_files()
     initOptions(bashIni)
+    global crcCache, changeJournal, installCache, bsaIndex, saveHeaderCache
+    crcCache = CrcCache(dirs['mods'], dirs['modsBash'].join(u'CRC Cache.dat'))
+    bsaIndex = BsaIndex(dirs['modsBash'].join(u'BSA Index.dat'))
+    saveHeaderCache = SaveHeaderCache(
+        dirs['modsBash'].join(u'Save Header Cache.dat'))
+    if inisettings['WatchFolders']:
+        changeJournal = make_change_journal()
+    if inisettings['InstallCacheSize'] > 0:
+        installCache = InstallCache(dirs['modsBash'].join(u'Install Cache'),
+            dirs['modsBash'].join(u'Install Cache.dat'),
+            inisettings['InstallCacheSize'] * 1024 * 1024,
+            inisettings['InstallCacheHardLinks'])
     from .bain import Installer
     Installer.init_bain_dirs()
     if os.name == u'nt': # don't add local directory to binaries on linux
@@ -3358,7 +3613,8 @@ def initSettings(readOnly=False, _dat=u'BashSettings.dat',
     def _load(dat_file=_dat):
     # bolt.PickleDict.load() handles EOFError, ValueError falling back to bak
         return bolt.Settings( # calls PickleDict.load() and copies loaded data
-            bolt.PickleDict(dirs['saveBase'].join(dat_file), readOnly))
+            bolt.PickleDict(dirs['saveBase'].join(dat_file), readOnly,
+                            journaled=True))
 
     _dat = dirs['saveBase'].join(_dat)
     _bak = dirs['saveBase'].join(_bak)
@@ -28,7 +28,7 @@
 from ..cint import ObCollection
 from ..exception import ModError
 from ..load_order import cached_is_active
-from ..mod_files import LoadFactory, ModHeaderReader, ModFile
+from ..mod_files import LoadFactory, ModHeaderReader
 
 def _is_mergeable_no_load(modInfo, reasons):
     verbose = reasons is not None
@@ -78,38 +78,58 @@ def _pbash_mergeable_no_load(modInfo, reasons):
             modInfo.name.sbody, oblivionIni.get_ini_language()))
     return False if reasons else True
 
-def isPBashMergeable(modInfo, minfos, reasons):
-    """Returns True or error message indicating whether specified mod is mergeable."""
+def needs_record_scan(modInfo, verbose):
+    """Returns whether isPBashMergeable would look at the records of modInfo -
+    in non verbose mode it gives up first if the checks that need no loading
+    fail. If this returns False, modInfo is not mergeable (so there is no
+    need to call isPBashMergeable), else pass its MergeScan to
+    isPBashMergeable, which then skips those checks."""
+    return verbose or _pbash_mergeable_no_load(modInfo, None)
+
+def merge_load_factory():
+    """Returns the LoadFactory isPBashMergeable looks at plugins with, see
+    ModHeaderReader.scan_for_merging."""
+    return LoadFactory(False, *(recClass.rec_sig for recClass in
+                                bush.game.mergeClasses))
+
+def _merge_scan(modInfo, merge_scan, load_factory):
+    """Returns the MergeScan of modInfo, scanning it if merge_scan is None."""
+    if merge_scan is None:
+        merge_scan = ModHeaderReader.scan_for_merging(
+            [modInfo], load_factory or merge_load_factory())[modInfo.name]
+    return merge_scan
+
+def isPBashMergeable(modInfo, minfos, reasons, merge_scan=None):
+    """Returns True or error message indicating whether specified mod is
+    mergeable. The records of the mod are looked at through its MergeScan,
+    pass it in if it was already scanned - in non verbose mode, only mods
+    needs_record_scan returned True for may be passed a MergeScan, as the
+    checks that need no loading are then not run again."""
     verbose = reasons is not None
-    if not _pbash_mergeable_no_load(modInfo, reasons) and not verbose:
+    if (verbose or merge_scan is None) and not _pbash_mergeable_no_load(
+            modInfo, reasons) and not verbose:
         return False  # non verbose mode
-    #--Load test
-    mergeTypes = {recClass.rec_sig for recClass in bush.game.mergeClasses}
-    modFile = ModFile(modInfo, LoadFactory(False, *mergeTypes))
-    try:
-        modFile.load(True,loadStrings=False)
-    except ModError as error:
+    #--Header test - as if loaded with merge_load_factory
+    merge_scan = _merge_scan(modInfo, merge_scan, None)
+    if merge_scan.error is not None:
         if not verbose: return False
-        reasons.append(u'%s.' % error)
+        reasons.append(u'%s.' % merge_scan.error)
+    elif merge_scan.bad_grouping:
+        if not verbose: return False
+        reasons.append(u'%s.' % ModError(modInfo.name,
+                                         u'Improperly grouped file.'))
     #--Skipped over types?
-    if modFile.topsSkipped:
+    if merge_scan.tops_skipped:
         if not verbose: return False
-        reasons.append(_(u'Unsupported types: ')+u', '.join(sorted(modFile.topsSkipped))+u'.')
+        reasons.append(_(u'Unsupported types: ')+u', '.join(sorted(merge_scan.tops_skipped))+u'.')
     #--Empty mod
-    elif not modFile.tops:
+    elif not merge_scan.has_tops:
         if not verbose: return False
         reasons.append(_(u'Empty mod.'))
-    #--New record
-    lenMasters = len(modFile.tes4.masters)
-    newblocks = []
-    for top_type,block in modFile.tops.iteritems():
-        for record in block.iter_records():
-            if not record.flags1.ignored and record.fid >> 24 >= lenMasters:
-                if record.flags1.deleted: continue #if new records exist but are deleted just skip em.
-                if not verbose: return False
-                newblocks.append(top_type)
-                break
-    if newblocks: reasons.append(_(u'New record(s) in block(s): ')+u', '.join(sorted(newblocks))+u'.')
+    #--New record - if new records exist but are deleted just skip em
+    if merge_scan.new_blocks:
+        if not verbose: return False
+        reasons.append(_(u'New record(s) in block(s): ')+u', '.join(sorted(merge_scan.new_blocks))+u'.')
     dependent = _dependent(modInfo, minfos)
     if dependent:
         if not verbose: return False
@@ -119,12 +139,11 @@ def isPBashMergeable(modInfo, minfos, reasons):
 def _dependent(modInfo, minfos):
     """Get mods for which modInfo is a master mod (excluding BPs and
     mergeable)."""
-    dependent = [mname.s for mname, info in minfos.iteritems() if
-                 not info.isBP() and modInfo.name in info.get_masters() and
-                 mname not in minfos.mergeable]
+    dependent = [mname.s for mname in minfos.get_dependents(modInfo.name) if
+                 not minfos[mname].isBP() and mname not in minfos.mergeable]
     return dependent
 
-def is_esl_capable(modInfo, _minfos, reasons):
+def is_esl_capable(modInfo, _minfos, reasons, merge_scan=None):
     """Determines whether or not the specified mod can be converted to a light
     plugin. Optionally also returns the reasons it can't be converted.
 
@@ -134,27 +153,17 @@ def is_esl_capable(modInfo, _minfos, reasons):
     :param reasons: A list of strings that should be filled with the reasons
                     why this mod can't be ESL flagged, or None if only the
                     return value of this method is of interest.
+    :param merge_scan: The MergeScan of the mod, if it was already scanned.
     :return: True if the specified mod could be flagged as ESL."""
     verbose = reasons is not None
-    record_headers = {}
-    try:
-        record_headers = ModHeaderReader.read_mod_headers(modInfo)
-    except ModError as e:
+    merge_scan = _merge_scan(modInfo, merge_scan, LoadFactory(False))
+    if merge_scan.error is not None:
         if not verbose: return False
-        reasons.append(u'%s.' % e)
+        reasons.append(u'%s.' % merge_scan.error)
     # Check for new FormIDs greater then 0xFFF
-    num_masters = len(modInfo.header.masters)
-    has_new_recs = False
-    for _rec_type, rec_headers in record_headers.iteritems():
-        for header in rec_headers:
-            if header.fid >> 24 >= num_masters:
-                if (header.fid & 0xFFFFFF) > 0xFFF:
-                    has_new_recs = True
-                    break
-        if has_new_recs:
-            if not verbose: return False
-            reasons.append(_(u'New FormIDs greater than 0xFFF.'))
-            break
+    elif merge_scan.has_high_new_fids:
+        if not verbose: return False
+        reasons.append(_(u'New FormIDs greater than 0xFFF.'))
     return False if reasons else True
 
 def _modIsMergeableLoad(modInfo, minfos, reasons):
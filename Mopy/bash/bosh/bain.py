@@ -30,24 +30,60 @@
 import os
 import re
 import sys
+import tempfile
 import time
-from binascii import crc32
 from functools import partial, wraps
-from itertools import groupby, imap
+from itertools import groupby, imap, izip, repeat
 from operator import itemgetter, attrgetter
 
 from . import imageExts, DataStore, BestIniFile, InstallerConverter, ModInfos
 from .. import balt, gui # YAK!
 from .. import bush, bass, bolt, env, archives
 from ..archives import readExts, defaultExt, list_archive, compress7z, \
-    extract7z, compressionSettings
+    extract7z, compressionSettings, archive_listing
 from ..bolt import Path, deprint, round_size, GPath, sio, SubProgress, CIstr, \
     LowerDict, AFile
 from ..exception import AbstractError, ArgumentError, BSAError, CancelError, \
     InstallerArchiveError, SkipError, StateError, FileError
+from .loot_conditions import reset_eval_context
 from ..ini_files import OBSEIniFile
 
 os_sep = unicode(os.path.sep)
+# lowercase, as it is the safety check for Path.rmtree
+_STAGING_PREFIX = u'wryebash_staging_'
+
+def _same_volume(path_a, path_b):
+    """Return True if the two (existing) paths are on the same volume, so
+    files can be renamed from one to the other."""
+    if os.name == u'nt': # st_dev is always 0 on Windows in python 2
+        return os.path.splitdrive(os.path.abspath(path_a))[0].lower() == \
+               os.path.splitdrive(os.path.abspath(path_b))[0].lower()
+    return os.stat(path_a).st_dev == os.stat(path_b).st_dev
+
+def _rename_files(source_paths, dests):
+    """Move the specified files into place by renaming them, creating any
+    missing parent directories. Returns the (source, dest) lists of the files
+    that could not be renamed - e.g. if they are on different volumes - for
+    the caller to move some other way.
+
+    :type source_paths: list[Path]
+    :type dests: list[Path]"""
+    left_sources, left_dests = [], []
+    for index, (src, dest) in enumerate(izip(source_paths, dests)):
+        try:
+            dest.head.makedirs()
+            # on Windows rename fails if dest exists, so remove it first - if
+            # dest is read only this raises and the caller gets to move it
+            if os.name == u'nt' and dest.exists(): dest.remove()
+            os.rename(src.s, dest.s)
+        except OSError as e:
+            if e.errno == errno.EXDEV: # no point in trying the rest
+                left_sources.extend(source_paths[index:])
+                left_dests.extend(dests[index:])
+                break
+            left_sources.append(src)
+            left_dests.append(dest)
+    return left_sources, left_dests
 
 class Installer(object):
     """Object representing an installer archive, its user configuration, and
@@ -113,6 +149,24 @@ def init_bain_dirs():
         user_skipped = bass.inisettings['SkippedBashInstallersDirs'].split(u'|')
         InstallersData.installers_dir_skips.update(
             skipped.lower() for skipped in user_skipped if skipped)
+        Installer._sweep_staging_dirs()
+
+    @staticmethod
+    def _sweep_staging_dirs():
+        """Remove the staging dirs (and their file lists) that an earlier run
+        left in Bash Mod Data, e.g. because it crashed while installing - see
+        InstallersData._stage_installs."""
+        staging_root = bass.dirs['modsBash']
+        for leftover in staging_root.list():
+            if not leftover.cs.startswith(_STAGING_PREFIX): continue
+            leftover = staging_root.join(leftover)
+            if leftover.isdir():
+                Installer._rm_staging_dir(leftover)
+            else:
+                try:
+                    leftover.remove()
+                except OSError:
+                    deprint(u'Failed to remove %s' % leftover, traceback=True)
 
     tempList = Path.baseTempDir().join(u'WryeBash_InstallerTempList.txt')
 
@@ -126,18 +180,17 @@ def getGhosted():
                               not dataDir.join(x).root.exists())
 
     @staticmethod
-    def final_update(new_sizeCrcDate, old_sizeCrcDate, pending, pending_size,
-                     progress, recalculate_all_crcs, rootName):
+    def final_update(new_sizeCrcDate, old_sizeCrcDate, pending, progress,
+                     recalculate_all_crcs, rootName):
         """Clear old_sizeCrcDate and update it with new_sizeCrcDate after
         calculating crcs for pending."""
         #--Force update?
         if recalculate_all_crcs:
             pending.update(new_sizeCrcDate)
-            pending_size += sum(x[0] for x in new_sizeCrcDate.itervalues())
         changed = bool(pending) or (len(new_sizeCrcDate) != len(old_sizeCrcDate))
         #--Update crcs?
-        Installer.calc_crcs(pending, pending_size, rootName,
-                            new_sizeCrcDate, progress)
+        Installer.calc_crcs(pending, rootName, new_sizeCrcDate, progress,
+                            recalculate=recalculate_all_crcs)
         # drop _asFile
         old_sizeCrcDate.clear()
         for rpFile, (size, crc, date, _asFile) in new_sizeCrcDate.iteritems():
@@ -145,34 +198,24 @@ def final_update(new_sizeCrcDate, old_sizeCrcDate, pending, pending_size,
         return changed
 
     @staticmethod
-    def calc_crcs(pending, pending_size, rootName, new_sizeCrcDate, progress):
+    def calc_crcs(pending, rootName, new_sizeCrcDate, progress,
+                  recalculate=False):
+        """Calculate the crcs of the files in pending and add them to
+        new_sizeCrcDate. The crcs of files in the Data folder are looked up
+        in (and added to) the shared CRC cache, unless recalculate is True,
+        see crc_cache.CrcCache."""
         if not pending: return
-        done = 0
-        progress_msg= rootName + u'\n' + _(u'Calculating CRCs...') + u'\n'
-        progress(0, progress_msg)
-        # each mod increments the progress bar by at least one, even if it
-        # is size 0 - add len(pending) to the progress bar max to ensure we
-        # don't hit 100% and cause the progress bar to prematurely disappear
-        progress.setFull(pending_size + len(pending))
-        for rpFile, (size, _crc, date, asFile) in iter(sorted(pending.items())):
-            progress(done, progress_msg + rpFile)
-            sub = bolt.SubProgress(progress, done, done + size + 1)
-            sub.setFull(size + 1)
-            crc = 0
+        from . import crcCache
+        progress_msg = rootName + u'\n' + _(u'Calculating CRCs...') + u'\n'
+        path_crcs = crcCache.get_crcs(
+            [asFile for _size, _crc, _date, asFile in pending.itervalues()],
+            progress, progress_msg, recalculate)
+        for rpFile, (size, _crc, date, asFile) in pending.iteritems():
             try:
-                with open(asFile, u'rb') as ins:
-                    insTell = ins.tell
-                    for block in iter(partial(ins.read, 2097152), ''):
-                        crc = crc32(block, crc) # 2MB at a time, probably ok
-                        sub(insTell())
-            except IOError:
-                deprint(u'Failed to calculate crc for %s - please report '
-                        u'this, and the following traceback:' % asFile,
-                        traceback=True)
-                continue
-            crc &= 0xFFFFFFFF
-            done += size + 1
-            new_sizeCrcDate[rpFile] = (size, crc, date, asFile)
+                new_sizeCrcDate[rpFile] = (size, path_crcs[asFile], date,
+                                           asFile)
+            except KeyError:
+                continue # failed to calculate it, crc_cache logged why
 
     #--Initialization, etc ----------------------------------------------------
     def initDefault(self):
@@ -186,7 +229,7 @@ def initDefault(self):
         self.blockSize = None #--package only - set here and there
         self.fileSizeCrcs = [] #--list of tuples for _all_ files in installer
         #--For InstallerProject's, cache if refresh projects is skipped
-        self.src_sizeCrcDate = bolt.LowerDict()
+        self.src_sizeCrcDate = bolt.SizeCrcTable()
         #--Set by refreshBasic
         self.fileRootIdex = 0 # len of the root path including the final separator
         self.type = 0 #--Package type: 0: unset/invalid; 1: simple; 2: complex
@@ -212,9 +255,10 @@ def initDefault(self):
         self.project_refreshed = False
         self._dir_dirs_files = None
         #--Volatile: set by refreshDataSizeCrc
-        # LowerDict mapping destinations (relative to Data/ directory) of files
-        # in this installer to their size and crc - built in refreshDataSizeCrc
-        self.ci_dest_sizeCrc = bolt.LowerDict()
+        # SizeCrcTable mapping destinations (relative to Data/ directory) of
+        # files in this installer to their size and crc - built in
+        # refreshDataSizeCrc
+        self.ci_dest_sizeCrc = bolt.SizeCrcTable(2)
         self.has_fomod_conf = False
         self.hasWizard = False
         self.hasBCF = False
@@ -298,8 +342,6 @@ def __getstate__(self):
         return tuple(getter(self,x) for x in self.persistent)
 
     def _fixme_drop__for_loading_in_previous_versions(self):
-        self.src_sizeCrcDate = dict( # FIXME: backwards compat !
-            (GPath(x), y) for x, y in self.src_sizeCrcDate.iteritems())
         self.dirty_sizeCrc = dict(
             (GPath(x), y) for x, y in self.dirty_sizeCrc.iteritems())
         self.fileSizeCrcs = [(unicode(x), y, z) for x, y, z in
@@ -340,9 +382,9 @@ def __setstate(self,values):
             rescan = True ##: for people that used my wip branch, drop on 307
         if not self.ipath.exists():  # pickled installer deleted outside bash
             return  # don't do anything should be deleted from our data soon
-        if not isinstance(self.src_sizeCrcDate, bolt.LowerDict):
-            self.src_sizeCrcDate = bolt.LowerDict(
-                ('%s' % x, y) for x, y in self.src_sizeCrcDate.iteritems())
+        if not isinstance(self.src_sizeCrcDate, bolt.SizeCrcTable):
+            self.src_sizeCrcDate = bolt.SizeCrcTable(3, (
+                ('%s' % x, y) for x, y in self.src_sizeCrcDate.iteritems()))
         if not isinstance(self.dirty_sizeCrc, bolt.LowerDict):
             self.dirty_sizeCrc = bolt.LowerDict(
                 ('%s' % x, y) for x, y in self.dirty_sizeCrc.iteritems())
@@ -665,7 +707,7 @@ def refreshDataSizeCrc(self, checkOBSE=False, splitExt=os.path.splitext):
         activeSubs = (
             set(x for x, y in zip(self.subNames[1:], self.subActives[1:]) if y)
             if bain_type == 2 else set())
-        data_sizeCrc = bolt.LowerDict()
+        data_sizeCrc = bolt.SizeCrcTable(2)
         skipDirFiles = self.skipDirFiles
         skipDirFilesAdd = skipDirFiles.add
         skipDirFilesDiscard = skipDirFiles.discard
@@ -1117,9 +1159,9 @@ def _installer_rename(self, data, newName):
                           iniInfos.table[x]['installer'] == self.archive]
                 self.archive = newName.s # don't forget to rename !
                 for i in mfiles:
-                    modInfos.table[i]['installer'] = self.archive
+                    modInfos.table.setItem(i, 'installer', self.archive)
                 for i in ifiles:
-                    iniInfos.table[i]['installer'] = self.archive
+                    iniInfos.table.setItem(i, 'installer', self.archive)
                 return True, bool(mfiles), bool(ifiles)
         return False, False, False
 
@@ -1143,23 +1185,52 @@ def _refreshSource(self, progress, recalculate_project_crc):
         """
         raise AbstractError
 
-    def install(self, destFiles, progress=None):
-        """Install specified files to Game\Data directory."""
+    def files_to_install(self, destFiles):
+        """Return a dict mapping those of destFiles this installer has to
+        their paths in the package."""
         destFiles = set(destFiles)
         dest_src = self.refreshDataSizeCrc(True)
         for k in dest_src.keys():
             if k not in destFiles: del dest_src[k]
-        if not dest_src: return bolt.LowerDict(), set(), set(), set()
+        return dest_src
+
+    def stage_install(self, dest_src, staging_root, progress=None):
+        """Prepare the files in dest_src (see files_to_install) for install
+        into a new directory under staging_root and return it - or None if
+        they are installed straight from the package. Called from background
+        threads, see InstallersData._stage_installs - so progress must be a
+        bolt.ThreadSubProgress."""
+        return None
+
+    def install(self, destFiles, progress=None, staged=None):
+        """Install specified files to Game\Data directory.
+
+        :param staged: the dest_src dict and staging dir of destFiles, if
+            they were staged in advance (see stage_install) - the staging dir
+            is removed once done."""
+        dest_src, unpack_dir = staged or (self.files_to_install(destFiles),
+                                          None)
+        if not dest_src:
+            if unpack_dir: self._rm_staging_dir(unpack_dir)
+            return bolt.LowerDict(), set(), set(), set()
         progress = progress if progress else bolt.Progress()
-        return self._install(dest_src, progress)
+        return self._install(dest_src, progress, unpack_dir)
 
-    def _install(self, dest_src, progress):
+    def _install(self, dest_src, progress, unpack_dir=None):
         raise AbstractError
 
+    @staticmethod
+    def _rm_staging_dir(unpack_dir):
+        try:
+            unpack_dir.rmtree(safety=_STAGING_PREFIX)
+        except OSError:
+            deprint(u'Failed to remove %s' % unpack_dir, traceback=True)
+
     def _fs_install(self, dest_src, srcDirJoin, progress,
                     subprogressPlus, unpackDir):
         """Filesystem install, if unpackDir is not None we are installing
-         an archive."""
+         an archive - its files are placed from the install cache, or moved
+         (renamed if possible) from unpackDir, instead of copied."""
         norm_ghostGet = Installer.getGhosted().get
         data_sizeCrcDate_update = bolt.LowerDict()
         data_sizeCrc = self.ci_dest_sizeCrc
@@ -1188,13 +1259,23 @@ def _fs_install(self, dest_src, srcDirJoin, progress,
             add_dest(join_data_dir(norm_ghostGet(dest, dest)))
             subprogressPlus()
         #--Now Move
-        try:
-            if data_sizeCrcDate_update:
-                fs_operation = env.shellMove if unpackDir else env.shellCopy
-                fs_operation(source_paths, dests, progress.getParent())
-        finally:
-            #--Clean up unpack dir if we're an archive
-            if unpackDir: bass.rmTempDir()
+        if unpackDir:
+            from . import installCache
+            if installCache is not None:
+                to_move, to_copy = installCache.place_files(
+                    [data_sizeCrc[dest] for dest in dest_src], source_paths,
+                    dests)
+                source_paths = [src for src, _dest in to_move]
+                dests = [dest for _src, dest in to_move]
+                if to_copy:
+                    env.shellCopy([src for src, _dest in to_copy],
+                                  [dest for _src, dest in to_copy],
+                                  progress.getParent())
+            source_paths, dests = _rename_files(source_paths, dests)
+            if source_paths:
+                env.shellMove(source_paths, dests, progress.getParent())
+        elif data_sizeCrcDate_update:
+            env.shellCopy(source_paths, dests, progress.getParent())
         #--Update Installers data
         return data_sizeCrcDate_update, mods, inis, bsas
 
@@ -1259,7 +1340,7 @@ def _refreshSource(self, progress, recalculate_project_crc):
         """Marker: size is -1, fileSizeCrcs empty, modified = creation time."""
         pass
 
-    def install(self, destFiles, progress=None):
+    def install(self, destFiles, progress=None, staged=None):
         """Install specified files to Oblivion\Data directory."""
         pass
 
@@ -1281,6 +1362,8 @@ class InstallerArchive(Installer):
     """Represents an archive installer entry."""
     __slots__ = tuple() #--No new slots
     type_string = _(u'Archive')
+    # archive path -> listing of it, see prefetch_listing
+    _listings = {}
 
     @classmethod
     def is_archive(cls): return True
@@ -1310,60 +1393,115 @@ def _parse_archive_line(key, value):
             elif key == u'CRC' and value: _li.crc = int(value,16)
             elif key == u'Method':
                 if _li.filepath and not _li.isdir and _li.filepath != \
-                        tempArch.s:
+                        listed_path:
                     fileSizeCrcs.append((_li.filepath, _li.size, _li.crc))
                     _li.cumCRC += _li.crc
                 _li.filepath = _li.size = _li.crc = _li.isdir = 0
-        with self.ipath.unicodeSafe() as tempArch:
-            try:
-                list_archive(tempArch, _parse_archive_line)
-                self.crc = _li.cumCRC & 0xFFFFFFFF
-            except:
-                archive_msg = u"Unable to read archive '%s'." % self.ipath.s
-                deprint(archive_msg, traceback=True)
-                raise InstallerArchiveError(archive_msg)
+        try:
+            listed_path, listing = self._listings.pop(
+                self.ipath, None) or self.prefetch_listing(self.ipath)
+            list_archive(self.ipath, _parse_archive_line, listing=listing)
+            self.crc = _li.cumCRC & 0xFFFFFFFF
+        except:
+            archive_msg = u"Unable to read archive '%s'." % self.ipath.s
+            deprint(archive_msg, traceback=True)
+            raise InstallerArchiveError(archive_msg)
+
+    @staticmethod
+    def prefetch_listing(archive_path):
+        """Return the path 7z was passed for the archive and the output of
+        listing it. Used to list several archives at once in background
+        threads, see InstallersData._refreshInstallers - so it must not touch
+        the installer."""
+        with archive_path.unicodeSafe() as tempArch:
+            return tempArch.s, archive_listing(tempArch)
 
     def unpackToTemp(self, fileNames, progress=None, recurse=False):
         """Erases all files from self.tempDir and then extracts specified files
         from archive to self.tempDir. progress will be zeroed so pass a
         SubProgress in.
         fileNames: File names (not paths)."""
+        #--Ensure temp dir empty
+        bass.rmTempDir()
+        unpack_dir = bass.getTempDir()
+        self._extract_files(fileNames, unpack_dir, self.tempList, progress,
+                            recurse)
+        #--Done -> don't clean out temp dir, it's going to be used soon
+        return unpack_dir
+
+    def _extract_files(self, fileNames, unpack_dir, list_path, progress=None,
+                       recurse=False):
+        """Extract the specified files from the archive to unpack_dir, using
+        list_path for the list of files passed to 7z."""
         if not fileNames: raise ArgumentError(
             u'No files to extract for %s.' % self.archive)
-        # expand wildcards in fileNames to get actual count of files to extract
         #--Dump file list
-        with self.tempList.open('w',encoding='utf8') as out:
+        with list_path.open('w',encoding='utf8') as out:
             out.write(u'\n'.join(fileNames))
-        #--Ensure temp dir empty
-        bass.rmTempDir()
         with self.ipath.unicodeSafe() as arch:
             if progress:
                 progress.state = 0
                 progress.setFull(len(fileNames))
             #--Extract files
-            unpack_dir = bass.getTempDir()
             try:
                 extract7z(arch, unpack_dir, progress, recursive=recurse,
-                          filelist_to_extract=self.tempList.s)
+                          filelist_to_extract=list_path.s)
             finally:
-                self.tempList.remove()
+                list_path.remove()
                 bolt.clearReadOnly(unpack_dir)
-        #--Done -> don't clean out temp dir, it's going to be used soon
+
+    def _files_to_extract(self, dest_src, unpack_dir):
+        """Return the sources in dest_src that are neither in unpack_dir nor
+        in the install cache."""
+        from . import installCache
+        dest_sizeCrc = self.ci_dest_sizeCrc
+        cached = () if installCache is None else installCache.cached_keys(
+            {dest_sizeCrc[dest] for dest in dest_src})
+        join = unpack_dir.join
+        return [src for dest, src in dest_src.iteritems() if
+                dest_sizeCrc[dest] not in cached and not join(src).exists()]
+
+    def stage_install(self, dest_src, staging_root, progress=None):
+        # each archive gets its own dir and file list, as several archives
+        # may be extracted at once
+        unpack_dir = GPath(tempfile.mkdtemp(prefix=_STAGING_PREFIX,
+                                            dir=staging_root.s))
+        try:
+            to_extract = self._files_to_extract(dest_src, unpack_dir)
+            if to_extract:
+                self._extract_files(to_extract, unpack_dir,
+                                    unpack_dir + u'.txt', progress)
+        except:
+            self._rm_staging_dir(unpack_dir)
+            raise
         return unpack_dir
 
-    def _install(self, dest_src, progress):
-        #--Extract
-        progress(0, self.archive + u'\n' + _(u'Extracting files...'))
-        unpackDir = self.unpackToTemp(dest_src.values(),
-                                      SubProgress(progress, 0, 0.9))
-        #--Rearrange files
-        progress(0.9, self.archive + u'\n' + _(u'Organizing files...'))
-        srcDirJoin = unpackDir.join
-        subprogress = SubProgress(progress,0.9,1.0)
-        subprogress.setFull(len(dest_src))
-        subprogressPlus = subprogress.plus
-        return self._fs_install(dest_src, srcDirJoin, progress,
-                                subprogressPlus, unpackDir)
+    def _install(self, dest_src, progress, unpack_dir=None):
+        staged = unpack_dir is not None
+        if not staged:
+            bass.rmTempDir()
+            unpack_dir = bass.getTempDir()
+        try:
+            #--Extract - only the files that were not extracted in advance
+            #  and are not in the install cache
+            to_extract = self._files_to_extract(dest_src, unpack_dir)
+            if to_extract:
+                progress(0, self.archive + u'\n' + _(u'Extracting files...'))
+                self._extract_files(to_extract, unpack_dir,
+                                    unpack_dir + u'.txt',
+                                    SubProgress(progress, 0, 0.9))
+            #--Rearrange files
+            progress(0.9, self.archive + u'\n' + _(u'Organizing files...'))
+            srcDirJoin = unpack_dir.join
+            subprogress = SubProgress(progress,0.9,1.0)
+            subprogress.setFull(len(dest_src))
+            subprogressPlus = subprogress.plus
+            return self._fs_install(dest_src, srcDirJoin, progress,
+                                    subprogressPlus, unpack_dir)
+        finally:
+            #--Clean up unpack dir
+            if staged: self._rm_staging_dir(unpack_dir)
+            else: bass.rmTempDir()
 
     def unpackToProject(self, project, progress=None):
         """Unpacks archive to build directory."""
@@ -1524,7 +1662,7 @@ def _refresh_from_project_dir(self, progress=None,
         asRoot = apRoot.s
         relPos = len(asRoot) + 1
         max_mtime = apRoot.mtime
-        pending, pending_size = bolt.LowerDict(), 0
+        pending = bolt.LowerDict()
         new_sizeCrcDate = bolt.LowerDict()
         oldGet = self.src_sizeCrcDate.get
         walk = self._dir_dirs_files if self._dir_dirs_files is not None else bolt.walkdir(asRoot)
@@ -1546,10 +1684,8 @@ def _refresh_from_project_dir(self, progress=None,
                     new_sizeCrcDate[rpFile] = (oSize, oCrc, oDate, asFile)
                 else:
                     pending[rpFile] = (size, oCrc, date, asFile)
-                    pending_size += size
         Installer.final_update(new_sizeCrcDate, self.src_sizeCrcDate, pending,
-                               pending_size, progress, recalculate_all_crcs,
-                               rootName)
+                               progress, recalculate_all_crcs, rootName)
         #--Done
         return int(max_mtime)
 
@@ -1557,11 +1693,17 @@ def size_or_mtime_changed(self, apath, _lstat=os.lstat):
         #FIXME(ut): getmtime(True) won't detect all changes - for instance COBL
         # has 3/25/2020 8:02:00 AM modification time if unpacked and no
         # amount of internal shuffling won't change its apath.getmtime(True)
+        from . import changeJournal
+        if changeJournal is not None:
+            if changeJournal.dirty_dirs(u'projects', apath.s) == {}:
+                return False # nothing changed since we last found it unchanged
+            walk = changeJournal.walk
+        else: walk = bolt.walkdir
         getM, join = os.path.getmtime, os.path.join
         c, size = [], 0
         cExtend, cAppend = c.extend, c.append
         self._dir_dirs_files = []
-        for root, d, files in bolt.walkdir(apath.s):
+        for root, d, files in walk(apath.s):
             cAppend(getM(root))
             lstats = [_lstat(join(root, f)) for f in files]
             cExtend(ls.st_mtime for ls in lstats)
@@ -1576,7 +1718,11 @@ def size_or_mtime_changed(self, apath, _lstat=os.lstat):
             mtime = int(max(c))
         except ValueError: # int(max([]))
             mtime = 0
-        return self.modified != mtime
+        if self.modified != mtime: return True
+        # only trust the journal once we know the project is up to date
+        if changeJournal is not None:
+            changeJournal.mark_clean(u'projects', apath.s)
+        return False
 
     def _refreshSource(self, progress, recalculate_project_crc):
         """Refresh src_sizeCrcDate, fileSizeCrcs, size, modified, crc from
@@ -1596,7 +1742,7 @@ def _refreshSource(self, progress, recalculate_project_crc):
         self.crc = cumCRC & 0xFFFFFFFF
         self.project_refreshed = True
 
-    def _install(self, dest_src, progress):
+    def _install(self, dest_src, progress, unpack_dir=None):
         progress.setFull(len(dest_src))
         progress(0, self.archive + u'\n' + _(u'Moving files...'))
         progressPlus = progress.plus
@@ -1649,6 +1795,126 @@ def _projects_walk_cache_wrapper(self, *args, **kwargs):
                     project._dir_dirs_files = None
     return _projects_walk_cache_wrapper
 
+#------------------------------------------------------------------------------
+class _OwnershipIndex(object):
+    """Inverted index of the files all installers would install, mapping
+    each (lowercase) destination path to the installers owning it. Kept up to
+    date by sync, which only reindexes the installers that were added,
+    removed, refreshed or (de)activated since the last sync - so conflict
+    and anneal queries only cost as much as the files they ask about.
+
+    Also keeps track of the highest order active owner of each file, i.e.
+    the installer whose version of the file should be in the Data folder.
+
+    An installer is reindexed when its ci_dest_sizeCrc is replaced by another
+    table, as refreshDataSizeCrc does - ci_dest_sizeCrc must never be edited
+    in place. As a check, a table whose size changed since it was indexed is
+    reindexed too, at the cost of a scan of the whole index."""
+
+    def __init__(self):
+        # dest path -> list of (installer, ci_dest, (size, crc)) - the CIstr
+        # and the tuple are the ones in installer.ci_dest_sizeCrc
+        self._owners = {}
+        # installer -> (ci_dest_sizeCrc, is_active, order, number of files)
+        # when last synced
+        self._indexed = {}
+        # dest path -> (installer, ci_dest, (size, crc)) of the highest order
+        # active owner
+        self._norm = {}
+
+    def sync(self, installers):
+        """Update the index to reflect the current state of installers, which
+        must be all installers in InstallersData. If any installer's order
+        changed, the norm of all files owned by more than one installer is
+        recalculated, since that's where order matters."""
+        dirty = set()
+        current = set(installers)
+        for gone in [i for i in self._indexed if i not in current]:
+            dirty.update(self._unindex(gone))
+            del self._indexed[gone]
+        reordered = False
+        for installer in current:
+            dest_sizeCrc = installer.ci_dest_sizeCrc
+            indexed = self._indexed.get(installer)
+            if indexed is None or indexed[0] is not dest_sizeCrc:
+                if indexed is not None: dirty.update(self._unindex(installer))
+                dirty.update(self._index(installer, dest_sizeCrc))
+            elif indexed[3] != len(dest_sizeCrc):
+                deprint(u'%s: ci_dest_sizeCrc was edited in place' %
+                        installer.archive)
+                dirty.update(self._unindex(installer, edited=True))
+                dirty.update(self._index(installer, dest_sizeCrc))
+            elif indexed[1] != installer.is_active:
+                dirty.update(ci_dest.lower() for ci_dest in dest_sizeCrc)
+            elif indexed[2] != installer.order:
+                reordered = True
+            self._indexed[installer] = (dest_sizeCrc, installer.is_active,
+                                        installer.order, len(dest_sizeCrc))
+        if reordered:
+            dirty.update(dest for dest, dest_owners in self._owners.iteritems()
+                         if len(dest_owners) > 1)
+        owners_get = self._owners.get
+        norm = self._norm
+        for dest in dirty:
+            dest_owners = owners_get(dest, ())
+            if len(dest_owners) == 1 and dest_owners[0][0].is_active:
+                norm[dest] = dest_owners[0]
+                continue
+            active_owners = [o for o in dest_owners if o[0].is_active]
+            if active_owners:
+                norm[dest] = max(active_owners, key=lambda o: o[0].order)
+            else:
+                norm.pop(dest, None)
+
+    def _index(self, installer, dest_sizeCrc):
+        """Add the files of installer, returning their lowercase paths."""
+        owners = self._owners
+        added = [ci_dest.lower() for ci_dest in dest_sizeCrc]
+        for dest, (ci_dest, sizeCrc) in izip(added,
+                                             dest_sizeCrc.iteritems()):
+            try:
+                owners[dest].append((installer, ci_dest, sizeCrc))
+            except KeyError:
+                owners[dest] = [(installer, ci_dest, sizeCrc)]
+        return added
+
+    def _unindex(self, installer, edited=False):
+        """Remove the files installer had when it was last indexed, returning
+        their lowercase paths. If its table was edited since, it no longer
+        tells which files those were, so the whole index is searched."""
+        owners = self._owners
+        removed = []
+        if edited:
+            indexed_dests = [d for d, dest_owners in owners.iteritems() if any(
+                o[0] is installer for o in dest_owners)]
+        else:
+            indexed_dests = (ci_dest.lower() for ci_dest in
+                             self._indexed[installer][0])
+        for dest in indexed_dests:
+            dest_owners = [o for o in owners[dest] if o[0] is not installer]
+            if dest_owners:
+                owners[dest] = dest_owners
+            else:
+                del owners[dest]
+            removed.append(dest)
+        return removed
+
+    def get_owners(self, ci_dest):
+        """Return a list of (installer, ci_dest, (size, crc)) tuples for the
+        installers owning ci_dest, sorted by install order."""
+        return sorted(self._owners.get(ci_dest.lower(), ()),
+                      key=lambda o: o[0].order)
+
+    def get_norm(self, ci_dest):
+        """Return the (installer, ci_dest, (size, crc)) tuple of the highest
+        order active installer owning ci_dest, or None if there is none."""
+        return self._norm.get(ci_dest.lower())
+
+    def iter_norm(self):
+        """Iterate over the (installer, ci_dest, (size, crc)) tuples of the
+        highest order active owner of each file."""
+        return self._norm.itervalues()
+
 #------------------------------------------------------------------------------
 class InstallersData(DataStore):
     """Installers tank data. This is the data source for the InstallersList."""
@@ -1675,13 +1941,17 @@ def __init__(self):
         #--Persistent data
         self.dictFile = bolt.PickleDict(self.bash_dir.join(u'Installers.dat'))
         self.data = {}
-        self.data_sizeCrcDate = bolt.LowerDict()
+        self.data_sizeCrcDate = bolt.SizeCrcTable()
         from . import converters
         self.converters_data = converters.ConvertersData(bass.dirs['bainData'],
             bass.dirs['converters'], bass.dirs['dupeBCFs'],
             bass.dirs['corruptBCFs'], bass.dirs['installers'])
         #--Volatile
         self.ci_underrides_sizeCrc = bolt.LowerDict() # underridden files
+        self._ownership = _OwnershipIndex() # see sync_ownership
+        # _data_dir_skips_state when data_sizeCrcDate was last synced with the
+        # change journal
+        self._journal_skips_state = None
         self.bcfPath_sizeCrcDate = {}
         self.hasChanged = False
         self.loaded = False
@@ -1722,7 +1992,7 @@ def irefresh(self, progress=None, what='DIONSC', fullRefresh=False,
         if self.lastKey not in self.data:
             self.data[self.lastKey] = InstallerMarker(self.lastKey)
         if fullRefresh: # BAIN uses modInfos crc cache
-            with gui.BusyCursor(): modInfos.refresh_crcs()
+            with gui.BusyCursor(): modInfos.refresh_crcs(progress=progress)
         #--Refresh Other - FIXME(ut): docs
         if 'D' in what:
             changed |= self._refresh_from_data_dir(progress, fullRefresh)
@@ -1744,8 +2014,9 @@ def __load(self, progress):
         data = self.dictFile.data
         self.data = data.get('installers', {})
         pickle = data.get('sizeCrcDate', {})
-        self.data_sizeCrcDate = bolt.LowerDict(pickle) if not isinstance(
-            pickle, bolt.LowerDict) else pickle
+        self.data_sizeCrcDate = pickle if isinstance(
+            pickle, bolt.SizeCrcTable) else bolt.SizeCrcTable(3, (
+            ('%s' % x, y) for x, y in pickle.iteritems()))
         # fixup: all markers had their archive attribute set to u'===='
         for key, value in self.iteritems():
             if value.is_marker():
@@ -1757,15 +2028,18 @@ def save(self):
         """Saves to pickle file."""
         if self.hasChanged:
             self.dictFile.data['installers'] = self.data
-            self.dictFile.data['sizeCrcDate'] = dict( # FIXME: backwards compat
-                (GPath(x), y) for x, y in self.data_sizeCrcDate.iteritems())
+            self.dictFile.data['sizeCrcDate'] = self.data_sizeCrcDate
             # for backwards compatibility, drop
             self.dictFile.data['crc_installer'] = dict(
                 (x.crc, x) for x in self.itervalues() if x.is_archive())
-            self.dictFile.vdata['version'] = 1
+            self.dictFile.vdata['version'] = 2
             self.dictFile.save()
             self.converters_data.save()
             self.hasChanged = False
+        from . import bsaIndex, crcCache, installCache
+        crcCache.save()
+        bsaIndex.save()
+        if installCache is not None: installCache.save()
 
     def _rename_operation(self, oldName, newName):
         return self[oldName].renameInstaller(newName, self)
@@ -1861,12 +2135,40 @@ def _refreshInstallers(self, progress, fullRefresh, refresh_info, deleted,
             if not subPending: continue
             progress(0,_(u"Scanning Packages..."))
             progress.setFull(len(subPending))
-            for index,package in enumerate(sorted(subPending)):
-                progress(index,_(u'Scanning Packages...')+u'\n'+package.s)
-                self.refresh_installer(package, is_project, progress,
-                                       _index=index, _fullRefresh=fullRefresh)
+            subPending = sorted(subPending)
+            listings = repeat(None) if is_project else self._prefetch_listings(
+                subPending, progress)
+            try:
+                for index, (package, listing) in enumerate(izip(subPending,
+                                                                listings)):
+                    progress(index,_(u'Scanning Packages...')+u'\n'+package.s)
+                    if listing:
+                        InstallerArchive._listings[
+                            bass.dirs['installers'].join(package)] = listing
+                    self.refresh_installer(package, is_project, progress,
+                        _index=index, _fullRefresh=fullRefresh)
+            finally:
+                InstallerArchive._listings.clear()
         return changed
 
+    @staticmethod
+    def _prefetch_listings(archives, progress):
+        """Yield the listings of the specified archives in order, listing up
+        to ExtractProcesses of them ahead in background threads. Yields None
+        for archives that could not be listed, _refreshSource will list them
+        again and report the error."""
+        installers_dir = bass.dirs['installers']
+        def _listing(archive):
+            try:
+                return InstallerArchive.prefetch_listing(
+                    installers_dir.join(archive))
+            except Exception:
+                return None
+        num_threads = bass.inisettings['ExtractProcesses']
+        return bolt.ordered_thread_map(_listing, archives, num_threads,
+            max_ahead=num_threads,
+            wait_callback=lambda: progress(progress.state))
+
     def refresh_installer(self, package, is_project, progress,
                           install_order=None, do_refresh=False, _index=None,
                           _fullRefresh=False):
@@ -1955,6 +2257,10 @@ def scan_installers_dir(self, installers_paths=(), fullRefresh=False):
         projects/packages, skipping as necessary. It will refresh projects on
         boot.
         :rtype: InstallersData._RefreshInfo"""
+        from . import changeJournal
+        if changeJournal is not None:
+            # one watch for all projects on Windows, instead of one each
+            changeJournal.watch(bass.dirs['installers'].s)
         installers = set()
         installersJoin = bass.dirs['installers'].join
         pending, projects = set(), set()
@@ -2015,17 +2321,18 @@ def refreshOrder(self):
                 changed = True
         return changed
 
+    def sync_ownership(self):
+        """Bring the inverted index of the files each installer owns up to
+        date and return it."""
+        self._ownership.sync(self.values())
+        return self._ownership
+
     def refreshNorm(self):
         """Populate self.ci_underrides_sizeCrc with all underridden files."""
-        active_sorted = (x for x in self.sorted_values() if x.is_active)
-        #--dict mapping all should-be-installed files to their attributes
-        norm_sizeCrc = bolt.LowerDict()
-        for package in active_sorted:
-            norm_sizeCrc.update(package.ci_dest_sizeCrc)
-        #--Abnorm
+        #--Abnorm - compare all should-be-installed files to Data
         ci_underrides_sizeCrc = bolt.LowerDict()
         dataGet = self.data_sizeCrcDate.get
-        for path,sizeCrc in norm_sizeCrc.iteritems():
+        for _inst, path, sizeCrc in self.sync_ownership().iter_norm():
             sizeCrcDate = dataGet(path)
             if sizeCrcDate and sizeCrc != sizeCrcDate[:2]: # file is installed
                 # in data dir, but from a lower loading installer (or manually)
@@ -2048,9 +2355,35 @@ def _refresh_from_data_dir(self, progress=None, recalculate_all_crcs=False):
         Recalculates crcs for all espms in Data/ directory and all other
         files whose cached date or size has changed. Will skip directories (
         but not files) specified in Installer global skips and remove empty
-        dirs if the setting is on."""
-        #--Scan for changed files
+        dirs if the setting is on. If the change journal knows which
+        directories changed since the last refresh only those are rescanned,
+        else the whole Data directory is walked."""
+        from . import changeJournal
         progress = progress if progress else bolt.Progress()
+        asRoot = bass.dirs['mods'].s
+        dirty_dirs = skips_state = None
+        if changeJournal is not None:
+            dirty_dirs = changeJournal.dirty_dirs(u'bain', asRoot)
+            skips_state = self._data_dir_skips_state()
+            if recalculate_all_crcs or dirty_dirs and dirty_dirs.get(
+                    asRoot) or skips_state != self._journal_skips_state:
+                dirty_dirs = None
+        if dirty_dirs is None:
+            changed = self._walk_data_dir(progress, recalculate_all_crcs,
+                                          changeJournal)
+        else:
+            changed = self._rescan_data_dirs(dirty_dirs, progress)
+        if changeJournal is not None:
+            changeJournal.mark_clean(u'bain', asRoot)
+            self._journal_skips_state = skips_state
+        self.update_for_overridden_skips(progress=progress) #after final_update
+        #--Done
+        return changed
+
+    def _walk_data_dir(self, progress, recalculate_all_crcs, changeJournal):
+        """Walk the whole Data directory - watching it using changeJournal,
+        unless that is None - and rebuild data_sizeCrcDate from scratch."""
+        #--Scan for changed files
         progress_msg = bass.dirs['mods'].stail + u': ' + _(u'Pre-Scanning...')
         progress(0, progress_msg + u'\n')
         progress.setFull(1)
@@ -2058,44 +2391,115 @@ def _refresh_from_data_dir(self, progress=None, recalculate_all_crcs=False):
         dirDirsFilesAppend, emptyDirsAdd = dirDirsFiles.append, emptyDirs.add
         asRoot = bass.dirs['mods'].s
         relPos = len(asRoot) + 1
-        for asDir, sDirs, sFiles in bolt.walkdir(asRoot):
+        walk = changeJournal.walk if changeJournal is not None else \
+            bolt.walkdir
+        for asDir, sDirs, sFiles in walk(asRoot):
             progress(0.05, progress_msg + (u'\n%s' % asDir[relPos:]))
             if not (sDirs or sFiles): emptyDirsAdd(GPath(asDir))
             if asDir == asRoot: InstallersData._skips_in_data_dir(sDirs)
             dirDirsFilesAppend((asDir, sDirs, sFiles))
         progress(0, _(u"%s: Scanning...") % bass.dirs['mods'].stail)
-        new_sizeCrcDate, pending, pending_size = \
-            self._process_data_dir(dirDirsFiles, progress)
+        new_sizeCrcDate, pending = self._process_data_dir(dirDirsFiles,
+                                                          progress)
+        # Forget the cached crcs of files that are gone from Data
+        from . import crcCache
+        crcCache.retain(os.path.join(asDir[relPos:], sFile)
+                        for asDir, _sDirs, sFiles in dirDirsFiles
+                        for sFile in sFiles)
+        self._remove_empty_dirs(emptyDirs)
+        return Installer.final_update(new_sizeCrcDate, self.data_sizeCrcDate,
+                                      pending, progress, recalculate_all_crcs,
+                                      bass.dirs['mods'].stail)
+
+    def _rescan_data_dirs(self, dirty_dirs, progress):
+        """Rescan the directories in Data that the change journal reports as
+        changed and update data_sizeCrcDate in place - see
+        ChangeJournal.dirty_dirs for the format of dirty_dirs. Only the files
+        directly in a directory are rescanned, unless its whole tree
+        changed."""
+        progress(0, _(u"%s: Scanning...") % bass.dirs['mods'].stail)
+        asRoot = bass.dirs['mods'].s
+        relPos = len(asRoot) + 1
+        dirDirsFiles, emptyDirs = [], set()
+        # lowercase Data relative paths of the directories we rescanned, so
+        # that we can drop the entries of files that are gone
+        shallow_dirs, deep_prefixes = set(), []
+        top_dirs_kept = {}
+        for asDir, whole_tree in dirty_dirs.iteritems():
+            rsDir = asDir[relPos:]
+            if rsDir:
+                top_dir = rsDir.split(os.sep, 1)[0]
+                if top_dir not in top_dirs_kept:
+                    kept = [top_dir]
+                    InstallersData._skips_in_data_dir(kept)
+                    top_dirs_kept[top_dir] = bool(kept)
+                if not top_dirs_kept[top_dir]: continue
+            parent_dir = os.path.dirname(asDir) # rescanned along with a parent?
+            while len(parent_dir) > len(asRoot) and not dirty_dirs.get(
+                    parent_dir):
+                parent_dir = os.path.dirname(parent_dir)
+            if len(parent_dir) > len(asRoot): continue
+            if whole_tree:
+                deep_prefixes.append(rsDir.lower() + os.sep)
+                dir_walk = bolt.walkdir(asDir)
+            else:
+                shallow_dirs.add(rsDir.lower())
+                dir_walk = [next(bolt.walkdir(asDir), None)]
+            for dir_dirs_files in dir_walk:
+                if dir_dirs_files is None: continue # directory is gone
+                if not (dir_dirs_files[1] or dir_dirs_files[2]):
+                    emptyDirs.add(GPath(dir_dirs_files[0]))
+                dirDirsFiles.append(dir_dirs_files)
+        new_sizeCrcDate, pending = self._process_data_dir(dirDirsFiles,
+                                                          progress)
+        deep_prefixes = tuple(deep_prefixes)
+        def rescanned(rp_lower):
+            return rp_lower.rpartition(os.sep)[0] in shallow_dirs or \
+                   rp_lower.startswith(deep_prefixes)
+        # Forget the cached crcs of files that are gone from the directories
+        # we rescanned
+        from . import crcCache
+        crcCache.retain((os.path.join(asDir[relPos:], sFile)
+                         for asDir, _sDirs, sFiles in dirDirsFiles
+                         for sFile in sFiles), rescanned=rescanned)
+        self._remove_empty_dirs(emptyDirs)
+        Installer.calc_crcs(pending, bass.dirs['mods'].stail, new_sizeCrcDate,
+                            progress)
+        changed = False
+        if shallow_dirs or deep_prefixes:
+            for rpFile in self.data_sizeCrcDate.keys():
+                if rescanned(rpFile.lower()) and \
+                        rpFile not in new_sizeCrcDate:
+                    del self.data_sizeCrcDate[rpFile]
+                    changed = True
+        for rpFile, (size, crc, date, _asFile) in new_sizeCrcDate.iteritems():
+            if self.data_sizeCrcDate.get(rpFile) != (size, crc, date):
+                self.data_sizeCrcDate[rpFile] = (size, crc, date)
+                changed = True
+        return changed
+
+    @staticmethod
+    def _remove_empty_dirs(emptyDirs):
         #--Remove empty dirs?
         if not bass.settings['bash.installers.removeEmptyDirs']:
             for empty in emptyDirs:
                 try: empty.removedirs()
                 except OSError: pass
-        changed = Installer.final_update(new_sizeCrcDate,
-                                         self.data_sizeCrcDate, pending,
-                                         pending_size, progress,
-                                         recalculate_all_crcs,
-                                         bass.dirs['mods'].stail)
-        self.update_for_overridden_skips(progress=progress) #after final_update
-        #--Done
-        return changed
 
     def _process_data_dir(self, dirDirsFiles, progress):
         """Construct dictionaries mapping the paths in dirDirsFiles to
         filesystem attributes. Old data_SizeCrcDate is used to decide which
-        files need their crc recalculated. Return a tuple containing:
-        - new_sizeCrcDate and pending: two newly constructed dicts mapping
-        paths to their size, date and absolute path and also the crc (for
-        new_sizeCrcDate) if the cached value is valid (no change in mod time
-        or size of the file)
-        - the size of pending files used in displaying crc calculation progress
+        files need their crc recalculated. Return new_sizeCrcDate and
+        pending: two newly constructed dicts mapping paths to their size, date
+        and absolute path and also the crc (for new_sizeCrcDate) if the cached
+        value is valid (no change in mod time or size of the file).
         Compare to similar code in InstallerProject._refresh_from_project_dir
 
         :param dirDirsFiles: list of tuples in the format of the output of walk
         """
         from . import modInfos # to get the crcs for espms
         progress.setFull(1 + len(dirDirsFiles))
-        pending, pending_size = bolt.LowerDict(), 0
+        pending = bolt.LowerDict()
         new_sizeCrcDate = bolt.LowerDict()
         oldGet = self.data_sizeCrcDate.get
         ghost_norm = bolt.LowerDict(
@@ -2135,19 +2539,32 @@ def _process_data_dir(self, dirDirsFiles, progress):
                     size, date = lstat.st_size, int(lstat.st_mtime)
                     if size != oSize or date != oDate:
                         pending[rpFile] = (size, oCrc, date, asFile)
-                        pending_size += size
                     else:
                         new_sizeCrcDate[rpFile] = (oSize, oCrc, oDate, asFile)
                 except OSError as e:
                     if e.errno == errno.ENOENT: continue # file does not exist
                     raise
-        return new_sizeCrcDate, pending, pending_size
+        return new_sizeCrcDate, pending
 
     def reset_refresh_flag_on_projects(self):
         for installer in self.itervalues():
             if installer.is_project():
                 installer.project_refreshed = False
 
+    @staticmethod
+    def _data_dir_skips_state():
+        """Return the settings _skips_in_data_dir and _process_data_dir depend
+        on - if they changed, rescanning only the directories the change
+        journal reports is not enough."""
+        return tuple(bass.settings[k] for k in (
+            u'bash.installers.allowOBSEPlugins', u'bash.installers.skipDocs',
+            u'bash.installers.skipImages', u'bash.installers.skipDistantLOD',
+            u'bash.installers.skipLandscapeLODMeshes',
+            u'bash.installers.skipScreenshots',
+            u'bash.installers.skipLandscapeLODTextures',
+            u'bash.installers.skipLandscapeLODNormals',
+            u'bash.installers.autoRefreshBethsoft'))
+
     @staticmethod
     def _skips_in_data_dir(sDirs):
         """Skip some top level directories based on global settings - EVEN
@@ -2200,12 +2617,12 @@ def update_data_SizeCrcDate(self, dest_paths, progress=None):
         for key, val in groupby(root_files, key=itemgetter(0)):
             root_dirs_files.append((key, [], [j for i, j in val]))
         progress = progress or bolt.Progress()
-        new_sizeCrcDate, pending, pending_size = self._process_data_dir(
-            root_dirs_files, progress)
+        new_sizeCrcDate, pending = self._process_data_dir(root_dirs_files,
+                                                          progress)
         deleted_or_pending = set(dest_paths) - set(new_sizeCrcDate)
         for d in deleted_or_pending: self.data_sizeCrcDate.pop(d, None)
-        Installer.calc_crcs(pending, pending_size, bass.dirs['mods'].stail,
-                            new_sizeCrcDate, progress)
+        Installer.calc_crcs(pending, bass.dirs['mods'].stail, new_sizeCrcDate,
+                            progress)
         for rpFile, (size, crc, date, _asFile) in new_sizeCrcDate.iteritems():
             self.data_sizeCrcDate[rpFile] = (size, crc, date)
 
@@ -2381,35 +2798,93 @@ def _install(self, packages, refresh_ui, progress=None, last=False,
             self.moveArchives(packages, len(self))
         to_install = set(self[x] for x in packages)
         min_order = min(x.order for x in to_install)
-        #--Install packages in turn
-        progress.setFull(len(packages))
-        index = 0
+        #--Decide which files each package installs, so the archives can be
+        #  extracted ahead of the installs
+        installer_destinations = []
         for installer in self.sorted_values(reverse=True):
             if installer in to_install:
-                progress(index,installer.archive)
                 destFiles = set(installer.ci_dest_sizeCrc) - mask
                 if not override:
                     destFiles &= installer.missingFiles
-                if destFiles:
-                    self._createTweaks(destFiles, installer, tweaksCreated)
-                    self.__installer_install(installer, destFiles, index,
-                                             progress, refresh_ui)
-                index += 1 # increment after it's used in __installer_install
-                installer.is_active = True
+                installer_destinations.append((installer, destFiles))
                 if installer.order == min_order:
                     break # we are done
             #prevent lower packages from installing any files of this installer
-            if installer.is_active: mask |= set(installer.ci_dest_sizeCrc)
+            if installer.is_active or installer in to_install:
+                mask |= set(installer.ci_dest_sizeCrc)
+        #--Install packages in turn
+        progress.setFull(len(packages))
+        for index, (installer, destFiles, staged) in enumerate(
+                self._stage_installs(installer_destinations, progress)):
+            progress(index,installer.archive)
+            if destFiles:
+                self._createTweaks(destFiles, installer, tweaksCreated)
+                self.__installer_install(installer, destFiles, index,
+                                         progress, refresh_ui, staged)
+            installer.is_active = True
         if tweaksCreated:
             self._editTweaks(tweaksCreated)
             refresh_ui[1] |= bool(tweaksCreated)
         return tweaksCreated
 
+    @staticmethod
+    def _staging_root():
+        """Return the directory to extract archives to before installing
+        their files - on the same volume as the Data folder if possible, so
+        the files can be moved into place by renaming them."""
+        for staging_root in (bass.dirs['modsBash'], Path.baseTempDir()):
+            try:
+                if _same_volume(staging_root.s, bass.dirs['mods'].s):
+                    return staging_root
+            except OSError:
+                deprint(u'Failed to stat %s' % staging_root, traceback=True)
+        return Path.baseTempDir()
+
+    def _stage_installs(self, installer_destinations, progress):
+        """Yield (installer, destFiles, staged) tuples for the (installer,
+        destFiles) pairs in installer_destinations, in order. The files of
+        archives are extracted (by up to ExtractProcesses 7z processes at
+        once) while the previous installers are installed - pass staged to
+        Installer.install."""
+        staging_root = self._staging_root()
+        # files_to_install refreshes the installers, so not in the threads -
+        # the threads report to the same part of progress as the installs
+        jobs = [(installer, destFiles,
+                 destFiles and installer.files_to_install(destFiles),
+                 bolt.ThreadSubProgress(progress, index, index + 1))
+                for index, (installer, destFiles) in enumerate(
+                installer_destinations)]
+        def _stage(job):
+            installer, destFiles, dest_src, sub_progress = job
+            staged = None
+            if dest_src:
+                staged = (dest_src, installer.stage_install(
+                    dest_src, staging_root, sub_progress))
+            return installer, destFiles, staged
+        def _discard(stage_result):
+            staged = stage_result[2]
+            if staged and staged[1]: Installer._rm_staging_dir(staged[1])
+        waiting_for = [0] # the job the installs wait for
+        def _wait():
+            if not jobs[waiting_for[0]][3].flush():
+                progress(progress.state)
+        num_threads = bass.inisettings['ExtractProcesses']
+        stage_results = bolt.ordered_thread_map(_stage, jobs, num_threads,
+            max_ahead=num_threads, wait_callback=_wait, discard=_discard)
+        try:
+            for stage_result in stage_results:
+                waiting_for[0] += 1
+                yield stage_result
+        finally:
+            stage_results.close()
+
     def __installer_install(self, installer, destFiles, index, progress,
-                            refresh_ui):
+                            refresh_ui, staged=None):
         sub_progress = SubProgress(progress, index, index + 1)
         data_sizeCrcDate_update, mods, inis, bsas = installer.install(
-            destFiles, sub_progress)
+            destFiles, sub_progress, staged)
+        # LOOT conditions may evaluate differently now
+        reset_eval_context()
         refresh_ui[0] |= bool(mods)
         refresh_ui[1] |= bool(inis)
         # refresh modInfos, iniInfos adding new/modified mods
@@ -2543,6 +3018,8 @@ def _removeFiles(self, removes, refresh_ui, progress=None):
             ex = sys.exc_info()
             raise
         finally:
+            # LOOT conditions may evaluate differently now
+            reset_eval_context()
             if ex:removes = [f for f in removes if not modsDirJoin(f).exists()]
             #--Update InstallersData
             data_sizeCrcDatePop = self.data_sizeCrcDate.pop
@@ -2640,12 +3117,14 @@ def _restoreFiles(self, restores, refresh_ui, progress):
         installer_destinations = sorted(installer_destinations.items(),
             key=lambda item: self[item[0]].order)
         progress.setFull(len(installer_destinations))
-        for index, (archive, destFiles) in enumerate(installer_destinations):
-            progress(index, archive.s)
+        installer_destinations = [(self[archive], destFiles) for
+                                  archive, destFiles in installer_destinations]
+        for index, (installer, destFiles, staged) in enumerate(
+                self._stage_installs(installer_destinations, progress)):
+            progress(index, installer.archive)
             if destFiles:
-                installer = self[archive]
                 self.__installer_install(installer, destFiles, index, progress,
-                                         refresh_ui)
+                                         refresh_ui, staged)
 
     def bain_anneal(self, anPackages, refresh_ui, progress=None):
         """Anneal selected packages. If no packages are selected, anneal all.
@@ -2662,14 +3141,22 @@ def bain_anneal(self, anPackages, refresh_ui, progress=None):
                 removes |= installer.missingFiles # re-added in __restore
                 removes |= set(installer.dirty_sizeCrc)
             installer.dirty_sizeCrc.clear()
-        #--March through packages in reverse order...
+        #--The highest order active package owning a file may provide a
+        #  restore file - if the file is installed as is, it just needs to
+        #  own it. Like __restore, but only looks at the files to remove
         restores = bolt.LowerDict()
         cede_ownership = collections.defaultdict(set)
-        for installer in self.sorted_values(reverse=True):
-            #--Other active package. May provide a restore file.
-            #  And/or may block later uninstalls.
-            if installer.is_active:
-                self.__restore(installer, removes, restores, cede_ownership)
+        ownership = self.sync_ownership()
+        dataGet = self.data_sizeCrcDate.get
+        for dest_file in list(removes):
+            norm = ownership.get_norm(dest_file)
+            if norm is None: continue
+            installer, _ci_dest, sizeCrc = norm
+            if sizeCrc != dataGet(dest_file, (0, 0, 0))[:2]:
+                restores[dest_file] = GPath(installer.archive)
+            else:
+                cede_ownership[installer.archive].add(dest_file)
+            removes.discard(dest_file) # don't remove it anyway
         self._remove_restore(removes, restores, refresh_ui, cede_ownership,
                              progress)
 
@@ -2812,21 +3299,25 @@ def _sort_bsa_conflicts(bsa_conflict):
             higher_bsa.sort(key=_sort_bsa_conflicts)
         else:
             lower_bsa, higher_bsa = None, None
-        # Calculate loose conflicts
-        lower_loose, higher_loose = [], []
-        for package, installer in self.sorted_pairs():
-            if installer.order == srcOrder or not (
+        # Calculate loose conflicts - only look at the owners of the files
+        inst_conflicts = collections.defaultdict(list)
+        get_owners = self.sync_ownership().get_owners
+        for src_file in mismatched:
+            src_file_sizeCrc = src_sizeCrc[src_file]
+            for installer, ci_dest, sizeCrc in get_owners(src_file):
+                if installer.order == srcOrder or not (
                         showInactive or installer.is_active): continue
-            if not showLower and installer.order < srcOrder: continue
-            curConflicts = bolt.sortFiles(
-                [x for x, y in installer.ci_dest_sizeCrc.iteritems()
-                if x in mismatched and y != src_sizeCrc[x]])
-            if curConflicts:
-                if installer.order < srcOrder:
-                    conflict_type = lower_loose
-                else:
-                    conflict_type = higher_loose
-                conflict_type.append((installer, package.s, curConflicts))
+                if not showLower and installer.order < srcOrder: continue
+                if sizeCrc != src_file_sizeCrc:
+                    inst_conflicts[installer].append(ci_dest)
+        lower_loose, higher_loose = [], []
+        for installer in sorted(inst_conflicts, key=attrgetter('order')):
+            if installer.order < srcOrder:
+                conflict_type = lower_loose
+            else:
+                conflict_type = higher_loose
+            conflict_type.append((installer, installer.archive,
+                                  bolt.sortFiles(inst_conflicts[installer])))
         return lower_loose, higher_loose, lower_bsa, higher_bsa
 
     def find_src_assets(self, src_installer, active_bsas):
@@ -38,14 +38,16 @@
 import struct
 import zlib
 from functools import partial
-from itertools import groupby, imap
+from itertools import groupby, imap, izip
 from operator import itemgetter
 from .dds_files import DDSFile, mk_dxgi_fmt
+from .. import bass
 from ..bolt import deprint, Progress, struct_pack, struct_unpack, \
-    unpack_byte, unpack_string, unpack_int, Flags, AFile
+    unpack_byte, unpack_string, unpack_int, Flags, AFile, GPath, \
+    ordered_thread_map
 from ..exception import AbstractError, BSAError, BSADecodingError, \
     BSAFlagError, BSACompressionError, BSADecompressionError, \
-    BSADecompressionSizeError
+    BSADecompressionSizeError, DDSError
 
 _bsa_encoding = u'cp1252' #rumor has it that's the files/folders names encoding
 path_sep = u'\\'
@@ -57,6 +59,26 @@ def _decode_path(string_path, bsa_name):
     except UnicodeDecodeError:
         raise BSADecodingError(bsa_name, string_path)
 
+def _ba2_hash(string_path):
+    """The hash used by BA2s - a CRC32 without the usual pre and post
+    conditioning."""
+    return (zlib.crc32(string_path.encode(_bsa_encoding), 0xFFFFFFFF) ^
+            0xFFFFFFFF) & 0xFFFFFFFF
+
+def _join_names(asset_paths):
+    """Joins the paths of the assets of an archive, for its index - a single
+    string is much faster to pickle and to normcase."""
+    return u'\n'.join(asset_paths)
+
+def _split_names(joined_paths):
+    return joined_paths.split(u'\n') if joined_paths else []
+
+def _encode_path(asset_path, bsa_name):
+    try:
+        return asset_path.encode(_bsa_encoding)
+    except UnicodeEncodeError:
+        raise BSAError(bsa_name, u'Unencodable path %r' % asset_path)
+
 class _BsaCompressionType(object):
     """Abstractly represents a way of compressing and decompressing BSA
     records."""
@@ -133,6 +155,12 @@ def load_header(self, ins, bsa_name):
             raise BSAError(bsa_name, u'Magic wrong: got %r, expected %r' % (
                 self.file_id, self.__class__.bsa_magic))
 
+    def dump_header(self):
+        """Dumps this header to a bytestring and returns the result."""
+        return b''.join(struct_pack(fmt[0], getattr(self, attr))
+                        for fmt, attr in zip(_Header.formats,
+                                             _Header.__slots__))
+
 class BsaHeader(_Header):
     __slots__ = ( # in the order encountered in the header
          u'folder_records_offset', u'archive_flags', u'folder_count',
@@ -167,6 +195,11 @@ def load_header(self, ins, bsa_name):
         if not self.archive_flags.include_file_names:
             raise BSAFlagError(bsa_name, u"'Has Names For Files'", 2)
 
+    def dump_header(self):
+        return super(BsaHeader, self).dump_header() + b''.join(
+            struct_pack(fmt[0], int(getattr(self, attr)))
+            for fmt, attr in zip(BsaHeader.formats, BsaHeader.__slots__))
+
     def is_compressed(self): return self.archive_flags.compressed_archive
     def embed_filenames(self): return self.archive_flags.embed_file_names
 
@@ -188,6 +221,11 @@ def load_header(self, ins, bsa_name):
                                      u'%s' % (
                 self.ba2_files_type, u' or '.join(self.file_types)))
 
+    def dump_header(self):
+        return super(Ba2Header, self).dump_header() + b''.join(
+            struct_pack(fmt[0], getattr(self, attr))
+            for fmt, attr in zip(Ba2Header.formats, Ba2Header.__slots__))
+
 class MorrowindBsaHeader(_Header):
     __slots__ = (u'file_id', u'hash_offset', u'file_count')
     formats = [(f, struct.calcsize(f)) for f in (u'4s', u'I', u'I')]
@@ -211,20 +249,25 @@ def embed_filenames(self): return False
 # Records ---------------------------------------------------------------------
 class _HashedRecord(object):
     __slots__ = (u'record_hash',)
-    formats = [(u'Q', struct.calcsize(u'Q'))]
+    # Hashes are Q in BSAs but I in BA2s, see the Ba2 records
+    hash_format = (u'Q', struct.calcsize(u'Q'))
 
     def load_record(self, ins):
-        fmt, fmt_siz = _HashedRecord.formats[0]
+        fmt, fmt_siz = self.__class__.hash_format
         self.record_hash, = struct_unpack(fmt, ins.read(fmt_siz))
 
     def load_record_from_buffer(self, memview, start):
-        fmt, fmt_siz = _HashedRecord.formats[0]
+        fmt, fmt_siz = self.__class__.hash_format
         self.record_hash, = struct.unpack_from(fmt, memview, start)
         return start + fmt_siz
 
+    def dump_record(self):
+        """Dumps this record to a bytestring and returns the result."""
+        return struct_pack(self.__class__.hash_format[0], self.record_hash)
+
     @classmethod
     def total_record_size(cls):
-        return _HashedRecord.formats[0][1]
+        return cls.hash_format[1]
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
@@ -263,6 +306,11 @@ def load_record_from_buffer(self, memview, start):
             start += fmt[1]
         return start
 
+    def dump_record(self):
+        return super(_BsaHashedRecord, self).dump_record() + b''.join(
+            struct_pack(fmt[0], getattr(self, attr)) for fmt, attr in
+            zip(self.__class__.formats, self.__class__.__slots__))
+
     @classmethod
     def total_record_size(cls):
         return super(_BsaHashedRecord, cls).total_record_size() + sum(
@@ -358,6 +406,7 @@ class Ba2FileRecordGeneral(_BsaHashedRecord):
     # unused1 is always BAADF00D
     __slots__ = (u'file_extension', u'dir_hash', u'unknown1', u'offset',
                  u'packed_size', u'unpacked_size', u'unused1')
+    hash_format = (u'I', struct.calcsize(u'I'))
     formats = [(f, struct.calcsize(f)) for f in (u'4s', u'I', u'I', u'Q', u'I',
                                                  u'I', u'I')]
 
@@ -369,6 +418,7 @@ class Ba2FileRecordTexture(_BsaHashedRecord):
                  u'num_mips', u'dxgi_format', u'cube_maps', u'tex_chunks')
     formats = [(f, struct.calcsize(f)) for f in (u'4s', u'I', u'B', u'B', u'H',
                                                  u'H', u'H', u'B', u'B', u'H')]
+    hash_format = (u'I', struct.calcsize(u'I'))
 
     def load_record(self, ins):
         super(Ba2FileRecordTexture, self).load_record(ins)
@@ -379,6 +429,16 @@ def load_record(self, ins):
             tex_chunk.load_chunk(ins)
             self.tex_chunks.append(tex_chunk)
 
+    def dump_record(self):
+        dxgi_format = self.dxgi_format
+        self.dxgi_format = dxgi_format.fmt_index
+        try:
+            record_data = super(Ba2FileRecordTexture, self).dump_record()
+        finally:
+            self.dxgi_format = dxgi_format
+        return record_data + b''.join(
+            tex_chunk.dump_chunk() for tex_chunk in self.tex_chunks)
+
 class Ba2TexChunk(object):
     """BA2 texture chunk, used in texture file records."""
     # unused1 is always BAADF00D
@@ -391,6 +451,10 @@ def load_chunk(self, ins): ##: Centralize this, copy-pasted everywhere
         for fmt, attr in zip(Ba2TexChunk.formats, Ba2TexChunk.__slots__):
             self.__setattr__(attr, struct_unpack(fmt[0], ins.read(fmt[1]))[0])
 
+    def dump_chunk(self):
+        return b''.join(struct_pack(fmt[0], getattr(self, attr)) for fmt, attr
+                        in zip(Ba2TexChunk.formats, Ba2TexChunk.__slots__))
+
     def __repr__(self):
         return u'Ba2TexChunk<mipmaps #%u to #%u>' % (
             self.start_mip, self.end_mip)
@@ -421,13 +485,16 @@ class ABsa(AFile):
     _header_type = BsaHeader
     _assets = frozenset()
     _compression_type = _Bsa_zlib # type: _BsaCompressionType
+    # Files with these extensions are stored uncompressed in compressed
+    # archives, the games can't play compressed sounds
+    _incompressible_exts = frozenset(
+        (u'.fuz', u'.mp3', u'.ogg', u'.wav', u'.xwm'))
 
     def __init__(self, fullpath, load_cache=False, names_only=True):
         super(ABsa, self).__init__(fullpath)
         self.bsa_name = self.abs_path.stail
         self.bsa_header = self.__class__._header_type()
         self.bsa_folders = collections.OrderedDict() # keep folder order
-        self._filenames = []
         self.total_names_length = 0 # reported wrongly at times - calculate it
         if load_cache: self.__load(names_only)
 
@@ -446,7 +513,7 @@ def __load(self, names_only):
             if not names_only:
                 self._load_bsa()
             else:
-                self._load_bsa_light()
+                self._load_assets()
         except struct.error as e:
             raise BSAError(self.bsa_name, u'Error while unpacking: %r' % e)
 
@@ -477,17 +544,16 @@ def extract_assets(self, asset_paths, dest_folder, progress=None):
         folder_files_dict = self._map_files_to_folders(
             imap(unicode.lower, asset_paths))
         del asset_paths # forget about this
-        # load the bsa - this should be reworked to load only needed records
-        self._load_bsa()
-        folder_to_assets = self._map_assets_to_folders(folder_files_dict)
-        # unload the bsa
-        self.bsa_folders.clear()
-        # get the data from the file
-        global_compression = self.bsa_header.is_compressed()
+        bsa_index = self._get_index()
         i = 0
-        if progress:
-            progress.setFull(len(folder_to_assets))
         with open(u'%s' % self.abs_path, u'rb') as bsa_file:
+            # load only the records of the assets we need
+            self.bsa_header.load_header(bsa_file, self.bsa_name)
+            folder_to_assets = self._read_wanted_records(
+                bsa_file, bsa_index, folder_files_dict)
+            global_compression = self.bsa_header.is_compressed()
+            if progress:
+                progress.setFull(len(folder_to_assets))
             for folder, file_records in folder_to_assets.iteritems():
                 if progress:
                     progress(i, u'Extracting %s...\n%s' % (
@@ -504,7 +570,8 @@ def extract_assets(self, asset_paths, dest_folder, progress=None):
                         filename_len = unpack_byte(bsa_file)
                         bsa_file.seek(filename_len, 1) # discard filename
                         data_size -= filename_len + 1
-                    if global_compression ^ record.compression_toggle():
+                    if global_compression != bool(
+                            record.compression_toggle()):
                         # This is a compressed record, so decompress it
                         uncompressed_size = unpack_int(bsa_file)
                         data_size -= 4
@@ -527,22 +594,86 @@ def extract_assets(self, asset_paths, dest_folder, progress=None):
                               u'wb') as out:
                         out.write(raw_data)
 
-    def _map_assets_to_folders(self, folder_files_dict):
-        folder_to_assets = collections.OrderedDict()
-        for folder_path, bsa_folder in self.bsa_folders.iteritems():
-            if folder_path.lower() not in folder_files_dict: continue
-            # Has assets we need to extract. Keep order to avoid seeking
-            # back and forth in the file
-            folder_to_assets[folder_path] = file_records = []
-            filenames = folder_files_dict[folder_path.lower()]
-            for filename, filerecord in bsa_folder.folder_assets.iteritems():
-                if filename.lower() not in filenames: continue
-                file_records.append((filename, filerecord))
-        return folder_to_assets
-
     # Abstract
     def _load_bsa(self): raise AbstractError()
-    def _load_bsa_light(self): raise AbstractError()
+    def _read_index(self): raise AbstractError()
+    def _read_wanted_records(self, bsa_file, bsa_index, folder_files_dict):
+        """Reads the records of the wanted assets from bsa_file, using the
+        index of this archive to seek straight to them. Returns an
+        OrderedDict mapping the folders of the assets to lists of (file name,
+        record) tuples, in the order they appear in the archive - to avoid
+        seeking back and forth in the file.
+
+        :param folder_files_dict: The wanted assets, see
+            _map_files_to_folders."""
+        raise AbstractError()
+    @classmethod
+    def _write_assets(cls, out, bsa_name, assets, compress, progress):
+        """Writes the specified (asset path, source path) pairs to the out
+        stream as a new archive."""
+        raise AbstractError()
+
+    # Writing
+    @classmethod
+    def write_bsa(cls, bsa_path, assets, compress=True, progress=None):
+        """Packs loose files into a new archive at bsa_path, replacing it if
+        it exists. The records are compressed in several threads, and only a
+        few records are held in memory at a time.
+
+        :param bsa_path: The path of the archive to write.
+        :param assets: A dict mapping the paths of the files in the archive
+            (relative to the Data folder, e.g. u'meshes\\foo.nif') to the
+            absolute paths of the loose files to pack.
+        :param compress: If True, compress the records of the archive.
+        :param progress: The progress callback to use. None if unwanted."""
+        cls._write_archive(bsa_path, assets, progress,
+                           partial(cls._write_assets, compress=compress))
+
+    @classmethod
+    def _write_archive(cls, bsa_path, assets, progress, write_assets):
+        bsa_path = GPath(bsa_path)
+        bsa_name = bsa_path.stail
+        to_pack = {}
+        for asset_path, src_path in assets.iteritems():
+            asset_path = asset_path.replace(u'/', path_sep).strip(path_sep)
+            to_pack[asset_path.lower()] = (asset_path, src_path)
+        progress = progress or Progress()
+        progress.setFull(max(len(to_pack), 1))
+        temp_path = bsa_path.temp
+        try:
+            with temp_path.open(u'wb') as out:
+                write_assets(out, bsa_name, [to_pack[k] for k in
+                                             sorted(to_pack)],
+                             progress=progress)
+            bsa_path.untemp()
+        finally:
+            temp_path.remove() # if we failed before untemp moved it
+
+    @classmethod
+    def _pack_records(cls, bsa_name, file_records, to_pack, pack_file,
+                      write_record, progress, progress_paths):
+        """Calls pack_file for each of to_pack in several threads, then
+        write_record with each of file_records and the matching result, in
+        order."""
+        num_threads = bass.inisettings[u'BsaThreads']
+        # at most two records per thread are packed ahead of write_record, so
+        # memory use does not grow with the number of records
+        packed = ordered_thread_map(pack_file, to_pack, num_threads,
+                                    max_ahead=2 * num_threads)
+        try:
+            for i, (file_rec, progress_path, result) in enumerate(izip(
+                    file_records, progress_paths, packed)):
+                progress(i, u'Packing %s...\n%s' % (bsa_name, progress_path))
+                write_record(file_rec, result)
+        finally:
+            packed.close() # stop the threads if we failed
+
+    @classmethod
+    def _compress_data(cls, bsa_name, raw_data):
+        """Returns the compressed raw_data, or None if compressing it does not
+        make it smaller."""
+        compressed = cls._compression_type.compress_rec(raw_data, bsa_name)
+        return compressed if len(compressed) < len(raw_data) else None
 
     # API - delegates to abstract methods above
     def has_assets(self, asset_paths):
@@ -555,10 +686,29 @@ def assets(self):
         """
         if self._assets is self.__class__._assets:
             self.__load(names_only=True)
-            self._assets = frozenset(imap(os.path.normcase, self._filenames))
-            del self._filenames[:]
         return self._assets
 
+    def _load_assets(self):
+        # normcase all the names at once
+        self._assets = frozenset(_split_names(os.path.normcase(
+            self._get_index()[0])))
+
+    # Index - lets us find assets without loading the whole archive
+    def read_index(self):
+        """Reads the index of this archive: a tuple of the paths of its
+        assets, joined by newlines in the order of their records, and the
+        format specific data needed to find the records of the assets
+        without loading all of them - see _read_wanted_records."""
+        try:
+            return self._read_index()
+        except struct.error as e:
+            raise BSAError(self.bsa_name, u'Error while unpacking: %r' % e)
+
+    def _get_index(self):
+        """Returns the index of this archive, see read_index. Overridden to
+        cache it."""
+        return self.read_index()
+
 class BSA(ABsa):
     """Bsa file. Notes:
     - We require that include_directory_names and include_file_names are True.
@@ -566,6 +716,56 @@ class BSA(ABsa):
     are embedded."""
     file_record_type = BSAFileRecord
     folder_record_type = BSAFolderRecord
+    _bsa_version = 104
+    # A dictionary mapping file extensions to hash components. Used by all
+    # games that use BSAs when hashing file names for them.
+    _bsa_ext_lookup = collections.defaultdict(int)
+    for ext, hash_part in [(u'.kf', 0x80), (u'.nif', 0x8000),
+                           (u'.dds', 0x8080), (u'.wav', 0x80000000)]:
+        _bsa_ext_lookup[ext] = hash_part
+    # The bits of the file_flags header field set for the files with these
+    # extensions - other files set the 'misc' bit
+    _file_flag_exts = {
+        u'.nif': 0x1, u'.kf': 0x1, u'.dds': 0x2, u'.xml': 0x4, u'.wav': 0x8,
+        u'.xwm': 0x8, u'.mp3': 0x10, u'.ogg': 0x10, u'.fuz': 0x10,
+        u'.lip': 0x10, u'.txt': 0x20, u'.html': 0x20, u'.bat': 0x20,
+        u'.scc': 0x20, u'.fxp': 0x20, u'.spt': 0x40, u'.tex': 0x80,
+        u'.fnt': 0x80,
+    }
+    _misc_file_flag = 0x100
+
+    @staticmethod
+    def calculate_hash(file_name):
+        """Calculates the hash used by BSAs for the provided file name.
+        Based on Timeslips code with cleanup and pythonization.
+
+        See here for more information:
+        https://en.uesp.net/wiki/Tes4Mod:Hash_Calculation"""
+        #--NOTE: fileName is NOT a Path object!
+        root, ext = os.path.splitext(file_name.lower())
+        return BSA._calculate_hash(root, ext)
+
+    @staticmethod
+    def calculate_folder_hash(folder_path):
+        """Calculates the hash used by BSAs for the provided folder path -
+        unlike file names, folder paths are hashed whole."""
+        return BSA._calculate_hash(folder_path.lower(), u'')
+
+    @staticmethod
+    def _calculate_hash(root, ext):
+        chars = map(ord, root)
+        hash_part_1 = BSA._bsa_ext_lookup[ext]
+        if chars: # empty for files in the root folder
+            hash_part_1 |= chars[-1] | (
+                    (len(chars) > 2 and chars[-2]) or 0) << 8 | \
+                           len(chars) << 16 | chars[0] << 24
+        uint_mask, hash_part_2, hash_part_3 = 0xFFFFFFFF, 0, 0
+        for char in chars[1:-2]:
+            hash_part_2 = ((hash_part_2 * 0x1003F) + char) & uint_mask
+        for char in map(ord, ext):
+            hash_part_3 = ((hash_part_3 * 0x1003F) + char) & uint_mask
+        hash_part_2 = (hash_part_2 + hash_part_3) & uint_mask
+        return (hash_part_2 << 32) + hash_part_1
 
     def _load_bsa(self):
         folder_records = [] # we need those to parse the folder names
@@ -593,21 +793,44 @@ def _read_file_records(cls, file_records, bsa_file, folder_path,
             rec.load_record(bsa_file)
             file_records.append(rec)
 
-    def _load_bsa_light(self):
+    def _read_index(self):
+        """The index of a BSA holds the path, hash, file records offset and
+        files count of each of its folders."""
         folder_records = [] # we need those to parse the folder names
-        _filenames = []
-        path_folder_record = collections.OrderedDict()
+        folder_blocks = []
         read_file_record = partial(self._discard_file_records,
-                                   folders=path_folder_record)
+                                   folders=folder_blocks)
         file_names = self._read_bsa_file(folder_records, read_file_record)
+        asset_paths = []
         names_record_index = 0
-        for folder_path, folder_record in path_folder_record.iteritems():
-            for __ in xrange(folder_record.files_count):
+        for folder_path, _folder_hash, _offset, files_count in folder_blocks:
+            for __ in xrange(files_count):
                 filename = _decode_path(
                     file_names[names_record_index], self.bsa_name)
-                _filenames.append(path_sep.join((folder_path, filename)))
+                asset_paths.append(path_sep.join((folder_path, filename)))
                 names_record_index += 1
-        self._filenames = _filenames
+        return _join_names(asset_paths), tuple(folder_blocks)
+
+    def _read_wanted_records(self, bsa_file, bsa_index, folder_files_dict):
+        asset_paths = _split_names(bsa_index[0])
+        folder_to_assets = collections.OrderedDict()
+        names_record_index = 0
+        for folder_path, _folder_hash, records_offset, files_count in \
+                bsa_index[1]:
+            folder_assets = asset_paths[
+                names_record_index:names_record_index + files_count]
+            names_record_index += files_count
+            filenames = folder_files_dict.get(folder_path.lower())
+            if not filenames: continue
+            bsa_file.seek(records_offset)
+            folder_to_assets[folder_path] = file_records = []
+            for asset_path in folder_assets:
+                rec = self.file_record_type()
+                rec.load_record(bsa_file)
+                filename = asset_path[len(folder_path) + 1:]
+                if filename.lower() in filenames:
+                    file_records.append((filename, rec))
+        return folder_to_assets
 
     def _read_bsa_file(self, folder_records, read_file_records):
         total_names_length = 0
@@ -641,9 +864,127 @@ def _read_bsa_file(self, folder_records, read_file_records):
 
     def _discard_file_records(self, bsa_file, folder_path, folder_record,
                               folders=None):
+        folders.append((folder_path, folder_record.record_hash,
+                        bsa_file.tell(), folder_record.files_count))
         bsa_file.seek(self.file_record_type.total_record_size() *
                       folder_record.files_count, 1)
-        folders[folder_path] = folder_record
+
+    @classmethod
+    def _write_assets(cls, out, bsa_name, assets, compress, progress):
+        # Names are stored in lowercase. Group the files by folder, folders
+        # and the files in each folder are sorted by hash
+        folder_files = collections.defaultdict(list)
+        for asset_path, src_path in assets:
+            folder_path, _sep, file_name = asset_path.lower().rpartition(
+                path_sep)
+            folder_files[folder_path].append(
+                (cls.calculate_hash(file_name), file_name, src_path))
+        folders = sorted((cls.calculate_folder_hash(folder_path), folder_path,
+                          sorted(files))
+                         for folder_path, files in folder_files.iteritems())
+        del folder_files
+        header = cls._header_type()
+        header.file_id = header.bsa_magic
+        header.version = cls._bsa_version
+        header.folder_records_offset = header.header_size
+        header.archive_flags = header._archive_flags(0)
+        header.archive_flags.include_directory_names = True
+        header.archive_flags.include_file_names = True
+        header.archive_flags.compressed_archive = compress
+        header.folder_count = len(folders)
+        header.file_count = len(assets)
+        header.total_folder_name_length = header.total_file_name_length = 0
+        header.file_flags = 0
+        folder_records, file_records = [], []
+        folder_names, file_names = [], []
+        to_pack, progress_paths = [], []
+        prev_hash = None
+        for folder_hash, folder_path, files in folders:
+            folder_name = _encode_path(folder_path, bsa_name)
+            if folder_hash == prev_hash or len(folder_name) > 254:
+                raise BSAError(bsa_name, u'Folder %s can not be packed (its '
+                    u'name is too long or its hash collides with another '
+                    u'folder)' % folder_path)
+            prev_hash = folder_hash
+            folder_names.append(folder_name)
+            header.total_folder_name_length += len(folder_name) + 1
+            folder_rec = cls.folder_record_type()
+            for attr in folder_rec.__slots__: setattr(folder_rec, attr, 0)
+            folder_rec.record_hash = folder_hash
+            folder_rec.files_count = len(files)
+            folder_records.append(folder_rec)
+            prev_file_hash = None
+            for file_hash, file_name, src_path in files:
+                asset_path = path_sep.join((folder_path, file_name)) \
+                    if folder_path else file_name
+                if file_hash == prev_file_hash:
+                    raise BSAError(bsa_name, u'The hash of %s collides with '
+                        u'another file in its folder' % asset_path)
+                prev_file_hash = file_hash
+                file_names.append(_encode_path(file_name, bsa_name))
+                header.total_file_name_length += len(file_names[-1]) + 1
+                file_rec = cls.file_record_type()
+                file_rec.record_hash = file_hash
+                file_records.append(file_rec)
+                file_ext = os.path.splitext(file_name)[1]
+                header.file_flags |= cls._file_flag_exts.get(
+                    file_ext, cls._misc_file_flag)
+                to_pack.append(
+                    (src_path, file_ext not in cls._incompressible_exts))
+                progress_paths.append(asset_path)
+        # The offsets of the file record blocks of the folders are known
+        # upfront, so we can write the data of the files straight away and
+        # fill in the records once it's written
+        file_rec_size = cls.file_record_type.total_record_size()
+        block_offset = header.header_size + len(
+            folder_records) * cls.folder_record_type.total_record_size()
+        for folder_rec, folder_name in izip(folder_records, folder_names):
+            # the offset includes the length of the file names, don't ask me
+            folder_rec.file_records_offset = \
+                block_offset + header.total_file_name_length
+            block_offset += len(folder_name) + 2 + \
+                            folder_rec.files_count * file_rec_size
+        out.seek(block_offset + header.total_file_name_length)
+        def _write_record(file_rec, packed_rec):
+            rec_chunks, size_flags = packed_rec
+            file_rec.raw_file_data_offset = out.tell()
+            rec_size = sum(imap(len, rec_chunks))
+            if file_rec.raw_file_data_offset > 0xFFFFFFFF or \
+                    rec_size > 0x3FFFFFFF:
+                raise BSAError(bsa_name, u'Archive or file too big')
+            file_rec.file_size_flags = rec_size | size_flags
+            for rec_chunk in rec_chunks: out.write(rec_chunk)
+        cls._pack_records(bsa_name, file_records, to_pack,
+                          partial(cls._pack_file, bsa_name, compress),
+                          _write_record, progress, progress_paths)
+        # Now write the header, the records and the names
+        out.seek(0)
+        out.write(header.dump_header())
+        for folder_rec in folder_records:
+            out.write(folder_rec.dump_record())
+        file_recs = iter(file_records)
+        for folder_rec, folder_name in izip(folder_records, folder_names):
+            out.write(struct_pack(u'B', len(folder_name) + 1))
+            out.write(folder_name + b'\x00')
+            for __ in xrange(folder_rec.files_count):
+                out.write(next(file_recs).dump_record())
+        for file_name in file_names:
+            out.write(file_name + b'\x00')
+
+    @classmethod
+    def _pack_file(cls, bsa_name, compress, src_compressible):
+        """Reads the specified file and returns the chunks of data of its
+        record, along with the compression toggle bit of its
+        file_size_flags."""
+        src_path, compressible = src_compressible
+        with open(src_path, u'rb') as ins:
+            raw_data = ins.read()
+        if compress and compressible:
+            compressed = cls._compress_data(bsa_name, raw_data)
+            if compressed is not None:
+                return [struct_pack(u'I', len(raw_data)), compressed], 0
+        # stored as is - in a compressed archive, the toggle bit says so
+        return [raw_data], 0x40000000 if compress else 0
 
 class BA2(ABsa):
     _header_type = Ba2Header
@@ -652,18 +993,17 @@ def extract_assets(self, asset_paths, dest_folder, progress=None):
         # map files to folders
         folder_files_dict = self._map_files_to_folders(asset_paths)
         del asset_paths # forget about this
-        # load the bsa - this should be reworked to load only needed records
-        self._load_bsa()
-        my_header = self.bsa_header # type: Ba2Header
-        is_dx10 = my_header.ba2_files_type == b'DX10'
-        folder_to_assets = self._map_assets_to_folders(folder_files_dict)
-        # unload the bsa
-        self.bsa_folders.clear()
-        # get the data from the file
+        bsa_index = self._get_index()
         i = 0
-        if progress:
-            progress.setFull(len(folder_to_assets))
         with open(u'%s' % self.abs_path, u'rb') as bsa_file:
+            # load only the records of the assets we need
+            my_header = self.bsa_header # type: Ba2Header
+            my_header.load_header(bsa_file, self.bsa_name)
+            is_dx10 = my_header.ba2_files_type == b'DX10'
+            folder_to_assets = self._read_wanted_records(
+                bsa_file, bsa_index, folder_files_dict)
+            if progress:
+                progress.setFull(len(folder_to_assets))
             def _read_rec_or_chunk(record):
                 """Helper method, handles reading both compressed and
                 uncompressed records (or texture chunks)."""
@@ -764,11 +1104,28 @@ def _load_bsa(self):
             current_folder.folder_assets[filename[folder_dex + 1:]] = \
                 file_records[index]
 
-    def _load_bsa_light(self):
+    # Offset of num_chunks in texture file records
+    _num_chunks_offset = 13
+
+    def _read_index(self):
+        """The index of a BA2 holds its type and, for texture BA2s, the number
+        of texture chunks of each record - records are variable sized
+        there."""
         my_header = self.bsa_header # type: Ba2Header
+        chunk_counts = None
         with open(u'%s' % self.abs_path, u'rb') as bsa_file:
             # load the header from input stream
             my_header.load_header(bsa_file, self.bsa_name)
+            if my_header.ba2_files_type == b'DX10':
+                chunk_counts = bytearray()
+                record_size = Ba2FileRecordTexture.total_record_size()
+                chunk_size = sum(f[1] for f in Ba2TexChunk.formats)
+                for __ in xrange(my_header.ba2_num_files):
+                    num_chunks = ord(bsa_file.read(record_size)[
+                                         self._num_chunks_offset])
+                    chunk_counts.append(num_chunks)
+                    bsa_file.seek(num_chunks * chunk_size, 1)
+                chunk_counts = bytes(chunk_counts)
             # load the file names block
             bsa_file.seek(my_header.ba2_name_table_offset)
             file_names_block = memoryview(bsa_file.read())
@@ -780,12 +1137,217 @@ def _load_bsa_light(self):
                 file_names_block[2:name_size + 2].tobytes(), self.bsa_name)
             _filenames.append(filename)
             file_names_block = file_names_block[name_size + 2:]
-        self._filenames = _filenames
+        return _join_names(_filenames), (my_header.ba2_files_type,
+                                         chunk_counts)
+
+    def _read_wanted_records(self, bsa_file, bsa_index, folder_files_dict):
+        ba2_files_type, chunk_counts = bsa_index[1]
+        if ba2_files_type == b'GNRL':
+            file_record_type = Ba2FileRecordGeneral
+        else:
+            file_record_type = Ba2FileRecordTexture
+        record_size = file_record_type.total_record_size()
+        chunk_size = sum(f[1] for f in Ba2TexChunk.formats)
+        record_offset = Ba2Header.header_size
+        folder_to_assets = collections.OrderedDict()
+        for index, asset_path in enumerate(_split_names(bsa_index[0])):
+            folder_path, _sep, filename = asset_path.rpartition(path_sep)
+            filenames = folder_files_dict.get(folder_path.lower())
+            if filenames and filename.lower() in filenames:
+                bsa_file.seek(record_offset)
+                rec = file_record_type()
+                rec.load_record(bsa_file)
+                folder_to_assets.setdefault(folder_path, []).append(
+                    (filename, rec))
+            record_offset += record_size
+            if chunk_counts is not None:
+                record_offset += ord(chunk_counts[index]) * chunk_size
+        return folder_to_assets
+
+    # Writing
+    _ba2_version = 1
+    _gnrl_unknown1 = 0x00100100 # what Archive2 writes, never read
+    # Mip levels at least this big get a texture chunk of their own, so the
+    # game can stream them - the smaller ones share the last chunk
+    _tex_chunk_min_dim = 512
+
+    @classmethod
+    def write_bsa(cls, bsa_path, assets, compress=True, progress=None,
+                  dx10=False):
+        """Packs loose files into a new BA2, see ABsa.write_bsa. If dx10 is
+        True, a texture (DX10) BA2 is written - all assets must be DDS files
+        then - else a general (GNRL) one."""
+        cls._write_archive(bsa_path, assets, progress, partial(
+            cls._write_dx10 if dx10 else cls._write_general,
+            compress=compress))
+
+    @staticmethod
+    def calculate_hashes(asset_path):
+        """Calculates the hashes used by BA2s for the provided asset path.
+        Returns the hash of the file name (without extension), the extension
+        and the hash of the folder path."""
+        folder_path, _sep, file_name = asset_path.lower().rpartition(path_sep)
+        root, ext = os.path.splitext(file_name)
+        return _ba2_hash(root), ext[1:].encode(_bsa_encoding), _ba2_hash(
+            folder_path)
+
+    @classmethod
+    def _write_general(cls, out, bsa_name, assets, compress, progress):
+        file_records, file_names, to_pack = [], [], []
+        for asset_path, src_path in assets:
+            file_names.append(_encode_path(asset_path, bsa_name))
+            file_rec = Ba2FileRecordGeneral()
+            file_rec.record_hash, file_rec.file_extension, \
+                file_rec.dir_hash = cls.calculate_hashes(asset_path)
+            file_rec.unknown1 = cls._gnrl_unknown1
+            file_rec.unused1 = 0xBAADF00D
+            file_records.append(file_rec)
+            to_pack.append((src_path, compress and os.path.splitext(
+                asset_path)[1].lower() not in cls._incompressible_exts))
+        out.seek(Ba2Header.header_size + len(
+            file_records) * Ba2FileRecordGeneral.total_record_size())
+        def _write_record(file_rec, packed_rec):
+            rec_data, packed_size, unpacked_size = packed_rec
+            file_rec.offset = out.tell()
+            file_rec.packed_size = packed_size
+            file_rec.unpacked_size = unpacked_size
+            out.write(rec_data)
+        cls._pack_records(bsa_name, file_records, to_pack,
+                          partial(cls._pack_general, bsa_name), _write_record,
+                          progress, [a for a, _src_path in assets])
+        cls._finish_ba2(out, b'GNRL', file_records, file_names)
+
+    @classmethod
+    def _write_dx10(cls, out, bsa_name, assets, compress, progress):
+        file_records, file_names, to_pack = [], [], []
+        records_size = 0
+        for asset_path, src_path in assets:
+            file_names.append(_encode_path(asset_path, bsa_name))
+            file_rec = Ba2FileRecordTexture()
+            file_rec.record_hash, file_rec.file_extension, \
+                file_rec.dir_hash = cls.calculate_hashes(asset_path)
+            data_offset = cls._load_texture(file_rec, src_path, bsa_name)
+            file_records.append(file_rec)
+            to_pack.append((src_path, data_offset, [
+                tex_chunk.unpacked_size for tex_chunk in file_rec.tex_chunks]))
+            records_size += file_rec.total_record_size() + len(
+                file_rec.tex_chunks) * sum(f[1] for f in Ba2TexChunk.formats)
+        out.seek(Ba2Header.header_size + records_size)
+        def _write_record(file_rec, packed_chunks):
+            for tex_chunk, (chunk_data, packed_size, unpacked_size) in izip(
+                    file_rec.tex_chunks, packed_chunks):
+                tex_chunk.offset = out.tell()
+                tex_chunk.packed_size = packed_size
+                tex_chunk.unpacked_size = unpacked_size
+                out.write(chunk_data)
+        cls._pack_records(bsa_name, file_records, to_pack,
+                          partial(cls._pack_texture, bsa_name, compress),
+                          _write_record, progress,
+                          [a for a, _src_path in assets])
+        cls._finish_ba2(out, b'DX10', file_records, file_names)
+
+    @classmethod
+    def _load_texture(cls, file_rec, src_path, bsa_name):
+        """Fills in the texture file record from the headers of the specified
+        DDS file and plans its texture chunks. Returns the offset of the
+        image data in the file."""
+        dds_file = DDSFile(u'')
+        try:
+            with open(src_path, u'rb') as ins:
+                dds_file.load_headers(ins)
+                data_offset = ins.tell()
+                ins.seek(0, os.SEEK_END)
+                data_size = ins.tell() - data_offset
+            dxgi_format = dds_file.get_dxgi_format()
+        except (DDSError, struct.error) as e:
+            raise BSAError(bsa_name, u'Failed to read DDS file %s: %r' % (
+                src_path, e))
+        dds_header = dds_file.dds_header
+        width, height = dds_header.dw_width, dds_header.dw_height
+        num_mips = max(dds_header.dw_mip_map_count, 1)
+        # 0x4 == DDS_RESOURCE_MISC_TEXTURECUBE
+        is_cube = dds_header.dw_caps2.DDSCAPS2_CUBEMAP or (
+                dds_header.ddspf.needs_dxt10 and
+                dds_file.dds_dxt10.misc_flag & 0x4)
+        file_rec.unknown_tex = 0
+        file_rec.chunk_header_size = 24
+        file_rec.height = height
+        file_rec.width = width
+        file_rec.num_mips = num_mips
+        file_rec.dxgi_format = dxgi_format
+        file_rec.cube_maps = 2049 if is_cube else 2048
+        mip_sizes = [dxgi_format.slice_pitch(max(width >> m, 1),
+                                             max(height >> m, 1))
+                     for m in xrange(num_mips)]
+        # Cubemaps store all the mips of each face in turn, so they can't be
+        # split by mip level - nor can data we don't know the layout of
+        chunk_mips = [] # (start mip, end mip, size of the mips)
+        if not is_cube and sum(mip_sizes) == data_size:
+            mip = 0
+            while mip < num_mips - 1 and min(width >> mip, height >> mip) >= \
+                    cls._tex_chunk_min_dim:
+                chunk_mips.append((mip, mip, mip_sizes[mip]))
+                mip += 1
+            chunk_mips.append((mip, num_mips - 1, sum(mip_sizes[mip:])))
+        else:
+            chunk_mips.append((0, num_mips - 1, data_size))
+        file_rec.tex_chunks = []
+        for start_mip, end_mip, chunk_size in chunk_mips:
+            tex_chunk = Ba2TexChunk()
+            tex_chunk.offset = tex_chunk.packed_size = 0 # set when written
+            tex_chunk.unpacked_size = chunk_size
+            tex_chunk.start_mip = start_mip
+            tex_chunk.end_mip = end_mip
+            tex_chunk.unused1 = 0xBAADF00D
+            file_rec.tex_chunks.append(tex_chunk)
+        file_rec.num_chunks = len(file_rec.tex_chunks)
+        return data_offset
+
+    @classmethod
+    def _finish_ba2(cls, out, ba2_files_type, file_records, file_names):
+        """Writes the name table at the current position of out, then the
+        header and the file records at its start."""
+        header = Ba2Header()
+        header.file_id = header.bsa_magic
+        header.version = cls._ba2_version
+        header.ba2_files_type = ba2_files_type
+        header.ba2_num_files = len(file_records)
+        header.ba2_name_table_offset = out.tell()
+        for file_name in file_names:
+            out.write(struct_pack(u'H', len(file_name)))
+            out.write(file_name)
+        out.seek(0)
+        out.write(header.dump_header())
+        for file_rec in file_records:
+            out.write(file_rec.dump_record())
+
+    @classmethod
+    def _pack_chunk(cls, bsa_name, compress, raw_data):
+        """Returns the data to write for raw_data, its packed size (0 if it
+        is stored uncompressed) and its unpacked size."""
+        compressed = compress and cls._compress_data(bsa_name, raw_data)
+        if compressed:
+            return compressed, len(compressed), len(raw_data)
+        return raw_data, 0, len(raw_data)
+
+    @classmethod
+    def _pack_general(cls, bsa_name, src_compress):
+        src_path, compress = src_compress
+        with open(src_path, u'rb') as ins:
+            return cls._pack_chunk(bsa_name, compress, ins.read())
+
+    @classmethod
+    def _pack_texture(cls, bsa_name, compress, texture_job):
+        src_path, data_offset, chunk_sizes = texture_job
+        with open(src_path, u'rb') as ins:
+            ins.seek(data_offset)
+            return [cls._pack_chunk(bsa_name, compress, ins.read(chunk_size))
+                    for chunk_size in chunk_sizes]
 
 class MorrowindBsa(ABsa):
     _header_type = MorrowindBsaHeader
 
-    def _load_bsa_light(self):
+    def _load_bsa(self):
         self.file_records = []
         with open(u'%s' % self.abs_path, u'rb') as bsa_file:
             # load the header from input stream
@@ -799,18 +1361,38 @@ def _load_bsa_light(self):
             # null-terminated. Additionally, these seem to sometimes be
             # incorrect - perhaps created by bad tools?
             bsa_file.seek(4 * self.bsa_header.file_count, 1)
-            # load names and hashes, also take the opportunity to fill
-            # _filenames
+            # load names and hashes
             for file_record in self.file_records:
                 file_record.load_name(bsa_file, self.bsa_name)
-                self._filenames.append(file_record.file_name)
             for file_record in self.file_records:
                 file_record.load_hash(bsa_file)
             # remember the final offset, since the stored offsets are relative
             # to this
             self.final_offset = bsa_file.tell()
 
-    _load_bsa = _load_bsa_light
+    def _read_index(self):
+        """The index of a Morrowind BSA holds the final offset, which the
+        offsets of the file records are relative to."""
+        self._load_bsa()
+        index = _join_names(r.file_name for r in self.file_records), \
+                self.final_offset
+        del self.file_records[:]
+        return index
+
+    def _read_wanted_records(self, bsa_file, bsa_index, asset_paths):
+        """Return the file records of asset_paths, in the order they appear in
+        the BSA."""
+        record_size = sum(f[1] for f in BSAMorrowindFileRecord.formats)
+        records_offset = sum(f[1] for f in MorrowindBsaHeader.formats)
+        target_records = []
+        for index, asset_path in enumerate(_split_names(bsa_index[0])):
+            if asset_path in asset_paths:
+                bsa_file.seek(records_offset + record_size * index)
+                rec = BSAMorrowindFileRecord()
+                rec.load_record(bsa_file)
+                rec.file_name = asset_path
+                target_records.append(rec)
+        return target_records
 
     # We override this because Morrowind has no folder records, so we can
     # achieve better performance with a dedicated method
@@ -818,14 +1400,16 @@ def extract_assets(self, asset_paths, dest_folder, progress=None):
         # Speed up target_records construction
         if not isinstance(asset_paths, (frozenset, set)):
             asset_paths = frozenset(asset_paths)
-        self._load_bsa()
-        # Keep only the file records that correspond to asset_paths
-        target_records = [x for x in self.file_records
-                          if x.file_name in asset_paths]
+        bsa_index = self._get_index()
+        final_offset = bsa_index[1]
         i = 0
-        if progress:
-            progress.setFull(len(target_records))
         with open(u'%s' % self.abs_path, u'rb') as bsa_file:
+            self.bsa_header.load_header(bsa_file, self.bsa_name)
+            # Keep only the file records that correspond to asset_paths
+            target_records = self._read_wanted_records(bsa_file, bsa_index,
+                                                       asset_paths)
+            if progress:
+                progress.setFull(len(target_records))
             for file_record in target_records:
                 rec_name = file_record.file_name
                 if progress:
@@ -836,7 +1420,7 @@ def extract_assets(self, asset_paths, dest_folder, progress=None):
                     i += 1
                 # There is no compression for Morrowind BSAs, but all offsets
                 # are relative to the final_offset we read earlier
-                bsa_file.seek(self.final_offset + file_record.relative_offset)
+                bsa_file.seek(final_offset + file_record.relative_offset)
                 # Finally, simply read from the BSA file and write out the
                 # result, making sure to create any needed directories
                 raw_data = bsa_file.read(file_record.file_size)
@@ -848,34 +1432,7 @@ def extract_assets(self, asset_paths, dest_folder, progress=None):
 class OblivionBsa(BSA):
     _header_type = OblivionBsaHeader
     file_record_type = BSAOblivionFileRecord
-    # A dictionary mapping file extensions to hash components. Used by Oblivion
-    # when hashing file names for its BSAs.
-    _bsa_ext_lookup = collections.defaultdict(int)
-    for ext, hash_part in [(u'.kf', 0x80), (u'.nif', 0x8000),
-                           (u'.dds', 0x8080), (u'.wav', 0x80000000)]:
-        _bsa_ext_lookup[ext] = hash_part
-
-    @staticmethod
-    def calculate_hash(file_name):
-        """Calculates the hash used by Oblivion BSAs for the provided file
-        name.
-        Based on Timeslips code with cleanup and pythonization.
-
-        See here for more information:
-        https://en.uesp.net/wiki/Tes4Mod:Hash_Calculation"""
-        #--NOTE: fileName is NOT a Path object!
-        root, ext = os.path.splitext(file_name.lower())
-        chars = map(ord, root)
-        hash_part_1 = chars[-1] | ((len(chars) > 2 and chars[-2]) or 0) << 8 \
-                      | len(chars) << 16 | chars[0] << 24
-        hash_part_1 |= OblivionBsa._bsa_ext_lookup[ext]
-        uint_mask, hash_part_2, hash_part_3 = 0xFFFFFFFF, 0, 0
-        for char in chars[1:-2]:
-            hash_part_2 = ((hash_part_2 * 0x1003F) + char) & uint_mask
-        for char in map(ord, ext):
-            hash_part_3 = ((hash_part_3 * 0x1003F) + char) & uint_mask
-        hash_part_2 = (hash_part_2 + hash_part_3) & uint_mask
-        return (hash_part_2 << 32) + hash_part_1
+    _bsa_version = 103
 
     def undo_alterations(self, progress=Progress()):
         """Undoes any alterations that previously applied BSA Alteration may
@@ -883,8 +1440,8 @@ def undo_alterations(self, progress=Progress()):
 
         NOTE: In order for this method to do anything, the BSA must be fully
         loaded - that means you must either pass load_cache=True and
-        names_only=False to the constructor, or call _load_bsa() (NOT
-        _load_bsa_light() !) before calling this method.
+        names_only=False to the constructor, or call _load_bsa() before
+        calling this method.
 
         See this link for an in-depth overview of BSA Alteration and the
         problem it tries to solve:
@@ -899,8 +1456,8 @@ def undo_alterations(self, progress=Progress()):
                     rebuilt_hash = self.calculate_hash(file_name)
                     if file_info.record_hash != rebuilt_hash:
                         bsa_file.seek(file_info.file_pos)
-                        bsa_file.write(struct_pack(_HashedRecord.formats[0][0],
-                                                   rebuilt_hash))
+                        bsa_file.write(struct_pack(
+                            file_info.hash_format[0], rebuilt_hash))
                         reset_count += 1
                 progress(progress.state + 1, u'Rebuilding Hashes...\n' +
                          folder_name)
@@ -909,6 +1466,7 @@ def undo_alterations(self, progress=Progress()):
 class SkyrimSeBsa(BSA):
     folder_record_type = BSASkyrimSEFolderRecord
     _compression_type = _Bsa_lz4
+    _bsa_version = 105
 
 # Factory
 def get_bsa_type(game_fsName):
@@ -922,6 +1480,4 @@ def get_bsa_type(game_fsName):
     elif game_fsName in (u'Skyrim Special Edition', u'Skyrim VR'):
         return SkyrimSeBsa
     elif game_fsName in (u'Fallout4', u'Fallout4VR'):
-        # Hashes are I not Q in BA2s!
-        _HashedRecord.formats = [(u'I', struct.calcsize(u'I'))]
         return BA2
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+"""Persistent index of the BSAs in the Data folder. For each archive it holds
+the paths of its assets and whatever its format needs to find the records of
+some of them without loading all of them (see ABsa.read_index), so that
+checking for conflicts needs no archive I/O and extracting an asset only needs
+to read its record."""
+
+import errno
+import os
+import zlib
+
+from .. import bolt
+from ..exception import BSAError
+
+# How many bytes at the start and at the end of an archive are checked to
+# tell whether it changed - these hold its header and, for BA2s, its name table
+_SAMPLE_SIZE = 64 * 1024
+
+def _sample_crc(ins, size):
+    """Returns the CRC of the first and last _SAMPLE_SIZE bytes of the
+    specified open archive, which is size bytes long."""
+    sample_crc = zlib.crc32(ins.read(_SAMPLE_SIZE))
+    if size > 2 * _SAMPLE_SIZE:
+        ins.seek(-_SAMPLE_SIZE, os.SEEK_END)
+    sample_crc = zlib.crc32(ins.read(_SAMPLE_SIZE), sample_crc)
+    return sample_crc & 0xFFFFFFFF
+
+class BsaIndex(bolt.PersistentCache):
+    """Persistent cache of the indices of BSAs, keyed by their (lowercase)
+    absolute path. An entry is only valid as long as the size, modification
+    time and the CRC of the start and end of its archive do not change - Bash
+    resets the mtimes of BSAs (see the ResetBSATimestamps setting), so an
+    archive replaced by one of the same size could otherwise keep the index of
+    the old one."""
+    _cache_version = 2
+    # abs path -> (size, mtime, sample crc, index)
+    _entries_key = u'indices'
+
+    def get_index(self, bsa_info):
+        """Returns the index of the specified archive, from the cache if it is
+        still valid for it. Raises BSAError if the archive can't be parsed.
+
+        :type bsa_info: bosh.bsa_files.ABsa"""
+        indices = self._load()
+        abs_path = bsa_info.abs_path.s
+        path_key = abs_path.lower()
+        try:
+            st = os.stat(abs_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT: raise
+            if indices.pop(path_key, None) is not None: self._changed = True
+            return bsa_info.read_index() # let it raise
+        try:
+            with open(abs_path, u'rb') as ins:
+                stat_key = (st.st_size, st.st_mtime,
+                            _sample_crc(ins, st.st_size))
+        except (IOError, OSError):
+            return bsa_info.read_index() # let it raise
+        cached = indices.get(path_key)
+        if cached is not None and cached[:3] == stat_key:
+            return cached[3]
+        try:
+            bsa_index = bsa_info.read_index()
+        except BSAError:
+            if indices.pop(path_key, None) is not None: self._changed = True
+            raise
+        indices[path_key] = stat_key + (bsa_index,)
+        self._changed = True
+        return bsa_index
+
+    def retain(self, abs_paths):
+        """Drops the cached indices of all archives not in abs_paths, which
+        must hold the (case insensitive) absolute paths of all archives that
+        are to be kept."""
+        keep = {p.lower() for p in abs_paths}
+        self._drop_entries(keep.__contains__)
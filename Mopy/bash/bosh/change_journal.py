@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+"""Journal of the changes made to the Data and Bash Installers folders
+between refreshes, so that refreshes only need to rescan the directories that
+changed instead of walking (and lstat'ing) whole trees. Backed by
+ReadDirectoryChangesW on Windows and by inotify on Linux - elsewhere, or if
+the OS runs out of watches, make_change_journal returns None and everything
+falls back to full walks.
+
+The journal is shared by several consumers (ModInfos, BAIN's Data scan, BAIN
+projects), each of which keeps its own set of dirty directories. A consumer
+asks for the directories that changed under a root with dirty_dirs, rescans
+them and then calls mark_clean. Until a consumer has walked a root (using
+walk, which watches the directories it visits) or if the event queue of the
+OS overflows, dirty_dirs returns None, meaning the consumer must walk the
+whole root."""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import sys
+
+from .. import bolt
+from ..bolt import deprint
+
+def make_change_journal():
+    """Return a new ChangeJournal, or None if the OS does not let us watch
+    directories."""
+    if sys.platform == u'win32':
+        return _make_windows_journal()
+    if sys.platform.startswith(u'linux'):
+        return _make_inotify_journal()
+    return None
+
+class ChangeJournal(object):
+    """Records which directories changed between refreshes - see the module
+    docstring. Paths are the absolute unicode paths the consumers use, with
+    no trailing separator. Subclasses implement watching directories and
+    reading the events of the OS."""
+
+    def __init__(self):
+        # consumer -> {dirty dir -> (serial, True if its whole tree changed)}
+        self._dirty = {}
+        # consumer -> roots it walked (or listed) since the last overflow
+        self._known = {}
+        # (consumer, root) -> serial of the last event seen by dirty_dirs
+        self._checkpoints = {}
+        self._serial = 0
+        self._broken = False
+
+    # Consumer API ------------------------------------------------------------
+    def dirty_dirs(self, consumer, root):
+        """Return a dict mapping the directories under root (root included)
+        that changed since consumer last called mark_clean for root to True
+        if their whole tree changed (they were created, deleted or moved) or
+        False if only the files directly in them did. Returns None if the
+        consumer has to walk all of root instead."""
+        if self._broken or not self._watch(root): return None
+        # Record changes for the consumer from now on, so that the ones made
+        # while it walks root the first time are not lost
+        consumer_dirty = self._dirty.setdefault(consumer, {})
+        self._pump()
+        self._checkpoints[(consumer, root)] = self._serial
+        if root not in self._known.get(consumer, ()): return None
+        under_root = root + os.sep
+        return {d: deep for d, (_serial, deep) in consumer_dirty.iteritems()
+                if d == root or d.startswith(under_root)}
+
+    def mark_clean(self, consumer, root):
+        """Forget the changes under root that consumer saw in its last
+        dirty_dirs call for root - call this once they are processed, or
+        after walking root using walk. Changes made since then are kept."""
+        checkpoint = self._checkpoints.pop((consumer, root), None)
+        if self._broken or checkpoint is None: return
+        consumer_dirty = self._dirty.setdefault(consumer, {})
+        under_root = root + os.sep
+        for d in [d for d, (serial, _deep) in consumer_dirty.iteritems()
+                  if serial <= checkpoint and (
+                          d == root or d.startswith(under_root))]:
+            del consumer_dirty[d]
+        self._known.setdefault(consumer, set()).add(root)
+
+    def watch(self, dir_path):
+        """Watch dir_path ahead of the consumers asking about the roots under
+        it. ReadDirectoryChangesW watches whole trees, so on Windows this
+        saves a watch per root when several roots share a parent (e.g. BAIN
+        projects). Returns False if it could not be watched."""
+        return self._watch(dir_path)
+
+    def walk(self, root):
+        """Wrap bolt.walkdir, watching each directory before it is listed.
+        Pruning the yielded subdirectories in place works as usual - pruned
+        directories are not watched."""
+        for asDir, sDirs, sFiles in bolt.walkdir(root):
+            yield asDir, sDirs, sFiles
+            for sDir in sDirs:
+                self._watch(os.path.join(asDir, sDir))
+
+    # Backend API -------------------------------------------------------------
+    def _watch(self, dir_path):
+        """Watch dir_path if it is not already watched. Returns False if it
+        could not be watched."""
+        raise NotImplementedError
+
+    def _pump(self):
+        """Read all pending events from the OS and record them."""
+        raise NotImplementedError
+
+    def _close(self):
+        """Release the resources of the OS we hold."""
+        raise NotImplementedError
+
+    # Internals ---------------------------------------------------------------
+    def _forget_known(self, dir_path):
+        """Consumers have to walk dir_path and the roots under it again."""
+        under_dir = dir_path + os.sep
+        for known in self._known.itervalues():
+            known.difference_update([k for k in known if k == dir_path or
+                                     k.startswith(under_dir)])
+
+    def _mark_dirty(self, dir_path, deep):
+        self._serial += 1
+        for consumer_dirty in self._dirty.itervalues():
+            was_deep = consumer_dirty.get(dir_path, (0, False))[1]
+            consumer_dirty[dir_path] = (self._serial, deep or was_deep)
+
+    def _reset(self):
+        """Forget everything the consumers know - they have to walk their
+        roots again. Watches are kept."""
+        for consumer_dirty in self._dirty.itervalues(): consumer_dirty.clear()
+        for known in self._known.itervalues(): known.clear()
+        self._checkpoints.clear()
+
+    def _break(self, msg):
+        deprint(msg + u' - falling back to full scans')
+        self._broken = True
+        self._reset()
+        self._close()
+
+#------------------------------------------------------------------------------
+# inotify (Linux) - see inotify(7)
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_UNMOUNT = 0x00002000
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM |
+               _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF |
+               _IN_MOVE_SELF | _IN_ONLYDIR)
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+_EVENT_HEADER = struct.Struct(u'iIII')
+_READ_SIZE = 65536
+_FS_ENCODING = sys.getfilesystemencoding() or u'utf-8'
+
+def _make_inotify_journal():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library(u'c'), use_errno=True)
+        inotify_fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+    except (OSError, AttributeError):
+        deprint(u'inotify is not available', traceback=True)
+        return None
+    if inotify_fd < 0:
+        deprint(u'inotify_init1 failed: %s' % os.strerror(ctypes.get_errno()))
+        return None
+    return _InotifyJournal(libc, inotify_fd)
+
+class _InotifyJournal(ChangeJournal):
+    """inotify only watches single directories, so each directory of the
+    watched trees gets its own watch - added by walk as it visits them."""
+
+    def __init__(self, libc, inotify_fd):
+        super(_InotifyJournal, self).__init__()
+        self._libc = libc
+        self._fd = inotify_fd
+        self._wd_paths = {} # watch descriptor -> watched directory
+        self._path_wds = {}
+
+    def _watch(self, dir_path):
+        if self._broken: return False
+        if dir_path in self._path_wds: return True
+        wd = self._libc.inotify_add_watch(
+            self._fd, dir_path.encode(_FS_ENCODING), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return False # gone, or the walk can't see into it either
+            self._break(u'inotify_add_watch failed for %s: %s' % (
+                dir_path, os.strerror(err)))
+            return False
+        old_path = self._wd_paths.get(wd)
+        if old_path is not None: # same directory, reachable by another path
+            del self._path_wds[old_path]
+        self._wd_paths[wd] = dir_path
+        self._path_wds[dir_path] = wd
+        return True
+
+    def _close(self):
+        os.close(self._fd)
+
+    def _watch_tree(self, dir_path):
+        for asDir, sDirs, _sFiles in self.walk(dir_path):
+            if not self._watch(asDir): sDirs[:] = []
+
+    def _unwatch_tree(self, dir_path):
+        """Stop watching dir_path and its subdirectories, e.g. because they
+        were moved out from under the watched roots."""
+        under_dir = dir_path + os.sep
+        for path in [p for p in self._path_wds
+                     if p == dir_path or p.startswith(under_dir)]:
+            wd = self._path_wds.pop(path)
+            del self._wd_paths[wd]
+            self._libc.inotify_rm_watch(self._fd, wd)
+        self._forget_known(dir_path)
+
+    def _pump(self):
+        while not self._broken:
+            try:
+                buff = os.read(self._fd, _READ_SIZE)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR): return
+                raise
+            if not buff: return
+            pos = 0
+            while pos < len(buff):
+                wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(buff,
+                                                                        pos)
+                pos += _EVENT_HEADER.size
+                name = buff[pos:pos + name_len].rstrip(b'\0')
+                pos += name_len
+                self._record(wd, mask, name)
+
+    def _record(self, wd, mask, name):
+        if mask & _IN_Q_OVERFLOW:
+            deprint(u'inotify event queue overflowed, rescanning everything')
+            self._reset()
+            return
+        dir_path = self._wd_paths.get(wd)
+        if dir_path is None: return # unwatched since the event was queued
+        if mask & _IN_UNMOUNT:
+            self._break(u'%s was unmounted' % dir_path)
+        elif mask & _IN_MOVE_SELF:
+            # the parent's watch (if any) records it as a deep change - but if
+            # a walk already found it at its new path, that path is gone too
+            self._unwatch_tree(dir_path)
+            if os.path.isdir(dir_path):
+                self._watch_tree(dir_path)
+                self._mark_dirty(dir_path, True)
+        elif mask & (_IN_IGNORED | _IN_DELETE_SELF):
+            # subdirectories get their own events, no need to walk the tree
+            del self._wd_paths[wd]
+            if self._path_wds.get(dir_path) == wd: # else it was recreated
+                del self._path_wds[dir_path]
+            for known in self._known.itervalues(): known.discard(dir_path)
+        else:
+            self._mark_dirty(dir_path, False)
+            if not (mask & _IN_ISDIR): return
+            try:
+                sub_dir = os.path.join(dir_path, name.decode(_FS_ENCODING))
+            except UnicodeDecodeError:
+                self._mark_dirty(dir_path, True)
+                return
+            if mask & _IN_MOVED_FROM:
+                self._unwatch_tree(sub_dir)
+            elif mask & (_IN_CREATE | _IN_MOVED_TO):
+                self._watch_tree(sub_dir)
+            self._mark_dirty(sub_dir, True)
+
+#------------------------------------------------------------------------------
+# ReadDirectoryChangesW (Windows)
+_FILE_LIST_DIRECTORY = 0x0001
+_FILE_SHARE_ALL = 0x00000001 | 0x00000002 | 0x00000004 # read, write, delete
+_OPEN_EXISTING = 3
+_FILE_FLAG_BACKUP_SEMANTICS = 0x02000000 # needed to open directories
+_FILE_FLAG_OVERLAPPED = 0x40000000
+_NOTIFY_FILTER = (0x00000001 | # FILE_NOTIFY_CHANGE_FILE_NAME
+                  0x00000002 | # FILE_NOTIFY_CHANGE_DIR_NAME
+                  0x00000008 | # FILE_NOTIFY_CHANGE_SIZE
+                  0x00000010 | # FILE_NOTIFY_CHANGE_LAST_WRITE
+                  0x00000040)  # FILE_NOTIFY_CHANGE_CREATION
+_FILE_ACTION_ADDED = 1
+_FILE_ACTION_REMOVED = 2
+_FILE_ACTION_RENAMED_OLD_NAME = 4
+_FILE_ACTION_RENAMED_NEW_NAME = 5
+_WAIT_TIMEOUT = 258
+# struct FILE_NOTIFY_INFORMATION: DWORD NextEntryOffset, Action,
+# FileNameLength; WCHAR FileName[FileNameLength / 2]
+_NOTIFY_HEADER = struct.Struct(u'<III')
+# The OS buffers the changes made between two reads of a watch in a buffer
+# of this size, too - if it overflows, the whole watched tree is rescanned
+_NOTIFY_BUFFER_SIZE = 65536
+
+def _make_windows_journal():
+    try:
+        from ctypes import wintypes
+        kernel32 = ctypes.WinDLL(u'kernel32', use_last_error=True)
+    except (ImportError, OSError, AttributeError, ValueError):
+        deprint(u'ReadDirectoryChangesW is not available', traceback=True)
+        return None
+    class _Overlapped(ctypes.Structure):
+        _fields_ = [(u'Internal', ctypes.c_size_t),
+                    (u'InternalHigh', ctypes.c_size_t),
+                    (u'Offset', wintypes.DWORD),
+                    (u'OffsetHigh', wintypes.DWORD),
+                    (u'hEvent', wintypes.HANDLE)]
+    p_overlapped = ctypes.POINTER(_Overlapped)
+    kernel32.CreateFileW.argtypes = [wintypes.LPCWSTR, wintypes.DWORD,
+        wintypes.DWORD, wintypes.LPVOID, wintypes.DWORD, wintypes.DWORD,
+        wintypes.HANDLE]
+    kernel32.CreateFileW.restype = wintypes.HANDLE
+    kernel32.CreateIoCompletionPort.argtypes = [wintypes.HANDLE,
+        wintypes.HANDLE, ctypes.c_size_t, wintypes.DWORD]
+    kernel32.CreateIoCompletionPort.restype = wintypes.HANDLE
+    kernel32.ReadDirectoryChangesW.argtypes = [wintypes.HANDLE,
+        wintypes.LPVOID, wintypes.DWORD, wintypes.BOOL, wintypes.DWORD,
+        ctypes.POINTER(wintypes.DWORD), p_overlapped, wintypes.LPVOID]
+    kernel32.ReadDirectoryChangesW.restype = wintypes.BOOL
+    kernel32.GetQueuedCompletionStatus.argtypes = [wintypes.HANDLE,
+        ctypes.POINTER(wintypes.DWORD), ctypes.POINTER(ctypes.c_size_t),
+        ctypes.POINTER(p_overlapped), wintypes.DWORD]
+    kernel32.GetQueuedCompletionStatus.restype = wintypes.BOOL
+    kernel32.CancelIo.argtypes = [wintypes.HANDLE]
+    kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+    port = kernel32.CreateIoCompletionPort(
+        wintypes.HANDLE(-1).value, None, 0, 1)
+    if not port:
+        deprint(u'CreateIoCompletionPort failed: %s' % ctypes.FormatError(
+            ctypes.get_last_error()))
+        return None
+    return _WindowsJournal(kernel32, port, _Overlapped, wintypes)
+
+class _WindowsJournal(ChangeJournal):
+    """ReadDirectoryChangesW watches whole trees, so only the roots the
+    consumers ask about get a watch - directories under a watched root are
+    already covered. All watches complete to a single I/O completion port,
+    which _pump polls without waiting, so no threads are needed."""
+
+    def __init__(self, kernel32, port, overlapped_type, wintypes):
+        super(_WindowsJournal, self).__init__()
+        self._kernel32 = kernel32
+        self._port = port
+        self._overlapped_type = overlapped_type
+        self._wintypes = wintypes
+        self._invalid_handle = wintypes.HANDLE(-1).value
+        # watch key -> (root, directory handle, buffer, OVERLAPPED) - the
+        # buffer and OVERLAPPED must live as long as a read is pending
+        self._watches = {}
+        self._root_keys = {} # os.path.normcase(root) -> watch key
+        # watch key -> cancelled watch, kept alive until its read is aborted
+        self._cancelled = {}
+        self._next_key = 1
+
+    def _watch(self, dir_path):
+        if self._broken: return False
+        # Covered by the watch of dir_path or of one of its parents?
+        norm_path = os.path.normcase(dir_path)
+        while True:
+            if norm_path in self._root_keys: return True
+            parent_path = os.path.dirname(norm_path)
+            if parent_path == norm_path: break
+            norm_path = parent_path
+        k32 = self._kernel32
+        handle = k32.CreateFileW(dir_path, _FILE_LIST_DIRECTORY,
+            _FILE_SHARE_ALL, None, _OPEN_EXISTING,
+            _FILE_FLAG_BACKUP_SEMANTICS | _FILE_FLAG_OVERLAPPED, None)
+        if not handle or handle == self._invalid_handle:
+            return False # gone, or the walk can't see into it either
+        key = self._next_key
+        self._next_key += 1
+        if not k32.CreateIoCompletionPort(handle, self._port, key, 0):
+            k32.CloseHandle(handle)
+            self._break(u'CreateIoCompletionPort failed for %s: %s' % (
+                dir_path, ctypes.FormatError(ctypes.get_last_error())))
+            return False
+        watch = (dir_path, handle,
+                 ctypes.create_string_buffer(_NOTIFY_BUFFER_SIZE),
+                 self._overlapped_type())
+        self._watches[key] = watch
+        self._root_keys[os.path.normcase(dir_path)] = key
+        if not self._read(watch):
+            self._unwatch(key)
+            return False
+        return True
+
+    def _read(self, watch):
+        """Issue the next asynchronous read of changes for watch."""
+        _root, handle, buff, overlapped = watch
+        return bool(self._kernel32.ReadDirectoryChangesW(handle, buff,
+            _NOTIFY_BUFFER_SIZE, True, _NOTIFY_FILTER, None,
+            ctypes.byref(overlapped), None))
+
+    def _unwatch(self, key):
+        watch = self._watches.pop(key)
+        del self._root_keys[os.path.normcase(watch[0])]
+        self._kernel32.CancelIo(watch[1])
+        self._kernel32.CloseHandle(watch[1])
+        self._cancelled[key] = watch
+
+    def _close(self):
+        for key in self._watches.keys(): self._unwatch(key)
+        self._kernel32.CloseHandle(self._port)
+
+    def _pump(self):
+        wintypes = self._wintypes
+        num_bytes = wintypes.DWORD()
+        key = ctypes.c_size_t()
+        p_overlapped = ctypes.POINTER(self._overlapped_type)()
+        while not self._broken:
+            if not self._kernel32.GetQueuedCompletionStatus(self._port,
+                    ctypes.byref(num_bytes), ctypes.byref(key),
+                    ctypes.byref(p_overlapped), 0):
+                if not p_overlapped: # nothing (more) to dequeue
+                    err = ctypes.get_last_error()
+                    if err != _WAIT_TIMEOUT:
+                        self._break(u'GetQueuedCompletionStatus failed: %s'
+                                    % ctypes.FormatError(err))
+                    return
+                if self._cancelled.pop(key.value, None) is not None:
+                    continue # the aborted read of an unwatched root
+                # The read failed, e.g. because the root was deleted - the
+                # consumers have to walk it again, which watches it again
+                watch = self._watches.get(key.value)
+                if watch is not None:
+                    self._unwatch(key.value)
+                    self._forget_known(watch[0])
+                    self._mark_dirty(watch[0], True)
+                continue
+            watch = self._watches.get(key.value)
+            if watch is None: # completed before _unwatch could cancel it
+                self._cancelled.pop(key.value, None)
+                continue
+            if num_bytes.value:
+                self._record(watch[0], watch[2].raw[:num_bytes.value])
+            else:
+                # the buffer of the OS overflowed, we missed some changes -
+                # the consumers have to walk all their roots under it
+                self._forget_known(watch[0])
+                self._mark_dirty(watch[0], True)
+            if not self._read(watch):
+                self._unwatch(key.value)
+                self._forget_known(watch[0])
+                self._mark_dirty(watch[0], True)
+
+    def _record(self, root, buff):
+        pos = 0
+        while True:
+            next_offset, action, name_len = _NOTIFY_HEADER.unpack_from(buff,
+                                                                       pos)
+            name_start = pos + _NOTIFY_HEADER.size
+            changed_path = os.path.join(root, buff[
+                name_start:name_start + name_len].decode(u'utf-16-le'))
+            self._mark_dirty(os.path.dirname(changed_path), False)
+            # We can't tell if a deleted or renamed path was a directory, so
+            # rescan it as one - for a file that finds nothing
+            if action in (_FILE_ACTION_REMOVED, _FILE_ACTION_RENAMED_OLD_NAME
+                          ) or action in (_FILE_ACTION_ADDED,
+                                          _FILE_ACTION_RENAMED_NEW_NAME
+                                          ) and os.path.isdir(changed_path):
+                self._mark_dirty(changed_path, True)
+            if not next_offset: return
+            pos += next_offset
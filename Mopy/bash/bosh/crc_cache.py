@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+"""CRC calculation shared by ModInfos and BAIN. Files are spread over a pool
+of threads, biggest ones first, so that reading files from disk (which
+releases the GIL) overlaps with calculating the CRCs of the blocks already
+read. The CRCs of the files in the Data folder are kept in a persistent cache,
+so no file there is read twice unless it changed."""
+
+import errno
+import os
+import threading
+from collections import deque
+from functools import partial
+from itertools import izip
+from zlib import crc32 # faster than binascii.crc32 on Python 2
+
+from .. import bass, bolt
+from ..bolt import deprint
+
+_BLOCK_SIZE = 2097152 # 2MB at a time, probably ok
+
+def _calc_crc(abs_path, blocks_read, cancelled):
+    """Return the CRC of the specified file, or None if it could not be
+    read or cancelled got set. Appends the size of each block read to the
+    blocks_read deque, for the progress of calc_crcs."""
+    crc = 0
+    try:
+        with open(abs_path, u'rb') as ins:
+            for block in iter(partial(ins.read, _BLOCK_SIZE), b''):
+                crc = crc32(block, crc)
+                blocks_read.append(len(block))
+                if cancelled.is_set(): return None
+    except Exception: # not just IOError - calc_crcs waits on every file
+        deprint(u'Failed to calculate crc for %s - please report this, '
+                u'and the following traceback:' % abs_path, traceback=True)
+        return None
+    return crc & 0xFFFFFFFF
+
+def calc_crcs(path_sizes, progress=None, progress_msg=u''):
+    """Calculates the CRCs of the specified files using several threads and
+    returns a dict mapping their paths to their CRCs. Files that could not be
+    read are left out.
+
+    :param path_sizes: dict mapping the absolute paths (unicode) of the files
+        to their sizes, used to order them and to report progress.
+    :param progress: Progress to report aggregate progress to, the name of
+        the last file done is appended to progress_msg."""
+    path_crcs = {}
+    if not path_sizes: return path_crcs
+    progress = progress or bolt.Progress()
+    # each file increments the progress bar by at least one, even if it is
+    # size 0 - add len(path_sizes) to the progress bar max to ensure we don't
+    # hit 100% and cause the progress bar to prematurely disappear
+    progress.setFull(sum(path_sizes.itervalues()) + len(path_sizes))
+    progress(0, progress_msg)
+    # Biggest files first, so we are not left waiting on one of them at the
+    # end with all the other threads idle
+    jobs = sorted(path_sizes, key=path_sizes.__getitem__, reverse=True)
+    blocks_read = deque() # appending and popping are thread safe
+    cancelled = threading.Event()
+    done = [0]
+    def _report_blocks(message=u''):
+        try:
+            while blocks_read: done[0] += blocks_read.popleft()
+            progress(done[0], message)
+        except:
+            # e.g. a CancelError - stop reading big files before the threads
+            # are waited for
+            cancelled.set()
+            raise
+    crcs = bolt.ordered_thread_map(
+        lambda abs_path: _calc_crc(abs_path, blocks_read, cancelled), jobs,
+        bass.inisettings[u'CrcThreads'], wait_callback=_report_blocks)
+    try:
+        for abs_path, crc in izip(jobs, crcs):
+            if crc is not None: path_crcs[abs_path] = crc
+            done[0] += 1
+            _report_blocks(progress_msg + abs_path)
+    finally:
+        crcs.close()
+    return path_crcs
+
+class CrcCache(bolt.PersistentCache):
+    """Persistent cache of the CRCs of the files in the Data folder, keyed by
+    their (lowercase) path relative to it. An entry is only valid as long as
+    the size, modification time and inode of its file do not change - on
+    Windows the inode is always 0 in Python 2, so it is not checked there.
+
+    Files outside of the Data folder are never cached."""
+    # rel path -> (size, mtime, inode, crc)
+    _entries_key = u'crcs'
+
+    def __init__(self, data_dir, cache_path):
+        """:type data_dir: bolt.Path
+        :type cache_path: bolt.Path"""
+        super(CrcCache, self).__init__(cache_path)
+        self._data_prefix = data_dir.s.lower() + os.sep
+
+    def _cache_key(self, abs_path):
+        """Returns the key abs_path is cached under, or None if it is outside
+        of the Data folder."""
+        lower_path = abs_path.lower()
+        if lower_path.startswith(self._data_prefix):
+            return lower_path[len(self._data_prefix):]
+        return None
+
+    @staticmethod
+    def _stat_key(abs_path):
+        lstat = os.lstat(abs_path)
+        return lstat.st_size, int(lstat.st_mtime), lstat.st_ino
+
+    def get_crc(self, abs_path, recalculate=False):
+        """Returns the CRC of the specified file, from the cache if it is
+        still valid for it. If recalculate is True, the CRC is always
+        calculated anew (and cached). Raises IOError/OSError if the file
+        can't be read.
+
+        :type abs_path: bolt.Path"""
+        crcs = self._load()
+        path_key = self._cache_key(abs_path.s)
+        stat_key = self._stat_key(abs_path.s)
+        if path_key is not None and not recalculate:
+            cached = crcs.get(path_key)
+            if cached is not None and cached[:3] == stat_key:
+                return cached[3]
+        path_crc = abs_path.crc
+        if path_key is not None:
+            crcs[path_key] = stat_key + (path_crc,)
+            self._changed = True
+        return path_crc
+
+    def get_crcs(self, abs_paths, progress=None, progress_msg=u'',
+                 recalculate=False):
+        """Returns a dict mapping the specified absolute paths (unicode) to
+        the CRCs of the files. The ones not in the cache (all of them if
+        recalculate is True) are calculated in parallel, see calc_crcs. Files
+        that do not exist or can't be read are left out."""
+        crcs = self._load()
+        path_crcs = {}
+        pending = {} # abs path -> size
+        stat_keys = {} # abs path -> (path key, stat key)
+        for abs_path in abs_paths:
+            path_key = self._cache_key(abs_path)
+            try:
+                stat_key = self._stat_key(abs_path)
+            except OSError as e:
+                if e.errno != errno.ENOENT: raise
+                if crcs.pop(path_key, None) is not None: self._changed = True
+                continue
+            if path_key is not None and not recalculate:
+                cached = crcs.get(path_key)
+                if cached is not None and cached[:3] == stat_key:
+                    path_crcs[abs_path] = cached[3]
+                    continue
+            pending[abs_path] = stat_key[0]
+            stat_keys[abs_path] = (path_key, stat_key)
+        new_crcs = calc_crcs(pending, progress, progress_msg)
+        for abs_path, path_crc in new_crcs.iteritems():
+            path_key, stat_key = stat_keys[abs_path]
+            if path_key is not None:
+                crcs[path_key] = stat_key + (path_crc,)
+                self._changed = True
+        path_crcs.update(new_crcs)
+        return path_crcs
+
+    def retain(self, rel_paths, rescanned=None):
+        """Drops the cached CRCs of all files not in rel_paths, which must
+        hold the (case insensitive) paths of all files in the Data folder
+        that are to be kept. If only some directories were rescanned, pass a
+        function returning True for the lowercase paths of the files in them
+        as rescanned - the CRCs of all other files are kept."""
+        keep = {p.lower() for p in rel_paths}
+        if rescanned is None:
+            self._drop_entries(keep.__contains__)
+        else:
+            self._drop_entries(lambda k: k in keep or not rescanned(k))
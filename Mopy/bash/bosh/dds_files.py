@@ -252,8 +252,9 @@ def setup_file(self, dds_file, use_legacy_formats=False):
 
         :type dds_file: DDSFile
         :param use_legacy_formats: If set to True, use non-DXT10 legacy formats
-            that are equivalent instead."""
-        target_pf = self._fmt_ddspf if use_legacy_formats else _DDSPF_DXT10
+            that are equivalent instead, where there are any."""
+        target_pf = self._fmt_ddspf if use_legacy_formats and \
+                                       self._fmt_ddspf else _DDSPF_DXT10
         dds_file.dds_header.ddspf = copy.copy(target_pf)
         row_pitch, slice_pitch = _compute_pitch[self._fmt_name](
             self._fmt_bpp, dds_file.dds_header.dw_width,
@@ -266,9 +267,14 @@ def setup_file(self, dds_file, use_legacy_formats=False):
             dds_file.dds_header.dw_flags.DDSD_PITCH = True
             dds_file.dds_header.dw_flags.DDSD_LINEARSIZE = False
             dds_file.dds_header.dw_pitch_or_linear_size = row_pitch
-        if self._fmt_ddspf.needs_dxt10:
+        if target_pf.needs_dxt10:
             dds_file.dds_dxt10.dxgi_format = copy.copy(self)
 
+    def slice_pitch(self, width, height):
+        """Returns the size in bytes of an image of the specified dimensions
+        in this DXGI format."""
+        return _compute_pitch[self._fmt_name](self._fmt_bpp, width, height)[1]
+
     def __repr__(self):
         return u'%s (%u)' % (self._fmt_name, self._fmt_index)
 
@@ -435,11 +441,11 @@ def _compute_shift_dyn(_bpp, width, height):
 _compute_nv11 = _compute_complex(4, lambda height: height, 3, 2)
 _compute_p208 = _compute_complex(2, lambda height: height)
 
-def _compute_v208(width, height):
+def _compute_v208(_bpp, width, height):
     """V208-specific row/slice pitch computation function."""
     return width, width * (height + (((height + 1) >> 1) * 2))
 
-def _compute_v408(width, height):
+def _compute_v408(_bpp, width, height):
     """V408-specific row/slice pitch computation function."""
     return width, width * (height + ((height >> 1) * 4))
 
@@ -607,12 +613,32 @@ def load_file(self):
 
     def load_from_stream(self, ins):
         """Load the entire DDS file from the specified stream."""
+        self.load_headers(ins)
+        # Read and store the rest of the stream
+        self.dds_contents = ins.read()
+
+    def load_headers(self, ins):
+        """Load only the headers of the DDS file from the specified stream,
+        leaving it at the start of the image data."""
         self.dds_header.load_header(ins)
         # Check if a DXT10 header is going to be present
         if self.dds_header.ddspf.needs_dxt10:
             self.dds_dxt10.load_header(ins)
-        # Read and store the rest of the stream
-        self.dds_contents = ins.read()
+
+    def get_dxgi_format(self):
+        """Returns the DXGI format of this DDS file - for files without a DXT10
+        header, the DXGI format equivalent to their legacy pixel format."""
+        ddspf = self.dds_header.ddspf
+        if ddspf.needs_dxt10:
+            return self.dds_dxt10.dxgi_format
+        if ddspf.pf_flags.DDPF_FOURCC:
+            pf_key = _legacy_four_ccs.get(ddspf.pf_four_cc, ddspf.pf_four_cc)
+        else:
+            pf_key = _legacy_pf_key(ddspf)
+        try:
+            return _legacy_to_dxgi[pf_key]
+        except KeyError:
+            raise DDSError(u'Unsupported legacy pixel format %r' % (pf_key,))
 
     def dump_file(self):
         """Dumps this DDS file to a bytestring and returns the result."""
@@ -643,6 +669,30 @@ def _reset_cache(self, stat_tuple, load_cache):
         self.dds_dxt10 = _DDSHeaderDXT10()
         self.dds_contents = b''
 
+def _legacy_pf_key(ddspf):
+    """Returns the properties identifying a non-fourcc legacy pixel format."""
+    return (int(ddspf.pf_flags), ddspf.pf_rgb_bit_count, ddspf.pf_r_bit_mask,
+            ddspf.pf_g_bit_mask, ddspf.pf_b_bit_mask, ddspf.pf_a_bit_mask)
+
+# Maps legacy pixel formats (by fourcc or _legacy_pf_key) to the first DXGI
+# format that is equivalent to them
+_legacy_to_dxgi = {}
+for _fmt_index, _dxgi_fmt in sorted(_DXGIFormat.index_to_fmt.iteritems()):
+    _fmt_pf = _dxgi_fmt._fmt_ddspf
+    if _fmt_pf is None or _fmt_pf.needs_dxt10: continue
+    _legacy_to_dxgi.setdefault(
+        _fmt_pf.pf_four_cc if _fmt_pf.pf_flags.DDPF_FOURCC
+        else _legacy_pf_key(_fmt_pf), _dxgi_fmt)
+del _fmt_index, _dxgi_fmt, _fmt_pf
+# Legacy fourccs that are aliases of (or premultiplied versions of) the ones
+# above, cf. GetDXGIFormat in DirectXTexDDS.cpp
+_legacy_four_ccs = {
+    _MAGIC_DXT2: _MAGIC_DXT3,
+    _MAGIC_DXT4: _MAGIC_DXT5,
+    b'ATI1': _MAGIC_BC4_UNORM,
+    b'ATI2': _MAGIC_BC5_UNORM,
+}
+
 def mk_dxgi_fmt(fmt_index):
     """Returns a matching DXGI format instance for the specified DXGI index."""
     try:
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+"""Cache of the files BAIN extracted from archives, so that reinstalling or
+annealing an archive does not need to extract them again. Files are stored by
+content - keyed by the (size, crc) BAIN already knows for every file in an
+archive - so identical files shared by several archives are stored once.
+
+Files are placed in the Data folder by cloning (reflinking) them where the
+filesystem supports it. Hard linking them instead is opt in, as a hard linked
+file changes along with its copy in the Data folder when that is edited in
+place - so a cached file whose size, modification time or inode changed has
+its CRC checked before it is used again and is dropped if it does not match
+anymore. Files that are commonly edited in place (ini, txt, json...) are
+never hard linked. Freshly extracted files that can be neither cloned nor
+hard linked are moved to the Data folder and not cached, as copying them
+would double the I/O of every install - files cached earlier are copied."""
+
+import errno
+import os
+import shutil
+import threading
+import time
+
+from .. import bolt, env
+from ..bolt import deprint
+
+class InstallCache(bolt.PersistentCache):
+    """Content addressed cache of extracted files with a size budget - the
+    least recently used files are dropped when the cache is saved. Thread
+    safe, as archives are extracted in background threads."""
+    # (size, crc) -> [(size, mtime, inode) of the file, last used time]
+    _entries_key = u'blobs'
+    # Extensions of files that users and tools edit in place - hard linking
+    # them would change the cached copy (and every other installed copy)
+    _edited_exts = frozenset((u'.cfg', u'.ini', u'.json', u'.toml', u'.txt',
+                              u'.xml', u'.yaml'))
+
+    def __init__(self, cache_dir, index_path, max_size, hard_links=False):
+        """:type cache_dir: bolt.Path
+        :type index_path: bolt.Path
+        :param max_size: the budget of the cache in bytes.
+        :param hard_links: if True, files that can't be cloned are hard
+            linked into the Data folder instead of copied, unless they have
+            one of the _edited_exts."""
+        super(InstallCache, self).__init__(index_path)
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+        self._hard_links = hard_links
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            super(InstallCache, self)._load()
+            self._sync_dir()
+        return self._entries
+
+    def _sync_dir(self):
+        """Drop the entries whose file is gone and delete the files that have
+        no entry - e.g. because we crashed before saving the index."""
+        on_disk = set()
+        cache_dir = self._cache_dir.s
+        for sub_dir in (os.listdir(cache_dir) if os.path.isdir(cache_dir)
+                        else ()):
+            sub_path = os.path.join(cache_dir, sub_dir)
+            if not os.path.isdir(sub_path): continue
+            for blob_name in os.listdir(sub_path):
+                blob_path = os.path.join(sub_path, blob_name)
+                try:
+                    crc, size = blob_name.split(u'_')
+                    key = (int(size), int(crc, 16))
+                except ValueError:
+                    key = None
+                if key in self._entries: on_disk.add(key)
+                else: self._remove_file(blob_path)
+        self._drop_entries(on_disk.__contains__)
+
+    @staticmethod
+    def _cacheable(key):
+        """Whether the file with the (size, crc) key may be cached - 7z
+        lists no CRC for the files of some archives (e.g. RAR5 ones that use
+        BLAKE2 checksums), so BAIN has 0 for them and different files of the
+        same size would share their key."""
+        return key[1] != 0 or key[0] == 0
+
+    def _blob_path(self, key):
+        size, crc = key
+        return os.path.join(self._cache_dir.s, u'%02X' % (crc >> 24),
+                            u'%08X_%d' % (crc, size))
+
+    @staticmethod
+    def _stat_key(abs_path):
+        st = os.stat(abs_path)
+        return st.st_size, st.st_mtime, st.st_ino
+
+    @staticmethod
+    def _remove_file(abs_path):
+        try:
+            bolt.GPath(abs_path).remove()
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                deprint(u'Failed to remove %s' % abs_path, traceback=True)
+
+    def _drop(self, key):
+        del self._entries[key]
+        self._changed = True
+        self._remove_file(self._blob_path(key))
+
+    def _valid_blob(self, key):
+        """Return the path to the cached file for key, or None if it is not
+        cached - or it was changed (through a hard link), in which case it is
+        dropped. Call with the lock held."""
+        if not self._cacheable(key): return None
+        entry = self._load().get(key)
+        if entry is None: return None
+        blob_path = self._blob_path(key)
+        try:
+            stat_key = self._stat_key(blob_path)
+            if stat_key != entry[0]:
+                # changed through a hard link (see hard_links) - often just
+                # the mtime, e.g. by the load order of a game that uses mtimes
+                if stat_key[0] != key[0] or \
+                        bolt.GPath(blob_path).crc != key[1]:
+                    raise ValueError
+                entry[0] = stat_key
+                self._changed = True
+        except (OSError, IOError, ValueError):
+            self._drop(key)
+            return None
+        return blob_path
+
+    def cached_keys(self, size_crcs):
+        """Return the set of size_crcs, (size, crc) tuples, that are in the
+        cache."""
+        with self._lock:
+            return {k for k in size_crcs if self._valid_blob(k) is not None}
+
+    def place_files(self, size_crcs, source_paths, dests):
+        """Install the files in dests from the cache, first adding those of
+        source_paths that were extracted to it. Files not cached are left to
+        the caller, as two lists of (source, dest) pairs: the ones to move
+        and the ones to copy (from the cache, e.g. if a dest is in use).
+
+        :type size_crcs: list[tuple]
+        :type source_paths: list[bolt.Path]
+        :type dests: list[bolt.Path]"""
+        to_move, to_copy = [], []
+        with self._lock:
+            blobs = self._load()
+            now = time.time()
+            for key, src, dest in zip(size_crcs, source_paths, dests):
+                blob_path = self._valid_blob(key)
+                added = False
+                if src.exists():
+                    if blob_path is None:
+                        blob_path = self._add(key, src)
+                        added = blob_path is not None
+                    else: # extracted anyway, e.g. by an earlier install
+                        self._remove_file(src.s)
+                if blob_path is None: # too big for the budget or not added
+                    to_move.append((src, dest))
+                    continue
+                self._changed = True
+                try:
+                    if self._place(blob_path, dest, move=added):
+                        blobs[key][1] = now
+                    else: # moved out of the cache
+                        del blobs[key]
+                except (IOError, OSError):
+                    deprint(u'Failed to install %s from %s' % (
+                        dest, blob_path), traceback=True)
+                    to_copy.append((bolt.GPath(blob_path), dest))
+        return to_move, to_copy
+
+    def _add(self, key, src):
+        """Move the extracted file src into the cache, returning its new path
+        or None if it could not be moved."""
+        if key[0] > self._max_size or not self._cacheable(key): return None
+        blob_path = self._blob_path(key)
+        try:
+            bolt.GPath(blob_path).head.makedirs()
+            if os.path.exists(blob_path): os.remove(blob_path) # orphan
+            os.rename(src.s, blob_path)
+        except OSError:
+            try: # e.g. a different volume
+                shutil.copyfile(src.s, blob_path)
+            except (IOError, OSError):
+                deprint(u'Failed to cache %s' % src, traceback=True)
+                self._remove_file(blob_path)
+                return None
+        self._entries[key] = [self._stat_key(blob_path), 0]
+        self._changed = True
+        return blob_path
+
+    def _place(self, blob_path, dest, move=False):
+        """Put a copy of blob_path at dest - removing dest first, as it may be
+        a hard link to the cached file. If move is True, blob_path is moved to
+        dest when it can be neither cloned nor hard linked, instead of copied.
+        Return False if blob_path was moved."""
+        dest.head.makedirs()
+        dest.remove()
+        if env.clone_file(blob_path, dest.s): return True
+        if self._hard_links and dest.cext.lower() not in self._edited_exts:
+            try:
+                env.hard_link(blob_path, dest.s)
+                return True
+            except OSError:
+                pass # e.g. a different volume
+        if move:
+            os.rename(blob_path, dest.s)
+            return False
+        shutil.copyfile(blob_path, dest.s)
+        return True
+
+    def save(self):
+        """Drop the least recently used files until the cache fits its budget
+        and save the index if it changed."""
+        if self._entries is None: return
+        with self._lock:
+            total = sum(k[0] for k in self._entries)
+            if total > self._max_size:
+                for key in sorted(self._entries,
+                                  key=lambda k: self._entries[k][1]):
+                    self._drop(key)
+                    total -= key[0]
+                    if total <= self._max_size: break
+            super(InstallCache, self).save()
@@ -25,7 +25,15 @@
 Wrye Bash. This file handles the evaluation of conditions.
 
 Recommended reading before working on this file:
-https://loot-api.readthedocs.io/en/latest/metadata/conditions.html."""
+https://loot-api.readthedocs.io/en/latest/metadata/conditions.html.
+
+Conditions are evaluated in an evaluation context, which memoizes the result
+of each distinct condition (and subcondition) along with the directory
+listings, CRCs and compiled regexes the condition functions need. The context
+is dropped by reset_eval_context and whenever the active plugins change.
+ModInfos.refresh calls reset_eval_context, as do the BAIN paths that install
+files to or remove files from the Data folder, since conditions may check any
+file in there, not just plugins."""
 
 import operator
 import re
@@ -38,14 +46,102 @@
 
 __author__ = u'Infernio'
 
+# Evaluation context
+class _EvalContext(object):
+    """The state conditions are evaluated against, see the module
+    docstring."""
+    __slots__ = (u'active_plugins', u'cond_results', u'_dir_listings',
+                 u'_crcs', u'_regexes')
+
+    def __init__(self, active_plugins):
+        # type: (tuple) -> None
+        self.active_plugins = active_plugins
+        self.cond_results = {} # condition repr -> result
+        self._dir_listings = {} # directory Path -> its entries (unicode)
+        self._crcs = {} # file Path -> CRC, None if it can't be read
+        self._regexes = {}
+
+    def list_dir(self, dir_path):
+        # type: (Path) -> list
+        try:
+            return self._dir_listings[dir_path]
+        except KeyError:
+            entries = self._dir_listings[dir_path] = [
+                x.s for x in dir_path.list()]
+            return entries
+
+    def get_crc(self, file_path):
+        # type: (Path) -> int | None
+        """Returns the CRC of the specified file, or None if it does not exist
+        or is a directory. Files in the Data folder are looked up in the CRC
+        cache shared with BAIN and the mods tab."""
+        try:
+            return self._crcs[file_path]
+        except KeyError:
+            from . import crcCache
+            try:
+                file_crc = (file_path.crc if crcCache is None
+                            else crcCache.get_crc(file_path))
+            except (IOError, OSError):
+                file_crc = None # Doesn't exist or is a directory
+            self._crcs[file_path] = file_crc
+            return file_crc
+
+    def compile_regex(self, regex_str):
+        # type: (unicode) -> re._pattern_type
+        try:
+            return self._regexes[regex_str]
+        except KeyError:
+            compiled = self._regexes[regex_str] = re.compile(regex_str)
+            return compiled
+
+_eval_context = None # type: _EvalContext
+
+def _get_eval_context():
+    """Returns the current evaluation context, creating a new one if there is
+    none or the active plugins changed since it was created."""
+    global _eval_context
+    active_plugins = cached_active_tuple()
+    if _eval_context is None or \
+            _eval_context.active_plugins != active_plugins:
+        _eval_context = _EvalContext(active_plugins)
+    return _eval_context
+
+def reset_eval_context():
+    """Drops the current evaluation context, so that conditions are evaluated
+    anew against the current state of the game and Data folder."""
+    global _eval_context
+    _eval_context = None
+
 # Conditions
 class _ACondition(object):
     """Abstract base class for all conditions."""
-    __slots__ = ()
+    __slots__ = (u'_cond_key',)
 
     def evaluate(self):
         # type: () -> bool
         """Evaluates this condition, resolving it to a boolean value."""
+        return self._memo_evaluate(_get_eval_context())
+
+    def _memo_evaluate(self, eval_context):
+        # type: (_EvalContext) -> bool
+        """Returns the result of this condition memoized in eval_context,
+        evaluating it first if it is not there yet. Conditions are keyed by
+        their repr, so identical conditions share their result."""
+        try:
+            cond_key = self._cond_key
+        except AttributeError:
+            cond_key = self._cond_key = repr(self)
+        cond_results = eval_context.cond_results
+        try:
+            return cond_results[cond_key]
+        except KeyError:
+            result = cond_results[cond_key] = self._evaluate(eval_context)
+            return result
+
+    def _evaluate(self, eval_context):
+        # type: (_EvalContext) -> bool
+        """Evaluates this condition without memoizing it."""
         raise AbstractError()
 
 class ConditionAnd(_ACondition):
@@ -58,8 +154,9 @@ def __init__(self, first_cond, second_cond):
         self.first_cond = first_cond
         self.second_cond = second_cond
 
-    def evaluate(self):
-        return self.first_cond.evaluate() and self.second_cond.evaluate()
+    def _evaluate(self, eval_context):
+        return (self.first_cond._memo_evaluate(eval_context) and
+                self.second_cond._memo_evaluate(eval_context))
 
     def __repr__(self):
         return u'(%r and %r)' % (self.first_cond, self.second_cond)
@@ -82,11 +179,12 @@ def __init__(self, func_name, func_args):
         self.func_name = func_name
         self.func_args = func_args
 
-    def evaluate(self):
+    def _evaluate(self, eval_context):
         # Call the appropriate function, wrapping the error to make a nicer
         # error message if no appropriate function was found
         try:
-            return _function_mapping[self.func_name](*self.func_args)
+            return _function_mapping[self.func_name](eval_context,
+                                                     *self.func_args)
         except KeyError:
             raise ParserError(u"Unknown function '%s'" % self.func_name)
 
@@ -102,8 +200,8 @@ def __init__(self, target_cond):
         # type: (_ACondition) -> None
         self.target_cond = target_cond
 
-    def evaluate(self):
-        return not self.target_cond.evaluate()
+    def _evaluate(self, eval_context):
+        return not self.target_cond._memo_evaluate(eval_context)
 
     def __repr__(self):
         return u'(not %r)' % self.target_cond
@@ -118,15 +216,16 @@ def __init__(self, first_cond, second_cond):
         self.first_cond = first_cond
         self.second_cond = second_cond
 
-    def evaluate(self):
-        return self.first_cond.evaluate() or self.second_cond.evaluate()
+    def _evaluate(self, eval_context):
+        return (self.first_cond._memo_evaluate(eval_context) or
+                self.second_cond._memo_evaluate(eval_context))
 
     def __repr__(self):
         return u'(%r or %r)' % (self.first_cond, self.second_cond)
 
-# Functions
-def _fn_active(path_or_regex):
-    # type: (unicode) -> bool
+# Functions - each takes the evaluation context, then the arguments
+def _fn_active(eval_context, path_or_regex):
+    # type: (_EvalContext, unicode) -> bool
     """Takes either a file path or a regex. Returns True iff at least one
     active plugin matches the specified path or regex.
 
@@ -134,25 +233,23 @@ def _fn_active(path_or_regex):
     if _is_regex(path_or_regex):
         # Regex means we have to look at each active plugin - plugins can
         # obviously only be in Data, no need to process the path here
-        file_regex = re.compile(path_or_regex)
-        return any(file_regex.match(x.s) for x in cached_active_tuple())
+        file_regex = eval_context.compile_regex(path_or_regex)
+        return any(file_regex.match(x.s)
+                   for x in eval_context.active_plugins)
     else:
         return cached_is_active(GPath(path_or_regex))
 
-def _fn_checksum(file_path, expected_crc):
-    # type: (unicode, int) -> bool
+def _fn_checksum(eval_context, file_path, expected_crc):
+    # type: (_EvalContext, unicode, int) -> bool
     """Takes a file path. Returns True if the file that the path resolves to
     exists and its CRC32 matches the specified expected CRC.
 
     :param file_path: The path of the file to check.
     :param expected_crc: The expected CRC32 value."""
-    try:
-        return _process_path(file_path).crc == expected_crc
-    except IOError:
-        return False # Doesn't exist or is a directory
+    return eval_context.get_crc(_process_path(file_path)) == expected_crc
 
-def _fn_file(path_or_regex):
-    # type: (unicode) -> bool
+def _fn_file(eval_context, path_or_regex):
+    # type: (_EvalContext, unicode) -> bool
     """Takes either a file path or a regex. Returns True iff at least one
     file exists that matches the specified path or regex.
 
@@ -164,14 +261,16 @@ def _fn_file(path_or_regex):
         # to check every step of the way
         final_sep = path_or_regex.rfind(u'/')
         # Note that we don't have to error check here due to the +1 offset
-        file_regex = re.compile(path_or_regex[final_sep + 1:])
+        file_regex = eval_context.compile_regex(
+            path_or_regex[final_sep + 1:])
         parent_dir = _process_path(path_or_regex[:final_sep + 1])
-        return any(file_regex.match(x.s) for x in parent_dir.list())
+        return any(file_regex.match(x)
+                   for x in eval_context.list_dir(parent_dir))
     else:
         return _process_path(path_or_regex).exists()
 
-def _fn_is_master(file_path):
-    # type: (unicode) -> bool
+def _fn_is_master(eval_context, file_path):
+    # type: (_EvalContext, unicode) -> bool
     """Takes a file path. Returns True iff a plugin with the specified name
     exists and is treated as a master by the currently managed game.
 
@@ -181,31 +280,33 @@ def _fn_is_master(file_path):
     # Need to check if it's on disk first, otherwise modInfos[x] errors
     return plugin_path in modInfos and in_master_block(modInfos[plugin_path])
 
-def _fn_many(path_regex):
-    # type: (unicode) -> bool
+def _fn_many(eval_context, path_regex):
+    # type: (_EvalContext, unicode) -> bool
     """Takes a regex. Returns True iff more than 1 file matching the specified
     regex exists.
 
     :param path_regex: The regex to check."""
     # Same idea as in _fn_file
     final_sep = path_regex.rfind(u'/')
-    file_regex = re.compile(path_regex[final_sep + 1:])
+    file_regex = eval_context.compile_regex(path_regex[final_sep + 1:])
     parent_dir = _process_path(path_regex[:final_sep + 1])
     # Check if we have more than one matching file
-    return len([x for x in parent_dir.list() if file_regex.match(x.s)]) > 1
+    return len([x for x in eval_context.list_dir(parent_dir)
+                if file_regex.match(x)]) > 1
 
-def _fn_many_active(path_regex):
-    # type: (unicode) -> bool
+def _fn_many_active(eval_context, path_regex):
+    # type: (_EvalContext, unicode) -> bool
     """Takes a regex. Returns True iff more than 1 active plugin matches the
     specified regex.
 
     :param path_regex: The regex to check."""
-    file_regex = re.compile(path_regex)
+    file_regex = eval_context.compile_regex(path_regex)
     # Check if we have more than one matching active plugin
-    return len([x for x in cached_active_tuple() if file_regex.match(x.s)]) > 1
+    return len([x for x in eval_context.active_plugins
+                if file_regex.match(x.s)]) > 1
 
-def _fn_product_version(file_path, expected_ver, comparison):
-    # type: (unicode, unicode, Comparison) -> bool
+def _fn_product_version(eval_context, file_path, expected_ver, comparison):
+    # type: (_EvalContext, unicode, unicode, Comparison) -> bool
     """Takes a file path, an expected version and a comparison operator.
     Returns True iff the file path resolves to an executable (.exe or .dll) and
     its version compares successfully against the specified expected version,
@@ -238,8 +339,8 @@ def _fn_product_version(file_path, expected_ver, comparison):
         actual_ver, [int(x) for x in expected_ver.split(u'.')])
 
 _VERSION_REGEX = re.compile(u'Version: ([\\d.]+)', re.I | re.U)
-def _fn_version(file_path, expected_ver, comparison):
-    # type: (unicode, unicode, Comparison) -> bool
+def _fn_version(eval_context, file_path, expected_ver, comparison):
+    # type: (_EvalContext, unicode, unicode, Comparison) -> bool
     """Behaves like product_version, but extends its behavior to also allow
     plugin version checks. If the plugin's description contains a
     'Version: ...' section, then the version specified by that section is
@@ -28,8 +28,16 @@
 Recommended reading before working on this file:
 https://loot-api.readthedocs.io/en/latest/metadata/file_structure.html
 https://loot-api.readthedocs.io/en/latest/metadata/data_structures/index.html
-https://loot-api.readthedocs.io/en/latest/metadata/conditions.html."""
+https://loot-api.readthedocs.io/en/latest/metadata/conditions.html.
 
+Parsing the masterlist with PyYAML takes seconds, so the parsed lists can be
+stored in a snapshot file, keyed by the size and CRC of the lists they were
+parsed from. The snapshot stores each plugin entry - including its parsed tag
+conditions - serialized on its own, so that loading it is a single read and
+only the entries of plugins that are actually looked up are rebuilt."""
+
+import cPickle as pickle  # PY3
+import marshal
 import re
 import yaml
 from collections import deque
@@ -63,6 +71,19 @@ class LOOTParser(object):
     def __init__(self):
         self._cached_masterlist = {}
 
+    def _get_entry(self, plugin_name):
+        """Returns the entry of the specified plugin, rebuilding it first if
+        it was loaded from a snapshot. Raises KeyError if the plugin has no
+        entry.
+
+        :type plugin_name: unicode
+        :rtype: _PluginEntry"""
+        plugin_entry = self._cached_masterlist[plugin_name]
+        if type(plugin_entry) is bytes: # still serialized, see _load_snapshot
+            plugin_entry = _PluginEntry.from_snapshot(plugin_entry)
+            self._cached_masterlist[plugin_name] = plugin_entry
+        return plugin_entry
+
     def get_plugin_tags(self, plugin_name, catch_errors=True):
         """Retrieves added and removed tags for the specified plugin. If the
         plugin has no entry in the masterlist, two empty sets are returned.
@@ -78,7 +99,7 @@ def get_plugin_tags(self, plugin_name, catch_errors=True):
             removed tags.
         :rtype: tuple[set[unicode], set[unicode]]"""
         try:
-            plugin_entry = self._cached_masterlist[plugin_name.s]
+            plugin_entry = self._get_entry(plugin_name.s)
             # We may have to evaluate conditions now
             return (_ConditionalTag.resolve_tags(plugin_entry.tags_added),
                     _ConditionalTag.resolve_tags(plugin_entry.tags_removed))
@@ -93,9 +114,12 @@ def get_plugin_tags(self, plugin_name, catch_errors=True):
         return set(), set()
 
     def load_lists(self, masterlist_path, userlist_path=None,
-                   catch_errors=True):
+                   catch_errors=True, snapshot_path=None):
         """Parses and stores the specified LOOT masterlist, and optionally
-        merges any additions from the specified userlist in.
+        merges any additions from the specified userlist in. If snapshot_path
+        is given, the lists are loaded from the snapshot stored there instead
+        if it was made from the same lists - else they are parsed and a new
+        snapshot is stored there.
 
         :param masterlist_path: The path to the LOOT masterlist that should be
             parsed.
@@ -104,12 +128,22 @@ def load_lists(self, masterlist_path, userlist_path=None,
             should be parsed and merged with the masterlist.
         :type userlist_path: Path
         :param catch_errors: If False, no errors will be caught - you will have
-            to handle them manually. Intended for unit tests."""
+            to handle them manually. Intended for unit tests.
+        :param snapshot_path: Optional, the path of the snapshot file.
+        :type snapshot_path: Path"""
         try:
+            if snapshot_path:
+                snapshot_key = _snapshot_key(masterlist_path, userlist_path)
+                masterlist = _load_snapshot(snapshot_path, snapshot_key)
+                if masterlist is not None:
+                    self._cached_masterlist = masterlist
+                    return
             masterlist = _parse_list(masterlist_path)
             if userlist_path:
                 _merge_lists(masterlist, _parse_list(userlist_path))
             self._cached_masterlist = masterlist
+            if snapshot_path:
+                _save_snapshot(snapshot_path, snapshot_key, masterlist)
         except yaml.YAMLError:
             if not catch_errors:
                 raise
@@ -126,7 +160,7 @@ def is_plugin_dirty(self, plugin_name, mod_infos, catch_errors=True):
         :param catch_errors: If False, no errors will be caught - you will have
             to handle them manually. Intended for unit tests."""
         try:
-            plugin_entry = self._cached_masterlist[plugin_name.s]
+            plugin_entry = self._get_entry(plugin_name.s)
             return (plugin_entry and mod_infos[plugin_name].cached_mod_crc()
                     in plugin_entry.dirty_crcs)
         except KeyError:
@@ -182,6 +216,32 @@ def __init__(self, yaml_entry):
             target_set = self.tags_removed if removes else self.tags_added
             target_set.add(target_tag)
 
+    @classmethod
+    def from_snapshot(cls, entry_data):
+        """Rebuilds a plugin entry from the output of to_snapshot.
+
+        :type entry_data: bytes
+        :rtype: _PluginEntry"""
+        dirty_crcs, tags_added, tags_removed = marshal.loads(entry_data)
+        plugin_entry = cls.__new__(cls)
+        plugin_entry.dirty_crcs = set(dirty_crcs)
+        plugin_entry.tags_added = {_tag_from_snapshot(t) for t in tags_added}
+        plugin_entry.tags_removed = {_tag_from_snapshot(t)
+                                     for t in tags_removed}
+        return plugin_entry
+
+    def to_snapshot(self):
+        """Serializes this plugin entry for storing it in a snapshot. Parses
+        the conditions of its conditional tags, unless they fail to parse -
+        those are stored as strings, so that they still report their errors
+        when they are evaluated.
+
+        :rtype: bytes"""
+        return marshal.dumps((
+            list(self.dirty_crcs),
+            [_tag_to_snapshot(t) for t in self.tags_added],
+            [_tag_to_snapshot(t) for t in self.tags_removed]), 2)
+
     def merge_with(self, other_entry):
         """Merges the information stored in this plugin entry with the
         information stored in other_entry. Since another list can never remove
@@ -255,6 +315,52 @@ def resolve_tags(tag_set):
                 resulting_tags.add(tag)
         return resulting_tags
 
+# Snapshot serialization - conditional tags are stored as (name, condition)
+# tuples and conditions as nested tuples of their type and fields, except for
+# conditions that failed to parse, which are stored as strings
+def _tag_to_snapshot(tag):
+    try:
+        tag_condition = tag.tag_condition
+    except AttributeError:
+        return tag # Unconditional tag
+    if not isinstance(tag_condition, _ACondition):
+        try:
+            tag.tag_condition = tag_condition = _process_condition_string(
+                tag_condition)
+        except (LexerError, ParserError):
+            return tag.tag_name, tag_condition
+    return tag.tag_name, _condition_to_snapshot(tag_condition)
+
+def _tag_from_snapshot(tag_data):
+    if type(tag_data) is unicode: return tag_data # Unconditional tag
+    tag_name, cond_data = tag_data
+    return _ConditionalTag(tag_name, cond_data if type(cond_data) is unicode
+                           else _condition_from_snapshot(cond_data))
+
+def _condition_to_snapshot(condition):
+    if isinstance(condition, ConditionFunc):
+        # Arguments are strings, checksums or Comparison instances
+        return (u'func', condition.func_name, tuple(
+            (a.cmp_operator,) if isinstance(a, Comparison) else a
+            for a in condition.func_args))
+    elif isinstance(condition, ConditionNot):
+        return u'not', _condition_to_snapshot(condition.target_cond)
+    return (u'and' if isinstance(condition, ConditionAnd) else u'or',
+            _condition_to_snapshot(condition.first_cond),
+            _condition_to_snapshot(condition.second_cond))
+
+def _condition_from_snapshot(cond_data):
+    cond_type = cond_data[0]
+    if cond_type == u'func':
+        return ConditionFunc(cond_data[1], [
+            Comparison(a[0]) if type(a) is tuple else a
+            for a in cond_data[2]])
+    elif cond_type == u'not':
+        return ConditionNot(_condition_from_snapshot(cond_data[1]))
+    return (ConditionAnd if cond_type == u'and' else ConditionOr)(
+        _condition_from_snapshot(cond_data[1]),
+        _condition_from_snapshot(cond_data[2]))
+
 ##: A lot of the lexing/parsing stuff here could probably be moved to a
 # generic top-level file and used to eventually write a better wizard parser
 def _process_condition_string(condition_string):
@@ -603,3 +709,46 @@ def _parse_list(list_path):
         return LowerDict()
     return LowerDict({_loot_decode(p[u'name']): _PluginEntry(p) for p
                       in list_contents.get(u'plugins', ())})
+
+_snapshot_version = 1
+
+def _snapshot_key(masterlist_path, userlist_path):
+    """Returns the key a snapshot of the specified lists is valid for - their
+    paths, sizes and CRCs.
+
+    :type masterlist_path: Path
+    :type userlist_path: Path | None"""
+    return tuple((p.s, p.size, p.crc) for p in (masterlist_path, userlist_path)
+                 if p)
+
+def _load_snapshot(snapshot_path, snapshot_key):
+    """Loads the snapshot stored at snapshot_path if it matches snapshot_key.
+    Returns a LowerDict mapping plugins to their serialized entries - see
+    LOOTParser._get_entry - or None if there is no matching snapshot.
+
+    :type snapshot_path: Path
+    :rtype: LowerDict[unicode, bytes] | None"""
+    if not snapshot_path.exists(): return None
+    try:
+        with snapshot_path.open(u'rb') as ins:
+            if pickle.load(ins) != (_snapshot_version, snapshot_key):
+                return None
+            return LowerDict(pickle.load(ins))
+    except Exception: # corrupt or from another version, just reparse
+        deprint(u'Failed to load LOOT masterlist snapshot', traceback=True)
+        return None
+
+def _save_snapshot(snapshot_path, snapshot_key, parsed_list):
+    """Stores a snapshot of parsed_list at snapshot_path.
+
+    :type snapshot_path: Path
+    :type parsed_list: LowerDict[unicode, _PluginEntry]"""
+    try:
+        snapshot_path.head.makedirs()
+        with snapshot_path.temp.open(u'wb') as out:
+            pickle.dump((_snapshot_version, snapshot_key), out, -1)
+            pickle.dump([(unicode(p), e.to_snapshot()) for p, e
+                         in parsed_list.iteritems()], out, -1)
+        snapshot_path.untemp()
+    except (OSError, IOError):
+        deprint(u'Failed to save LOOT masterlist snapshot', traceback=True)
@@ -30,9 +30,10 @@
 from .loot_parser import libloot_version, LOOTParser
 from .. import balt, bolt, bush, bass, load_order
 from ..bolt import GPath, deprint, sio, struct_pack, struct_unpack
-from ..brec import ModReader, MreRecord, RecordHeader
+from ..brec import FastModReader, ModReader, MreRecord, RecordHeader
 from ..cint import ObBaseRecord, ObCollection
-from ..exception import BoltError, CancelError, ModError
+from ..mod_files import RecordIndex
+from ..exception import BoltError, CancelError
 
 lootDb = None # type: LOOTParser
 
@@ -55,6 +56,9 @@ def __init__(self):
         self.lootUserTime = None
         self.tagList = bass.dirs['defaultPatches'].join(u'taglist.yaml')
         self.tagListModTime = None
+        # Parsed masterlist/userlist or taglist, see loot_parser
+        self.lootSnapshotPath = bass.dirs['modsBash'].join(
+            u'LOOT Snapshot.dat')
         #--Bash Tags
         self.tagCache = {}
         #--Refresh
@@ -71,9 +75,11 @@ def refreshBashTags(self):
                 self.lootMasterTime = path.mtime
                 if userpath.exists():
                     self.lootUserTime = userpath.mtime
-                    lootDb.load_lists(path, userpath)
+                    lootDb.load_lists(path, userpath,
+                        snapshot_path=self.lootSnapshotPath)
                 else:
-                    lootDb.load_lists(path)
+                    lootDb.load_lists(path,
+                        snapshot_path=self.lootSnapshotPath)
             return # no changes or we parsed successfully
         #--No masterlist or an error occurred while reading it, use the taglist
         if not self.tagList.exists():
@@ -83,7 +89,7 @@ def refreshBashTags(self):
         if self.tagList.mtime == self.tagListModTime: return
         self.tagListModTime = self.tagList.mtime
         self.tagCache = {}
-        lootDb.load_lists(self.tagList)
+        lootDb.load_lists(self.tagList, snapshot_path=self.lootSnapshotPath)
 
     # TODO(inf) self.tagCache needs invalidation when a mod's CRC changes!
     def getTagsInfoCache(self, modName):
@@ -523,29 +529,44 @@ def _scan_Python(modInfos, what, progress, detailed=False,
                 parentFid = None
                 parentParentFid = None
                 # Location (Interior = #, Exteror = (X,Y)
-                with ModReader(modInfo.name,path.open('rb')) as ins:
+                # The record index tells us where everything is, so we only
+                # need to read the CELL and WRLD records we are interested in
+                with FastModReader.from_path(modInfo.name, path) as ins:
                     try:
-                        insAtEnd = ins.atEnd
+                        rec_index = RecordIndex.for_plugin(modInfo)
+                        get_offset = rec_index.get_offset
+                        get_sig = rec_index.get_sig
                         insTell = ins.tell
                         insUnpackRecHeader = ins.unpackRecHeader
                         insUnpackSubHeader = ins.unpackSubHeader
                         insRead = ins.read
                         ins_unpack = partial(ins.unpack, __unpacker)
                         headerSize = RecordHeader.rec_header_size
-                        while not insAtEnd():
-                            subprogress(insTell())
-                            header = insUnpackRecHeader()
-                            rtype,hsize = header.recType,header.size
-                            #(type,size,flags,fid,uint2) = ins.unpackRecHeader()
-                            if rtype == 'GRUP':
-                                groupType = header.groupType
-                                if groupType == 0 and header.label not in {'CELL','WRLD'}:
+                        def iter_cell_rows():
+                            """Yields the rows of everything in the CELL and
+                            WRLD top groups, skipping all other tops."""
+                            skip_end = 0
+                            for row in xrange(len(rec_index)):
+                                offset = get_offset(row)
+                                if offset < skip_end: continue
+                                if (rec_index.is_grup(row) and
+                                        rec_index.get_grup_type(row) == 0 and
+                                        rec_index.get_grup_label(row) not in
+                                        {'CELL','WRLD'}):
                                     # Skip Tops except for WRLD and CELL groups
-                                    insRead(hsize-headerSize)
-                                elif detailed:
+                                    skip_end = offset + rec_index.get_size(row)
+                                    continue
+                                yield row, offset
+                        for row, offset in iter_cell_rows():
+                            subprogress(offset)
+                            rtype = get_sig(row)
+                            if rtype == 'GRUP':
+                                if detailed:
+                                    groupType = rec_index.get_grup_type(row)
                                     if groupType == 1:
                                         # World Children
-                                        parentParentFid = header.label
+                                        parentParentFid = \
+                                            rec_index.get_grup_label(row)
                                         parentType = 1 # Exterior Cell
                                         parentFid = None
                                     elif groupType == 2:
@@ -555,19 +576,20 @@ def _scan_Python(modInfos, what, progress, detailed=False,
                                     elif groupType in {6,8,9,10}:
                                         # Cell Children, Cell Persistent Children,
                                         # Cell Temporary Children, Cell VWD Children
-                                        parentFid = header.label
+                                        parentFid = rec_index.get_grup_label(
+                                            row)
                                     else: # 3,4,5,7 - Topic Children
                                         pass
                             else:
-                                if doUDR and header.flags1 & 0x20 and rtype in (
+                                if doUDR and rec_index.get_flags1(row) & 0x20 and rtype in (
                                     'ACRE',               #--Oblivion only
                                     'ACHR','REFR',        #--Both
                                     'NAVM','PHZD','PGRE', #--Skyrim only
                                     ):
+                                    fid = rec_index.get_fid(row)
                                     if not detailed:
-                                        udr[header.fid] = ModCleaner.UdrInfo(header.fid)
+                                        udr[fid] = ModCleaner.UdrInfo(fid)
                                     else:
-                                        fid = header.fid
                                         udr[fid] = ModCleaner.UdrInfo(fid,rtype,parentFid,u'',parentType,parentParentFid,u'',None)
                                         parents_to_scan.setdefault(parentFid,set())
                                         parents_to_scan[parentFid].add(fid)
@@ -575,7 +597,8 @@ def _scan_Python(modInfos, what, progress, detailed=False,
                                             parents_to_scan.setdefault(parentParentFid,set())
                                             parents_to_scan[parentParentFid].add(fid)
                                 if doFog and rtype == 'CELL':
-                                    nextRecord = insTell() + hsize
+                                    ins.seek(offset + headerSize)
+                                    nextRecord = insTell() + rec_index.get_size(row)
                                     while insTell() < nextRecord:
                                         (nextType,nextSize) = insUnpackSubHeader()
                                         if nextType != 'XCLL':
@@ -583,42 +606,36 @@ def _scan_Python(modInfos, what, progress, detailed=False,
                                         else:
                                             color,near,far,rotXY,rotZ,fade,clip = ins_unpack(nextSize,'CELL.XCLL')
                                             if not (near or far or clip):
-                                                fog.add(header.fid)
-                                else:
-                                    insRead(hsize)
+                                                fog.add(rec_index.get_fid(row))
                         if parents_to_scan:
-                            # Detailed info - need to re-scan for CELL and WRLD infomation
-                            ins.seek(0)
+                            # Detailed info - need to read the CELL and WRLD
+                            # records for their EDIDs and positions
                             baseSize = modInfo.size
-                            while not insAtEnd():
-                                subprogress(baseSize+insTell())
-                                header = insUnpackRecHeader()
-                                rtype,hsize = header.recType,header.size
-                                if rtype == 'GRUP':
-                                    if header.groupType == 0 and header.label not in {'CELL','WRLD'}:
-                                        insRead(hsize-headerSize)
-                                else:
-                                    fid = header.fid
-                                    if fid in parents_to_scan:
-                                        record = MreRecord(header,ins,True)
-                                        record.loadSubrecords()
-                                        eid = u''
-                                        for subrec in record.subrecords:
-                                            if subrec.subType == 'EDID':
-                                                eid = bolt.decode(subrec.data)
-                                            elif subrec.subType == 'XCLC':
-                                                pos = struct_unpack(
-                                                    '=2i', subrec.data[:8])
-                                        for udrFid in parents_to_scan[fid]:
-                                            if rtype == 'CELL':
-                                                udr[udrFid].parentEid = eid
-                                                if udr[udrFid].parentType == 1:
-                                                    # Exterior Cell, calculate position
-                                                    udr[udrFid].pos = pos
-                                            elif rtype == 'WRLD':
-                                                udr[udrFid].parentParentEid = eid
-                                    else:
-                                        insRead(hsize)
+                            for row, offset in iter_cell_rows():
+                                subprogress(baseSize+offset)
+                                rtype = get_sig(row)
+                                if rtype == 'GRUP': continue
+                                fid = rec_index.get_fid(row)
+                                if fid in parents_to_scan:
+                                    ins.seek(offset)
+                                    header = insUnpackRecHeader()
+                                    record = MreRecord(header,ins,True)
+                                    record.loadSubrecords()
+                                    eid = u''
+                                    for subrec in record.subrecords:
+                                        if subrec.subType == 'EDID':
+                                            eid = bolt.decode(subrec.data)
+                                        elif subrec.subType == 'XCLC':
+                                            pos = struct_unpack(
+                                                '=2i', subrec.data[:8])
+                                    for udrFid in parents_to_scan[fid]:
+                                        if rtype == 'CELL':
+                                            udr[udrFid].parentEid = eid
+                                            if udr[udrFid].parentType == 1:
+                                                # Exterior Cell, calculate position
+                                                udr[udrFid].pos = pos
+                                        elif rtype == 'WRLD':
+                                            udr[udrFid].parentParentEid = eid
                     except CancelError:
                         raise
                     except:
@@ -699,47 +716,27 @@ def __init__(self):
 
     def readFromMod(self, modInfo, progress=None):
         """Extracts details from mod file."""
-        def getRecordReader(flags, size):
-            """Decompress record data as needed."""
-            if not MreRecord.flags1_(flags).compressed:
-                return ins,ins.tell()+size
-            else:
-                import zlib
-                sizeCheck, = struct_unpack('I', ins.read(4))
-                decomp = zlib.decompress(ins.read(size-4))
-                if len(decomp) != sizeCheck:
-                    raise ModError(ins.inName,
-                        u'Mis-sized compressed data. Expected %d, got %d.' % (size,len(decomp)))
-                reader = ModReader(modInfo.name,sio(decomp))
-                return reader,sizeCheck
         progress = progress or bolt.Progress()
         group_records = self.group_records = {}
         records = group_records[bush.game.Esp.plugin_header_sig] = []
-        with ModReader(modInfo.name,modInfo.getPath().open('rb')) as ins:
-            while not ins.atEnd():
-                header = ins.unpackRecHeader()
-                recType, rec_siz = header.recType, header.size
-                if recType == 'GRUP':
-                    # FIXME(ut): monkey patch for fallout QUST GRUP
-                    if bush.game.fsName in (u'Fallout4', u'Fallout4VR') and \
-                            header.groupType == 10:
-                        header.skip_group(ins)
-                        continue
-                    label = header.label
-                    progress(1.0*ins.tell()/modInfo.size,_(u"Scanning: ")+label)
-                    records = group_records.setdefault(label,[])
-                    if label in ('CELL', 'WRLD', 'DIAL'): # skip these groups
-                        header.skip_group(ins)
-                else:
-                    eid = u''
-                    nextRecord = ins.tell() + rec_siz
-                    recs, endRecs = getRecordReader(header.flags1, rec_siz)
-                    while recs.tell() < endRecs:
-                        (recType, rec_siz) = recs.unpackSubHeader()
-                        if recType == 'EDID':
-                            eid = recs.readString(rec_siz)
-                            break
-                        recs.seek(rec_siz, 1)
-                    records.append((header.fid,eid))
-                    ins.seek(nextRecord)
+        rec_index = RecordIndex.for_plugin(modInfo)
+        skip_end = 0 # offset of the end of the GRUP we are skipping
+        for row in xrange(len(rec_index)):
+            offset = rec_index.get_offset(row)
+            if offset < skip_end: continue
+            if rec_index.is_grup(row):
+                header = rec_index.get_header(row)
+                # FIXME(ut): monkey patch for fallout QUST GRUP
+                if bush.game.fsName in (u'Fallout4', u'Fallout4VR') and \
+                        header.groupType == 10:
+                    skip_end = offset + header.size
+                    continue
+                label = header.label
+                progress(1.0 * offset / modInfo.size, _(u'Scanning: ') + label)
+                records = group_records.setdefault(label,[])
+                if label in ('CELL', 'WRLD', 'DIAL'): # skip these groups
+                    skip_end = offset + header.size
+            else:
+                records.append((rec_index.get_fid(row),
+                                rec_index.get_eid(row)))
         del group_records[bush.game.Esp.plugin_header_sig]
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+"""Persistent cache of the parsed headers of the save files, so that opening
+the Saves tab does not need to read (and, for compressed saves, decompress)
+every save again. Headers are cached without their screenshots, which are
+only read when they are displayed - see SaveFileHeader.ssData."""
+
+import os
+from itertools import izip
+
+from .. import bass, bolt
+from ..bolt import deprint
+from ..exception import SaveHeaderError
+
+class SaveHeaderCache(bolt.PersistentCache):
+    """Persistent cache of save headers, keyed by the (lowercase) absolute
+    path of their save. An entry is only valid as long as the size and
+    modification time of its save do not change."""
+    # abs path -> (header type name, size, mtime, header state)
+    _entries_key = u'headers'
+
+    def _cached_state(self, header_type, save_path, stat_key):
+        cached = self._load().get(save_path.s.lower())
+        if cached is not None and cached[:3] == (
+                header_type.__name__,) + stat_key:
+            return cached[3]
+        return None
+
+    def _store(self, header_type, save_path, stat_key, header):
+        self._load()[save_path.s.lower()] = (
+            header_type.__name__,) + stat_key + (header.dump_state(),)
+        self._changed = True
+
+    def get_header(self, header_type, save_path, save_size, save_mtime):
+        """Returns the header of the specified save, from the cache if it is
+        still valid for it. Raises SaveHeaderError if the header can't be
+        read.
+
+        :type header_type: type[save_headers.SaveFileHeader]
+        :type save_path: bolt.Path"""
+        stat_key = (save_size, save_mtime)
+        header_state = self._cached_state(header_type, save_path, stat_key)
+        if header_state is not None:
+            return header_type.from_state(save_path, header_state)
+        header = header_type(save_path)
+        self._store(header_type, save_path, stat_key, header)
+        return header
+
+    def prefetch(self, header_type, save_stats):
+        """Reads the headers of the specified saves that are not cached in
+        parallel and caches them, so that get_header finds them. Saves whose
+        header can't be read are skipped - get_header will raise for them.
+
+        :param save_stats: list of (save path, size, mtime) tuples."""
+        if not header_type.parallel_reads: return
+        jobs = [s for s in save_stats if self._cached_state(
+            header_type, s[0], s[1:]) is None]
+        num_threads = min(bass.inisettings[u'SaveHeaderThreads'], len(jobs))
+        if num_threads < 2: return # not worth it, let get_header read it
+        def _read_header(save_stat):
+            try:
+                return header_type(save_stat[0])
+            except (SaveHeaderError, IOError, OSError):
+                pass # get_header will raise it
+            except Exception:
+                deprint(u'Failed to read %s' % save_stat[0], traceback=True)
+            return None
+        for save_stat, header in izip(jobs, bolt.ordered_thread_map(
+                _read_header, jobs, num_threads)):
+            if header is not None:
+                self._store(header_type, save_stat[0], save_stat[1:], header)
+
+    def retain(self, saves_dir, abs_paths):
+        """Drops the cached headers of all saves in saves_dir that are not in
+        abs_paths, which must hold the (case insensitive) absolute paths of
+        all saves in it that are to be kept. The headers of the saves of other
+        save profiles are kept.
+
+        :type saves_dir: bolt.Path"""
+        # not a prefix check - that would match the saves of the profiles in
+        # the subfolders of saves_dir too
+        saves_dir = saves_dir.s.lower()
+        keep = {p.lower() for p in abs_paths}
+        self._drop_entries(lambda k: k in keep or
+                           os.path.dirname(k) != saves_dir)
@@ -53,13 +53,17 @@ def _pack(out, fmt, pack_arg): out.write(struct_pack(fmt, pack_arg))
 class SaveFileHeader(object):
     save_magic = 'OVERRIDE'
     # common slots Bash code expects from SaveHeader (added header_size and
-    # turned image to a property)
+    # turned image to a property) - the screenshot is only read when ssData
+    # is first accessed, from _ssOffset
     __slots__ = (u'header_size', u'pcName', u'pcLevel', u'pcLocation',
-                 u'gameDays', u'gameTicks', u'ssWidth', u'ssHeight', u'ssData',
-                 u'masters', u'_save_path', u'_mastersStart')
+                 u'gameDays', u'gameTicks', u'ssWidth', u'ssHeight',
+                 u'_ssData', u'_ssOffset', u'masters', u'_save_path',
+                 u'_mastersStart')
     # map slots to (seek position, unpacker) - seek position negative means
     # seek relative to ins.tell(), otherwise to the beginning of the file
     unpackers = OrderedDict()
+    # Whether headers of this type may be read in several threads at once
+    parallel_reads = True
 
     def __init__(self, save_path):
         self._save_path = save_path
@@ -93,8 +97,30 @@ def load_header(self, ins):
             for x in self.masters]
 
     def load_image_data(self, ins):
-        bpp = (4 if self.has_alpha else 3)
-        self.ssData = bytearray(ins.read(bpp * self.ssWidth * self.ssHeight))
+        self._ssOffset = ins.tell()
+        ins.seek(self._image_size(), 1)
+
+    def _image_size(self):
+        return (4 if self.has_alpha else 3) * self.ssWidth * self.ssHeight
+
+    @property
+    def ssData(self):
+        """The screenshot pixels, read from the save on first access."""
+        try:
+            return self._ssData
+        except AttributeError:
+            self._ssData = self._read_image_data()
+            return self._ssData
+
+    def _read_image_data(self):
+        try:
+            with self._save_path.open('rb') as ins:
+                ins.seek(self._ssOffset)
+                return bytearray(ins.read(self._image_size()))
+        except (OSError, IOError):
+            bolt.deprint(u'Failed to read the screenshot of %s' %
+                         self._save_path, traceback=True)
+            return bytearray(self._image_size()) # black
 
     def load_masters(self, ins):
         self._mastersStart = ins.tell()
@@ -105,6 +131,32 @@ def load_masters(self, ins):
 
     def calc_time(self): pass
 
+    def dump_state(self):
+        """Returns the parsed header, except for the screenshot, as a dict
+        mapping its attributes to their values - for caching it, see
+        from_state."""
+        header_state = {}
+        for header_type in type(self).__mro__:
+            for attr in getattr(header_type, u'__slots__', ()):
+                if attr in (u'_save_path', u'_ssData'): continue
+                try:
+                    header_state[attr] = getattr(self, attr)
+                except AttributeError:
+                    pass # not set for this save, e.g. _sse_start
+        header_state[u'masters'] = [x.s for x in self.masters]
+        return header_state
+
+    @classmethod
+    def from_state(cls, save_path, header_state):
+        """Creates a header of the specified save from the output of
+        dump_state, without reading the save."""
+        header = cls.__new__(cls)
+        header._save_path = save_path
+        for attr, value in header_state.iteritems():
+            setattr(header, attr, value)
+        header.masters = [bolt.GPath_no_norm(x) for x in header.masters]
+        return header
+
     @property
     def has_alpha(self):
         """Whether or not this save file has alpha."""
@@ -297,7 +349,10 @@ def _sse_decompress(self, ins, compressed_size, decompressed_size,
         """Decompresses the specified data using either LZ4 or zlib, depending
         on self._compressType. Do not call for uncompressed files!"""
         if self._compressType == 1:
-            decompressor = self._sse_decompress_zlib
+            if light_decompression:
+                decompressor = self._sse_light_decompress_zlib
+            else:
+                decompressor = self._sse_decompress_zlib
         else:
             if light_decompression:
                 decompressor = self._sse_light_decompress_lz4
@@ -318,6 +373,34 @@ def _sse_decompress_zlib(ins, compressed_size, decompressed_size):
                 decompressed_size, len(decompressed_data)))
         return StringIO.StringIO(decompressed_data)
 
+    @staticmethod
+    def _sse_light_decompress_zlib(ins, compressed_size, _decomp_size):
+        """Decompress the start of the zlib compressed data in the SSE
+        savefile, chunk by chunk, and stop when the whole master table is
+        found. Return a file-like object that can be read by _load_masters_16
+        containing the now decompressed master table."""
+        decompressor = zlib.decompressobj()
+        uncompressed = b''
+        masters_size = None # type: int
+        remaining = compressed_size
+        try:
+            while remaining > 0:
+                chunk = ins.read(min(remaining, 0x10000))
+                if not chunk: break
+                remaining -= len(chunk)
+                uncompressed += decompressor.decompress(chunk)
+                # The masters table's size is found in bytes 1-5
+                if masters_size is None and len(uncompressed) >= 5:
+                    masters_size = struct_unpack('I', uncompressed[1:5])[0]
+                # Stop when we have the whole masters table
+                if masters_size is not None and \
+                        len(uncompressed) >= masters_size + 5:
+                    break
+        except zlib.error as e:
+            raise SaveHeaderError(u'zlib error while decompressing '
+                                  u'zlib-compressed header: %r' % e)
+        return StringIO.StringIO(uncompressed)
+
     @staticmethod
     def _sse_decompress_lz4(ins, compressed_size, decompressed_size):
         try:
@@ -583,6 +666,7 @@ class MorrowindSaveHeader(SaveFileHeader):
     Accordingly, we delegate loading the header to our existing mod API."""
     save_magic = 'TES3'
     __slots__ = ('pc_curr_health', 'pc_max_health')
+    parallel_reads = False # goes through ModInfo
 
     def load_header(self, ins):
         # TODO(inf) A bit ugly, this is not a mod - maybe move readHeader out?
@@ -599,13 +683,22 @@ def load_header(self, ins):
         self.masters = save_info.masterNames[:]
         self.pc_curr_health = save_info.header.pc_curr_health
         self.pc_max_health = save_info.header.pc_max_health
+        self._ssData = self._image_from_info(save_info)
+        self.ssHeight = self.ssWidth = 128 # fixed size for Morrowind
+
+    def _read_image_data(self):
+        # Only needed for headers created by from_state
+        from . import ModInfo
+        return self._image_from_info(ModInfo(self._save_path, load_cache=True))
+
+    @staticmethod
+    def _image_from_info(save_info):
         # Read the image data - note that it comes as BGRA, which we
         # need to turn into RGB - ##: in the future: RGBA
         out = StringIO.StringIO()
         for pxl in save_info.header.screenshot_data:
             out.write(struct_pack(u'3B', pxl.red, pxl.green, pxl.blue))
-        self.ssData = out.getvalue()
-        self.ssHeight = self.ssWidth = 128 # fixed size for Morrowind
+        return out.getvalue()
 
     @property
     def can_edit_header(self):
@@ -25,8 +25,10 @@
 files."""
 
 from __future__ import division, print_function
+import mmap
 import os
 import struct
+import zlib
 
 # no local imports beyond this, imported everywhere in brec
 from .utils_constants import _int_unpacker, group_types, null1, strFid
@@ -214,6 +216,8 @@ def __init__(self,inName,ins):
         ins.seek(curPos)
         self.strings = {}
         self.hasStrings = False
+        # Whether MelRecords should be unpacked lazily, see MelRecord
+        self.lazy_unpack = False
 
     # with statement
     def __enter__(self): return self
@@ -332,6 +336,128 @@ def unpackSubHeader(self, recType='----', expType=None, expSize=0,
                                          (expSize,), size)
         return rec_type,size
 
+class FastModReader(ModReader):
+    """ModReader over an in-memory buffer - either a string or a read only
+    memory map of the whole plugin. Keeps its own read position and unpacks
+    headers and fixed size structs straight from the buffer (via
+    Struct.unpack_from), so no intermediate string is created for them."""
+
+    def __init__(self, inName, ins_buffer, _mmap=None):
+        self.inName = inName
+        self._buffer = ins_buffer
+        self._mmap = _mmap
+        self._pos = 0
+        self.size = len(ins_buffer)
+        self.strings = {}
+        self.hasStrings = False
+        # Whether MelRecords should be unpacked lazily, see MelRecord
+        self.lazy_unpack = False
+
+    @classmethod
+    def from_path(cls, inName, file_path):
+        """Return a FastModReader for the file at file_path, memory mapping
+        it. Falls back to reading the file for empty files, which can't be
+        mapped.
+
+        :type file_path: bolt.Path"""
+        with open(file_path.s, u'rb') as ins:
+            try:
+                ins_map = mmap.mmap(ins.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, EnvironmentError): # empty file, most likely
+                return cls(inName, ins.read())
+        return cls(inName, ins_map, _mmap=ins_map)
+
+    def __exit__(self, exc_type, exc_value, exc_traceback): self.close()
+
+    #--I/O Stream -----------------------------------------
+    def seek(self,offset,whence=os.SEEK_SET,recType='----'):
+        """File seek."""
+        if whence == os.SEEK_CUR:
+            newPos = self._pos + offset
+        elif whence == os.SEEK_END:
+            newPos = self.size + offset
+        else:
+            newPos = offset
+        if newPos < 0 or newPos > self.size:
+            raise exception.ModReadError(self.inName, recType, newPos, self.size)
+        self._pos = newPos
+
+    def tell(self):
+        """File tell."""
+        return self._pos
+
+    def close(self):
+        """Close the memory map, if we own one. Record data read from it are
+        copies, so they stay valid."""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._buffer = b''
+
+    def atEnd(self,endPos=-1,recType='----'):
+        """Return True if current read position is at EOF."""
+        filePos = self._pos
+        if endPos == -1:
+            return filePos == self.size
+        elif filePos > endPos:
+            raise exception.ModError(self.inName, u'Exceeded limit of: ' + recType)
+        else:
+            return filePos == endPos
+
+    #--Read/Unpack ----------------------------------------
+    def read(self,size,recType='----'):
+        """Read from file."""
+        curPos = self._pos
+        endPos = curPos + size
+        if endPos > self.size:
+            raise exception.ModSizeError(self.inName, recType, (endPos,),
+                                         self.size)
+        self._pos = endPos
+        return self._buffer[curPos:endPos]
+
+    def crc32(self, size, recType='----'):
+        """Skip size bytes, returning their CRC32 - computed without copying
+        them out of the buffer."""
+        curPos = self._pos
+        endPos = curPos + size
+        if endPos > self.size:
+            raise exception.ModSizeError(self.inName, recType, (endPos,),
+                                         self.size)
+        self._pos = endPos
+        # PY3: memoryview
+        return zlib.crc32(buffer(self._buffer, curPos, size)) & 0xFFFFFFFF
+
+    def readLString(self, size, recType='----', __unpacker=_int_unpacker):
+        """Read translatable string. If the mod has STRINGS files, this is a
+        uint32 to lookup the string in the string table. Otherwise, this is a
+        zero-terminated string."""
+        if self.hasStrings:
+            if size != 4:
+                endPos = self._pos + size
+                raise exception.ModReadError(self.inName, recType, endPos, self.size)
+            id_, = self.unpack(__unpacker, 4, recType)
+            if id_ == 0: return u''
+            else: return self.strings.get(id_,u'LOOKUP FAILED!') #--Same as Skyrim
+        else:
+            return self.readString(size,recType)
+
+    def unpack(self, struct_unpacker, size, recType='----'):
+        """Unpack size bytes at the current position according to format of
+        struct_unpacker - which is normally the bound unpack method of a
+        struct.Struct, in which case no intermediate string is created."""
+        curPos = self._pos
+        endPos = curPos + size
+        if endPos > self.size:
+            raise exception.ModReadError(self.inName, recType, endPos, self.size)
+        self._pos = endPos
+        try:
+            unpacker_struct = struct_unpacker.__self__
+            if unpacker_struct.size == size:
+                return unpacker_struct.unpack_from(self._buffer, curPos)
+        except AttributeError: # not the unpack method of a struct.Struct
+            pass
+        return struct_unpacker(self._buffer[curPos:endPos])
+
 #------------------------------------------------------------------------------
 class ModWriter(object):
     """Wrapper around a TES4 output stream.  Adds utility functions."""
@@ -30,9 +30,9 @@
 from itertools import chain
 from operator import itemgetter
 # Wrye Bash imports
-from .mod_io import GrupHeader, ModReader, RecordHeader, TopGrupHeader
+from .mod_io import FastModReader, GrupHeader, RecordHeader, TopGrupHeader
 from .utils_constants import group_types
-from ..bolt import GPath, sio
+from ..bolt import GPath
 from ..exception import AbstractError, ModError, ModFidMismatchError
 
 class MobBase(object):
@@ -128,7 +128,7 @@ def dump(self,out):
 
     def getReader(self):
         """Returns a ModReader wrapped around self.data."""
-        return ModReader(self.inName,sio(self.data))
+        return FastModReader(self.inName, self.data)
 
     # Abstract methods --------------------------------------------------------
     def get_all_signatures(self):
@@ -186,11 +186,19 @@ def updateRecords(self,block,mapper,toLong):
 #------------------------------------------------------------------------------
 class MobObjects(MobBase):
     """Represents a top level group consisting of one type of record only. I.e.
-    all top groups except CELL, WRLD and DIAL."""
+    all top groups except CELL, WRLD and DIAL.
+
+    Records are kept in order in self.records. Alongside id_records,
+    _id_positions maps each record id to the position of its record in
+    self.records, so that records can be replaced in place in constant time.
+    An index of records by eid is only built once getRecordByEid is used."""
 
     def __init__(self, header, loadFactory, ins=None, do_unpack=False):
         self.records = []
         self.id_records = {}
+        self._id_positions = {}
+        self._eid_records = None
+        self._num_eid_records = 0
         MobBase.__init__(self, header, loadFactory, ins, do_unpack)
 
     def get_all_signatures(self):
@@ -265,8 +273,13 @@ def convertFids(self,mapper,toLong):
     def indexRecords(self):
         """Indexes records by fid."""
         self.id_records.clear()
-        for record in self.records:
-            self.id_records[record.fid] = record
+        self._id_positions.clear()
+        self._eid_records = None
+        id_records = self.id_records
+        id_positions = self._id_positions
+        for index, record in enumerate(self.records):
+            id_records[record.fid] = record
+            id_positions[record.fid] = index
 
     def getRecord(self,fid,default=None):
         """Gets record with corresponding id.
@@ -276,38 +289,80 @@ def getRecord(self,fid,default=None):
         return self.id_records.get(fid,default)
 
     def getRecordByEid(self,eid,default=None):
-        """Gets record by eid, or returns default."""
+        """Gets record by eid, or returns default. If several records share
+        the eid, returns the first one. Records may be renamed in place, so a
+        miss or a hit on a record that has another eid by now rebuilds the
+        index before it is trusted - a miss thus costs as much as a scan. A
+        record renamed in place to the eid of a later record is only returned
+        once the index is rebuilt, e.g. by indexRecords."""
         if not self.records: return default
+        eid_records = self._eid_records
+        # Rebuild if records were added behind our back
+        if (eid_records is None or
+                self._num_eid_records != len(self.records)):
+            eid_records = self._index_eids()
+            return eid_records.get(eid, default)
+        record = eid_records.get(eid)
+        if record is None or record.eid != eid:
+            record = self._index_eids().get(eid)
+        return default if record is None else record
+
+    def _index_eids(self):
+        """Indexes records by eid, keeping the first record for each
+        eid."""
+        eid_records = {}
+        set_eid_record = eid_records.setdefault
         for record in self.records:
-            if record.eid == eid:
-                return record
-        else:
-            return default
+            set_eid_record(record.eid, record)
+        self._eid_records = eid_records
+        self._num_eid_records = len(self.records)
+        return eid_records
 
     def setRecord(self,record):
         """Adds record to record list and indexed."""
-        from .. import bosh
         if self.records and not self.id_records:
             self.indexRecords()
         record_id = record.fid
         if record.isKeyedByEid:
+            from .. import bosh
             if record_id == (bosh.modInfos.masterName, 0):
                 record_id = record.eid
+        records = self.records
+        eid_records = self._eid_records
         if record_id in self.id_records:
             oldRecord = self.id_records[record_id]
-            index = self.records.index(oldRecord)
-            self.records[index] = record
+            index = self._id_positions.get(record_id)
+            if index is None or index >= len(records) or \
+                    records[index] is not oldRecord:
+                # self.records was changed directly, fall back to a search
+                index = records.index(oldRecord)
+                self._id_positions[record_id] = index
+            records[index] = record
+            if eid_records is not None:
+                if record.eid != oldRecord.eid:
+                    self._eid_records = None
+                elif eid_records.get(record.eid) is oldRecord:
+                    eid_records[record.eid] = record
         else:
-            self.records.append(record)
+            self._id_positions[record_id] = len(records)
+            records.append(record)
+            if eid_records is not None:
+                eid_records.setdefault(record.eid, record)
+                self._num_eid_records += 1
         self.id_records[record_id] = record
 
     def keepRecords(self, p_keep_ids):
         """Keeps records with fid in set p_keep_ids. Discards the rest."""
-        from .. import bosh
-        self.records = [record for record in self.records if (record.fid == (
-            record.isKeyedByEid and bosh.modInfos.masterName,
-            0) and record.eid in p_keep_ids) or record.fid in p_keep_ids]
+        null_fid = None # records keyed by eid have this fid
+        if self.records and self.records[0].isKeyedByEid:
+            from .. import bosh
+            null_fid = (bosh.modInfos.masterName, 0)
+        self.records = [record for record in self.records
+                        if record.fid in p_keep_ids or (
+                            record.fid == null_fid and
+                            record.eid in p_keep_ids)]
         self.id_records.clear()
+        self._eid_records = None
         self.setChanged()
 
     def updateRecords(self,srcBlock,mapper,mergeIds):
@@ -456,6 +511,7 @@ def keepRecords(self, p_keep_ids):
         if self.dial.fid not in p_keep_ids:
             self.dial = None # will drop us from MobDials
         self.id_records.clear()
+        self._eid_records = None
         self.setChanged()
 
     def merge_records(self, block, loadSet, mergeIds, iiSkipMerge, doFilter):
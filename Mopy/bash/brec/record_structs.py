@@ -27,8 +27,9 @@
 from __future__ import division, print_function
 import copy
 import zlib
+from collections import OrderedDict
 
-from .mod_io import ModReader, ModWriter
+from .mod_io import FastModReader, ModWriter
 from .utils_constants import strFid
 from .. import bolt, exception
 from ..bolt import decode, sio, struct_pack, struct_unpack
@@ -47,15 +48,22 @@ def __init__(self,*elements):
             element.getDefaulters(self.defaulters,'')
             element.getLoaders(self.loaders)
             element.hasFids(self.formElements)
+        self._lazy_units = None # see get_lazy_units
+        self._lazy_fid_units = None # see _get_fid_units
+        self.supports_lazy_unpack = True
 
     def getSlotsUsed(self):
         """This function returns all of the attributes used in record instances that use this instance."""
         return [s for element in self.elements for s in element.getSlotsUsed()]
 
     def initRecord(self, record, header, ins, do_unpack):
-        """Initialize record, setting its attributes based on its elements."""
-        for element in self.elements:
-            element.setDefault(record)
+        """Initialize record, setting its attributes based on its elements -
+        unless it is going to be unpacked lazily, see MelRecord."""
+        record._lazy_state = None
+        if not (do_unpack is True and ins is not None and ins.lazy_unpack
+                and record.can_unpack_lazily()):
+            for element in self.elements:
+                element.setDefault(record)
         MreRecord.__init__(record, header, ins, do_unpack)
 
     def getDefault(self,attr):
@@ -86,6 +94,132 @@ def loadData(self,record,ins,endPos):
             except Exception as error:
                 self._handle_load_error(error, record, ins, sub_type, sub_size)
 
+    def get_lazy_units(self):
+        """Returns the units in which records using this MelSet are unpacked
+        lazily, as a tuple of a dict mapping each attribute to the index of
+        its unit and the list of all units. A unit is a tuple of the elements
+        sharing loaders or attributes, the signatures of the subrecords they
+        load and the attributes they set."""
+        if self._lazy_units is None:
+            grouped = [] # list of (shared keys, elements, signatures)
+            for element in self.elements:
+                element_loaders = {}
+                element.getLoaders(element_loaders)
+                shared_keys = set(element.getSlotsUsed())
+                shared_keys.update(id(self.loaders[s]) for s in element_loaders)
+                elements = [element]
+                unit_sigs = set(element_loaders)
+                for other in [g for g in grouped if g[0] & shared_keys]:
+                    grouped.remove(other)
+                    shared_keys |= other[0]
+                    elements = other[1] + elements
+                    unit_sigs |= other[2]
+                grouped.append((shared_keys, elements, unit_sigs))
+            units = []
+            attr_unit = {}
+            for _shared_keys, elements, unit_sigs in grouped:
+                elements.sort(key=self.elements.index)
+                unit_attrs = list(OrderedDict.fromkeys(
+                    a for e in elements for a in e.getSlotsUsed()))
+                for attr in unit_attrs:
+                    attr_unit[attr] = len(units)
+                units.append((elements, frozenset(unit_sigs), unit_attrs))
+            self._lazy_units = (attr_unit, units)
+        return self._lazy_units
+
+    def unpack_lazily(self, record, unit_indices=None):
+        """Unpacks the specified units (all of them if None) of a lazily
+        unpacked record from its raw data, see get_lazy_units. Attributes that
+        have already been set on the record keep their values."""
+        lazy_state = record._lazy_state
+        if lazy_state is None: return
+        units = self.get_lazy_units()[1]
+        if unit_indices is None: unit_indices = xrange(len(units))
+        read_id_prefix = record.recType + '.'
+        loaders = self.loaders
+        sub_offsets = lazy_state.get_sub_offsets(record, loaders)
+        reader = FastModReader(record.inName, lazy_state.buffer)
+        reader.setStringTable(lazy_state.strings)
+        unpacked = lazy_state.unpacked
+        fid_units = self._get_fid_units()
+        for unit_index in unit_indices:
+            if unit_index in unpacked: continue
+            unpacked.add(unit_index)
+            unit_elements, unit_sigs, unit_attrs = units[unit_index]
+            preset = {}
+            for attr in unit_attrs:
+                try:
+                    preset[attr] = object.__getattribute__(record, attr)
+                except AttributeError:
+                    pass
+            for element in unit_elements:
+                element.setDefault(record)
+            for sub_type, sub_size, sub_pos in sub_offsets:
+                if sub_type not in unit_sigs: continue
+                reader.seek(sub_pos)
+                try:
+                    loaders[sub_type].loadData(record, reader, sub_type,
+                        sub_size, read_id_prefix + sub_type)
+                except Exception as error:
+                    self._handle_load_error(error, record, reader, sub_type,
+                                            sub_size)
+            # Apply any fid conversions deferred while the unit was packed
+            fid_mapper = lazy_state.fid_mapper
+            if fid_mapper is not None and unit_index in fid_units:
+                for element in fid_units[unit_index]:
+                    element.mapFids(record, fid_mapper, True)
+            for attr, attr_val in preset.iteritems():
+                setattr(record, attr, attr_val)
+        if len(unpacked) == len(units):
+            record._lazy_state = None
+
+    def _get_fid_units(self):
+        """Returns a dict mapping the indices of the lazy units holding fids
+        to the form elements (see hasFids) of each unit."""
+        if self._lazy_fid_units is None:
+            attr_unit = self.get_lazy_units()[0]
+            fid_units = {}
+            for element in self.formElements:
+                for unit_index in {attr_unit[a] for a in
+                                   element.getSlotsUsed()}:
+                    fid_units.setdefault(unit_index, []).append(element)
+            self._lazy_fid_units = fid_units
+        return self._lazy_fid_units
+
+    def _unpack_fid_units(self, record):
+        """Lazily unpacks all units holding fids, see unpack_lazily."""
+        if record._lazy_state is None: return
+        self.unpack_lazily(record, sorted(self._get_fid_units()))
+
+    def _defer_fid_mapping(self, record, mapper):
+        """Maps the fids of a lazily unpacked record, deferring the mapping
+        of units that are still packed until they get unpacked. Units whose
+        attributes have been set already are unpacked first, so that the
+        values set get mapped too."""
+        units = self.get_lazy_units()[1]
+        fid_units = self._get_fid_units()
+        unpacked = record._lazy_state.unpacked
+        for unit_index in sorted(fid_units):
+            if unit_index in unpacked: continue
+            for attr in units[unit_index][2]:
+                try:
+                    object.__getattribute__(record, attr)
+                except AttributeError:
+                    continue
+                self.unpack_lazily(record, (unit_index,))
+                break
+        lazy_state = record._lazy_state
+        for unit_index, unit_elements in fid_units.iteritems():
+            if lazy_state is None or unit_index in lazy_state.unpacked:
+                for element in unit_elements:
+                    element.mapFids(record, mapper, True)
+        if lazy_state is not None:
+            prev_mapper = lazy_state.fid_mapper
+            if prev_mapper is None:
+                lazy_state.fid_mapper = mapper
+            else:
+                lazy_state.fid_mapper = lambda fid: mapper(prev_mapper(fid))
+
     def _handle_load_error(self, error, record, ins, sub_type, sub_size):
         eid = getattr(record, u'eid', u'<<NO EID>>')
         bolt.deprint(u'Error loading %r record and/or subrecord: %08X' %
@@ -98,6 +232,7 @@ def _handle_load_error(self, error, record, ins, sub_type, sub_size):
 
     def dumpData(self,record, out):
         """Dumps state into out. Called by getSize()."""
+        self.unpack_lazily(record)
         for element in self.elements:
             try:
                 element.dumpData(record,out)
@@ -118,6 +253,7 @@ def dumpData(self,record, out):
 
     def mapFids(self,record,mapper,save=False):
         """Maps fids of subelements."""
+        self._unpack_fid_units(record)
         for element in self.formElements:
             element.mapFids(record,mapper,save)
 
@@ -126,14 +262,19 @@ def convertFids(self,record, mapper,toLong):
         toLong should be True if converting to long format or False if converting to short format."""
         if record.longFids == toLong: return
         record.fid = mapper(record.fid)
-        for element in self.formElements:
-            element.mapFids(record,mapper,True)
+        if record._lazy_state is not None:
+            # Leave the fids of still packed units packed for now
+            self._defer_fid_mapping(record, mapper)
+        else:
+            for element in self.formElements:
+                element.mapFids(record,mapper,True)
         record.longFids = toLong
         record.setChanged()
 
     def updateMasters(self,record,masters):
         """Updates set of master names according to masters actually used."""
         if not record.longFids: raise exception.StateError("Fids not in long format")
+        self._unpack_fid_units(record)
         def updater(fid):
             masters.add(fid)
         updater(record.fid)
@@ -157,6 +298,9 @@ def with_distributor(self, distributor_config):
         self.elements += (distributor,)
         distributor.getLoaders(self.loaders)
         distributor.set_mel_set(self)
+        # The distributor routes subrecords based on the ones preceding them,
+        # so they can't be unpacked piecemeal
+        self.supports_lazy_unpack = False
         return self
 
 #------------------------------------------------------------------------------
@@ -486,7 +630,7 @@ def dump(self,out):
 
     def getReader(self):
         """Returns a ModReader wrapped around (decompressed) self.data."""
-        return ModReader(self.inName,sio(self.getDecompressed()))
+        return FastModReader(self.inName, self.getDecompressed())
 
     #--Accessing subrecords ---------------------------------------------------
     def getSubString(self,subType):
@@ -498,7 +642,7 @@ def getSubString(self,subType):
         # If not MreRecord, then we will have info in data.
         if self.__class__ != MreRecord:
             if attr not in self.__slots__: return value
-            return self.__getattribute__(attr)
+            return getattr(self, attr)
         # Subrecords available?
         if self.subrecords is not None:
             for subrecord in self.subrecords:
@@ -523,14 +667,96 @@ def getSubString(self,subType):
         return decode(value)
 
 #------------------------------------------------------------------------------
+class _LazyState(object):
+    """What a lazily unpacked MelRecord needs to unpack itself later on."""
+    __slots__ = (u'strings', u'unpacked', u'buffer', u'sub_offsets',
+                 u'fid_mapper')
+
+    def __init__(self, strings):
+        self.strings = strings # the string table of the plugin, if any
+        self.unpacked = set() # indices of the units unpacked so far
+        self.buffer = None # (decompressed) record data
+        self.sub_offsets = None # list of (sub_type, size, offset)
+        self.fid_mapper = None # fid conversion pending for packed units
+
+    def get_sub_offsets(self, record, loaders):
+        """Returns the offset table of the record's subrecords, building it on
+        first use."""
+        if self.sub_offsets is None:
+            self.buffer = record.getDecompressed()
+            rec_type = record.recType
+            sub_offsets = []
+            with FastModReader(record.inName, self.buffer) as reader:
+                unpack_sub_header = reader.unpackSubHeader
+                while not reader.atEnd(reader.size, rec_type):
+                    sub_type, sub_size = unpack_sub_header(rec_type)
+                    if sub_type not in loaders:
+                        raise exception.ModError(record.inName,
+                            u'Unexpected subrecord: %s.%s' % (rec_type,
+                                                               sub_type))
+                    sub_offsets.append((sub_type, sub_size, reader.tell()))
+                    reader.seek(sub_size, 1, rec_type)
+            self.sub_offsets = sub_offsets
+        return self.sub_offsets
+
 class MelRecord(MreRecord):
-    """Mod record built from mod record elements."""
+    """Mod record built from mod record elements.
+
+    When loaded from a reader with lazy_unpack set, the record keeps just its
+    raw data and unpacks each of its elements the first time one of the
+    attributes it sets is read (see __getattr__). Note that this does not
+    happen for attributes read via record.__getattribute__ - use getattr.
+    Unchanged records are written back from the raw data, while the rest of
+    the elements are unpacked before fids are mapped or the record is
+    dumped or copied. Converting the fids of such a record only converts the
+    fids already unpacked, the rest are converted as they get unpacked."""
     melSet = None #--Subclasses must define as MelSet(*mels)
-    __slots__ = []
+    __slots__ = [u'_lazy_state']
+    # Classes that can be unpacked lazily, see can_unpack_lazily
+    _lazy_classes = {}
 
     def __init__(self, header, ins=None, do_unpack=False):
         self.__class__.melSet.initRecord(self, header, ins, do_unpack)
 
+    def __getattr__(self, attr):
+        # Only called for attributes that are not set - if we are being
+        # unpacked lazily, unpack the element(s) setting attr
+        if attr == u'_lazy_state': raise AttributeError(attr)
+        if self._lazy_state is not None:
+            mel_set = self.__class__.melSet
+            unit_index = mel_set.get_lazy_units()[0].get(attr)
+            if unit_index is not None:
+                mel_set.unpack_lazily(self, (unit_index,))
+                return object.__getattribute__(self, attr)
+        raise AttributeError(u"'%s' object has no attribute '%s'" % (
+            self.__class__.__name__, attr))
+
+    @classmethod
+    def can_unpack_lazily(cls):
+        """Returns True if records of this class can be unpacked lazily, i.e.
+        they are fully described by their MelSet."""
+        try:
+            return MelRecord._lazy_classes[cls]
+        except KeyError:
+            can_lazy = MelRecord._lazy_classes[cls] = (
+                cls.melSet.supports_lazy_unpack and
+                cls.load.__func__ is MelRecord.load.__func__ and
+                cls.loadData.__func__ is MelRecord.loadData.__func__)
+            return can_lazy
+
+    def load(self, ins=None, do_unpack=False):
+        if (do_unpack is True and ins is not None and ins.lazy_unpack and
+                self.can_unpack_lazily()):
+            self.data = ins.read(self.size, self.recType)
+            self._lazy_state = _LazyState(ins.hasStrings and ins.strings or
+                                          None)
+        else:
+            super(MelRecord, self).load(ins, do_unpack)
+
+    def getTypeCopy(self,mapper=None):
+        self.__class__.melSet.unpack_lazily(self)
+        return super(MelRecord, self).getTypeCopy(mapper)
+
     def getDefault(self,attr):
         """Returns default instance of specified instance. Only useful for
         MelGroup and MelGroups."""
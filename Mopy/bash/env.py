@@ -30,8 +30,9 @@
 import re as _re
 import shutil as _shutil
 import stat
-from ctypes import byref, c_wchar_p, c_void_p, POINTER, Structure, windll, \
-    wintypes
+import sys as _sys
+from ctypes import byref, c_size_t, c_wchar_p, c_void_p, POINTER, sizeof, \
+    Structure, windll, wintypes
 from uuid import UUID
 
 from .bolt import GPath, deprint, Path, decode, struct_unpack
@@ -773,6 +774,77 @@ def getJava():
         java = win.join(u'syswow64', u'javaw.exe')
     return java
 
+# https://docs.microsoft.com/en-us/windows/win32/api/psapi/ns-psapi-process_memory_counters
+class _PROCESS_MEMORY_COUNTERS(Structure):
+    _fields_ = [
+        ('cb', wintypes.DWORD),
+        ('PageFaultCount', wintypes.DWORD),
+        ('PeakWorkingSetSize', c_size_t),
+        ('WorkingSetSize', c_size_t),
+        ('QuotaPeakPagedPoolUsage', c_size_t),
+        ('QuotaPagedPoolUsage', c_size_t),
+        ('QuotaPeakNonPagedPoolUsage', c_size_t),
+        ('QuotaNonPagedPoolUsage', c_size_t),
+        ('PagefileUsage', c_size_t),
+        ('PeakPagefileUsage', c_size_t),
+    ]
+
+def get_peak_memory():
+    """Return the most memory (in bytes) this process used so far, or None if
+    that can't be determined on this platform."""
+    if _os.name == u'nt':
+        counters = _PROCESS_MEMORY_COUNTERS()
+        counters.cb = sizeof(counters)
+        get_current_process = windll.kernel32.GetCurrentProcess
+        get_current_process.restype = wintypes.HANDLE
+        get_memory_info = windll.psapi.GetProcessMemoryInfo
+        get_memory_info.argtypes = [wintypes.HANDLE,
+            POINTER(_PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+        if not get_memory_info(get_current_process(), byref(counters),
+                               counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, but in kilobytes everywhere else
+    return peak if _sys.platform == u'darwin' else peak * 1024
+
+_FICLONE = 0x40049409 # see ioctl_ficlone(2)
+
+def clone_file(src_path, dest_path):
+    """Create dest_path as a copy on write clone (aka reflink) of src_path,
+    sharing its data on disk until either of them is written to. Only
+    supported by some Linux filesystems (btrfs, XFS) - returns False if the
+    clone could not be made, leaving no file at dest_path."""
+    if not _sys.platform.startswith(u'linux'): return False
+    import fcntl
+    try:
+        with open(src_path, u'rb') as ins:
+            with open(dest_path, u'wb') as out:
+                fcntl.ioctl(out.fileno(), _FICLONE, ins.fileno())
+        return True
+    except (IOError, OSError):
+        try:
+            _os.remove(dest_path)
+        except OSError:
+            pass
+        return False
+
+def hard_link(src_path, dest_path):
+    """Create dest_path as a hard link to src_path. Raises OSError if that is
+    not possible, e.g. because they are on different volumes."""
+    if _os.name != u'nt':
+        _os.link(src_path, dest_path)
+        return
+    create_hard_link = windll.kernel32.CreateHardLinkW
+    create_hard_link.argtypes = [c_wchar_p, c_wchar_p, c_void_p]
+    if not create_hard_link(dest_path, src_path, None):
+        from ctypes import WinError
+        raise WinError()
+
 # TODO(inf) Maybe move to windows.py? Circular dependency though...
 # All code starting from the 'BEGIN MIT-LICENSED PART' comment and until the
 # 'END MIT-LICENSED PART' comment is based on
@@ -21,8 +21,6 @@
 #  https://github.com/wrye-bash
 #
 # =============================================================================
-from ....brec import MreRecord
-from ....mod_files import ModFile, LoadFactory
 from ....patcher.patchers.base import AImportPatcher, CBash_ImportPatcher, \
     ImportPatcher
 
@@ -45,14 +43,10 @@ def __init__(self, p_name, p_file, p_sources):
     def initData(self,progress):
         """Get cells from source files."""
         if not self.isActive: return
-        loadFactory = LoadFactory(False, *[MreRecord.type_class[x] for x in
-                                           self._read_write_records])
+        load_plugin = self.patchFile.plugin_cache.load_plugin
         for srcMod in self.srcs:
             if srcMod not in self.patchFile.p_file_minfos: continue
-            srcInfo = self.patchFile.p_file_minfos[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
-            srcFile.load(True)
-            srcFile.convertToLongFids(('WRLD','ROAD'))
+            srcFile = load_plugin(srcMod, self._read_write_records)
             for worldBlock in srcFile.WRLD.worldBlocks:
                 if worldBlock.road:
                     worldId = worldBlock.world.fid
@@ -28,7 +28,6 @@
 from ....bolt import GPath, sio, SubProgress, CsvReader, deprint
 from ....brec import MreRecord, RecHeader, null4
 from ....exception import StateError
-from ....mod_files import ModFile, LoadFactory
 from ....patcher import getPatchesPath
 from ....patcher.base import Patcher, CBash_Patcher, Abstract_Patcher, \
     AListPatcher
@@ -736,10 +735,8 @@ def __init__(self, p_name, p_file):
         super(SEWorldEnforcer, self).__init__(p_name, p_file)
         self.cyrodiilQuests = set()
         if _ob_path in p_file.loadSet:
-            loadFactory = LoadFactory(False,MreRecord.type_class['QUST'])
-            modInfo = self.patchFile.p_file_minfos[_ob_path]
-            modFile = ModFile(modInfo,loadFactory)
-            modFile.load(True)
+            modFile = self.patchFile.plugin_cache.load_plugin(
+                _ob_path, (MreRecord.type_class['QUST'],))
             mapper = modFile.getLongMapper()
             for record in modFile.QUST.getActiveRecords():
                 for condition in record.conditions:
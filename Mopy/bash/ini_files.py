@@ -54,19 +54,26 @@ def get_ini_type_and_encoding(abs_ini_path):
     detected_encoding, _confidence = getbestencoding(content)
     decoded_content = decode(content, detected_encoding)
     count = Counter()
+    tokenize = IniFile._tokenize_line
+    obse_comment = OBSEIniFile.reComment
+    obse_regexes = OBSEIniFile.formatRes
     for line in decoded_content.splitlines():
-        for ini_type in (IniFile, OBSEIniFile):
-            stripped = ini_type.reComment.sub(u'', line).strip()
-            for regex in ini_type.formatRes:
-                if regex.match(stripped):
-                    count[ini_type] += 1
-                    break
+        if tokenize(line)[0] in (_INI_SETTING, _INI_SECTION):
+            count[IniFile] += 1
+        stripped = obse_comment.sub(u'', line).strip()
+        for regex in obse_regexes:
+            if regex.match(stripped):
+                count[OBSEIniFile] += 1
+                break
     try:
         inferred_ini_type = count.most_common(1)[0][0]
     except IndexError: # empty file or failed to parse ini lines
         raise BoltError(u'Failed to infer type for %s' % abs_ini_path)
     return inferred_ini_type, detected_encoding
 
+# Line kinds returned by IniFile._tokenize_line
+_INI_EMPTY, _INI_SECTION, _INI_SETTING, _INI_DELETED, _INI_OTHER = range(5)
+
 class IniFile(AFile):
     """Any old ini file."""
     reComment = re.compile(u';.*',re.U)
@@ -88,6 +95,40 @@ def __init__(self, fullpath, ini_encoding):
         self._deleted = False
         self.updated = False # notify iniInfos which should clear this flag
 
+    @staticmethod
+    def _tokenize_line(line):
+        """Classify a single line of the ini in one pass, without running
+        reComment, reSection, reSetting and reDeletedSetting over it. Returns
+        a (kind, name, value) tuple, where kind is one of:
+        _INI_SECTION: name is the section
+        _INI_SETTING: name is the setting, value its stripped value
+        _INI_DELETED: a ';-' line, name is the deleted setting
+        _INI_OTHER: anything else that is not a comment or whitespace
+        _INI_EMPTY: blank or comment line
+        The results are the same as the ones of the regexes above."""
+        comment_start = line.find(u';')
+        stripped = (line if comment_start == -1 else
+                    line[:comment_start]).strip()
+        if stripped:
+            if stripped[0] == u'[' and stripped[-1] == u']' \
+                    and len(stripped) > 2:
+                inner = stripped[1:-1]
+                return _INI_SECTION, inner.strip() or inner[-1], None
+            equals = stripped.find(u'=', 1)
+            if equals == -1:
+                return _INI_OTHER, None, None
+            return (_INI_SETTING, stripped[:equals].rstrip(),
+                    stripped[equals + 1:].strip())
+        if comment_start == 0 and line.startswith(u';-'):
+            deleted = line[2:].lstrip()
+            if deleted and (deleted[0].isalnum() or deleted[0] == u'_'):
+                end = len(deleted)
+                for sep in (u';', u'='):
+                    sep_pos = deleted.find(sep, 1)
+                    if sep_pos != -1 and sep_pos < end: end = sep_pos
+                return _INI_DELETED, deleted[:end].rstrip(), None
+        return _INI_EMPTY, None, None
+
     def getSetting(self, section, key, default):
         """Gets a single setting from the file."""
         try:
@@ -153,34 +194,27 @@ def _get_ci_settings(self, tweakPath):
         ci_deleted_settings = DefaultLowerDict(LowerDict)
         default_section = self.__class__.defaultSection
         isCorrupted = u''
-        reComment = self.__class__.reComment
-        reSection = self.__class__.reSection
-        reDeleted = self.__class__.reDeletedSetting
-        reSetting = self.__class__.reSetting
+        tokenize = self._tokenize_line
+        ini_encoding = self.ini_encoding
         #--Read ini file
         with tweakPath.open('r') as iniFile:
             sectionSettings = None
             section = None
             for i,line in enumerate(iniFile.readlines()):
-                line = unicode(line, self.ini_encoding)
-                maDeleted = reDeleted.match(line)
-                stripped = reComment.sub(u'',line).strip()
-                maSection = reSection.match(stripped)
-                maSetting = reSetting.match(stripped)
-                if maSection:
-                    section = maSection.group(1)
+                kind, name, value = tokenize(unicode(line, ini_encoding))
+                if kind == _INI_SECTION:
+                    section = name
                     sectionSettings = ci_settings[section]
-                elif maSetting:
+                elif kind == _INI_SETTING:
                     if sectionSettings is None:
                         sectionSettings = ci_settings[default_section]
                         isCorrupted = _(
                             u'Your %s should begin with a section header ('
                             u'e.g. "[General]"), but does not.') % tweakPath
-                    sectionSettings[maSetting.group(1)] = maSetting.group(
-                        2).strip(), i
-                elif maDeleted:
+                    sectionSettings[name] = value, i
+                elif kind == _INI_DELETED:
                     if not section: continue
-                    ci_deleted_settings[section][maDeleted.group(1)] = i
+                    ci_deleted_settings[section][name] = i
         return ci_settings, ci_deleted_settings, isCorrupted
 
     def read_ini_content(self, as_unicode=True):
@@ -221,32 +255,26 @@ def analyse_tweak(self, tweak_file):
         deleted: deleted line (?)"""
         lines = []
         ci_settings, ci_deletedSettings = self.get_ci_settings(with_deleted=True)
-        reComment = self.reComment
-        reSection = self.reSection
-        reDeleted = self.reDeletedSetting
-        reSetting = self.reSetting
+        tokenize = self._tokenize_line
         #--Read ini file
         section = self.__class__.defaultSection
         tweak_lines = tweak_file.read_ini_content() # type: list[unicode]
         for i, line in enumerate(tweak_lines):
-            maDeletedSetting = reDeleted.match(line)
-            stripped = reComment.sub(u'', line).strip()
-            maSection = reSection.match(stripped)
-            maSetting = reSetting.match(stripped)
+            kind, name, tweak_value = tokenize(line)
             deleted = False
             setting = None
             value = u''
             status = 0
             lineNo = -1
-            if maSection:
-                section = maSection.group(1)
+            if kind == _INI_SECTION:
+                section = name
                 if section not in ci_settings:
                     status = -10
-            elif maSetting:
+            elif kind == _INI_SETTING:
                 if section in ci_settings:
-                    setting = maSetting.group(1)
+                    setting = name
                     if setting in ci_settings[section]:
-                        value = maSetting.group(2).strip()
+                        value = tweak_value
                         lineNo = ci_settings[section][setting][1]
                         if ci_settings[section][setting][0] == value:
                             status = 20
@@ -256,8 +284,8 @@ def analyse_tweak(self, tweak_file):
                         status = -10
                 else:
                     status = -10
-            elif maDeletedSetting:
-                setting = maDeletedSetting.group(1)
+            elif kind == _INI_DELETED:
+                setting = name
                 status = 20
                 if section in ci_settings and setting in ci_settings[section]:
                     lineNo = ci_settings[section][setting][1]
@@ -265,9 +293,8 @@ def analyse_tweak(self, tweak_file):
                 elif section in ci_deletedSettings and setting in ci_deletedSettings[section]:
                     lineNo = ci_deletedSettings[section][setting]
                 deleted = True
-            else:
-                if stripped:
-                    status = -10
+            elif kind == _INI_OTHER:
+                status = -10
             lines.append((line, section, setting, value, status, lineNo,
                           deleted))
         return lines
@@ -288,10 +315,7 @@ def saveSettings(self,ini_settings,deleted_settings={}):
         ini_settings = _to_lower(ini_settings)
         deleted_settings = LowerDict((x, set(CIstr(u) for u in y)) for x, y in
                                      deleted_settings.iteritems())
-        reDeleted = self.reDeletedSetting
-        reComment = self.reComment
-        reSection = self.reSection
-        reSetting = self.reSetting
+        tokenize = self._tokenize_line
         #--Read init, write temp
         section = None
         sectionSettings = {}
@@ -305,24 +329,20 @@ def _add_remaining_new_items():
                     tmpFileWrite(u'%s=%s\n' % (sett, val))
                 tmpFileWrite(u'\n')
             for line in ini_lines:
-                stripped = reComment.sub(u'', line).strip()
-                maSection = reSection.match(stripped)
-                if maSection:
+                kind, name, _value = tokenize(line)
+                if kind == _INI_SECTION:
                     # 'new' entries still to be added from previous section
                     _add_remaining_new_items()
-                    section = maSection.group(1)  # entering new section
+                    section = name  # entering new section
                     sectionSettings = ini_settings.get(section, {})
-                else:
-                    match = reSetting.match(stripped) or reDeleted.match(
-                        line)  # note we run maDeleted on LINE
-                    if match:
-                        setting = match.group(1)
-                        if setting in sectionSettings:
-                            value = sectionSettings[setting]
-                            line = u'%s=%s' % (setting, value)
-                            del sectionSettings[setting]
-                        elif section in deleted_settings and setting in deleted_settings[section]:
-                            line = u';-' + line
+                elif kind == _INI_SETTING or kind == _INI_DELETED:
+                    setting = name
+                    if setting in sectionSettings:
+                        value = sectionSettings[setting]
+                        line = u'%s=%s' % (setting, value)
+                        del sectionSettings[setting]
+                    elif section in deleted_settings and setting in deleted_settings[section]:
+                        line = u';-' + line
                 tmpFileWrite(line + u'\n')
             # This will occur for the last INI section in the ini file
             _add_remaining_new_items()
@@ -338,26 +358,19 @@ def _add_remaining_new_items():
     def applyTweakFile(self, tweak_lines):
         """Read ini tweak file and apply its settings to self (the target ini).
         """
-        reDeleted = self.reDeletedSetting
-        reComment = self.reComment
-        reSection = self.reSection
-        reSetting = self.reSetting
+        tokenize = self._tokenize_line
         #--Read Tweak file
         ini_settings = DefaultLowerDict(LowerDict)
         deleted_settings = DefaultLowerDict(set)
         section = None
         for line in tweak_lines:
-            maDeleted = reDeleted.match(line)
-            stripped = reComment.sub(u'',line).strip()
-            maSection = reSection.match(stripped)
-            maSetting = reSetting.match(stripped)
-            if maSection:
-                section = maSection.group(1)
-            elif maSetting:
-                ini_settings[section][maSetting.group(1)] = maSetting.group(
-                    2).strip()
-            elif maDeleted:
-                deleted_settings[section].add(CIstr(maDeleted.group(1)))
+            kind, name, value = tokenize(line)
+            if kind == _INI_SECTION:
+                section = name
+            elif kind == _INI_SETTING:
+                ini_settings[section][name] = value
+            elif kind == _INI_DELETED:
+                deleted_settings[section].add(CIstr(name))
         self.saveSettings(ini_settings,deleted_settings)
         return True
 
@@ -366,8 +379,7 @@ def remove_section(self, target_section): # type: (unicode) -> None
         this will only remove the first matching section. If you want to remove
         multiple, you will have to call this in a loop and check if the section
         still exists after each iteration."""
-        re_comment = self.reComment
-        re_section = self.reSection
+        tokenize = self._tokenize_line
         ini_lines = self.read_ini_content(as_unicode=True)
         # Tri-State: If None, we haven't hit the section yet. If True, then
         # we've hit it and are actively removing it. If False, then we've fully
@@ -375,10 +387,8 @@ def remove_section(self, target_section): # type: (unicode) -> None
         remove_current = None
         with self._open_for_writing(self.abs_path.temp.s) as out:
             for line in ini_lines:
-                stripped = re_comment.sub(u'', line).strip()
-                match_section = re_section.match(stripped)
-                if match_section:
-                    section = match_section.group(1)
+                kind, section, _value = tokenize(line)
+                if kind == _INI_SECTION:
                     # Check if we need to remove this section
                     if remove_current is None and section.lower() == \
                             target_section.lower():
@@ -253,6 +253,19 @@ def save_lo(lord, acti=None, __index_move=0, quiet=False):
     _update_cache(lord=lord, acti_sorted=acti, __index_move=__index_move)
     return cached_lord
 
+def use_lo(lord, acti):
+    """Validate the given load order and active plugins and cache them,
+    without saving them to disk - the ones of the game stay as they are.
+
+    :type lord: list[bolt.Path]
+    :type acti: list[bolt.Path]"""
+    fix_lo = _games_lo.FixInfo()
+    lord, acti = _game_handle.set_load_order(list(lord), list(acti),
+                                             dry_run=True, fix_lo=fix_lo)
+    fix_lo.lo_deprint()
+    _update_cache(lord=lord, acti_sorted=acti)
+    return cached_lord
+
 def _update_cache(lord=None, acti_sorted=None, __index_move=0):
     """
     :type lord: tuple[bolt.Path] | list[bolt.Path]
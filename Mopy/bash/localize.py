@@ -135,6 +135,20 @@ def setup_locale(cli_lang, _wx):
     del _temp_app
     return target_locale
 
+def install_translation(locale_name):
+    """Installs the translation for locale_name, the locale setup_locale
+    ended up with, without looking at wx or compiling anything - e.g. in a
+    freshly spawned worker process."""
+    mo = os.path.join(os.getcwdu(), u'bash', u'l10n', u'%s.mo' % locale_name)
+    try:
+        with open(mo, u'rb') as trans_file:
+            trans = gettext.GNUTranslations(trans_file)
+    except (IOError, OSError): # English, or no compiled translation
+        trans = gettext.NullTranslations()
+    # PY3: drop the unicode=True, see setup_locale
+    trans.install(unicode=True)
+    bass.active_locale = locale_name
+
 #------------------------------------------------------------------------------
 # Internationalization
 def _find_all_bash_modules(bash_path=None, cur_dir=None, _files=None):
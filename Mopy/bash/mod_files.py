@@ -24,15 +24,20 @@
 """This module houses the entry point for reading and writing plugin files
 through PBash (LoadFactory + ModFile) as well as some related classes."""
 
+import array
+import cPickle as pickle  # PY3
+import multiprocessing
 import re
 import struct
-from collections import defaultdict
+import zlib
+from collections import defaultdict, deque, OrderedDict
 
-from . import bolt, bush, env, load_order
+from . import bass, bolt, bush, env, load_order
 from .bass import dirs
 from .bolt import deprint, GPath, SubProgress
-from .brec import MreRecord, ModReader, ModWriter, RecordHeader, RecHeader, \
-    TopGrupHeader, MobBase, MobDials, MobICells, MobObjects, MobWorlds
+from .brec import MreRecord, FastModReader, ModWriter, RecordHeader, \
+    RecHeader, GrupHeader, TopGrupHeader, MobBase, MobDials, MobICells, \
+    MobObjects, MobWorlds
 from .exception import ArgumentError, MasterMapError, ModError, StateError
 
 class MasterSet(set):
@@ -60,19 +65,22 @@ def __init__(self,inMasters,outMasters):
             else:
                 map[index] = -1
         self.map = map
+        # Table of the shifted output indices, indexed by input mod index -
+        # -1 for masters missing from outMasters, -2 for unknown indices
+        self._shifted = [(map[i] << 24) if map.get(i, -1) >= 0
+                         else map.get(i, -2) for i in xrange(0x100)]
 
     def __call__(self,fid,default=-1):
         """Maps a fid from first set of masters to second. If no mapping
         is possible, then either returns default (if defined) or raises MasterMapError."""
         if not fid: return fid
-        inIndex = int(fid >> 24)
-        outIndex = self.map.get(inIndex,-2)
-        if outIndex >= 0:
-            return (int(outIndex) << 24 ) | (fid & 0xFFFFFF)
+        shifted = self._shifted[fid >> 24]
+        if shifted >= 0:
+            return shifted | (fid & 0xFFFFFF)
         elif default != -1:
             return default
         else:
-            raise MasterMapError(inIndex)
+            raise MasterMapError(int(fid >> 24))
 
 class LoadFactory(object):
     """Factory for mod representation objects."""
@@ -190,22 +198,26 @@ def __getattr__(self, topType, __rh=RecordHeader):
             raise ArgumentError(u'Invalid top group type: '+topType)
 
     def load(self, do_unpack=False, progress=None, loadStrings=True,
-             catch_errors=True):
-        """Load file."""
+             catch_errors=True, strings_lang=None, lazy_unpack=False):
+        """Load file. strings_lang is the language of the STRINGS files to
+        load, defaulting to the one set in the game ini. If lazy_unpack is
+        True, records only unpack their subrecords when first accessed - see
+        MelRecord."""
         from . import bosh
         progress = progress or bolt.Progress()
         progress.setFull(1.0)
-        with ModReader(self.fileInfo.name,self.fileInfo.getPath().open(
-                u'rb')) as ins:
+        with FastModReader.from_path(self.fileInfo.name,
+                                     self.fileInfo.getPath()) as ins:
             insRecHeader = ins.unpackRecHeader
             # Main header of the mod file - generally has 'TES4' signature
             header = insRecHeader()
             self.tes4 = bush.game.plugin_header_class(header,ins,True)
+            ins.lazy_unpack = lazy_unpack
             # Check if we need to handle strings
             self.strings.clear()
             if do_unpack and self.tes4.flags1.hasStrings and loadStrings:
                 stringsProgress = SubProgress(progress,0,0.1) # Use 10% of progress bar for strings
-                lang = bosh.oblivionIni.get_ini_language()
+                lang = strings_lang or bosh.oblivionIni.get_ini_language()
                 stringsPaths = self.fileInfo.getStringsPaths(lang)
                 stringsProgress.setFull(max(len(stringsPaths),1))
                 for i,path in enumerate(stringsPaths):
@@ -288,38 +300,52 @@ def save(self,outPath=None):
                     selfTops[rec_type].dump(out)
 
     def getLongMapper(self):
-        """Returns a mapping function to map short fids to long fids."""
+        """Returns a mapping function to map short fids to long fids. Mapped
+        fids are memoized, so every fid is only converted once and all the
+        records referencing it share the same long fid."""
         masters = self.tes4.masters+[self.fileInfo.name]
-        maxMaster = len(masters)-1
+        # Mod indices past the plugin itself map to the plugin - pad the
+        # masters to all 256 mod indices so no clamping is needed
+        long_masters = masters + masters[-1:] * max(0x100 - len(masters), 0)
+        long_fids = {None: None}
         def mapper(fid):
-            if fid is None: return None
-            if isinstance(fid,tuple): return fid
-            mod,object = int(fid >> 24),int(fid & 0xFFFFFF)
-            return masters[min(mod,maxMaster)],object
+            try:
+                return long_fids[fid]
+            except KeyError:
+                if isinstance(fid,tuple): return fid
+                long_fid = long_fids[fid] = (long_masters[int(fid >> 24)],
+                                             int(fid & 0xFFFFFF))
+                return long_fid
         return mapper
 
     def getShortMapper(self):
-        """Returns a mapping function to map long fids to short fids."""
+        """Returns a mapping function to map long fids to short fids. Like
+        getLongMapper, mapped fids are memoized."""
         masters = self.tes4.masters + [self.fileInfo.name]
-        indices = {name: index for index, name in enumerate(masters)}
+        indices = {name: index << 24 for index, name in enumerate(masters)}
         gLong = self.getLongMapper()
         has_expanded_range = bush.game.Esp.expanded_plugin_range
-        if has_expanded_range and len(masters) > 1:
-            # Plugin has at least one master, it may freely use the
-            # expanded (0x000-0x800) range
-            def _master_index(m_name, obj_id):
-                return indices[m_name]
-        else:
-            # 0x000-0x800 are reserved for hardcoded (engine) records
-            def _master_index(m_name, obj_id):
-                return indices[m_name] if obj_id >= 0x800 else 0
+        # 0x000-0x800 are reserved for hardcoded (engine) records, unless the
+        # plugin has at least one master - then it may freely use the
+        # expanded (0x000-0x800) range
+        reserved_range = not has_expanded_range or len(masters) == 1
+        short_fids = {None: None}
         def mapper(fid):
-            if fid is None: return None
-            ##: #312: drop this once convertToLongFids is auto-applied
-            if isinstance(fid, (int, long)): # PY3: just int here
-                fid = gLong(fid)
-            modName, object_id = fid
-            return (_master_index(modName, object_id) << 24) | object_id
+            try:
+                return short_fids[fid]
+            except KeyError:
+                ##: #312: drop this once convertToLongFids is auto-applied
+                if isinstance(fid, (int, long)): # PY3: just int here
+                    long_fid = gLong(fid)
+                else:
+                    long_fid = fid
+                modName, object_id = long_fid
+                if reserved_range and object_id < 0x800:
+                    short_fid = object_id
+                else:
+                    short_fid = indices[modName] | object_id
+                short_fids[fid] = short_fid
+                return short_fid
         return mapper
 
     def convertToLongFids(self,types=None):
@@ -413,10 +439,663 @@ def getMgefName(self):
     def __repr__(self):
         return u'ModFile<%s>' % self.fileInfo.name.s
 
-# TODO(inf) Use this for a bunch of stuff in mods_metadata.py (e.g. UDRs)
+class PluginCache(object):
+    """Caches parsed top groups of plugins, keyed by (plugin name, top group
+    signature). Meant to be owned by a single client (e.g. a PatchFile) that
+    loads the same plugins many times over - the record types requested so far
+    are unioned, so that each plugin is parsed once for all of them. Whole top
+    groups are evicted in least recently used order once the estimated memory
+    used by the cached groups exceeds the budget.
+
+    Cached top groups are converted to long fids on load and shared between
+    all clients, so they must be treated as read only - use getTypeCopy to get
+    a record that can be edited. Their records are unpacked lazily, so only
+    the subrecords clients actually look at are ever decoded."""
+    # Record signatures that end up in the CELL/WRLD top groups
+    _cell_sigs = {b'WRLD', b'ROAD', b'CELL', b'REFR', b'ACHR', b'ACRE',
+                  b'PGRD', b'LAND'}
+    # Parsed records take up much more space than they do in the plugin: a
+    # record object, the raw record data kept around for lazy unpacking and
+    # the subrecords clients unpacked. Measured with top groups of 100k BOOKs
+    # and of 100k GMSTs, parsed lazily and with every EDID looked up, each
+    # record took up about 1.1KB plus 3.3 times its size in the plugin. This
+    # is rounded up, as running out of address space is much worse than
+    # parsing a plugin twice
+    _record_overhead = 1280
+    _memory_factor = 4
+
+    def __init__(self, mod_infos, budget):
+        """:param mod_infos: The ModInfos to retrieve plugins from.
+        :param budget: Estimated memory in bytes that the cached top groups
+            may take up."""
+        self._mod_infos = mod_infos
+        self._budget = budget
+        # Union of the record classes requested so far, keyed by signature
+        self._type_class = {}
+        self._plugin_headers = {} # plugin name -> plugin header record
+        # (plugin name, top sig) -> (top group, frozenset of loaded rec sigs)
+        self._top_groups = OrderedDict()
+        self._absent_tops = defaultdict(set) # plugin name -> absent top sigs
+        self.cached_size = 0
+        # Bytes of top groups this cache parsed - groups that were skipped,
+        # served from the cache or added via add_plugin don't count
+        self.bytes_parsed = 0
+
+    def _child_sigs(self, top_sig, load_factory):
+        """Returns the signatures of the records that load_factory loads into
+        the specified top group."""
+        if top_sig in (b'CELL', b'WRLD'):
+            return frozenset(load_factory.recTypes & self._cell_sigs)
+        elif top_sig == b'DIAL':
+            return frozenset(load_factory.recTypes & {b'DIAL', b'INFO'})
+        return frozenset([top_sig])
+
+    def _is_cached(self, mod_name, top_sig, load_factory):
+        """Returns True if the specified top group of mod_name is cached (or
+        known to be absent) with the exact records load_factory would load."""
+        if top_sig in self._absent_tops[mod_name]: return True
+        try:
+            cached_sigs = self._top_groups[(mod_name, top_sig)][1]
+        except KeyError:
+            return False
+        # CELL, WRLD and DIAL must hold exactly the requested children
+        return cached_sigs == self._child_sigs(top_sig, load_factory)
+
+    def missing_classes(self, mod_name, rec_classes):
+        """Returns the classes among rec_classes whose top groups in the
+        specified plugin are not cached with the records a LoadFactory for
+        rec_classes would load.
+
+        :type mod_name: bolt.Path"""
+        wanted_factory = LoadFactory(False, *rec_classes)
+        missing_tops = {s for s in wanted_factory.topTypes if
+                        not self._is_cached(mod_name, s, wanted_factory)}
+        def _top_sigs(rec_sig):
+            if rec_sig in self._cell_sigs: return {b'CELL', b'WRLD'}
+            elif rec_sig == b'INFO': return {b'DIAL'}
+            return {rec_sig}
+        return [c for c in rec_classes if _top_sigs(c.rec_sig) & missing_tops]
+
+    def load_plugin(self, mod_name, rec_classes, progress=None):
+        """Returns a ModFile holding the top groups of the specified plugin
+        that a LoadFactory for rec_classes would load, with long fids. Parses
+        the plugin only if some of these top groups are not cached yet - and
+        then loads all other record types requested so far as well.
+
+        :type mod_name: bolt.Path
+        :rtype: ModFile"""
+        rec_classes = [MreRecord.type_class[c] if isinstance(c, basestring)
+                       else c for c in rec_classes]
+        self._type_class.update((c.rec_sig, c) for c in rec_classes)
+        wanted_factory = LoadFactory(False, *rec_classes)
+        wanted_tops = wanted_factory.topTypes
+        to_load = [s for s in wanted_tops if
+                   not self._is_cached(mod_name, s, wanted_factory)]
+        if to_load:
+            self._load_tops(mod_name, wanted_factory, to_load, progress)
+        mod_file = ModFile(self._mod_infos[mod_name], wanted_factory)
+        mod_file.tes4 = self._plugin_headers[mod_name]
+        mod_file.longFids = True
+        for top_sig in wanted_tops:
+            cache_key = (mod_name, top_sig)
+            try:
+                # Pop and reinsert to mark as most recently used
+                cached = self._top_groups[cache_key] = self._top_groups.pop(
+                    cache_key)
+            except KeyError:
+                continue # absent from this plugin
+            mod_file.tops[top_sig] = cached[0]
+        # Only evict now, so that we never lose the groups we just loaded
+        self._evict()
+        return mod_file
+
+    def _load_tops(self, mod_name, wanted_factory, to_load, progress):
+        """Parses the plugin once, loading the top groups in to_load with the
+        classes of wanted_factory, plus any other simple top groups of the
+        types requested so far that are not yet cached."""
+        load_classes = [c for s, c in self._type_class.iteritems() if
+                        s not in self._cell_sigs and s not in (b'DIAL',
+                        b'INFO') and not self._is_cached(mod_name, s,
+                                                         wanted_factory)]
+        load_classes.extend(wanted_factory.type_class[s] for s in
+                            wanted_factory.recTypes if
+                            s in self._cell_sigs or s in (b'DIAL', b'INFO'))
+        load_factory = LoadFactory(False, *load_classes)
+        mod_file = ModFile(self._mod_infos[mod_name], load_factory)
+        # Clients tend to look at only a few attributes of most records
+        mod_file.load(True, progress, lazy_unpack=True)
+        self.bytes_parsed += sum(t.size for t in mod_file.tops.itervalues())
+        mod_file.convertToLongFids()
+        self._store_tops(mod_name, mod_file, to_load)
+
+    def add_plugin(self, mod_file):
+        """Caches all top groups of mod_file, which must already be loaded
+        and converted to long fids - e.g. by a PluginPrefetcher."""
+        self._store_tops(mod_file.fileInfo.name, mod_file,
+                         mod_file.loadFactory.topTypes)
+
+    def _store_tops(self, mod_name, mod_file, to_load):
+        """Caches the top groups that mod_file was loaded with, noting the
+        ones absent from it. CELL, WRLD and DIAL are only cached if they are
+        in to_load."""
+        load_factory = mod_file.loadFactory
+        self._plugin_headers[mod_name] = mod_file.tes4
+        absent_tops = self._absent_tops[mod_name]
+        for top_sig in load_factory.topTypes:
+            # Complex tops must only be cached with the children they were
+            # requested with, see _is_cached
+            if top_sig not in to_load and top_sig in (
+                    b'CELL', b'WRLD', b'DIAL'): continue
+            self.discard(mod_name, top_sig)
+            if top_sig not in mod_file.tops:
+                absent_tops.add(top_sig)
+                continue
+            absent_tops.discard(top_sig)
+            top_block = mod_file.tops[top_sig]
+            self._top_groups[(mod_name, top_sig)] = (
+                top_block, self._child_sigs(top_sig, load_factory))
+            self.cached_size += self._estimated_size(top_block)
+
+    @classmethod
+    def _estimated_size(cls, top_block):
+        """Returns the estimated memory used by the parsed top_block."""
+        return (top_block.getNumRecords(False) * cls._record_overhead +
+                top_block.size * cls._memory_factor)
+
+    def _evict(self):
+        """Drops least recently used top groups until we are within our
+        budget again."""
+        top_groups = self._top_groups
+        while self.cached_size > self._budget and top_groups:
+            top_block = top_groups.popitem(last=False)[1][0]
+            self.cached_size -= self._estimated_size(top_block)
+
+    def discard(self, mod_name, top_sig=None):
+        """Drops the specified top group of the specified plugin from the
+        cache - or all of them, if top_sig is None."""
+        if top_sig is None:
+            for cache_key in [k for k in self._top_groups if
+                              k[0] == mod_name]:
+                self.cached_size -= self._estimated_size(
+                    self._top_groups.pop(cache_key)[0])
+            self._absent_tops.pop(mod_name, None)
+            self._plugin_headers.pop(mod_name, None)
+        else:
+            cached = self._top_groups.pop((mod_name, top_sig), None)
+            if cached is not None:
+                self.cached_size -= self._estimated_size(cached[0])
+
+    def clear(self):
+        """Empties the cache."""
+        self._top_groups.clear()
+        self._absent_tops.clear()
+        self._plugin_headers.clear()
+        self.cached_size = 0
+
+    def __repr__(self):
+        return u'<PluginCache: %u top group(s), %u/%u bytes>' % (
+            len(self._top_groups), self.cached_size, self._budget)
+
+#------------------------------------------------------------------------------
+# Worker side of PluginPrefetcher and ModHeaderReader.scan_for_merging - must
+# be importable, so module level
+def _worker_state():
+    """Returns the state of this process that _init_plugin_worker sets up in
+    the worker processes."""
+    return (bush.game.displayName, bush.game.gamePath, bolt.pluginEncoding,
+            dict(dirs), dict(bass.inisettings), bass.active_locale)
+
+def _init_plugin_worker(worker_state):
+    """Sets a worker process up with worker_state, see _worker_state. Forked
+    workers inherit all of it from the parent process already, but freshly
+    spawned ones (e.g. on Windows) start with no translation, directories,
+    ini settings or game. Note that the globals of bosh (modInfos,
+    oblivionIni, etc.) are never set up in workers, so the jobs must be
+    passed anything they would get from those."""
+    (game_name, game_dir, plugin_encoding, bash_dirs, ini_settings,
+     active_locale) = worker_state
+    dirs.update(bash_dirs)
+    bass.inisettings.update(ini_settings)
+    if bush.game is None:
+        from . import localize
+        localize.install_translation(active_locale)
+        bush._supportedGames()
+        bush.foundGames[game_name] = game_dir
+        bush.detect_and_set_game(name=game_name)
+    bolt.pluginEncoding = plugin_encoding
+
+class _PrefetchInfo(object):
+    """The parts of a ModInfo that ModFile.load needs, for worker processes
+    that have no ModInfos."""
+    def __init__(self, mod_name, mod_path, strings_paths):
+        self.name = mod_name
+        self._mod_path = mod_path
+        self._strings_paths = strings_paths
+
+    def getPath(self): return self._mod_path
+    def getStringsPaths(self, lang): return self._strings_paths
+
+def _prefetch_plugin(mod_name, mod_path, rec_classes, strings_paths,
+                     strings_lang):
+    """Parses and unpacks the specified plugin, returning its header and top
+    groups, with long fids. Returns None on any error - the plugin will then
+    be loaded (and the error reported) by the main process."""
+    try:
+        mod_file = ModFile(_PrefetchInfo(mod_name, mod_path, strings_paths),
+                           LoadFactory(False, *rec_classes))
+        mod_file.load(True, strings_lang=strings_lang)
+        mod_file.convertToLongFids()
+        return mod_file.tes4, mod_file.tops
+    except Exception:
+        deprint(u'Failed to prefetch %s' % mod_name, traceback=True)
+        return None
+
+class PluginPrefetcher(object):
+    """Parses plugins ahead of time in a pool of worker processes, which send
+    the unpacked top groups back pickled - only the ones plugin_cache does
+    not hold already. Plugins are requested strictly in the order they were
+    passed in and at most lookahead of them are parsed or waiting to be
+    collected at any time, to bound memory usage. Anything that could not be
+    prefetched is simply reported as missing, so the caller can load it
+    itself."""
+
+    def __init__(self, mod_infos, mod_names, get_rec_classes, workers,
+                 plugin_cache=None):
+        """:param mod_infos: The ModInfos to retrieve plugins from.
+        :param mod_names: The plugins that will be requested, in order.
+        :param get_rec_classes: Called right before a plugin is queued up to
+            get the record classes to load it with.
+        :param workers: The number of worker processes to use.
+        :param plugin_cache: The PluginCache the prefetched plugins are
+            added to, if any."""
+        self._mod_infos = mod_infos
+        self._queued = deque(mod_names)
+        self._get_rec_classes = get_rec_classes
+        self._plugin_cache = plugin_cache
+        self._lookahead = workers * 2
+        self._pending = OrderedDict() # mod name -> (AsyncResult, factory)
+        self._strings_lang = None
+        self._pool = None
+        try:
+            self._pool = multiprocessing.Pool(workers,
+                initializer=_init_plugin_worker, initargs=(_worker_state(),))
+        except (OSError, ImportError, ValueError):
+            deprint(u'Failed to start plugin loading workers, plugins '
+                    u'will be loaded serially', traceback=True)
+        self._fill()
+
+    def _fill(self):
+        """Queues plugins up until we have lookahead of them pending."""
+        if self._pool is None: return
+        while self._queued and len(self._pending) < self._lookahead:
+            mod_name = self._queued.popleft()
+            rec_classes = list(self._get_rec_classes())
+            if self._plugin_cache is not None:
+                rec_classes = self._plugin_cache.missing_classes(mod_name,
+                                                                 rec_classes)
+                if not rec_classes: continue # all cached already
+            mod_info = self._mod_infos[mod_name]
+            strings_paths = []
+            if mod_info.header.flags1.hasStrings:
+                if self._strings_lang is None:
+                    from . import bosh
+                    self._strings_lang = \
+                        bosh.oblivionIni.get_ini_language()
+                strings_paths = mod_info.getStringsPaths(self._strings_lang)
+            self._pending[mod_name] = (self._pool.apply_async(
+                _prefetch_plugin, (mod_name, mod_info.getPath(), rec_classes,
+                                   strings_paths, self._strings_lang)),
+                                       LoadFactory(False, *rec_classes))
+
+    def get_plugin(self, mod_name):
+        """Waits for the specified plugin to be parsed and returns it as a
+        ModFile (with long fids), or None if it could not be prefetched.
+        Plugins queued up before it are dropped.
+
+        :type mod_name: bolt.Path
+        :rtype: ModFile | None"""
+        try:
+            while mod_name in self._pending:
+                pending_name, (async_result, load_factory) = \
+                    self._pending.popitem(last=False)
+                if pending_name == mod_name: break
+            else:
+                return None
+            try:
+                loaded = async_result.get()
+            except Exception: # e.g. the result could not be unpickled
+                deprint(u'Failed to receive prefetched %s' % mod_name,
+                        traceback=True)
+                loaded = None
+        finally:
+            self._fill()
+        if loaded is None: return None
+        mod_file = ModFile(self._mod_infos[mod_name], load_factory)
+        mod_file.tes4, mod_file.tops = loaded
+        mod_file.longFids = True
+        return mod_file
+
+    def close(self):
+        """Stops the worker processes, dropping any pending results."""
+        self._queued.clear()
+        self._pending.clear()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+#------------------------------------------------------------------------------
+class RecordIndex(object):
+    """Index of every record and GRUP in a plugin, built in a single pass over
+    its headers. Stores, in file order, each entry's header fields, offset in
+    the plugin, enclosing GRUP and (for records) the raw EDID. Indices are
+    persisted in the Bash mod data directory, keyed by the plugin's path,
+    size, modification time and CRC, so unchanged plugins are never scanned
+    twice. The few most recently used indices are kept in memory too."""
+    _index_version = 1
+    _cache = OrderedDict() # plugin path -> RecordIndex
+    _cache_limit = 4
+
+    def __init__(self, index_key):
+        self._index_key = index_key
+        # Parallel columns, one entry per header. The uints follow the header
+        # layout - for records: flags1, fid, flags2, for GRUPs: label (top
+        # group signatures packed into an int), groupType, stamp
+        self._sigs = []
+        self._sizes = array.array('I')
+        self._uint0 = array.array('I')
+        self._uint1 = array.array('I')
+        self._uint2 = array.array('I')
+        self._extras = array.array('I')
+        self._offsets = array.array('I')
+        self._parents = array.array('i') # row of enclosing GRUP or -1
+        self._eids = [] # raw EDIDs, None for GRUPs and records without one
+
+    @classmethod
+    def for_plugin(cls, mod_info):
+        """Returns the index of the specified plugin, from memory or disk if
+        it is still up to date, otherwise building it.
+
+        :rtype: RecordIndex"""
+        return cls.for_path(mod_info.name, mod_info.abs_path,
+                            cls.index_key(mod_info), cls.index_path(mod_info))
+
+    @classmethod
+    def for_path(cls, mod_name, mod_path, index_key, index_path):
+        """Like for_plugin, for processes that have no ModInfos - see
+        index_key and index_path.
+
+        :rtype: RecordIndex"""
+        path_key = mod_path.s
+        index = cls._cache.pop(path_key, None)
+        if index is None or index._index_key != index_key:
+            index = cls._load(mod_name, index_path, index_key)
+            if index is None:
+                index = cls(index_key)
+                index._build(mod_name, mod_path)
+                index._save(mod_name, index_path)
+        cls._cache[path_key] = index
+        while len(cls._cache) > cls._cache_limit:
+            cls._cache.popitem(last=False)
+        return index
+
+    @staticmethod
+    def index_key(mod_info):
+        """Returns the key the index of mod_info is valid for."""
+        return (mod_info.abs_path.s, mod_info.size, mod_info.mtime,
+                mod_info.calculate_crc()[0])
+
+    @staticmethod
+    def index_path(mod_info):
+        """Returns the path the index of mod_info is stored at."""
+        return dirs[u'modsBash'].join(u'Record Index',
+                                      mod_info.name.s + u'.dat')
+
+    @classmethod
+    def _load(cls, mod_name, index_path, index_key):
+        """Loads the index stored at index_path if it matches index_key."""
+        if not index_path.exists(): return None
+        try:
+            with index_path.open(u'rb') as ins:
+                if pickle.load(ins) != (cls._index_version, index_key):
+                    return None
+                index = cls(index_key)
+                (index._sigs, index._sizes, index._uint0, index._uint1,
+                 index._uint2, index._extras, index._offsets, index._parents,
+                 index._eids) = pickle.load(ins)
+            return index
+        except Exception: # corrupt or from another version, just rebuild
+            deprint(u'Failed to load record index of %s' % mod_name,
+                    traceback=True)
+            return None
+
+    def _save(self, mod_name, index_path):
+        try:
+            index_path.head.makedirs()
+            with index_path.temp.open(u'wb') as out:
+                pickle.dump((self._index_version, self._index_key), out, -1)
+                pickle.dump((self._sigs, self._sizes, self._uint0,
+                             self._uint1, self._uint2, self._extras,
+                             self._offsets, self._parents, self._eids),
+                            out, -1)
+            index_path.untemp()
+        except (OSError, IOError):
+            deprint(u'Failed to save record index of %s' % mod_name,
+                    traceback=True)
+
+    def _build(self, mod_name, mod_path,
+               __unpacker=struct.Struct(u'I').unpack):
+        """Walks the headers of the plugin, filling in the columns."""
+        sigs, sizes = self._sigs, self._sizes
+        uint0, uint1, uint2 = self._uint0, self._uint1, self._uint2
+        extras, offsets = self._extras, self._offsets
+        parents, eids = self._parents, self._eids
+        grup_ends = [] # stack of (row, end offset) of the GRUPs we are in
+        with FastModReader.from_path(mod_name, mod_path) as ins:
+            ins_at_end = ins.atEnd
+            ins_tell = ins.tell
+            ins_seek = ins.seek
+            ins_unpack_rec_header = ins.unpackRecHeader
+            try:
+                while not ins_at_end():
+                    header_pos = ins_tell()
+                    while grup_ends and header_pos >= grup_ends[-1][1]:
+                        grup_ends.pop()
+                    header = ins_unpack_rec_header()
+                    sigs.append(header.recType)
+                    sizes.append(header.size)
+                    extras.append(header.extra)
+                    offsets.append(header_pos)
+                    parents.append(grup_ends[-1][0] if grup_ends else -1)
+                    if header.recType == b'GRUP':
+                        label = header.label
+                        if header.groupType == 0: # top group
+                            label = __unpacker(label)[0]
+                        uint0.append(label)
+                        uint1.append(header.groupType)
+                        uint2.append(header.stamp)
+                        eids.append(None)
+                        grup_ends.append((len(sigs) - 1,
+                                          header_pos + header.size))
+                    else:
+                        uint0.append(header.flags1)
+                        uint1.append(header.fid)
+                        uint2.append(header.flags2)
+                        body_end = ins_tell() + header.size
+                        eids.append(self._read_eid(ins, header))
+                        ins_seek(body_end)
+            except (OSError, struct.error) as e:
+                raise ModError(ins.inName, u'Error scanning %s, file read '
+                                           u"pos: %i\nCaused by: '%r'" % (
+                    mod_name.s, ins.tell(), e))
+
+    @staticmethod
+    def _read_eid(ins, header, __rh=RecordHeader):
+        """Reads the EDID of the record whose header was just read, if any.
+        The EDID is nearly always the first subrecord, so that is looked at
+        first - for compressed records, just enough data is decompressed. If
+        it is not, all the subrecords are walked."""
+        sub_header_size = __rh.sub_header_size
+        if header.size < sub_header_size: return None
+        if header.flags1 & 0x00040000: # compressed
+            if header.size < 4 + sub_header_size: return None
+            decomp = zlib.decompressobj()
+            sub_head = decomp.decompress(ins.read(header.size)[4:],
+                                         sub_header_size)
+            if len(sub_head) < sub_header_size: return None
+            sub_sig, sub_size = __rh.sub_header_unpack(sub_head)
+            if sub_sig != b'EDID':
+                return RecordIndex._find_eid(
+                    sub_head + decomp.decompress(decomp.unconsumed_tail))
+            eid = decomp.decompress(decomp.unconsumed_tail, sub_size)
+        else:
+            sub_head = ins.read(sub_header_size, b'SUB_HEAD')
+            sub_sig, sub_size = __rh.sub_header_unpack(sub_head)
+            if sub_sig != b'EDID':
+                return RecordIndex._find_eid(sub_head + ins.read(
+                    header.size - sub_header_size, header.recType))
+            if sub_size > header.size - sub_header_size: return None
+            eid = ins.read(sub_size, b'EDID')
+        return bolt.cstrip(eid)
+
+    @staticmethod
+    def _find_eid(rec_data, __rh=RecordHeader,
+                  __unpacker=struct.Struct(u'I').unpack):
+        """Walks the subrecords in rec_data, the data of a record, returning
+        its EDID, if any."""
+        sub_header_size = __rh.sub_header_size
+        pos, ext_size = 0, None
+        while pos + sub_header_size <= len(rec_data):
+            sub_sig, sub_size = __rh.sub_header_unpack(
+                rec_data[pos:pos + sub_header_size])
+            pos += sub_header_size
+            if sub_sig == b'XXXX': # the size of the next subrecord
+                ext_size = __unpacker(rec_data[pos:pos + 4])[0]
+            else:
+                if ext_size is not None:
+                    sub_size, ext_size = ext_size, None
+                if sub_sig == b'EDID':
+                    if pos + sub_size > len(rec_data): return None
+                    return bolt.cstrip(rec_data[pos:pos + sub_size])
+            pos += sub_size
+        return None
+
+    # Queries -----------------------------------------------------------------
+    def __len__(self): return len(self._sigs)
+
+    def get_sig(self, row): return self._sigs[row]
+    def get_size(self, row): return self._sizes[row]
+    def get_offset(self, row): return self._offsets[row]
+    def get_parent(self, row): return self._parents[row]
+    def is_grup(self, row): return self._sigs[row] == b'GRUP'
+
+    def get_fid(self, row):
+        """Returns the fid of the record at row (or the groupType, if row is a
+        GRUP)."""
+        return self._uint1[row]
+
+    def get_flags1(self, row): return self._uint0[row]
+
+    def get_header(self, row, __packer=struct.Struct(u'I').pack):
+        """Returns the header of the record or GRUP at row, as read from the
+        plugin.
+
+        :rtype: RecordHeader"""
+        sig = self._sigs[row]
+        if sig != b'GRUP':
+            return RecHeader(sig, self._sizes[row], self._uint0[row],
+                             self._uint1[row], self._uint2[row],
+                             self._extras[row])
+        if self._uint1[row] == 0: # top group
+            return TopGrupHeader(self._sizes[row], __packer(self._uint0[row]),
+                                 0, self._uint2[row], self._extras[row])
+        return GrupHeader(self._sizes[row], self._uint0[row],
+                          self._uint1[row], self._uint2[row],
+                          self._extras[row])
+
+    def get_eid(self, row):
+        """Returns the decoded EDID of the record at row, or u'' if it has
+        none."""
+        eid = self._eids[row]
+        if not eid: return u''
+        return u'\n'.join(bolt.decode(x, bolt.pluginEncoding,
+                                      avoidEncodings=(u'utf8', u'utf-8'))
+                          for x in eid.split(b'\n'))
+
+    def get_grup_label(self, row, __packer=struct.Struct(u'I').pack):
+        """Returns the label of the GRUP at row."""
+        if self._uint1[row] == 0: return __packer(self._uint0[row])
+        return self._uint0[row]
+
+    def get_grup_type(self, row): return self._uint1[row]
+
+    def iter_record_rows(self):
+        """Yields the rows of all records (not GRUPs), in file order."""
+        return (r for r, s in enumerate(self._sigs) if s != b'GRUP')
+
+class MergeScan(object):
+    """What the mergeability checks need to know about the records of a
+    plugin, gathered from its RecordIndex instead of loading it. Small, so
+    that worker processes can send it back cheaply.
+
+    The plugin is looked at as if loaded with a LoadFactory for rec_types:
+    top groups of other types are skipped (tops_skipped), new records that
+    are neither ignored nor deleted mark their top group (new_blocks).
+    has_high_new_fids is True if any record at all is new and has an object
+    index above 0xFFF, so that the plugin can't be ESL flagged."""
+    __slots__ = (u'error', u'bad_grouping', u'tops_skipped', u'has_tops',
+                 u'new_blocks', u'has_high_new_fids')
+
+    def __init__(self):
+        self.error = None # the message of the ModError indexing raised
+        self.bad_grouping = False
+        self.tops_skipped = set()
+        self.has_tops = False
+        self.new_blocks = set()
+        self.has_high_new_fids = False
+
+    def scan_index(self, rec_index, top_types, rec_types, num_masters):
+        loaded_top = False
+        for row in xrange(len(rec_index)):
+            if rec_index.get_parent(row) == -1: # outside of any GRUP
+                if rec_index.is_grup(row) and \
+                        rec_index.get_grup_type(row) == 0:
+                    top_label = rec_index.get_grup_label(row)
+                    loaded_top = top_label in top_types
+                    if loaded_top: self.has_tops = True
+                    else: self.tops_skipped.add(top_label)
+                elif row: # only the plugin header may be outside of them
+                    self.bad_grouping = True
+                    return
+                continue
+            if rec_index.is_grup(row): continue
+            fid = rec_index.get_fid(row)
+            if fid >> 24 < num_masters: continue
+            if fid & 0xFFFFFF > 0xFFF: self.has_high_new_fids = True
+            # ignored (0x1000) or deleted (0x20) records are not new ones
+            if loaded_top and not rec_index.get_flags1(row) & 0x1020 and \
+                    rec_index.get_sig(row) in rec_types:
+                self.new_blocks.add(top_label)
+
+def _scan_for_merging(job):
+    """Scans a plugin for ModHeaderReader.scan_for_merging, returning its
+    name and MergeScan."""
+    (mod_name, mod_path, index_key, index_path, top_types, rec_types,
+     num_masters) = job
+    merge_scan = MergeScan()
+    try:
+        rec_index = RecordIndex.for_path(mod_name, mod_path, index_key,
+                                         index_path)
+    except ModError as e:
+        merge_scan.error = u'%s' % e
+    else:
+        merge_scan.scan_index(rec_index, top_types, rec_types, num_masters)
+    return mod_name, merge_scan
+
 class ModHeaderReader(object):
     """Allows very fast reading of a plugin's headers, skipping reading and
-    decoding of anything but the headers."""
+    decoding of anything but the headers. Backed by the plugin's
+    RecordIndex, so unchanged plugins are only scanned once."""
     @staticmethod
     def read_mod_headers(mod_info):
         """Reads the headers of every record in the specified mod, returning
@@ -426,26 +1105,12 @@ def read_mod_headers(mod_info):
 
         :rtype: defaultdict[str, list[RecordHeader]]"""
         ret_headers = defaultdict(list)
-        with ModReader(mod_info.name, mod_info.abs_path.open(u'rb')) as ins:
-            ins_at_end = ins.atEnd
-            ins_unpack_rec_header = ins.unpackRecHeader
-            ins_seek = ins.seek
-            try:
-                while not ins_at_end():
-                    header = ins_unpack_rec_header()
-                    # Skip GRUPs themselves, only process their records
-                    header_rec_sig = header.recType
-                    if header_rec_sig != b'GRUP':
-                        ret_headers[header_rec_sig].append(header)
-                        ins_seek(header.size, 1)
-            except (OSError, struct.error) as e:
-                raise ModError(ins.inName, u'Error scanning %s, file read '
-                                           u"pos: %i\nCaused by: '%r'" % (
-                    mod_info.name.s, ins.tell(), e))
+        rec_index = RecordIndex.for_plugin(mod_info)
+        get_header = rec_index.get_header
+        for row in rec_index.iter_record_rows():
+            ret_headers[rec_index.get_sig(row)].append(get_header(row))
         return ret_headers
 
-    ##: The method above has to be very fast, but this one can afford to be
-    # much slower. Should eventually be absorbed by refactored ModFile API.
     @staticmethod
     def read_temp_child_headers(mod_info):
         """Reads the headers of all temporary CELL chilren in the specified mod
@@ -453,39 +1118,92 @@ def read_temp_child_headers(mod_info):
 
         :rtype: list[RecordHeader]"""
         ret_headers = []
-        # We want to read only the children of these, so skip their tops
+        # We want only the children of these, not the records themselves
         interested_sigs = {b'CELL', b'WRLD'}
         tops_to_skip = interested_sigs | {bush.game.Esp.plugin_header_sig}
-        grup_header_size = RecordHeader.rec_header_size
-        with ModReader(mod_info.name, mod_info.abs_path.open(u'rb')) as ins:
-            ins_at_end = ins.atEnd
-            ins_unpack_rec_header = ins.unpackRecHeader
-            ins_seek = ins.seek
-            try:
-                while not ins_at_end():
-                    header = ins_unpack_rec_header()
-                    header_rec_sig = header.recType
-                    if header_rec_sig == b'GRUP':
-                        header_group_type = header.groupType
-                        # Skip all top-level GRUPs we're not interested in
-                        # (group type == 0) and all persistent children and
-                        # dialog topics (group type == 7 or 8, respectively).
-                        if ((header_group_type == 0 and
-                             header.label not in interested_sigs)
-                                or header_group_type in (7, 8)):
-                            # Note that GRUP sizes include their own header
-                            # size, so we need to subtract that
-                            ins_seek(header.size - grup_header_size, 1)
-                    elif header_rec_sig in tops_to_skip:
-                        # Skip TES4, CELL and WRLD to get to their contents
-                        ins_seek(header.size, 1)
-                    else:
-                        # We must be in a temp CELL children group, store the
-                        # header and skip the record body
-                        ret_headers.append(header)
-                        ins_seek(header.size, 1)
-            except (OSError, struct.error) as e:
-                raise ModError(ins.inName, u'Error scanning %s, file read '
-                                           u"pos: %i\nCaused by: '%r'" % (
-                    mod_info.name.s, ins.tell(), e))
+        rec_index = RecordIndex.for_plugin(mod_info)
+        skipped_grups = {} # GRUP row -> whether its contents are skipped
+        for row in rec_index.iter_record_rows():
+            if rec_index.get_sig(row) in tops_to_skip: continue
+            # Skip the contents of all top-level GRUPs we're not interested in
+            # (group type == 0) and of all persistent children and dialog
+            # topics (group type == 7 or 8, respectively)
+            grup_row = rec_index.get_parent(row)
+            grup_chain = []
+            while grup_row != -1 and grup_row not in skipped_grups:
+                grup_chain.append(grup_row)
+                grup_row = rec_index.get_parent(grup_row)
+            skip = grup_row != -1 and skipped_grups[grup_row]
+            for grup_row in reversed(grup_chain):
+                grup_type = rec_index.get_grup_type(grup_row)
+                skip = skip or grup_type in (7, 8) or (
+                    grup_type == 0 and rec_index.get_grup_label(
+                        grup_row) not in interested_sigs)
+                skipped_grups[grup_row] = skip
+            if not skip:
+                ret_headers.append(rec_index.get_header(row))
         return ret_headers
+
+    @staticmethod
+    def read_top_group_crcs(mod_info):
+        """Reads the specified mod and returns a dict mapping the signature of
+        its plugin header and of each of its top groups to the CRC32 of that
+        record/group, header included. Used to tell which parts of a plugin
+        changed between two versions of it.
+
+        :rtype: dict[str, int]"""
+        ret_crcs = {}
+        hsize = RecordHeader.rec_header_size
+        with FastModReader.from_path(mod_info.name, mod_info.abs_path) as ins:
+            while not ins.atEnd():
+                header = ins.unpackRecHeader()
+                if header.recType == b'GRUP':
+                    top_sig, data_size = header.label, header.size - hsize
+                else:
+                    top_sig, data_size = header.recType, header.size
+                ins.seek(-hsize, 1)
+                ret_crcs[top_sig] = ins.crc32(hsize + data_size, top_sig)
+        return ret_crcs
+
+    @staticmethod
+    def scan_for_merging(mod_infos, load_factory, workers=0, progress=None):
+        """Scans the records of the specified plugins for the mergeability
+        checks, returning a dict mapping their names to their MergeScans.
+        Building the RecordIndex of a plugin that changed is the expensive
+        part, so if workers is not 0 the plugins are spread over a pool of
+        that many worker processes.
+
+        :param load_factory: The LoadFactory the plugins would be loaded
+            with - decides which top groups and records are looked at.
+        :rtype: dict[bolt.Path, MergeScan]"""
+        progress = progress or bolt.Progress()
+        progress.setFull(max(len(mod_infos), 1))
+        jobs = [(mod_info.name, mod_info.abs_path,
+                 RecordIndex.index_key(mod_info),
+                 RecordIndex.index_path(mod_info), load_factory.topTypes,
+                 load_factory.recTypes, len(mod_info.header.masters))
+                for mod_info in mod_infos]
+        pool = None
+        if workers > 0 and len(jobs) > 1:
+            try:
+                pool = multiprocessing.Pool(min(workers, len(jobs)),
+                    initializer=_init_plugin_worker,
+                    initargs=(_worker_state(),))
+            except (OSError, ImportError, ValueError):
+                deprint(u'Failed to start plugin scanning workers, plugins '
+                        u'will be scanned serially', traceback=True)
+        try:
+            if pool is None:
+                scanned = (_scan_for_merging(job) for job in jobs)
+            else:
+                scanned = pool.imap_unordered(_scan_for_merging, jobs,
+                                              chunksize=4)
+            merge_scans = {}
+            for i, (mod_name, merge_scan) in enumerate(scanned):
+                progress(i, mod_name.s)
+                merge_scans[mod_name] = merge_scan
+            return merge_scans
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
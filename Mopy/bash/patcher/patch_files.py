@@ -22,21 +22,28 @@
 #
 # =============================================================================
 from __future__ import print_function
+import cPickle as pickle  # PY3
+import re
 import time
-from collections import defaultdict, Counter
+from collections import defaultdict, Counter, OrderedDict
 from operator import attrgetter
+from timeit import default_timer
 from .. import bush # for game etc
 from .. import bosh # for modInfos
 from .. import bolt # for type hints
 from ..balt import readme_url
 from .. import load_order
 from .. import bass
+from .. import env
 from ..brec import MreRecord
+from ..bass import dirs
 from ..bolt import GPath, SubProgress, deprint, Progress
 from ..cint import ObModFile, FormID, dump_record, ObCollection, MGEFCode
 from ..exception import BoltError, CancelError, ModError, StateError
 from ..localize import format_date
-from ..mod_files import ModFile, LoadFactory
+from ..mod_files import ModFile, LoadFactory, PluginCache, \
+    PluginPrefetcher, ModHeaderReader
+from . import getPatchesPath
 
 # the currently executing patch set in _Mod_Patch_Update before showing the
 # dialog - used in getAutoItems, to get mods loading before the patch
@@ -182,6 +189,9 @@ def __init__(self, modInfo):
         self.longFids = True
         self.keepIds = set()
         _PFile.__init__(self, modInfo.name)
+        # Parsed top groups shared by the patchers and scanLoadMods
+        self.plugin_cache = PluginCache(self.p_file_minfos, bass.inisettings[
+            u'PatchPluginCacheSize'] * 1024 * 1024)
 
     def getKeeper(self):
         """Returns a function to add fids to self.keepIds."""
@@ -206,55 +216,94 @@ def scanLoadMods(self,progress):
         """Scans load+merge mods."""
         nullProgress = Progress()
         progress = progress.setFull(len(self.allMods))
-        for index,modName in enumerate(self.allMods):
-            modInfo = bosh.modInfos[modName]
-            bashTags = modInfo.getBashTags()
-            if modName in self.loadSet and u'Filter' in bashTags:
-                self.unFilteredMods.append(modName)
-            try:
-                loadFactory = (self.readFactory,self.mergeFactory)[modName in self.mergeSet]
-                progress(index,modName.s+u'\n'+_(u'Loading...'))
-                modFile = ModFile(modInfo,loadFactory)
-                modFile.load(True,SubProgress(progress,index,index+0.5))
-            except ModError as e:
-                deprint('load error:', traceback=True)
-                self.loadErrorMods.append((modName,e))
-                continue
-            try:
-                #--Error checks
-                if 'WRLD' in modFile.tops and modFile.WRLD.orphansSkipped:
-                    self.worldOrphanMods.append(modName)
-                # TODO adapt for other games
-                if bush.game.fsName == u'Oblivion' and 'SCPT' in \
-                        modFile.tops and \
-                        modName != GPath(bush.game.master_file):
-                    gls = modFile.SCPT.getRecord(0x00025811)
-                    if gls and gls.compiled_size == 4 and gls.last_index == 0:
-                        self.compiledAllMods.append(modName)
-                pstate = index+0.5
-                isMerged = modName in self.mergeSet
-                doFilter = isMerged and u'Filter' in bashTags
-                #--iiMode is a hack to support Item Interchange. Actual key used is IIM.
-                iiMode = isMerged and u'IIM' in bashTags
-                if isMerged:
-                    progress(pstate,modName.s+u'\n'+_(u'Merging...'))
-                    self.mergeModFile(modFile, doFilter, iiMode)
-                else:
-                    progress(pstate,modName.s+u'\n'+_(u'Scanning...'))
-                    self.update_patch_records_from_mod(modFile)
-                for patcher in sorted(self._patcher_instances, key=attrgetter('scanOrder')):
-                    if iiMode and not patcher.iiMode: continue
-                    progress(pstate,u'%s\n%s' % (modName.s,patcher.getName()))
-                    patcher.scan_mod_file(modFile,nullProgress)
-                # Clip max version at 1.0.  See explanation in the CBash version as to why.
-                self.tes4.version = min(max(modFile.tes4.version, self.tes4.version), max(bush.game.Esp.validHeaderVersions))
-            except CancelError:
-                raise
-            except:
-                print(_(u"MERGE/SCAN ERROR:"),modName.s)
-                raise
+        load_workers = bass.inisettings[u'PatchLoadWorkers']
+        prefetcher = None
+        if load_workers > 0:
+            # Merging may add record types to the read factory, so the classes
+            # are only looked up right before each plugin is queued up
+            prefetcher = PluginPrefetcher(self.p_file_minfos,
+                [m for m in self.allMods if m not in self.mergeSet],
+                self.readFactory.type_class.values, load_workers,
+                self.plugin_cache)
+        try:
+            self._scan_load_mods(progress, prefetcher, nullProgress)
+        finally:
+            if prefetcher is not None: prefetcher.close()
+        self.plugin_cache.clear()
         progress(progress.full,_(u'Load mods scanned.'))
 
+    def _scan_load_mods(self, progress, prefetcher, nullProgress):
+        """Loads, merges and scans every plugin in load order, picking up
+        the ones prefetcher parsed ahead of time if it is not None."""
+        for index,modName in enumerate(self.allMods):
+            self._scan_load_mod(index, modName, progress, prefetcher,
+                                nullProgress)
+
+    def _scan_load_mod(self, index, modName, progress, prefetcher,
+                       nullProgress):
+        """Loads the plugin at index in allMods, then merges it into the
+        patch or scans it and runs the patchers' scans on it."""
+        modInfo = bosh.modInfos[modName]
+        bashTags = modInfo.getBashTags()
+        if modName in self.loadSet and u'Filter' in bashTags:
+            self.unFilteredMods.append(modName)
+        try:
+            progress(index,modName.s+u'\n'+_(u'Loading...'))
+            load_progress = SubProgress(progress, index, index + 0.5)
+            if modName in self.mergeSet:
+                # Merging edits the loaded records, so don't cache these
+                modFile = ModFile(modInfo, self.mergeFactory)
+                modFile.load(True, load_progress)
+            else:
+                if prefetcher is not None:
+                    prefetched = prefetcher.get_plugin(modName)
+                    if prefetched is not None:
+                        self.plugin_cache.add_plugin(prefetched)
+                modFile = self.plugin_cache.load_plugin(modName,
+                    self.readFactory.type_class.values(), load_progress)
+        except ModError as e:
+            deprint('load error:', traceback=True)
+            self.loadErrorMods.append((modName,e))
+            return
+        try:
+            #--Error checks
+            if 'WRLD' in modFile.tops and modFile.WRLD.orphansSkipped:
+                self.worldOrphanMods.append(modName)
+            # TODO adapt for other games
+            if bush.game.fsName == u'Oblivion' and 'SCPT' in \
+                    modFile.tops and \
+                    modName != GPath(bush.game.master_file):
+                gls_fid = 0x00025811
+                if modFile.longFids:
+                    gls_fid = (GPath(bush.game.master_file), gls_fid)
+                gls = modFile.SCPT.getRecord(gls_fid)
+                if gls and gls.compiled_size == 4 and gls.last_index == 0:
+                    self.compiledAllMods.append(modName)
+            pstate = index+0.5
+            isMerged = modName in self.mergeSet
+            doFilter = isMerged and u'Filter' in bashTags
+            #--iiMode is a hack to support Item Interchange. Actual key used is IIM.
+            iiMode = isMerged and u'IIM' in bashTags
+            if isMerged:
+                progress(pstate,modName.s+u'\n'+_(u'Merging...'))
+                self.mergeModFile(modFile, doFilter, iiMode)
+            else:
+                progress(pstate,modName.s+u'\n'+_(u'Scanning...'))
+                self.update_patch_records_from_mod(modFile)
+            for patcher in sorted(self._patcher_instances, key=attrgetter('scanOrder')):
+                if iiMode and not patcher.iiMode: continue
+                progress(pstate,u'%s\n%s' % (modName.s,patcher.getName()))
+                patcher.scan_mod_file(modFile,nullProgress)
+            # Clip max version at 1.0.  See explanation in the CBash version as to why.
+            self.tes4.version = min(max(modFile.tes4.version, self.tes4.version), max(bush.game.Esp.validHeaderVersions))
+            # No one is going to ask for this plugin anymore
+            self.plugin_cache.discard(modName)
+        except CancelError:
+            raise
+        except:
+            print(_(u"MERGE/SCAN ERROR:"),modName.s)
+            raise
+
     def mergeModFile(self, modFile, doFilter, iiMode):
         """Copies contents of modFile into self."""
         modFile.convertToLongFids()
@@ -321,6 +370,302 @@ def buildPatch(self,log,progress):
                                       u'ESL-flagged to save a load order '
                                       u'slot.')
 
+class ProfiledPatchFile(PatchFile):
+    """A PatchFile that keeps track of how long each build phase, patcher and
+    plugin took, how many bytes of plugins were parsed and how much memory
+    the build needed. Used when building patches from the command line.
+
+    Only the top groups parsed in this process count as parsed bytes - the
+    ones skipped, served from the plugin cache or parsed ahead of time by a
+    PluginPrefetcher don't."""
+
+    def __init__(self, modInfo):
+        PatchFile.__init__(self, modInfo)
+        self.phase_stats = [] # (phase, seconds, peak memory) in build order
+        # patcher name -> seconds spent in initData, scan and buildPatch
+        self.patcher_stats = OrderedDict()
+        # plugin -> (seconds, seconds in patchers' scans, bytes, merged)
+        self.plugin_stats = OrderedDict()
+        self._scan_seconds = 0.0
+        self._merged_bytes = 0 # bytes of plugins parsed for merging
+
+    @property
+    def _bytes_parsed(self):
+        return self.plugin_cache.bytes_parsed + self._merged_bytes
+
+    def run_phase(self, phase_func, *args):
+        """Run the specified build phase (e.g. self.scanLoadMods), recording
+        how long it took and the peak memory at its end."""
+        start = default_timer()
+        phase_func(*args)
+        self.phase_stats.append((phase_func.__name__,
+            default_timer() - start, env.get_peak_memory()))
+
+    def init_patchers_data(self, patchers, progress):
+        for patcher in patchers:
+            if patcher.isActive: self._profile_patcher(patcher)
+        super(ProfiledPatchFile, self).init_patchers_data(patchers, progress)
+
+    def _profile_patcher(self, patcher):
+        """Shadow the patcher's initData, scan_mod_file and buildPatch with
+        versions that add up the time spent in them."""
+        times = self.patcher_stats[patcher.getName()] = Counter()
+        def _timed(step, step_method):
+            def _timed_step(*args):
+                start = default_timer()
+                try:
+                    return step_method(*args)
+                finally:
+                    elapsed = default_timer() - start
+                    times[step] += elapsed
+                    if step == u'scan': self._scan_seconds += elapsed
+            return _timed_step
+        patcher.initData = _timed(u'init_data', patcher.initData)
+        patcher.scan_mod_file = _timed(u'scan', patcher.scan_mod_file)
+        patcher.buildPatch = _timed(u'build', patcher.buildPatch)
+
+    def _scan_load_mod(self, index, modName, *args):
+        self._scan_seconds = 0.0
+        bytes_before = self._bytes_parsed
+        start = default_timer()
+        try:
+            super(ProfiledPatchFile, self)._scan_load_mod(index, modName,
+                                                          *args)
+        finally:
+            self.plugin_stats[modName] = (default_timer() - start,
+                self._scan_seconds, self._bytes_parsed - bytes_before,
+                modName in self.mergeSet)
+
+    def mergeModFile(self, modFile, doFilter, iiMode):
+        self._merged_bytes += sum(t.size for t in modFile.tops.itervalues())
+        super(ProfiledPatchFile, self).mergeModFile(modFile, doFilter, iiMode)
+
+    def get_report(self):
+        """Return a dict with everything recorded so far, ready to be dumped
+        as json."""
+        return {
+            u'app_version': bass.AppVersion,
+            u'game': bush.game.fsName,
+            u'patch': self.patchName.s,
+            u'total_seconds': sum(s for _p, s, _m in self.phase_stats),
+            u'bytes_parsed': self._bytes_parsed,
+            u'peak_memory': env.get_peak_memory(),
+            u'phases': [{u'phase': p, u'seconds': s, u'peak_memory': m}
+                        for p, s, m in self.phase_stats],
+            u'patchers': [{u'patcher': p_name,
+                           u'init_data': times[u'init_data'],
+                           u'scan': times[u'scan'], u'build': times[u'build']}
+                          for p_name, times in self.patcher_stats.iteritems()],
+            u'plugins': [{u'plugin': m.s, u'seconds': s, u'scan_seconds': p,
+                          u'bytes': b, u'merged': merged}
+                         for m, (s, p, b, merged) in
+                         self.plugin_stats.iteritems()],
+        }
+
+class PatchManifest(object):
+    """Records what a Bashed Patch was built from - the CRCs and Bash Tags of
+    the plugins it depends on, the patcher configs, the text files patchers
+    read, etc. - so that the next build can reuse the patch as is if none of
+    it changed.
+
+    A changed plugin forces a rebuild if it is merged into the patch or is a
+    source of some patcher. Plugins that were only scanned only do so if
+    their masters, header version or one of the top groups the patch read
+    from them changed - to tell, the CRC of each of their top groups is stored
+    as well. The STRINGS files of localized plugins are tracked by size and
+    mtime, since the patch holds the strings they contain."""
+    _manifest_version = 2
+
+    def __init__(self, patch_file, patchers, patch_configs):
+        """:type patch_file: PatchFile"""
+        self._patch_file = patch_file
+        self._patch_info = patch_file.fileInfo
+        minfos = patch_file.p_file_minfos
+        src_mods, text_srcs = set(), set()
+        for patcher in patchers:
+            if not patcher.isActive: continue
+            for src in getattr(patcher, u'srcs', ()):
+                (src_mods if src in minfos else text_srcs).add(src)
+        self._src_mods = src_mods
+        patch_mods = set(patch_file.allMods) | src_mods
+        strings_lang = bosh.oblivionIni.get_ini_language()
+        self._state = {
+            u'app_version': bass.AppVersion,
+            u'game': bush.game.fsName,
+            u'configs': patch_configs,
+            u'auto_esl': bush.game.has_esl and bass.settings[
+                u'bash.mods.auto_flag_esl'],
+            u'load_mods': patch_file.loadMods,
+            u'merged': sorted(patch_file.mergeSet),
+            u'text_sources': {s: self._text_source_key(s) for s in text_srcs},
+            u'plugins': {m: self._plugin_key(minfos[m]) for m in
+                         patch_mods},
+            u'strings': {m: self._strings_key(minfos[m], strings_lang) for m
+                         in patch_mods},
+        }
+        self._stored = self._load()
+        # Top group CRCs of scanned plugins, refreshed by is_up_to_date
+        self._top_crcs = self._stored[u'top_crcs'] if self._stored else {}
+
+    @staticmethod
+    def _plugin_key(mod_info):
+        """What the patch depends on besides the records of a plugin - the
+        plugin's CRC comes first."""
+        return (mod_info.calculate_crc()[0], frozenset(mod_info.getBashTags()),
+                tuple(mod_info.get_masters()), mod_info.header.version)
+
+    @staticmethod
+    def _strings_key(mod_info, strings_lang):
+        """The size and mtime of the STRINGS files of a localized plugin. If
+        some are not loose files, those of the BSAs they may come from."""
+        if not mod_info.header.flags1.hasStrings: return None
+        def _stat(file_path):
+            try:
+                return file_path.size_mtime()
+            except OSError:
+                return None
+        strings_stats = []
+        in_bsas = False
+        for strings_path in mod_info._string_files_paths(strings_lang):
+            file_stat = _stat(mod_info.dir.join(strings_path))
+            in_bsas |= file_stat is None
+            strings_stats.append(file_stat)
+        if in_bsas:
+            strings_stats.extend((b.name, _stat(b.abs_path)) for b in
+                                 mod_info._extra_bsas())
+        return tuple(strings_stats)
+
+    @staticmethod
+    def _text_source_key(src_name):
+        src_path = getPatchesPath(src_name)
+        return (src_path.size, src_path.mtime) if src_path.isfile() else None
+
+    def _manifest_path(self):
+        return dirs[u'modsBash'].join(u'Patch Manifests',
+                                      self._patch_info.name.s + u'.dat')
+
+    def _load(self):
+        manifest_path = self._manifest_path()
+        if not manifest_path.exists(): return None
+        try:
+            with manifest_path.open(u'rb') as ins:
+                if pickle.load(ins) != self._manifest_version: return None
+                return pickle.load(ins)
+        except Exception: # corrupt or from another version, just rebuild
+            deprint(u'Failed to load manifest of %s' % self._patch_info.name,
+                    traceback=True)
+            return None
+
+    @property
+    def stored_log(self):
+        """The log of the last build, dated now, with the elapsed time still
+        to be filled in."""
+        date_line = re.compile(u'(%s\\s*\\* )[^\\r\\n]*' % re.escape(
+            u'=== ' + _(u'Date/Time')), re.U)
+        return date_line.sub(lambda ma: ma.group(1) + format_date(
+            time.time()), self._stored[u'log'], 1)
+
+    def is_up_to_date(self):
+        """Returns True if the patch on disk is what a build would produce
+        right now."""
+        stored = self._stored
+        if stored is None: return False
+        state = self._state
+        for key, state_val in state.iteritems():
+            if key != u'plugins' and stored[key] != state_val: return False
+        stored_plugins = stored[u'plugins']
+        if set(stored_plugins) != set(state[u'plugins']): return False
+        patch_path = self._patch_info.abs_path
+        if not patch_path.isfile() or self._patch_info.calculate_crc()[0] \
+                != stored[u'patch_crc']:
+            return False
+        minfos = self._patch_file.p_file_minfos
+        merged = self._patch_file.mergeSet
+        read_tops = stored[u'read_tops']
+        for mod_name, plugin_key in state[u'plugins'].iteritems():
+            stored_key = stored_plugins[mod_name]
+            if plugin_key == stored_key: continue
+            if plugin_key[1:] != stored_key[1:]: return False
+            if mod_name in merged or mod_name in self._src_mods: return False
+            stored_tops = self._top_crcs.get(mod_name)
+            if stored_tops is None: return False
+            top_crcs = ModHeaderReader.read_top_group_crcs(minfos[mod_name])
+            if any(stored_tops.get(s) != top_crcs.get(s) for s in read_tops):
+                return False
+            self._top_crcs[mod_name] = top_crcs
+        return True
+
+    def verify(self, log):
+        """Called after a full build of a patch that is_up_to_date claimed
+        to be up to date - checks that the freshly built patch matches the
+        one that would have been reused, reporting the outcome in log."""
+        old_tops = self._stored[u'patch_tops']
+        new_tops = self._read_patch_tops()
+        if old_tops == new_tops:
+            log.setHeader(u'=== ' + _(u'Manifest Verification'))
+            log(u'* ' + _(u'Reusing the previous patch would have given the '
+                          u'same result.'))
+            return
+        changed = sorted(s for s in set(old_tops) | set(new_tops)
+                         if old_tops.get(s) != new_tops.get(s))
+        deprint(u'Patch manifest of %s was wrong, changed top groups: %s' % (
+            self._patch_info.name, u', '.join(changed)))
+        log.setHeader(u'=== ' + _(u'Manifest Verification'))
+        log(u'* ' + _(u'The patch would have been wrongly reused - these top '
+                      u'groups changed: %s') % u', '.join(changed))
+
+    def _read_patch_tops(self):
+        patch_tops = ModHeaderReader.read_top_group_crcs(self._patch_info)
+        patch_tops.pop(bush.game.Esp.plugin_header_sig, None)
+        return patch_tops
+
+    def save(self, log_text):
+        """Stores the manifest of the freshly built and saved patch, along
+        with the text of its log."""
+        stored_plugins = self._stored[u'plugins'] if self._stored else {}
+        scanned_mods = set(self._patch_file.allMods) - \
+                       self._patch_file.mergeSet - self._src_mods
+        minfos = self._patch_file.p_file_minfos
+        top_crcs = {}
+        for mod_name in scanned_mods:
+            # The top group CRCs can't have changed if the CRC did not
+            if mod_name in self._top_crcs and stored_plugins.get(
+                    mod_name) == self._state[u'plugins'][mod_name]:
+                top_crcs[mod_name] = self._top_crcs[mod_name]
+            else:
+                top_crcs[mod_name] = ModHeaderReader.read_top_group_crcs(
+                    minfos[mod_name])
+        manifest = dict(self._state)
+        manifest.update({
+            u'top_crcs': top_crcs,
+            u'read_tops': frozenset(self._patch_file.readFactory.topTypes),
+            u'patch_crc': self._patch_info.abs_path.crc,
+            u'patch_tops': self._read_patch_tops(),
+            u'log': log_text,
+        })
+        self._write(manifest)
+
+    def save_reused(self):
+        """Updates the stored manifest after the patch was reused, so that
+        the plugins that changed need not be checked again."""
+        manifest = dict(self._stored)
+        manifest[u'plugins'] = self._state[u'plugins']
+        manifest[u'top_crcs'] = self._top_crcs
+        self._write(manifest)
+
+    def _write(self, manifest):
+        manifest_path = self._manifest_path()
+        try:
+            manifest_path.head.makedirs()
+            with manifest_path.temp.open(u'wb') as out:
+                pickle.dump(self._manifest_version, out, -1)
+                pickle.dump(manifest, out, -1)
+            manifest_path.untemp()
+            self._stored = manifest
+        except (OSError, IOError):
+            deprint(u'Failed to save manifest of %s' % self._patch_info.name,
+                    traceback=True)
+
 class CBash_PatchFile(_PFile, ObModFile):
     """Defines and executes patcher configuration."""
 
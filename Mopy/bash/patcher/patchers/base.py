@@ -24,7 +24,7 @@
 
 """This module contains base patcher classes."""
 from __future__ import print_function
-from collections import Counter
+from collections import Counter, OrderedDict
 from itertools import chain
 from operator import itemgetter
 # Internal
@@ -35,6 +35,7 @@
 from ... import load_order, bush
 from ...bolt import GPath, CsvReader, deprint
 from ...brec import MreRecord
+from ...exception import AbstractError
 
 # Patchers 1 ------------------------------------------------------------------
 class ListPatcher(AListPatcher,Patcher): pass
@@ -72,6 +73,40 @@ def buildPatch(self,log,progress,patchFile): # extra param: patchFile
         """Edits patch file as desired. Should write to log."""
         pass ##: raise AbstractError ?
 
+    # Pooled tweaks - tweaks that implement wants_record and tweak_record are
+    # run by MultiTweaker, which walks the records of each type once for all
+    # of them, instead of through their scanModFile and buildPatch
+    # If True, the scan does not copy records that already are in the patch
+    scan_skips_patched = False
+    # Types of the records of the patch this tweak reads in
+    # prepare_for_tweaking or tweak_record, besides the record it is passed -
+    # pooled tweaks that edit those types are not pooled with it, so that it
+    # sees exactly the edits of the tweaks enabled before it
+    pooled_reads = ()
+
+    def is_pooled(self):
+        """Returns True if this tweak implements wants_record and
+        tweak_record."""
+        return self.__class__.tweak_record.__func__ is not \
+               MultiTweakItem.tweak_record.__func__
+
+    def wants_record(self, record):
+        """Returns True if the scan should copy record, a record of a scanned
+        mod, to the patch. Must only look at record, as the scan stops asking
+        the pooled tweaks once one of them wants it."""
+        raise AbstractError
+
+    def prepare_for_tweaking(self, patchFile):
+        """Called before tweak_record is called on the records of the
+        patch - for all the tweaks pooled with this one, before any of them
+        tweaks a record. If this reads records of the patch, add their types
+        to pooled_reads."""
+
+    def tweak_record(self, record):
+        """Tweaks record, a record of the patch, if it needs tweaking.
+        Returns True if it was tweaked, so that it is kept and logged."""
+        raise AbstractError
+
 class CBash_MultiTweakItem(AMultiTweakItem):
     # extra CBash_MultiTweakItem class variables
     iiMode = False
@@ -111,16 +146,76 @@ def getWriteClasses(self):
         return chain.from_iterable(tweak.getWriteClasses()
             for tweak in self.enabled_tweaks) if self.isActive else ()
 
+    def _pool_tweaks(self, tweaks):
+        """Returns an OrderedDict mapping the record types the pooled tweaks
+        among tweaks read to the lists of those tweaks."""
+        sig_tweaks = OrderedDict()
+        for tweak in tweaks:
+            if not tweak.is_pooled(): continue
+            for rec_sig in tweak.getReadClasses():
+                sig_tweaks.setdefault(rec_sig, []).append(tweak)
+        return sig_tweaks
+
     def scanModFile(self,modFile,progress):
+        patchFile = self.patchFile
+        mapper = modFile.getLongMapper()
+        for rec_sig, tweaks in self._pool_tweaks(
+                self.enabled_tweaks).iteritems():
+            if rec_sig not in modFile.tops: continue
+            patchBlock = getattr(patchFile, rec_sig)
+            id_records = patchBlock.id_records
+            for record in modFile.tops[rec_sig].getActiveRecords():
+                in_patch = mapper(record.fid) in id_records
+                for tweak in tweaks:
+                    if in_patch and tweak.scan_skips_patched: continue
+                    if tweak.wants_record(record):
+                        patchBlock.setRecord(record.getTypeCopy(mapper))
+                        break
         for tweak in self.enabled_tweaks:
-            tweak.scanModFile(modFile,progress,self.patchFile)
+            if not tweak.is_pooled():
+                tweak.scanModFile(modFile,progress,patchFile)
 
     def buildPatch(self,log,progress):
-        """Applies individual tweaks."""
+        """Applies individual tweaks. Consecutive pooled tweaks are applied
+        together, walking the records of each type once - unless one reads
+        (see pooled_reads) the types another one edits, so that the edits
+        are applied in the same order as if each tweak had its own pass."""
         if not self.isActive: return
         log.setHeader(u'= ' + self._patcher_name, True)
+        pooled, pool_edits, pool_reads = [], set(), set()
         for tweak in self.enabled_tweaks:
+            if tweak.is_pooled():
+                tweak_edits = set(tweak.getReadClasses())
+                if tweak_edits & pool_reads or pool_edits.intersection(
+                        tweak.pooled_reads):
+                    self._tweak_pooled(pooled, log)
+                    pooled, pool_edits, pool_reads = [], set(), set()
+                pooled.append(tweak)
+                pool_edits |= tweak_edits
+                pool_reads.update(tweak.pooled_reads)
+                continue
+            self._tweak_pooled(pooled, log)
+            pooled, pool_edits, pool_reads = [], set(), set()
             tweak.buildPatch(log,progress,self.patchFile)
+        self._tweak_pooled(pooled, log)
+
+    def _tweak_pooled(self, pooled, log):
+        """Applies the pooled tweaks and logs them, in order."""
+        if not pooled: return
+        patchFile = self.patchFile
+        keep = patchFile.getKeeper()
+        tweak_counts = {tweak: Counter() for tweak in pooled}
+        for tweak in pooled:
+            tweak.prepare_for_tweaking(patchFile)
+        for rec_sig, tweaks in self._pool_tweaks(pooled).iteritems():
+            if rec_sig not in patchFile.tops: continue
+            for record in patchFile.tops[rec_sig].records:
+                for tweak in tweaks:
+                    if tweak.tweak_record(record):
+                        keep(record.fid)
+                        tweak_counts[tweak][record.fid[0]] += 1
+        for tweak in pooled:
+            tweak._patchLog(log, tweak_counts[tweak])
 
 class CBash_MultiTweaker(AMultiTweaker,CBash_Patcher):
 
@@ -37,7 +37,6 @@
 from ...parsers import ActorFactions, CBash_ActorFactions, FactionRelations, \
     CBash_FactionRelations, FullNames, CBash_FullNames, ItemStats, \
     CBash_ItemStats, SpellRecords, CBash_SpellRecords
-from ...mod_files import ModFile, LoadFactory
 
 class _SimpleImporter(ImportPatcher):
     """For lack of a better name - common methods of a bunch of importers.
@@ -73,7 +72,7 @@ def _init_data_loop(self, mapper, recClass, srcFile, srcMod, temp_id_data):
         for record in srcFile.tops[recClass.rec_sig].getActiveRecords():
             fid = mapper(record.fid)
             temp_id_data[fid] = dict(
-                (attr, record.__getattribute__(attr)) for attr in recAttrs)
+                (attr, getattr(record, attr)) for attr in recAttrs)
 
     def initData(self, progress):
         """Common initData pattern.
@@ -83,19 +82,16 @@ def initData(self, progress):
         """
         if not self.isActive: return
         id_data = self.id_data
-        loadFactory = LoadFactory(False, *self.recAttrs_class.keys())
-        longTypes = self.longTypes & {x.rec_sig for x in self.recAttrs_class}
+        read_classes = self.recAttrs_class.keys()
+        load_plugin = self.patchFile.plugin_cache.load_plugin
         progress.setFull(len(self.srcs))
-        cachedMasters = {}
         minfs = self.patchFile.p_file_minfos
         for index,srcMod in enumerate(self.srcs):
             temp_id_data = {}
             if srcMod not in minfs: continue
             srcInfo = minfs[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
+            srcFile = load_plugin(srcMod, read_classes)
             masters = srcInfo.get_masters()
-            srcFile.load(True)
-            srcFile.convertToLongFids(longTypes)
             mapper = srcFile.getLongMapper()
             for recClass in self.recAttrs_class:
                 if recClass.rec_sig not in srcFile.tops: continue
@@ -105,14 +101,7 @@ def initData(self, progress):
                                      temp_id_data)
             for master in masters:
                 if master not in minfs: continue # or break filter mods
-                if master in cachedMasters:
-                    masterFile = cachedMasters[master]
-                else:
-                    masterInfo = minfs[master]
-                    masterFile = ModFile(masterInfo,loadFactory)
-                    masterFile.load(True)
-                    masterFile.convertToLongFids(longTypes)
-                    cachedMasters[master] = masterFile
+                masterFile = load_plugin(master, read_classes)
                 mapper = masterFile.getLongMapper()
                 for recClass in self.recAttrs_class:
                     if recClass.rec_sig not in masterFile.tops: continue
@@ -122,7 +111,7 @@ def initData(self, progress):
                         fid = mapper(record.fid)
                         if fid not in temp_id_data: continue
                         for attr, value in temp_id_data[fid].iteritems():
-                            if value == record.__getattribute__(attr): continue
+                            if value == getattr(record, attr): continue
                             else:
                                 id_data[fid][attr] = value
             progress.plus()
@@ -148,7 +137,7 @@ def scanModFile(self, modFile, progress):
                 if not record.longFids: fid = mapper(fid)
                 if fid not in id_data: continue
                 for attr, value in id_data[fid].iteritems():
-                    if record.__getattribute__(attr) != value:
+                    if getattr(record, attr) != value:
                         patchBlock.setRecord(record.getTypeCopy(mapper))
                         break
 
@@ -182,7 +171,7 @@ def _inner_loop(self, keep, records, top_mod_rec, type_count):
             rec_fid = record.fid
             if rec_fid not in id_data: continue
             for attr, value in id_data[rec_fid].iteritems():
-                if record.__getattribute__(attr) != value: break
+                if getattr(record, attr) != value: break
             else: continue
             for attr, value in id_data[rec_fid].iteritems():
                 record.__setattr__(attr, value)
@@ -281,7 +270,7 @@ def importCellBlockData(cellBlock):
             if not cellBlock.cell.flags1.ignored:
                 fid = cellBlock.cell.fid
                 for attr in attrs:
-                    tempCellData[fid][attr] = cellBlock.cell.__getattribute__(
+                    tempCellData[fid][attr] = getattr(cellBlock.cell,
                         attr)
                 for flg_ in flgs_:
                     tempCellData[fid + ('flags',)][
@@ -298,7 +287,7 @@ def checkMasterCellBlockData(cellBlock):
                 rec_fid = cellBlock.cell.fid
                 if rec_fid not in tempCellData: return
                 for attr in attrs:
-                    master_attr = cellBlock.cell.__getattribute__(attr)
+                    master_attr = getattr(cellBlock.cell, attr)
                     if tempCellData[rec_fid][attr] != master_attr:
                         cellData[rec_fid][attr] = tempCellData[rec_fid][attr]
                 for flg_ in flgs_:
@@ -306,10 +295,10 @@ def checkMasterCellBlockData(cellBlock):
                     if tempCellData[rec_fid + ('flags',)][flg_] != master_flag:
                         cellData[rec_fid + ('flags',)][flg_] = \
                             tempCellData[rec_fid + ('flags',)][flg_]
-        loadFactory = LoadFactory(False,MreRecord.type_class['CELL'],
-                                        MreRecord.type_class['WRLD'])
+        read_classes = (MreRecord.type_class['CELL'],
+                        MreRecord.type_class['WRLD'])
+        load_plugin = self.patchFile.plugin_cache.load_plugin
         progress.setFull(len(self.srcs))
-        cachedMasters = {}
         minfs = self.patchFile.p_file_minfos
         for srcMod in self.srcs:
             if srcMod not in minfs: continue
@@ -320,10 +309,7 @@ def checkMasterCellBlockData(cellBlock):
             tempCellData = defaultdict(dict)
             tempCellData['Maps'] = {} # unused !
             srcInfo = minfs[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
-            srcFile.load(True)
-            srcFile.convertToLongFids(('CELL','WRLD'))
-            cachedMasters[srcMod] = srcFile
+            srcFile = load_plugin(srcMod, read_classes)
             masters = srcInfo.get_masters()
             bashTags = srcInfo.getBashTags()
             # print bashTags
@@ -347,14 +333,7 @@ def checkMasterCellBlockData(cellBlock):
                     #         tempCellData['Maps'][worldBlock.world.fid] = worldBlock.world.mapPath
             for master in masters:
                 if master not in minfs: continue # or break filter mods
-                if master in cachedMasters:
-                    masterFile = cachedMasters[master]
-                else:
-                    masterInfo = minfs[master]
-                    masterFile = ModFile(masterInfo,loadFactory)
-                    masterFile.load(True)
-                    masterFile.convertToLongFids(('CELL','WRLD'))
-                    cachedMasters[master] = masterFile
+                masterFile = load_plugin(master, read_classes)
                 if 'CELL' in masterFile.tops:
                     for cellBlock in masterFile.CELL.cellBlocks:
                         checkMasterCellBlockData(cellBlock)
@@ -411,11 +390,11 @@ def handlePatchCellBlock(patchCellBlock):
             patch_cell_fid = patchCellBlock.cell.fid
             for attr,value in cellData[patch_cell_fid].iteritems():
                 if attr == 'regions':
-                    if set(value).difference(set(patchCellBlock.cell.__getattribute__(attr))):
+                    if set(value).difference(set(getattr(patchCellBlock.cell, attr))):
                         patchCellBlock.cell.__setattr__(attr, value)
                         modified = True
                 else:
-                    if patchCellBlock.cell.__getattribute__(attr) != value:
+                    if getattr(patchCellBlock.cell, attr) != value:
                         patchCellBlock.cell.__setattr__(attr, value)
                         modified=True
             for flag, value in cellData[
@@ -523,7 +502,7 @@ def _inner_loop(self, keep, records, top_mod_rec, type_count):
             rec_fid = record.fid
             if rec_fid not in set_id_data: continue
             for attr, value in id_data[rec_fid].iteritems():
-                rec_attr = record.__getattribute__(attr)
+                rec_attr = getattr(record, attr)
                 if isinstance(rec_attr, str) and isinstance(value, str):
                     if rec_attr.lower() != value.lower():
                         break
@@ -580,7 +559,7 @@ def _init_data_loop(self, mapper, recClass, srcFile, srcMod, temp_id_data):
             fid = mapper(record.fid)
             if recFidAttrs:
                 attr_fidvalue = dict(
-                    (attr, record.__getattribute__(attr)) for attr in
+                    (attr, getattr(record, attr)) for attr in
                     recFidAttrs)
                 for fidvalue in attr_fidvalue.values():
                     if fidvalue and (fidvalue[0] is None or fidvalue[
@@ -592,12 +571,12 @@ def _init_data_loop(self, mapper, recClass, srcFile, srcMod, temp_id_data):
                         break
                 else:
                     temp_id_data[fid] = dict(
-                        (attr, record.__getattribute__(attr)) for attr in
+                        (attr, getattr(record, attr)) for attr in
                         recAttrs)
                     temp_id_data[fid].update(attr_fidvalue)
             else:
                 temp_id_data[fid] = dict(
-                    (attr, record.__getattribute__(attr)) for attr in recAttrs)
+                    (attr, getattr(record, attr)) for attr in recAttrs)
 
     def _inner_loop(self, keep, records, top_mod_rec, type_count):
         id_data = self.id_data
@@ -605,20 +584,20 @@ def _inner_loop(self, keep, records, top_mod_rec, type_count):
             fid = record.fid
             if fid not in id_data: continue
             for attr, value in id_data[fid].iteritems():
-                if isinstance(record.__getattribute__(attr),
+                if isinstance(getattr(record, attr),
                               basestring) and isinstance(value, basestring):
-                    if record.__getattribute__(attr).lower() != value.lower():
+                    if getattr(record, attr).lower() != value.lower():
                         break
                     continue
                 elif attr in bush.game.graphicsModelAttrs:
                     try:
-                        if record.__getattribute__(
+                        if getattr(record,
                                 attr).modPath.lower() != value.modPath.lower():
                             break
                         continue
                     except: break  # assume they are not equal (ie they
                         # aren't __both__ NONE)
-                if record.__getattribute__(attr) != value: break
+                if getattr(record, attr) != value: break
             else: continue
             for attr, value in id_data[fid].iteritems():
                 record.__setattr__(attr, value)
@@ -688,19 +667,16 @@ def initData(self,progress):
         """Get actors from source files."""
         if not self.isActive: return
         id_data = self.id_data
-        loadFactory = LoadFactory(False, *self.recAttrs_class.keys())
-        longTypes = self.longTypes & {x.rec_sig for x in self.recAttrs_class}
+        read_classes = self.recAttrs_class.keys()
+        load_plugin = self.patchFile.plugin_cache.load_plugin
         progress.setFull(len(self.srcs))
-        cachedMasters = {}
         minfs = self.patchFile.p_file_minfos
         for index,srcMod in enumerate(self.srcs):
             temp_id_data = {}
             if srcMod not in minfs: continue
             srcInfo = minfs[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
+            srcFile = load_plugin(srcMod, read_classes)
             masters = srcInfo.get_masters()
-            srcFile.load(True)
-            srcFile.convertToLongFids(longTypes)
             mapper = srcFile.getLongMapper()
             for recClass in self.recAttrs_class:
                 if recClass.rec_sig not in srcFile.tops: continue
@@ -710,14 +686,7 @@ def initData(self,progress):
                                      temp_id_data)
             for master in masters:
                 if master not in minfs: continue # or break filter mods
-                if master in cachedMasters:
-                    masterFile = cachedMasters[master]
-                else:
-                    masterInfo = minfs[master]
-                    masterFile = ModFile(masterInfo,loadFactory)
-                    masterFile.load(True)
-                    masterFile.convertToLongFids(longTypes)
-                    cachedMasters[master] = masterFile
+                masterFile = load_plugin(master, read_classes)
                 mapper = masterFile.getLongMapper()
                 for recClass in self.recAttrs_class:
                     if recClass.rec_sig not in masterFile.tops: continue
@@ -929,21 +898,18 @@ def initData(self,progress):
         """Get data from source files."""
         if not self.isActive: return
         target_rec_types = self.target_rec_types
-        loadFactory = LoadFactory(False, *[MreRecord.type_class[x] for x
-                                           in target_rec_types])
+        read_classes = [MreRecord.type_class[x] for x in target_rec_types]
+        load_plugin = self.patchFile.plugin_cache.load_plugin
         progress.setFull(len(self.srcs))
-        cachedMasters = {}
         mer_del = self.id_merged_deleted
         minfs = self.patchFile.p_file_minfos
         for index,srcMod in enumerate(self.srcs):
             tempData = {}
             if srcMod not in minfs: continue
             srcInfo = minfs[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
+            srcFile = load_plugin(srcMod, read_classes)
             masters = srcInfo.get_masters()
             bashTags = srcInfo.getBashTags()
-            srcFile.load(True)
-            srcFile.convertToLongFids(target_rec_types)
             mapper = srcFile.getLongMapper()
             for recClass in (MreRecord.type_class[x] for x in target_rec_types):
                 if recClass.rec_sig not in srcFile.tops: continue
@@ -953,14 +919,7 @@ def initData(self,progress):
                     tempData[fi] = list(record.aiPackages)
             for master in reversed(masters):
                 if master not in minfs: continue # or break filter mods
-                if master in cachedMasters:
-                    masterFile = cachedMasters[master]
-                else:
-                    masterInfo = minfs[master]
-                    masterFile = ModFile(masterInfo,loadFactory)
-                    masterFile.load(True)
-                    masterFile.convertToLongFids(target_rec_types)
-                    cachedMasters[master] = masterFile
+                masterFile = load_plugin(master, read_classes)
                 mapper = masterFile.getLongMapper()
                 blocks = (MreRecord.type_class[x] for x in target_rec_types)
                 for block in blocks:
@@ -1553,12 +1512,10 @@ def initData(self,progress):
         """Get data from source files."""
         if not self.isActive or not self.srcs: return
         inv_types = bush.game.inventoryTypes
-        loadFactory = LoadFactory(False, *inv_types)
+        load_plugin = self.patchFile.plugin_cache.load_plugin
         progress.setFull(len(self.srcs))
         for index,srcMod in enumerate(self.srcs):
-            srcInfo = self.patchFile.p_file_minfos[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
-            srcFile.load(True)
+            srcFile = load_plugin(srcMod, inv_types)
             mapper = srcFile.getLongMapper()
             for block in inv_types:
                 for record in getattr(srcFile, block).getActiveRecords():
@@ -1779,21 +1736,18 @@ def initData(self,progress):
         """Get data from source files."""
         if not self.isActive: return
         target_rec_types = self._read_write_records
-        loadFactory = LoadFactory(False, *[MreRecord.type_class[x] for x
-                                           in target_rec_types])
+        read_classes = [MreRecord.type_class[x] for x in target_rec_types]
+        load_plugin = self.patchFile.plugin_cache.load_plugin
         progress.setFull(len(self.srcs))
-        cachedMasters = {}
         mer_del = self.id_merged_deleted
         minfs = self.patchFile.p_file_minfos
         for index,srcMod in enumerate(self.srcs):
             tempData = {}
             if srcMod not in minfs: continue
             srcInfo = minfs[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
+            srcFile = load_plugin(srcMod, read_classes)
             masters = srcInfo.get_masters()
             bashTags = srcInfo.getBashTags()
-            srcFile.load(True)
-            srcFile.convertToLongFids(target_rec_types)
             mapper = srcFile.getLongMapper()
             for recClass in (MreRecord.type_class[x] for x in target_rec_types):
                 if recClass.rec_sig not in srcFile.tops: continue
@@ -1802,14 +1756,7 @@ def initData(self,progress):
                     tempData[fid] = list(record.spells)
             for master in reversed(masters):
                 if master not in minfs: continue # or break filter mods
-                if master in cachedMasters:
-                    masterFile = cachedMasters[master]
-                else:
-                    masterInfo = minfs[master]
-                    masterFile = ModFile(masterInfo,loadFactory)
-                    masterFile.load(True)
-                    masterFile.convertToLongFids(target_rec_types)
-                    cachedMasters[master] = masterFile
+                masterFile = load_plugin(master, read_classes)
                 mapper = masterFile.getLongMapper()
                 for block in (MreRecord.type_class[x] for x in target_rec_types):
                     if block.rec_sig not in srcFile.tops: continue
@@ -2142,19 +2089,17 @@ def initData(self,progress):
         """Get faces from TNR files."""
         if not self.isActive: return
         faceData = self.faceData
-        loadFactory = LoadFactory(False,MreRecord.type_class['NPC_'])
+        read_classes = (MreRecord.type_class['NPC_'],)
+        load_plugin = self.patchFile.plugin_cache.load_plugin
         progress.setFull(len(self.srcs))
-        cachedMasters = {}
         minfs = self.patchFile.p_file_minfos
         for index,faceMod in enumerate(self.srcs):
             if faceMod not in minfs: continue
             temp_faceData = {}
             faceInfo = minfs[faceMod]
-            faceFile = ModFile(faceInfo,loadFactory)
+            faceFile = load_plugin(faceMod, read_classes)
             masters = faceInfo.get_masters()
             bashTags = faceInfo.getBashTags()
-            faceFile.load(do_unpack=True)
-            faceFile.convertToLongFids(('NPC_',))
             for npc in faceFile.NPC_.getActiveRecords():
                 if npc.fid[0] in self.patchFile.loadSet:
                     attrs, fidattrs = [],[]
@@ -2165,11 +2110,11 @@ def initData(self,progress):
                         fidattrs += ['eye']
                     if fidattrs:
                         attr_fidvalue = dict(
-                            (attr, npc.__getattribute__(attr)) for attr in
+                            (attr, getattr(npc, attr)) for attr in
                             fidattrs)
                     else:
                         attr_fidvalue = dict(
-                            (attr, npc.__getattribute__(attr)) for attr in
+                            (attr, getattr(npc, attr)) for attr in
                             ('eye', 'hair'))
                     for fidvalue in attr_fidvalue.values():
                         if fidvalue and (fidvalue[0] is None or fidvalue[0] not in self.patchFile.loadSet):
@@ -2178,12 +2123,12 @@ def initData(self,progress):
                     else:
                         if not fidattrs:
                             temp_faceData[npc.fid] = dict(
-                                (attr, npc.__getattribute__(attr)) for attr in
+                                (attr, getattr(npc, attr)) for attr in
                                 ('fggs_p', 'fgga_p', 'fgts_p', 'hairLength',
                                  'hairRed', 'hairBlue', 'hairGreen'))
                         else:
                             temp_faceData[npc.fid] = dict(
-                                (attr, npc.__getattribute__(attr)) for attr in
+                                (attr, getattr(npc, attr)) for attr in
                                 attrs)
                         temp_faceData[npc.fid].update(attr_fidvalue)
             if u'NpcFacesForceFullImport' in bashTags:
@@ -2192,19 +2137,12 @@ def initData(self,progress):
             else:
                 for master in masters:
                     if master not in minfs: continue # or break filter mods
-                    if master in cachedMasters:
-                        masterFile = cachedMasters[master]
-                    else:
-                        masterInfo = minfs[master]
-                        masterFile = ModFile(masterInfo,loadFactory)
-                        masterFile.load(True)
-                        masterFile.convertToLongFids(('NPC_',))
-                        cachedMasters[master] = masterFile
+                    masterFile = load_plugin(master, read_classes)
                     if 'NPC_' not in masterFile.tops: continue
                     for npc in masterFile.NPC_.getActiveRecords():
                         if npc.fid not in temp_faceData: continue
                         for attr, value in temp_faceData[npc.fid].iteritems():
-                            if value == npc.__getattribute__(attr): continue
+                            if value == getattr(npc, attr): continue
                             if npc.fid not in faceData: faceData[
                                 npc.fid] = dict()
                             try:
@@ -2234,7 +2172,7 @@ def buildPatch(self,log,progress):# buildPatch3: one type
             if npc.fid in faceData:
                 changed = False
                 for attr, value in faceData[npc.fid].iteritems():
-                    if value != npc.__getattribute__(attr):
+                    if value != getattr(npc, attr):
                         npc.__setattr__(attr,value)
                         changed = True
                 if changed:
@@ -2409,7 +2347,7 @@ def scanModFile(self, modFile, progress): # scanModFile4: ?
                 if longid in id_records: continue
                 itemStats = fid_attr_value.get(longid,None)
                 if not itemStats: continue
-                oldValues = dict(zip(attrs,map(record.__getattribute__,attrs)))
+                oldValues = dict(zip(attrs,[getattr(record, a) for a in attrs]))
                 if oldValues != itemStats:
                     patchBlock.setRecord(record.getTypeCopy(mapper))
 
@@ -2428,7 +2366,7 @@ def buildPatch(self,log,progress):# buildPatch2 !!!!
                 fid = record.fid
                 itemStats = fid_attr_value.get(fid,None)
                 if not itemStats: continue
-                oldValues = dict(zip(attrs,map(record.__getattribute__,attrs)))
+                oldValues = dict(zip(attrs,[getattr(record, a) for a in attrs]))
                 if oldValues != itemStats:
                     for attr, value in itemStats.iteritems():
                         setattr(record,attr,value)
@@ -2616,19 +2554,16 @@ def initData(self,progress):
         """Get graphics from source files."""
         if not self.isActive: return
         id_data = self.id_data
-        loadFactory = LoadFactory(False, *self.recAttrs_class.keys())
-        longTypes = self.longTypes & {x.rec_sig for x in self.recAttrs_class}
+        read_classes = self.recAttrs_class.keys()
+        load_plugin = self.patchFile.plugin_cache.load_plugin
         progress.setFull(len(self.srcs))
-        cachedMasters = {}
         minfs = self.patchFile.p_file_minfos
         for index,srcMod in enumerate(self.srcs):
             temp_id_data = {}
             if srcMod not in minfs: continue
             srcInfo = minfs[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
+            srcFile = load_plugin(srcMod, read_classes)
             masters = srcInfo.get_masters()
-            srcFile.load(True)
-            srcFile.convertToLongFids(longTypes)
             mapper = srcFile.getLongMapper()
             for recClass in self.recAttrs_class:
                 if recClass.rec_sig not in srcFile.tops: continue
@@ -2638,14 +2573,7 @@ def initData(self,progress):
                                      temp_id_data)
             for master in masters:
                 if master not in minfs: continue # or break filter mods
-                if master in cachedMasters:
-                    masterFile = cachedMasters[master]
-                else:
-                    masterInfo = minfs[master]
-                    masterFile = ModFile(masterInfo,loadFactory)
-                    masterFile.load(True)
-                    masterFile.convertToLongFids(longTypes)
-                    cachedMasters[master] = masterFile
+                masterFile = load_plugin(master, read_classes)
                 mapper = masterFile.getLongMapper()
                 for recClass in self.recAttrs_class:
                     if recClass.rec_sig not in masterFile.tops: continue
@@ -27,12 +27,10 @@
 
 import random
 import re
-from collections import Counter
 # Internal
 from ... import bass, bush
 from ...bolt import GPath
 from ...cint import FormID
-from ...exception import AbstractError
 from ...patcher.base import AMultiTweakItem
 from .base import MultiTweakItem, CBash_MultiTweakItem, MultiTweaker, \
     CBash_MultiTweaker
@@ -48,27 +46,13 @@ class BasalNPCTweaker(MultiTweakItem):
     """Base for all NPC tweakers"""
     tweak_read_classes = 'NPC_',
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchRecords = patchFile.NPC_
-        for record in modFile.NPC_.getActiveRecords():
-            record = record.getTypeCopy(mapper)
-            patchRecords.setRecord(record)
-
-    def buildPatch(self,log,progress,patchFile): raise AbstractError
+    def wants_record(self, record): return True
 
 class BasalCreatureTweaker(MultiTweakItem):
     """Base for all Creature tweakers"""
     tweak_read_classes = 'CREA',
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchRecords = patchFile.CREA
-        for record in modFile.CREA.getActiveRecords():
-            record = record.getTypeCopy(mapper)
-            patchRecords.setRecord(record)
-
-    def buildPatch(self,log,progress,patchFile): raise AbstractError
+    def wants_record(self, record): return True
 
 class _NpcCTweak(CBash_MultiTweakItem):
     tweak_read_classes = 'NPC_',
@@ -96,39 +80,35 @@ def __init__(self):
 
 class MAONPCSkeletonPatcher(AMAONPCSkeletonPatcher,BasalNPCTweaker):
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.NPC_.records:
-            if self.choiceValues[self.chosen][
-                0] == 1 and not record.flags.female:
-                continue
-            elif self.choiceValues[self.chosen][
-                0] == 2 and record.flags.female:
-                continue
-            # skip player record
-            if record.fid == (GPath(bush.game.master_file), 0x000007): continue
-            try:
-                oldModPath = record.model.modPath
-            except AttributeError:  # for freaking weird esps with NPC's
-                # with no skeleton assigned to them(!)
-                continue
-            newModPath = u"Mayu's Projects[M]\\Animation " \
-                         u"Overhaul\\Vanilla\\SkeletonBeast.nif"
-            try:
-                if oldModPath.lower() == \
-                        u'characters\\_male\\skeletonsesheogorath.nif':
-                    newModPath = u"Mayu's Projects[M]\\Animation " \
-                                 u"Overhaul\\Vanilla\\SkeletonSESheogorath.nif"
-            except AttributeError:  # in case modPath was None. Try/Except
-                # has no overhead if exception isn't thrown.
-                pass
-            if newModPath != oldModPath:
-                record.model.modPath = newModPath
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def tweak_record(self, record):
+        if self.choiceValues[self.chosen][
+            0] == 1 and not record.flags.female:
+            return False
+        elif self.choiceValues[self.chosen][
+            0] == 2 and record.flags.female:
+            return False
+        # skip player record
+        if record.fid == (GPath(bush.game.master_file), 0x000007):
+            return False
+        try:
+            oldModPath = record.model.modPath
+        except AttributeError:  # for freaking weird esps with NPC's
+            # with no skeleton assigned to them(!)
+            return False
+        newModPath = u"Mayu's Projects[M]\\Animation " \
+                     u"Overhaul\\Vanilla\\SkeletonBeast.nif"
+        try:
+            if oldModPath.lower() == \
+                    u'characters\\_male\\skeletonsesheogorath.nif':
+                newModPath = u"Mayu's Projects[M]\\Animation " \
+                             u"Overhaul\\Vanilla\\SkeletonSESheogorath.nif"
+        except AttributeError:  # in case modPath was None. Try/Except
+            # has no overhead if exception isn't thrown.
+            pass
+        if newModPath != oldModPath:
+            record.model.modPath = newModPath
+            return True
+        return False
 
 class CBash_MAONPCSkeletonPatcher(AMAONPCSkeletonPatcher, _NpcCTweak):
 
@@ -196,41 +176,38 @@ def _initSkeletonCollections():
 
 class VORB_NPCSkeletonPatcher(AVORB_NPCSkeletonPatcher,BasalNPCTweaker):
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired.  Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        #--Some setup
-        modSkeletonDir = GPath(u'Characters').join(u'_male')
-        skeletonList, skeletonSetSpecial = \
+    def prepare_for_tweaking(self, patchFile):
+        self._skeletonList, self._skeletonSetSpecial = \
             AVORB_NPCSkeletonPatcher._initSkeletonCollections()
-        if skeletonList:
-            femaleOnly = self.choiceValues[self.chosen][0] == 1
-            maleOnly = self.choiceValues[self.chosen][0] == 2
-            playerFid = (GPath(bush.game.master_file), 0x000007)
-            for record in patchFile.NPC_.records:
-                # skip records (male only, female only, player)
-                if femaleOnly and not record.flags.female: continue
-                elif maleOnly and record.flags.female: continue
-                if record.fid == playerFid: continue
-                try:
-                    oldModPath = record.model.modPath
-                except AttributeError:  # for freaking weird esps with
-                    # NPC's with no skeleton assigned to them(!)
-                    continue
-                specialSkelMesh = u"skel_special_%X.nif" % record.fid[1]
-                if specialSkelMesh in skeletonSetSpecial:
-                    newModPath = modSkeletonDir.join(specialSkelMesh)
-                else:
-                    random.seed(record.fid)
-                    randomNumber = random.randint(1, len(skeletonList))-1
-                    newModPath = modSkeletonDir.join(
-                        skeletonList[randomNumber])
-                if newModPath != oldModPath:
-                    record.model.modPath = newModPath.s
-                    keep(record.fid)
-                    count[record.fid[0]] += 1
-        self._patchLog(log, count)
+
+    def tweak_record(self, record):
+        skeletonList = self._skeletonList
+        if not skeletonList: return False
+        # skip records (male only, female only, player)
+        if self.choiceValues[self.chosen][0] == 1 and \
+                not record.flags.female: return False
+        elif self.choiceValues[self.chosen][0] == 2 and \
+                record.flags.female: return False
+        if record.fid == (GPath(bush.game.master_file), 0x000007):
+            return False
+        try:
+            oldModPath = record.model.modPath
+        except AttributeError:  # for freaking weird esps with
+            # NPC's with no skeleton assigned to them(!)
+            return False
+        modSkeletonDir = GPath(u'Characters').join(u'_male')
+        specialSkelMesh = u"skel_special_%X.nif" % record.fid[1]
+        if specialSkelMesh in self._skeletonSetSpecial:
+            newModPath = modSkeletonDir.join(specialSkelMesh)
+        else:
+            random.seed(record.fid)
+            randomNumber = random.randint(1, len(skeletonList))-1
+            newModPath = modSkeletonDir.join(
+                skeletonList[randomNumber])
+        if newModPath != oldModPath:
+            record.model.modPath = newModPath.s
+            return True
+        return False
 
 class CBash_VORB_NPCSkeletonPatcher(AVORB_NPCSkeletonPatcher, _NpcCTweak):
 
@@ -290,39 +267,29 @@ def __init__(self):
 
 class VanillaNPCSkeletonPatcher(AVanillaNPCSkeletonPatcher,BasalNPCTweaker):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchRecords = patchFile.NPC_
-        for record in modFile.NPC_.getActiveRecords():
-            record = record.getTypeCopy(mapper)
-            if not record.model: continue #for freaking weird esps with NPC's
-            # with no skeleton assigned to them(!)
-            model = record.model.modPath
-            if model.lower() == u'characters\\_male\\skeleton.nif':
-                patchRecords.setRecord(record)
-
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
+    def wants_record(self, record):
+        if not record.model: return False #for freaking weird esps with NPC's
+        # with no skeleton assigned to them(!)
+        model = record.model.modPath
+        return model.lower() == u'characters\\_male\\skeleton.nif'
+
+    def tweak_record(self, record):
         newModPath = u"Characters\\_Male\\SkeletonBeast.nif"
-        for record in patchFile.NPC_.records:
-            try:
-                oldModPath = record.model.modPath
-            except AttributeError: #for freaking weird esps with NPC's with no
-                # skeleton assigned to them(!)
-                continue
-            try:
-                if oldModPath.lower() != u'characters\\_male\\skeleton.nif':
-                    continue
-            except AttributeError: #in case oldModPath was None. Try/Except has
-                # no overhead if exception isn't thrown.
-                pass
-            if newModPath != oldModPath:
-                record.model.modPath = newModPath
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+        try:
+            oldModPath = record.model.modPath
+        except AttributeError: #for freaking weird esps with NPC's with no
+            # skeleton assigned to them(!)
+            return False
+        try:
+            if oldModPath.lower() != u'characters\\_male\\skeleton.nif':
+                return False
+        except AttributeError: #in case oldModPath was None. Try/Except has
+            # no overhead if exception isn't thrown.
+            pass
+        if newModPath != oldModPath:
+            record.model.modPath = newModPath
+            return True
+        return False
 
 class CBash_VanillaNPCSkeletonPatcher(AVanillaNPCSkeletonPatcher, _NpcCTweak):
     scanOrder = 31 #Run before MAO
@@ -363,17 +330,12 @@ def __init__(self):
 
 class RedguardNPCPatcher(ARedguardNPCPatcher,BasalNPCTweaker):
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.NPC_.records:
-            if not record.race: continue
-            if record.race[1] == 0x00d43:
-                record.fgts_p = '\x00'*200
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def tweak_record(self, record):
+        if not record.race: return False
+        if record.race[1] == 0x00d43:
+            record.fgts_p = '\x00'*200
+            return True
+        return False
 
 class CBash_RedguardNPCPatcher(ARedguardNPCPatcher, _NpcCTweak):
     redguardId = FormID(GPath(bush.game.master_file), 0x00000D43)
@@ -407,20 +369,14 @@ def __init__(self):
 
 class NoBloodCreaturesPatcher(ANoBloodCreaturesPatcher,BasalCreatureTweaker):
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.CREA.records:
-            if record.bloodDecalPath or record.bloodSprayPath:
-                record.bloodDecalPath = None
-                record.bloodSprayPath = None
-                record.flags.noBloodSpray = True
-                record.flags.noBloodDecal = True
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        #--Log
-        self._patchLog(log, count)
+    def tweak_record(self, record):
+        if record.bloodDecalPath or record.bloodSprayPath:
+            record.bloodDecalPath = None
+            record.bloodSprayPath = None
+            record.flags.noBloodSpray = True
+            record.flags.noBloodDecal = True
+            return True
+        return False
 
 class CBash_NoBloodCreaturesPatcher(ANoBloodCreaturesPatcher, _CreaCTweak):
 
@@ -455,35 +411,27 @@ def __init__(self):
 
 class AsIntendedImpsPatcher(AAsIntendedImpsPatcher,BasalCreatureTweaker):
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
+    def tweak_record(self, record):
         spell = (GPath(bush.game.master_file), 0x02B53F)
-        reImp  = self.reImp
-        reImpModPath = self.reImpModPath
-        for record in patchFile.CREA.records:
-            try:
-                oldModPath = record.model.modPath
-            except AttributeError:
-                continue
-            if not reImpModPath.search(oldModPath or u''): continue
-
-            for bodyPart in record.bodyParts:
-                if reImp.search(bodyPart):
-                    break
-            else:
-                continue
-            if record.baseScale < 0.4:
-                if u'big' in self.choiceValues[self.chosen]:
-                    continue
-            elif u'small' in self.choiceValues[self.chosen]:
-                continue
-            if spell not in record.spells:
-                record.spells.append(spell)
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+        try:
+            oldModPath = record.model.modPath
+        except AttributeError:
+            return False
+        if not self.reImpModPath.search(oldModPath or u''): return False
+        for bodyPart in record.bodyParts:
+            if self.reImp.search(bodyPart):
+                break
+        else:
+            return False
+        if record.baseScale < 0.4:
+            if u'big' in self.choiceValues[self.chosen]:
+                return False
+        elif u'small' in self.choiceValues[self.chosen]:
+            return False
+        if spell not in record.spells:
+            record.spells.append(spell)
+            return True
+        return False
 
 class CBash_AsIntendedImpsPatcher(AAsIntendedImpsPatcher, _CreaCTweak):
     spell = FormID(GPath(bush.game.master_file), 0x02B53F)
@@ -530,30 +478,22 @@ def __init__(self):
 
 class AsIntendedBoarsPatcher(AAsIntendedBoarsPatcher,BasalCreatureTweaker):
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
+    def tweak_record(self, record):
         spell = (GPath(bush.game.master_file), 0x02B54E)
-        keep = patchFile.getKeeper()
-        reBoar  = self.reBoar
-        reBoarModPath = self.reBoarModPath
-        for record in patchFile.CREA.records:
-            try:
-                oldModPath = record.model.modPath
-            except AttributeError:
-                continue
-            if not reBoarModPath.search(oldModPath or u''): continue
-
-            for bodyPart in record.bodyParts:
-                if reBoar.search(bodyPart):
-                    break
-            else:
-                continue
-            if spell not in record.spells:
-                record.spells.append(spell)
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+        try:
+            oldModPath = record.model.modPath
+        except AttributeError:
+            return False
+        if not self.reBoarModPath.search(oldModPath or u''): return False
+        for bodyPart in record.bodyParts:
+            if self.reBoar.search(bodyPart):
+                break
+        else:
+            return False
+        if spell not in record.spells:
+            record.spells.append(spell)
+            return True
+        return False
 
 class CBash_AsIntendedBoarsPatcher(AAsIntendedBoarsPatcher, _CreaCTweak):
     spell = FormID(GPath(bush.game.master_file), 0x02B54E)
@@ -592,16 +532,11 @@ def __init__(self):
 
 class SWALKNPCAnimationPatcher(ASWALKNPCAnimationPatcher,BasalNPCTweaker):
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.NPC_.records:
-            if record.flags.female == 1:
-                record.animations += [u'0sexywalk01.kf']
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def tweak_record(self, record):
+        if record.flags.female == 1:
+            record.animations += [u'0sexywalk01.kf']
+            return True
+        return False
 
 class CBash_SWALKNPCAnimationPatcher(ASWALKNPCAnimationPatcher, _NpcCTweak):
 
@@ -631,15 +566,11 @@ def __init__(self):
 
 class RWALKNPCAnimationPatcher(ARWALKNPCAnimationPatcher,BasalNPCTweaker):
 
-    def buildPatch(self,log,progress,patchFile):
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.NPC_.records:
-            if record.flags.female == 1:
-                record.animations += [u'0realwalk01.kf']
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def tweak_record(self, record):
+        if record.flags.female == 1:
+            record.animations += [u'0realwalk01.kf']
+            return True
+        return False
 
 class CBash_RWALKNPCAnimationPatcher(ARWALKNPCAnimationPatcher, _NpcCTweak):
 
@@ -673,34 +604,29 @@ def __init__(self):
 
 class QuietFeetPatcher(AQuietFeetPatcher,BasalCreatureTweaker):
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
+    def tweak_record(self, record):
         chosen = self.choiceValues[self.chosen][0]
-        for record in patchFile.CREA.records:
-            # Check if we're templated first (only relevant on FO3/FNV)
-            if _is_templated(record, 'useModelAnimation'): continue
-            sounds = record.sounds
-            if chosen == u'all':
-                sounds = [sound for sound in sounds if
-                          sound.type not in [0, 1, 2, 3]]
-            elif chosen == u'partial':
-                for sound in record.sounds:
-                    if sound.type in [2,3]:
-                        sounds = [sound for sound in sounds if
-                                  sound.type not in [0, 1, 2, 3]]
-                        break
-            else: # really is: "if chosen == 'mounts':", but less cpu to do it
-                # as else.
-                if record.creatureType == 4:
+        # Check if we're templated first (only relevant on FO3/FNV)
+        if _is_templated(record, 'useModelAnimation'): return False
+        sounds = record.sounds
+        if chosen == u'all':
+            sounds = [sound for sound in sounds if
+                      sound.type not in [0, 1, 2, 3]]
+        elif chosen == u'partial':
+            for sound in record.sounds:
+                if sound.type in [2,3]:
                     sounds = [sound for sound in sounds if
                               sound.type not in [0, 1, 2, 3]]
-            if sounds != record.sounds:
-                record.sounds = sounds
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+                    break
+        else: # really is: "if chosen == 'mounts':", but less cpu to do it
+            # as else.
+            if record.creatureType == 4:
+                sounds = [sound for sound in sounds if
+                          sound.type not in [0, 1, 2, 3]]
+        if sounds != record.sounds:
+            record.sounds = sounds
+            return True
+        return False
 
 class CBash_QuietFeetPatcher(AQuietFeetPatcher, _CreaCTweak):
 
@@ -747,26 +673,15 @@ def __init__(self):
 class IrresponsibleCreaturesPatcher(AIrresponsibleCreaturesPatcher,
                                     BasalCreatureTweaker):
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        chosen = self.choiceValues[self.chosen][0]
-        for record in patchFile.CREA.records:
-            if record.responsibility == 0: continue
-            # Check if we're templated first (only relevant on FO3/FNV)
-            if _is_templated(record, 'useAIData'): continue
-            if chosen == u'all':
-                record.responsibility = 0
-                keep(record.fid)
-                count[record.fid[0]] += 1
-            else: # really is: "if chosen == 'mounts':", but less cpu to do it
-                # as else.
-                if record.creatureType == 4:
-                    record.responsibility = 0
-                    keep(record.fid)
-                    count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def tweak_record(self, record):
+        if record.responsibility == 0: return False
+        # Check if we're templated first (only relevant on FO3/FNV)
+        if _is_templated(record, 'useAIData'): return False
+        if self.choiceValues[self.chosen][0] == u'all' or \
+                record.creatureType == 4: # else only mounts
+            record.responsibility = 0
+            return True
+        return False
 
 class CBash_IrresponsibleCreaturesPatcher(AIrresponsibleCreaturesPatcher,
                                           _CreaCTweak):
@@ -799,20 +714,15 @@ def __init__(self, tweak_key):
         )
         self.logMsg = u'* '+_(u'NPCs Tweaked') + u': %d'
 
-    def buildPatch(self, log, progress, patchFile):
-        tweaked_count = Counter()
-        keep = patchFile.getKeeper()
+    def tweak_record(self, record):
+        # Skip any NPCs that don't match this patcher's target gender
+        if self.targets_female_npcs != record.flags.female: return False
         # What we want to set the 'Opposite Gender Anims' flag to
         oga_target = self.choiceValues[self.chosen][0] == u'enable_all'
-        gender_target = self.targets_female_npcs
-        for curr_record in patchFile.NPC_.records:
-            # Skip any NPCs that don't match this patcher's target gender
-            if gender_target != curr_record.flags.female: continue
-            if curr_record.flags.oppositeGenderAnims != oga_target:
-                curr_record.flags.oppositeGenderAnims = oga_target
-                keep(curr_record.fid)
-                tweaked_count[curr_record.fid[0]] += 1
-        self._patchLog(log, tweaked_count)
+        if record.flags.oppositeGenderAnims != oga_target:
+            record.flags.oppositeGenderAnims = oga_target
+            return True
+        return False
 
 class OppositeGenderAnimsPatcher_Female(_AOppositeGenderAnimsPatcher):
     targets_female_npcs = True
@@ -48,26 +48,13 @@ def __init__(self, tweak_name, tweak_tip, key):
         self.hidesBit = {u'armorShowsRings':16,u'armorShowsAmulets':17}[key]
         self.logMsg = u'* '+_(u'Armor Pieces Tweaked') + u': %d'
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchRecords = patchFile.ARMO
-        hidesBit = self.hidesBit
-        for record in modFile.ARMO.getActiveRecords():
-            if record.flags[hidesBit] and not record.flags.notPlayable:
-                record = record.getTypeCopy(mapper)
-                patchRecords.setRecord(record)
+    def wants_record(self, record):
+        return record.flags[self.hidesBit] and not record.flags.notPlayable
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        hidesBit = self.hidesBit
-        for record in patchFile.ARMO.records:
-            if record.flags[hidesBit] and not record.flags.notPlayable:
-                record.flags[hidesBit] = False
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        record.flags[self.hidesBit] = False
+        return True
 
 class CBash_AssortedTweak_ArmorShows(DynamicNamedTweak, CBash_MultiTweakItem):
     """Fix armor to show amulets/rings."""
@@ -104,26 +91,13 @@ def __init__(self, tweak_name, tweak_tip, key):
             {u'ClothingShowsRings': 16, u'ClothingShowsAmulets': 17}[key]
         self.logMsg = u'* '+_(u'Clothing Pieces Tweaked') + u': %d'
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchRecords = patchFile.CLOT
-        hidesBit = self.hidesBit
-        for record in modFile.CLOT.getActiveRecords():
-            if record.flags[hidesBit] and not record.flags.notPlayable:
-                record = record.getTypeCopy(mapper)
-                patchRecords.setRecord(record)
+    def wants_record(self, record):
+        return record.flags[self.hidesBit] and not record.flags.notPlayable
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        hidesBit = self.hidesBit
-        for record in patchFile.CLOT.records:
-            if record.flags[hidesBit] and not record.flags.notPlayable:
-                record.flags[hidesBit] = False
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        record.flags[self.hidesBit] = False
+        return True
 
 class CBash_AssortedTweak_ClothingShows(DynamicNamedTweak,
                                         CBash_MultiTweakItem):
@@ -166,24 +140,13 @@ def __init__(self):
 
 class AssortedTweak_BowReach(AAssortedTweak_BowReach,MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchRecords = patchFile.WEAP
-        for record in modFile.WEAP.getActiveRecords():
-            if record.weaponType == 5 and record.reach <= 0:
-                record = record.getTypeCopy(mapper)
-                patchRecords.setRecord(record)
+    def wants_record(self, record):
+        return record.weaponType == 5 and record.reach <= 0
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.WEAP.records:
-            if record.weaponType == 5 and record.reach <= 0:
-                record.reach = 1
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        record.reach = 1
+        return True
 
 class CBash_AssortedTweak_BowReach(AAssortedTweak_BowReach,
                                    CBash_MultiTweakItem):
@@ -214,28 +177,16 @@ def __init__(self):
 class AssortedTweak_SkyrimStyleWeapons(AAssortedTweak_SkyrimStyleWeapons,
                                        MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchRecords = patchFile.WEAP
-        for record in modFile.WEAP.getActiveRecords():
-            if record.weaponType in [1,2]:
-                record = record.getTypeCopy(mapper)
-                patchRecords.setRecord(record)
+    def wants_record(self, record):
+        return record.weaponType in [1,2]
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.WEAP.records:
-            if record.weaponType == 1:
-                record.weaponType = 3
-                keep(record.fid)
-                count[record.fid[0]] += 1
-            elif record.weaponType == 2:
-                record.weaponType = 0
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def tweak_record(self, record):
+        if record.weaponType == 1:
+            record.weaponType = 3
+        elif record.weaponType == 2:
+            record.weaponType = 0
+        else: return False
+        return True
 
 class CBash_AssortedTweak_SkyrimStyleWeapons(AAssortedTweak_SkyrimStyleWeapons,
                                              CBash_MultiTweakItem):
@@ -270,25 +221,14 @@ def __init__(self):
 class AssortedTweak_ConsistentRings(AAssortedTweak_ConsistentRings,
                                     MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchRecords = patchFile.CLOT
-        for record in modFile.CLOT.getActiveRecords():
-            if record.flags.leftRing:
-                record = record.getTypeCopy(mapper)
-                patchRecords.setRecord(record)
+    def wants_record(self, record):
+        return record.flags.leftRing
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.CLOT.records:
-            if record.flags.leftRing:
-                record.flags.leftRing = False
-                record.flags.rightRing = True
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def tweak_record(self, record):
+        if not record.flags.leftRing: return False
+        record.flags.leftRing = False
+        record.flags.rightRing = True
+        return True
 
 class CBash_AssortedTweak_ConsistentRings(AAssortedTweak_ConsistentRings,
                                           CBash_MultiTweakItem):
@@ -324,38 +264,28 @@ def __init__(self):
 class AssortedTweak_ClothingPlayable(AAssortedTweak_ClothingPlayable,
                                      MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchRecords = patchFile.CLOT
-        for record in modFile.CLOT.getActiveRecords():
-            if record.flags.notPlayable:
-                record = record.getTypeCopy(mapper)
-                patchRecords.setRecord(record)
-
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.CLOT.records:
-            if record.flags.notPlayable:
-                full = record.full
-                if not full: continue
-                if record.script: continue
-                if rePlayableSkips.search(full): continue  # probably truly
-                # shouldn't be playable
-                # If only the right ring and no other body flags probably a
-                # token that wasn't zeroed (which there are a lot of).
-                if record.flags.leftRing != 0 or record.flags.foot != 0 or \
-                                record.flags.hand != 0 or \
-                                record.flags.amulet != 0 or \
-                                record.flags.lowerBody != 0 or \
-                                record.flags.upperBody != 0 or \
-                                record.flags.head != 0 or record.flags.hair \
-                        != 0 or record.flags.tail != 0:
-                    record.flags.notPlayable = 0
-                    keep(record.fid)
-                    count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def wants_record(self, record):
+        return record.flags.notPlayable
+
+    def tweak_record(self, record):
+        if not record.flags.notPlayable: return False
+        full = record.full
+        if not full: return False
+        if record.script: return False
+        if rePlayableSkips.search(full): return False  # probably truly
+        # shouldn't be playable
+        # If only the right ring and no other body flags probably a
+        # token that wasn't zeroed (which there are a lot of).
+        if record.flags.leftRing != 0 or record.flags.foot != 0 or \
+                        record.flags.hand != 0 or \
+                        record.flags.amulet != 0 or \
+                        record.flags.lowerBody != 0 or \
+                        record.flags.upperBody != 0 or \
+                        record.flags.head != 0 or record.flags.hair \
+                != 0 or record.flags.tail != 0:
+            record.flags.notPlayable = 0
+            return True
+        return False
 
 class CBash_AssortedTweak_ClothingPlayable(AAssortedTweak_ClothingPlayable,
                                            CBash_MultiTweakItem):
@@ -397,39 +327,29 @@ def __init__(self):
 
 class AssortedTweak_ArmorPlayable(AAssortedTweak_ArmorPlayable,MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchRecords = patchFile.ARMO
-        for record in modFile.ARMO.getActiveRecords():
-            if record.flags.notPlayable:
-                record = record.getTypeCopy(mapper)
-                patchRecords.setRecord(record)
-
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.ARMO.records:
-            if record.flags.notPlayable:
-                full = record.full
-                if not full: continue
-                if record.script: continue
-                if rePlayableSkips.search(full): continue  # probably truly
-                # shouldn't be playable
-                # We only want to set playable if the record has at least
-                # one body flag... otherwise most likely a token.
-                if record.flags.leftRing != 0 or record.flags.rightRing != 0\
-                        or record.flags.foot != 0 or record.flags.hand != 0 \
-                        or record.flags.amulet != 0 or \
-                                record.flags.lowerBody != 0 or \
-                                record.flags.upperBody != 0 or \
-                                record.flags.head != 0 or record.flags.hair \
-                        != 0 or record.flags.tail != 0 or \
-                                record.flags.shield != 0:
-                    record.flags.notPlayable = 0
-                    keep(record.fid)
-                    count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def wants_record(self, record):
+        return record.flags.notPlayable
+
+    def tweak_record(self, record):
+        if not record.flags.notPlayable: return False
+        full = record.full
+        if not full: return False
+        if record.script: return False
+        if rePlayableSkips.search(full): return False  # probably truly
+        # shouldn't be playable
+        # We only want to set playable if the record has at least
+        # one body flag... otherwise most likely a token.
+        if record.flags.leftRing != 0 or record.flags.rightRing != 0\
+                or record.flags.foot != 0 or record.flags.hand != 0 \
+                or record.flags.amulet != 0 or \
+                        record.flags.lowerBody != 0 or \
+                        record.flags.upperBody != 0 or \
+                        record.flags.head != 0 or record.flags.hair \
+                != 0 or record.flags.tail != 0 or \
+                        record.flags.shield != 0:
+            record.flags.notPlayable = 0
+            return True
+        return False
 
 class CBash_AssortedTweak_ArmorPlayable(AAssortedTweak_ArmorPlayable,
                                         CBash_MultiTweakItem):
@@ -479,76 +399,59 @@ def __init__(self):
 
 class AssortedTweak_DarnBooks(AAssortedTweak_DarnBooks,MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        # maxWeight = self.choiceValues[self.chosen][0] # TODO: is this
-        # supposed to be used ?
-        mapper = modFile.getLongMapper()
-        patchBlock = patchFile.BOOK
-        id_records = patchBlock.id_records
-        for record in modFile.BOOK.getActiveRecords():
-            if mapper(record.fid) in id_records: continue
-            if not record.enchantment:
-                record = record.getTypeCopy(mapper)
-                patchBlock.setRecord(record)
-
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        reColor = self.__class__.reColor
-        reTagInWord = self.__class__.reTagInWord
-        reFont1 = self.__class__.reFont1
-        reDiv = self.__class__.reDiv
-        reFont = self.__class__.reFont
-        reHead2 = self.__class__.reHead2
-        reHead3 = self.__class__.reHead3
-        reBold = self.__class__.reBold
-        reAlign = self.__class__.reAlign
-        keep = patchFile.getKeeper()
-        align_text = {u'^^':u'center',u'<<':u'left',u'>>':u'right'}
-        self.inBold = False
-        def replaceBold(mo):
-            self.inBold = not self.inBold
-            return u'<font face=3 color=%s>' % (
-                u'440000' if self.inBold else u'444444')
-        def replaceAlign(mo):
-            return u'<div align=%s>' % align_text[mo.group(1)]
-        for record in patchFile.BOOK.records:
-            if record.text and not record.enchantment:
-                rec_text = record.text
-                rec_text = rec_text.replace(u'\u201d', u'')  # there are some FUNKY
-                # quotes that don't translate properly. (they are in *latin*
-                # encoding not even cp1252 or something normal but non-unicode)
-                if reHead2.match(rec_text):
-                    self.inBold = False
-                    rec_text = reHead2.sub(
-                        u'' r'\1<font face=1 color=220000>\2<font face=3 '
-                        u'' r'color=444444>\r\n', rec_text)
-                    rec_text = reHead3.sub(
-                        u'' r'\1<font face=3 color=220000>\2<font face=3 '
-                        u'' r'color=444444>\r\n',
-                        rec_text)
-                    rec_text = reAlign.sub(replaceAlign,rec_text)
-                    rec_text = reBold.sub(replaceBold,rec_text)
-                    rec_text = re.sub(u'' r'\r\n', u'' r'<br>\r\n', rec_text)
-                else:
-                    maColor = reColor.search(rec_text)
-                    if maColor:
-                        color = maColor.group(1)
-                    elif record.flags.isScroll:
-                        color = u'000000'
-                    else:
-                        color = u'444444'
-                    fontFace = u'<font face=3 color='+color+u'>'
-                    rec_text = reTagInWord.sub(u'' r'\1', rec_text)
-                    if reDiv.search(rec_text) and not reFont.search(rec_text):
-                        rec_text = fontFace+rec_text
-                    else:
-                        rec_text = reFont1.sub(fontFace,rec_text)
-                if rec_text != record.text:
-                    record.text = rec_text
-                    keep(record.fid)
-                    count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    # maxWeight = self.choiceValues[self.chosen][0] # TODO: is this
+    # supposed to be used ?
+    scan_skips_patched = True
+    _align_text = {u'^^':u'center',u'<<':u'left',u'>>':u'right'}
+
+    def wants_record(self, record):
+        return not record.enchantment
+
+    def _replace_bold(self, mo):
+        self.inBold = not self.inBold
+        return u'<font face=3 color=%s>' % (
+            u'440000' if self.inBold else u'444444')
+
+    def _replace_align(self, mo):
+        return u'<div align=%s>' % self._align_text[mo.group(1)]
+
+    def tweak_record(self, record):
+        if not record.text or record.enchantment: return False
+        cls = self.__class__
+        rec_text = record.text
+        rec_text = rec_text.replace(u'\u201d', u'')  # there are some FUNKY
+        # quotes that don't translate properly. (they are in *latin*
+        # encoding not even cp1252 or something normal but non-unicode)
+        if cls.reHead2.match(rec_text):
+            self.inBold = False
+            rec_text = cls.reHead2.sub(
+                u'' r'\1<font face=1 color=220000>\2<font face=3 '
+                u'' r'color=444444>\r\n', rec_text)
+            rec_text = cls.reHead3.sub(
+                u'' r'\1<font face=3 color=220000>\2<font face=3 '
+                u'' r'color=444444>\r\n',
+                rec_text)
+            rec_text = cls.reAlign.sub(self._replace_align,rec_text)
+            rec_text = cls.reBold.sub(self._replace_bold,rec_text)
+            rec_text = re.sub(u'' r'\r\n', u'' r'<br>\r\n', rec_text)
+        else:
+            maColor = cls.reColor.search(rec_text)
+            if maColor:
+                color = maColor.group(1)
+            elif record.flags.isScroll:
+                color = u'000000'
+            else:
+                color = u'444444'
+            fontFace = u'<font face=3 color='+color+u'>'
+            rec_text = cls.reTagInWord.sub(u'' r'\1', rec_text)
+            if cls.reDiv.search(rec_text) and not cls.reFont.search(rec_text):
+                rec_text = fontFace+rec_text
+            else:
+                rec_text = cls.reFont1.sub(fontFace,rec_text)
+        if rec_text != record.text:
+            record.text = rec_text
+            return True
+        return False
 
 class CBash_AssortedTweak_DarnBooks(AAssortedTweak_DarnBooks,
                                     CBash_MultiTweakItem):
@@ -687,27 +590,13 @@ def __init__(self):
         flags.flickers = flags.flickerSlow = flags.pulse = flags.pulseSlow =\
             True
 
-    def scanModFile(self,modFile,progress,patchFile):
-        flickerFlags = self.flags
-        mapper = modFile.getLongMapper()
-        patchRecords = patchFile.LIGH
-        for record in modFile.LIGH.getActiveRecords():
-            if record.flags & flickerFlags:
-                record = record.getTypeCopy(mapper)
-                patchRecords.setRecord(record)
+    def wants_record(self, record):
+        return record.flags & self.flags
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        flickerFlags = self.flags
-        notFlickerFlags = ~flickerFlags
-        keep = patchFile.getKeeper()
-        for record in patchFile.LIGH.records:
-            if int(record.flags & flickerFlags):
-                record.flags &= notFlickerFlags
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def tweak_record(self, record):
+        if not int(record.flags & self.flags): return False
+        record.flags &= ~self.flags
+        return True
 
 class CBash_AssortedTweak_NoLightFlicker(AAssortedTweak_NoLightFlicker,
                                          CBash_MultiTweakItem):
@@ -758,31 +647,18 @@ def __init__(self):
 
 class AssortedTweak_PotionWeight(AAssortedTweak_PotionWeight,MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        maxWeight = self.weight
-        mapper = modFile.getLongMapper()
-        patchBlock = patchFile.ALCH
-        id_records = patchBlock.id_records
-        for record in modFile.ALCH.getActiveRecords():
-            if mapper(record.fid) in id_records: continue
-            if maxWeight < record.weight < 1:
-                record = record.getTypeCopy(mapper)
-                patchBlock.setRecord(record)
+    scan_skips_patched = True
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        maxWeight = self.weight
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.ALCH.records:
-            ##: Skips OBME records - rework to support them
-            if (maxWeight < record.weight < 1 and
+    def wants_record(self, record):
+        return self.weight < record.weight < 1
+
+    def tweak_record(self, record):
+        ##: Skips OBME records - rework to support them
+        if not (self.weight < record.weight < 1 and
                 record.obme_record_version is None and
-                    ('SEFF', 0) not in record.getEffects()):
-                record.weight = maxWeight
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log, count)
+                ('SEFF', 0) not in record.getEffects()): return False
+        record.weight = self.weight
+        return True
 
 class CBash_AssortedTweak_PotionWeight(AAssortedTweak_PotionWeight,
                                        CBash_MultiTweakItem_Weight):
@@ -828,28 +704,15 @@ def __init__(self):
 class AssortedTweak_IngredientWeight(AAssortedTweak_IngredientWeight,
                                      MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        maxWeight = self.weight
-        mapper = modFile.getLongMapper()
-        patchBlock = patchFile.INGR
-        id_records = patchBlock.id_records
-        for record in modFile.INGR.getActiveRecords():
-            if mapper(record.fid) in id_records: continue
-            if record.weight > maxWeight:
-                record = record.getTypeCopy(mapper)
-                patchBlock.setRecord(record)
+    scan_skips_patched = True
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        maxWeight = self.weight
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.INGR.records:
-            if record.weight > maxWeight:
-                record.weight = maxWeight
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log, count)
+    def wants_record(self, record):
+        return record.weight > self.weight
+
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        record.weight = self.weight
+        return True
 
 class CBash_AssortedTweak_IngredientWeight(AAssortedTweak_IngredientWeight,
                                            CBash_MultiTweakItem_Weight):
@@ -889,28 +752,15 @@ def __init__(self):
 class AssortedTweak_PotionWeightMinimum(AAssortedTweak_PotionWeightMinimum,
                                         MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        minWeight = self.weight
-        mapper = modFile.getLongMapper()
-        patchBlock = patchFile.ALCH
-        id_records = patchBlock.id_records
-        for record in modFile.ALCH.getActiveRecords():
-            if mapper(record.fid) in id_records: continue
-            if record.weight < minWeight:
-                record = record.getTypeCopy(mapper)
-                patchBlock.setRecord(record)
+    scan_skips_patched = True
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        minWeight = self.weight
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.ALCH.records:
-            if record.weight < minWeight:
-                record.weight = minWeight
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log, count)
+    def wants_record(self, record):
+        return record.weight < self.weight
+
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        record.weight = self.weight
+        return True
 
 class CBash_AssortedTweak_PotionWeightMinimum(
     AAssortedTweak_PotionWeightMinimum, CBash_MultiTweakItem_Weight):
@@ -945,28 +795,15 @@ def __init__(self):
 
 class AssortedTweak_StaffWeight(AAssortedTweak_StaffWeight,MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        maxWeight = self.weight
-        mapper = modFile.getLongMapper()
-        patchBlock = patchFile.WEAP
-        id_records = patchBlock.id_records
-        for record in modFile.WEAP.getActiveRecords():
-            if mapper(record.fid) in id_records: continue
-            if record.weaponType == 4 and record.weight > maxWeight:
-                record = record.getTypeCopy(mapper)
-                patchBlock.setRecord(record)
+    scan_skips_patched = True
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        maxWeight = self.weight
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.WEAP.records:
-            if record.weaponType == 4 and record.weight > maxWeight:
-                record.weight = maxWeight
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log, count)
+    def wants_record(self, record):
+        return record.weaponType == 4 and record.weight > self.weight
+
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        record.weight = self.weight
+        return True
 
 class CBash_AssortedTweak_StaffWeight(AAssortedTweak_StaffWeight,
                                       CBash_MultiTweakItem_Weight):
@@ -997,28 +834,15 @@ def __init__(self):
 
 class AssortedTweak_ArrowWeight(AAssortedTweak_ArrowWeight,MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        maxWeight = self.weight
-        mapper = modFile.getLongMapper()
-        patchBlock = patchFile.AMMO
-        id_records = patchBlock.id_records
-        for record in modFile.AMMO.getActiveRecords():
-            if mapper(record.fid) in id_records: continue
-            if record.weight > maxWeight:
-                record = record.getTypeCopy(mapper)
-                patchBlock.setRecord(record)
+    scan_skips_patched = True
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        maxWeight = self.weight
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.AMMO.records:
-            if record.weight > maxWeight:
-                record.weight = maxWeight
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log, count)
+    def wants_record(self, record):
+        return record.weight > self.weight
+
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        record.weight = self.weight
+        return True
 
 class CBash_AssortedTweak_ArrowWeight(AAssortedTweak_ArrowWeight,
                                       CBash_MultiTweakItem_Weight):
@@ -1109,7 +933,7 @@ def apply(self,modFile,record,bashTags):
         if record.eid == self.SEFF[0]:
             attrs = self.attrs
             newValues = self.newValues
-            oldValues = map(record.__getattribute__, attrs)
+            oldValues = [getattr(record, a) for a in attrs]
             if oldValues != newValues:
                 override = record.CopyAsOverride(self.patchFile)
                 if override:
@@ -1134,31 +958,20 @@ def __init__(self):
 
 class AssortedTweak_HarvestChance(AAssortedTweak_HarvestChance,MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        modFile.convertToLongFids(self.tweak_read_classes)
-        chance = self.choiceValues[self.chosen][0]
-        patchBlock = patchFile.FLOR
-        id_records = patchBlock.id_records
-        for record in modFile.FLOR.getActiveRecords():
-            if record.fid not in id_records:
-                patchBlock.setRecord(record.getTypeCopy())
+    scan_skips_patched = True
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
+    def wants_record(self, record):
+        return True
+
+    def tweak_record(self, record):
+        if record.eid.startswith(u'Nirnroot'): return False # skip Nirnroots
         chance = self.choiceValues[self.chosen][0]
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.FLOR.records:
-            if record.eid.startswith(u'Nirnroot'): continue # skip Nirnroots
-            chances_changed = False
-            for attr in (u'spring', u'summer', u'fall', u'winter'):
-                if getattr(record, attr) != chance:
-                    setattr(record, attr, chance)
-                    chances_changed = True
-            if chances_changed:
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+        chances_changed = False
+        for attr in (u'spring', u'summer', u'fall', u'winter'):
+            if getattr(record, attr) != chance:
+                setattr(record, attr, chance)
+                chances_changed = True
+        return chances_changed
 
 class CBash_AssortedTweak_HarvestChance(AAssortedTweak_HarvestChance,
                                         CBash_MultiTweakItem):
@@ -1171,7 +984,7 @@ def apply(self,modFile,record,bashTags):
         """Edits patch file as desired. """
         if record.eid.startswith(u'Nirnroot'): return #skip Nirnroots
         newValues = [self.choiceValues[self.chosen][0]] * 4
-        oldValues = map(record.__getattribute__, self.attrs)
+        oldValues = [getattr(record, a) for a in self.attrs]
         if oldValues != newValues:
             override = record.CopyAsOverride(self.patchFile)
             if override:
@@ -1194,26 +1007,15 @@ def __init__(self):
 
 class AssortedTweak_WindSpeed(AAssortedTweak_WindSpeed,MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchBlock = patchFile.WTHR
-        id_records = patchBlock.id_records
-        for record in modFile.WTHR.getActiveRecords():
-            if mapper(record.fid) in id_records: continue
-            if record.windSpeed != 0:
-                record = record.getTypeCopy(mapper)
-                patchBlock.setRecord(record)
+    scan_skips_patched = True
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.WTHR.records:
-            if record.windSpeed != 0:
-                record.windSpeed = 0
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def wants_record(self, record):
+        return record.windSpeed != 0
+
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        record.windSpeed = 0
+        return True
 
 class CBash_AssortedTweak_WindSpeed(AAssortedTweak_WindSpeed,
                                     CBash_MultiTweakItem):
@@ -1244,26 +1046,15 @@ def __init__(self):
 class AssortedTweak_UniformGroundcover(AAssortedTweak_UniformGroundcover,
                                        MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchBlock = patchFile.GRAS
-        id_records = patchBlock.id_records
-        for record in modFile.GRAS.getActiveRecords():
-            if mapper(record.fid) in id_records: continue
-            if record.heightRange != 0:
-                record = record.getTypeCopy(mapper)
-                patchBlock.setRecord(record)
+    scan_skips_patched = True
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.GRAS.records:
-            if record.heightRange != 0:
-                record.heightRange = 0
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def wants_record(self, record):
+        return record.heightRange != 0
+
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        record.heightRange = 0
+        return True
 
 class CBash_AssortedTweak_UniformGroundcover(AAssortedTweak_UniformGroundcover,
                                              CBash_MultiTweakItem):
@@ -1303,31 +1094,20 @@ class AssortedTweak_SetCastWhenUsedEnchantmentCosts(
     AAssortedTweak_SetCastWhenUsedEnchantmentCosts, MultiTweakItem):
     #info: 'itemType','chargeAmount','enchantCost'
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchBlock = patchFile.ENCH
-        id_records = patchBlock.id_records
-        for record in modFile.ENCH.getActiveRecords():
-            if mapper(record.fid) in id_records: continue
-            if record.itemType in [1,2]:
-                record = record.getTypeCopy(mapper)
-                patchBlock.setRecord(record)
+    scan_skips_patched = True
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.ENCH.records:
-            if record.itemType in [1,2]:
-                uses = self.choiceValues[self.chosen][0]
-                cost = uses
-                if uses != 0:
-                    cost = max(record.chargeAmount/uses,1)
-                record.enchantCost = cost
-                record.chargeAmount = cost * uses
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def wants_record(self, record):
+        return record.itemType in [1,2]
+
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        uses = self.choiceValues[self.chosen][0]
+        cost = uses
+        if uses != 0:
+            cost = max(record.chargeAmount/uses,1)
+        record.enchantCost = cost
+        record.chargeAmount = cost * uses
+        return True
 
 class CBash_AssortedTweak_SetCastWhenUsedEnchantmentCosts(
     AAssortedTweak_SetCastWhenUsedEnchantmentCosts, CBash_MultiTweakItem):
@@ -1366,158 +1146,143 @@ class AssortedTweak_DefaultIcons(AAssortedTweak_DefaultIcons,MultiTweakItem):
     tweak_read_classes = (
         'ALCH', 'AMMO', 'APPA', 'ARMO', 'BOOK', 'BSGN', 'CLAS', 'CLOT', 'FACT',
         'INGR', 'KEYM', 'LIGH', 'MISC', 'QUST', 'SGST', 'SLGM', 'WEAP',)
-
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        for blockType in self.tweak_read_classes:
-            if blockType not in modFile.tops: continue
-            modBlock = getattr(modFile,blockType)
-            patchBlock = getattr(patchFile,blockType)
-            id_records = patchBlock.id_records
-            for record in modBlock.getActiveRecords():
-                if mapper(record.fid) not in id_records:
-                    record = record.getTypeCopy(mapper)
-                    patchBlock.setRecord(record)
-
-    def buildPatch(self,log,progress,patchFile):
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for type_ in self.tweak_read_classes:
-            if type_ not in patchFile.tops: continue
-            for record in patchFile.tops[type_].records:
-                if getattr(record, 'iconPath', None): continue
-                if getattr(record, 'maleIconPath', None): continue
-                if getattr(record, 'femaleIconPath', None): continue
-                changed = False
-                if type_ == 'ALCH':
-                    record.iconPath = u"Clutter\\Potions\\IconPotion01.dds"
-                    changed = True
-                elif type_ == 'AMMO':
-                    record.iconPath = u"Weapons\\IronArrow.dds"
-                    changed = True
-                elif type_ == 'APPA':
-                    record.iconPath = u"Clutter\\IconMortarPestle.dds"
-                    changed = True
-                elif type_ == 'AMMO':
-                    record.iconPath = u"Weapons\\IronArrow.dds"
-                    changed = True
-                elif type_ == 'ARMO':
-                    if record.flags.notPlayable: continue
-                    #choose based on body flags:
-                    if record.flags.upperBody != 0:
-                        record.maleIconPath = u"Armor\\Iron\\M\\Cuirass.dds"
-                        record.femaleIconPath = u"Armor\\Iron\\F\\Cuirass.dds"
-                        changed = True
-                    elif record.flags.lowerBody != 0:
-                        record.maleIconPath = u"Armor\\Iron\\M\\Greaves.dds"
-                        record.femaleIconPath = u"Armor\\Iron\\F\\Greaves.dds"
-                        changed = True
-                    elif record.flags.head != 0 or record.flags.hair != 0:
-                        record.maleIconPath = u"Armor\\Iron\\M\\Helmet.dds"
-                        changed = True
-                    elif record.flags.hand != 0:
-                        record.maleIconPath = u"Armor\\Iron\\M\\Gauntlets.dds"
-                        record.femaleIconPath =u"Armor\\Iron\\F\\Gauntlets.dds"
-                        changed = True
-                    elif record.flags.foot != 0:
-                        record.maleIconPath = u"Armor\\Iron\\M\\Boots.dds"
-                        changed = True
-                    elif record.flags.shield != 0:
-                        record.maleIconPath = u"Armor\\Iron\\M\\Shield.dds"
-                        changed = True
-                    else: #Default icon, probably a token or somesuch
-                        record.maleIconPath = u"Armor\\Iron\\M\\Shield.dds"
-                        changed = True
-                elif type_ in ['BOOK', 'BSGN', 'CLAS']:  # just a random book
-                    # icon for class/birthsign as well.
-                    record.iconPath = u"Clutter\\iconbook%d.dds" % (
-                        random.randint(1, 13))
-                    changed = True
-                elif type_ == 'CLOT':
-                    if record.flags.notPlayable: continue
-                    #choose based on body flags:
-                    if record.flags.upperBody != 0:
-                        record.maleIconPath = \
-                            u"Clothes\\MiddleClass\\01\\M\\Shirt.dds"
-                        record.femaleIconPath = \
-                            u"Clothes\\MiddleClass\\01\\F\\Shirt.dds"
-                        changed = True
-                    elif record.flags.lowerBody != 0:
-                        record.maleIconPath = \
-                            u"Clothes\\MiddleClass\\01\\M\\Pants.dds"
-                        record.femaleIconPath = \
-                            u"Clothes\\MiddleClass\\01\\F\\Pants.dds"
-                        changed = True
-                    elif record.flags.head or record.flags.hair:
-                        record.maleIconPath = \
-                            u"Clothes\\MythicDawnrobe\\hood.dds"
-                        changed = True
-                    elif record.flags.hand != 0:
-                        record.maleIconPath = \
-                         u"Clothes\\LowerClass\\Jail\\M\\JailShirtHandcuff.dds"
-                        changed = True
-                    elif record.flags.foot != 0:
-                        record.maleIconPath = \
-                            u"Clothes\\MiddleClass\\01\\M\\Shoes.dds"
-                        record.femaleIconPath = \
-                            u"Clothes\\MiddleClass\\01\\F\\Shoes.dds"
-                        changed = True
-                    elif record.flags.leftRing or record.flags.rightRing:
-                        record.maleIconPath = u"Clothes\\Ring\\RingNovice.dds"
-                        changed = True
-                    else: #amulet
-                        record.maleIconPath = \
-                            u"Clothes\\Amulet\\AmuletSilver.dds"
-                        changed = True
-                elif type_ == 'FACT':
-                    #todo
-                    #changed = True
-                    pass
-                elif type_ == 'INGR':
-                    record.iconPath = u"Clutter\\IconSeeds.dds"
-                    changed = True
-                elif type_ == 'KEYM':
-                    record.iconPath = \
-                        [u"Clutter\\Key\\Key.dds", u"Clutter\\Key\\Key02.dds"][
-                            random.randint(0, 1)]
-                    changed = True
-                elif type_ == 'LIGH':
-                    if not record.flags.canTake: continue
-                    record.iconPath = u"Lights\\IconTorch02.dds"
-                    changed = True
-                elif type_ == 'MISC':
-                    record.iconPath = u"Clutter\\Soulgems\\AzurasStar.dds"
-                    changed = True
-                elif type_ == 'QUST':
-                    if not record.stages: continue
-                    record.iconPath = u"Quest\\icon_miscellaneous.dds"
-                    changed = True
-                elif type_ == 'SGST':
-                    record.iconPath = u"IconSigilStone.dds"
-                    changed = True
-                elif type_ == 'SLGM':
-                    record.iconPath = u"Clutter\\Soulgems\\AzurasStar.dds"
-                    changed = True
-                elif type_ == 'WEAP':
-                    if record.weaponType == 0:
-                        record.iconPath = u"Weapons\\IronDagger.dds"
-                    elif record.weaponType == 1:
-                        record.iconPath = u"Weapons\\IronClaymore.dds"
-                    elif record.weaponType == 2:
-                        record.iconPath = u"Weapons\\IronMace.dds"
-                    elif record.weaponType == 3:
-                        record.iconPath = u"Weapons\\IronBattleAxe.dds"
-                    elif record.weaponType == 4:
-                        record.iconPath = u"Weapons\\Staff.dds"
-                    elif record.weaponType == 5:
-                        record.iconPath = u"Weapons\\IronBow.dds"
-                    else: #Should never reach this point
-                        record.iconPath = u"Weapons\\IronDagger.dds"
-                    changed = True
-                if changed:
-                    keep(record.fid)
-                    count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    scan_skips_patched = True
+
+    def wants_record(self, record):
+        return True
+
+    def tweak_record(self, record):
+        type_ = record.recType
+        if getattr(record, 'iconPath', None): return False
+        if getattr(record, 'maleIconPath', None): return False
+        if getattr(record, 'femaleIconPath', None): return False
+        changed = False
+        if type_ == 'ALCH':
+            record.iconPath = u"Clutter\\Potions\\IconPotion01.dds"
+            changed = True
+        elif type_ == 'AMMO':
+            record.iconPath = u"Weapons\\IronArrow.dds"
+            changed = True
+        elif type_ == 'APPA':
+            record.iconPath = u"Clutter\\IconMortarPestle.dds"
+            changed = True
+        elif type_ == 'AMMO':
+            record.iconPath = u"Weapons\\IronArrow.dds"
+            changed = True
+        elif type_ == 'ARMO':
+            if record.flags.notPlayable: return False
+            #choose based on body flags:
+            if record.flags.upperBody != 0:
+                record.maleIconPath = u"Armor\\Iron\\M\\Cuirass.dds"
+                record.femaleIconPath = u"Armor\\Iron\\F\\Cuirass.dds"
+                changed = True
+            elif record.flags.lowerBody != 0:
+                record.maleIconPath = u"Armor\\Iron\\M\\Greaves.dds"
+                record.femaleIconPath = u"Armor\\Iron\\F\\Greaves.dds"
+                changed = True
+            elif record.flags.head != 0 or record.flags.hair != 0:
+                record.maleIconPath = u"Armor\\Iron\\M\\Helmet.dds"
+                changed = True
+            elif record.flags.hand != 0:
+                record.maleIconPath = u"Armor\\Iron\\M\\Gauntlets.dds"
+                record.femaleIconPath =u"Armor\\Iron\\F\\Gauntlets.dds"
+                changed = True
+            elif record.flags.foot != 0:
+                record.maleIconPath = u"Armor\\Iron\\M\\Boots.dds"
+                changed = True
+            elif record.flags.shield != 0:
+                record.maleIconPath = u"Armor\\Iron\\M\\Shield.dds"
+                changed = True
+            else: #Default icon, probably a token or somesuch
+                record.maleIconPath = u"Armor\\Iron\\M\\Shield.dds"
+                changed = True
+        elif type_ in ['BOOK', 'BSGN', 'CLAS']:  # just a random book
+            # icon for class/birthsign as well.
+            record.iconPath = u"Clutter\\iconbook%d.dds" % (
+                random.randint(1, 13))
+            changed = True
+        elif type_ == 'CLOT':
+            if record.flags.notPlayable: return False
+            #choose based on body flags:
+            if record.flags.upperBody != 0:
+                record.maleIconPath = \
+                    u"Clothes\\MiddleClass\\01\\M\\Shirt.dds"
+                record.femaleIconPath = \
+                    u"Clothes\\MiddleClass\\01\\F\\Shirt.dds"
+                changed = True
+            elif record.flags.lowerBody != 0:
+                record.maleIconPath = \
+                    u"Clothes\\MiddleClass\\01\\M\\Pants.dds"
+                record.femaleIconPath = \
+                    u"Clothes\\MiddleClass\\01\\F\\Pants.dds"
+                changed = True
+            elif record.flags.head or record.flags.hair:
+                record.maleIconPath = \
+                    u"Clothes\\MythicDawnrobe\\hood.dds"
+                changed = True
+            elif record.flags.hand != 0:
+                record.maleIconPath = \
+                 u"Clothes\\LowerClass\\Jail\\M\\JailShirtHandcuff.dds"
+                changed = True
+            elif record.flags.foot != 0:
+                record.maleIconPath = \
+                    u"Clothes\\MiddleClass\\01\\M\\Shoes.dds"
+                record.femaleIconPath = \
+                    u"Clothes\\MiddleClass\\01\\F\\Shoes.dds"
+                changed = True
+            elif record.flags.leftRing or record.flags.rightRing:
+                record.maleIconPath = u"Clothes\\Ring\\RingNovice.dds"
+                changed = True
+            else: #amulet
+                record.maleIconPath = \
+                    u"Clothes\\Amulet\\AmuletSilver.dds"
+                changed = True
+        elif type_ == 'FACT':
+            #todo
+            #changed = True
+            pass
+        elif type_ == 'INGR':
+            record.iconPath = u"Clutter\\IconSeeds.dds"
+            changed = True
+        elif type_ == 'KEYM':
+            record.iconPath = \
+                [u"Clutter\\Key\\Key.dds", u"Clutter\\Key\\Key02.dds"][
+                    random.randint(0, 1)]
+            changed = True
+        elif type_ == 'LIGH':
+            if not record.flags.canTake: return False
+            record.iconPath = u"Lights\\IconTorch02.dds"
+            changed = True
+        elif type_ == 'MISC':
+            record.iconPath = u"Clutter\\Soulgems\\AzurasStar.dds"
+            changed = True
+        elif type_ == 'QUST':
+            if not record.stages: return False
+            record.iconPath = u"Quest\\icon_miscellaneous.dds"
+            changed = True
+        elif type_ == 'SGST':
+            record.iconPath = u"IconSigilStone.dds"
+            changed = True
+        elif type_ == 'SLGM':
+            record.iconPath = u"Clutter\\Soulgems\\AzurasStar.dds"
+            changed = True
+        elif type_ == 'WEAP':
+            if record.weaponType == 0:
+                record.iconPath = u"Weapons\\IronDagger.dds"
+            elif record.weaponType == 1:
+                record.iconPath = u"Weapons\\IronClaymore.dds"
+            elif record.weaponType == 2:
+                record.iconPath = u"Weapons\\IronMace.dds"
+            elif record.weaponType == 3:
+                record.iconPath = u"Weapons\\IronBattleAxe.dds"
+            elif record.weaponType == 4:
+                record.iconPath = u"Weapons\\Staff.dds"
+            elif record.weaponType == 5:
+                record.iconPath = u"Weapons\\IronBow.dds"
+            else: #Should never reach this point
+                record.iconPath = u"Weapons\\IronDagger.dds"
+            changed = True
+        return changed
 
 class CBash_AssortedTweak_DefaultIcons(AAssortedTweak_DefaultIcons,
                                        CBash_MultiTweakItem):
@@ -1668,27 +1433,16 @@ def __init__(self):
 class AssortedTweak_SetSoundAttenuationLevels(
     AAssortedTweak_SetSoundAttenuationLevels, MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchBlock = patchFile.SOUN
-        id_records = patchBlock.id_records
-        for record in modFile.SOUN.getActiveRecords():
-            if mapper(record.fid) in id_records: continue
-            if record.staticAtten and not _is_nirnroot(record):
-                record = record.getTypeCopy(mapper)
-                patchBlock.setRecord(record)
+    scan_skips_patched = True
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.SOUN.records:
-            if record.staticAtten and not _is_nirnroot(record):
-                record.staticAtten = record.staticAtten * \
-                                     self.choiceValues[self.chosen][0] / 100
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def wants_record(self, record):
+        return record.staticAtten and not _is_nirnroot(record)
+
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        record.staticAtten = record.staticAtten * \
+                             self.choiceValues[self.chosen][0] / 100
+        return True
 
 class CBash_AssortedTweak_SetSoundAttenuationLevels(
     AAssortedTweak_SetSoundAttenuationLevels, CBash_MultiTweakItem):
@@ -1726,27 +1480,16 @@ def __init__(self):
 class AssortedTweak_SetSoundAttenuationLevels_NirnrootOnly(
     AAssortedTweak_SetSoundAttenuationLevels_NirnrootOnly, MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchBlock = patchFile.SOUN
-        id_records = patchBlock.id_records
-        for record in modFile.SOUN.getActiveRecords():
-            if mapper(record.fid) in id_records: continue
-            if _is_nirnroot(record) and record.staticAtten:
-                record = record.getTypeCopy(mapper)
-                patchBlock.setRecord(record)
+    scan_skips_patched = True
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.SOUN.records:
-            if _is_nirnroot(record) and record.staticAtten:
-                record.staticAtten = record.staticAtten * \
-                                     self.choiceValues[self.chosen][0] / 100
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def wants_record(self, record):
+        return _is_nirnroot(record) and record.staticAtten
+
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        record.staticAtten = record.staticAtten * \
+                             self.choiceValues[self.chosen][0] / 100
+        return True
 
 class CBash_AssortedTweak_SetSoundAttenuationLevels_NirnrootOnly(
     AAssortedTweak_SetSoundAttenuationLevels_NirnrootOnly,
@@ -1783,23 +1526,13 @@ def __init__(self):
 class AssortedTweak_FactioncrimeGoldMultiplier(
     AAssortedTweak_FactioncrimeGoldMultiplier, MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchRecords = patchFile.FACT
-        for record in modFile.FACT.getActiveRecords():
-            if record.crime_gold_multiplier is None:
-                patchRecords.setRecord(record.getTypeCopy(mapper))
+    def wants_record(self, record):
+        return record.crime_gold_multiplier is None
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.FACT.records:
-            if record.crime_gold_multiplier is None:
-                record.crime_gold_multiplier = 1.0
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        record.crime_gold_multiplier = 1.0
+        return True
 
 class CBash_AssortedTweak_FactioncrimeGoldMultiplier(
     AAssortedTweak_FactioncrimeGoldMultiplier, CBash_MultiTweakItem):
@@ -1829,24 +1562,13 @@ def __init__(self):
 class AssortedTweak_LightFadeValueFix(AAssortedTweak_LightFadeValueFix,
                                       MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchRecords = patchFile.LIGH
-        for record in modFile.LIGH.getActiveRecords():
-            if not isinstance(record.fade,float):
-                record = record.getTypeCopy(mapper)
-                patchRecords.setRecord(record)
+    def wants_record(self, record):
+        return not isinstance(record.fade,float)
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.LIGH.records:
-            if not isinstance(record.fade,float):
-                record.fade = 1.0
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        record.fade = 1.0
+        return True
 
 class CBash_AssortedTweak_LightFadeValueFix(AAssortedTweak_LightFadeValueFix,
                                             CBash_MultiTweakItem):
@@ -1875,24 +1597,13 @@ def __init__(self):
 
 class AssortedTweak_TextlessLSCRs(AAssortedTweak_TextlessLSCRs,MultiTweakItem):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchRecords = patchFile.LSCR
-        for record in modFile.LSCR.getActiveRecords():
-            if record.text:
-                record = record.getTypeCopy(mapper)
-                patchRecords.setRecord(record)
+    def wants_record(self, record):
+        return record.text
 
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        keep = patchFile.getKeeper()
-        for record in patchFile.LSCR.records:
-            if record.text:
-                record.text = u''
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log,count)
+    def tweak_record(self, record):
+        if not self.wants_record(record): return False
+        record.text = u''
+        return True
 
 class CBash_AssortedTweak_TextlessLSCRs(AAssortedTweak_TextlessLSCRs,
                                         CBash_MultiTweakItem):
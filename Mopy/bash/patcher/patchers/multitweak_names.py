@@ -27,7 +27,6 @@
 
 from __future__ import division
 import re
-from collections import Counter
 # Internal
 from ... import load_order
 from ...patcher.base import AMultiTweakItem, AMultiTweaker, DynamicNamedTweak
@@ -75,49 +74,40 @@ def getWriteClasses(self):
         """Returns load factory classes needed for writing."""
         return self.key,
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchBlock = getattr(patchFile,self.key)
-        id_records = patchBlock.id_records
-        for record in getattr(modFile,self.key).getActiveRecords():
-            if record.full and mapper(record.fid) not in id_records:
-                record = record.getTypeCopy(mapper)
-                patchBlock.setRecord(record)
-
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
+    scan_skips_patched = True
+
+    def wants_record(self, record):
+        return record.full
+
+    def prepare_for_tweaking(self, patchFile):
+        self._codes = patchFile.bodyTags
+
+    def tweak_record(self, record):
+        if not record.full: return False
+        if record.full[0] in u'+-=.()[]': return False
         format_ = self.choiceValues[self.chosen][0]
-        showStat = u'%02d' in format_
-        keep = patchFile.getKeeper()
-        codes = patchFile.bodyTags
         amulet,ring,gloves,head,tail,robe,chest,pants,shoes,shield = [
-            x for x in codes]
-        for record in getattr(patchFile,self.key).records:
-            if not record.full: continue
-            if record.full[0] in u'+-=.()[]': continue
-            rec_flgs = record.flags
-            if rec_flgs.head or rec_flgs.hair: type_ = head
-            elif rec_flgs.rightRing or rec_flgs.leftRing: type_ = ring
-            elif rec_flgs.amulet: type_ = amulet
-            elif rec_flgs.upperBody and rec_flgs.lowerBody: type_ = robe
-            elif rec_flgs.upperBody: type_ = chest
-            elif rec_flgs.lowerBody: type_ = pants
-            elif rec_flgs.hand: type_ = gloves
-            elif rec_flgs.foot: type_ = shoes
-            elif rec_flgs.tail: type_ = tail
-            elif rec_flgs.shield: type_ = shield
-            else: continue
-            if record.recType == 'ARMO':
-                type_ += 'LH'[record.flags.heavyArmor]
-            if showStat:
-                record.full = format_ % (
-                    type_, record.strength / 100) + record.full
-            else:
-                record.full = format_ % type_ + record.full
-            keep(record.fid)
-            count[record.fid[0]] += 1
-        self._patchLog(log, count)
+            x for x in self._codes]
+        rec_flgs = record.flags
+        if rec_flgs.head or rec_flgs.hair: type_ = head
+        elif rec_flgs.rightRing or rec_flgs.leftRing: type_ = ring
+        elif rec_flgs.amulet: type_ = amulet
+        elif rec_flgs.upperBody and rec_flgs.lowerBody: type_ = robe
+        elif rec_flgs.upperBody: type_ = chest
+        elif rec_flgs.lowerBody: type_ = pants
+        elif rec_flgs.hand: type_ = gloves
+        elif rec_flgs.foot: type_ = shoes
+        elif rec_flgs.tail: type_ = tail
+        elif rec_flgs.shield: type_ = shield
+        else: return False
+        if record.recType == 'ARMO':
+            type_ += 'LH'[record.flags.heavyArmor]
+        if u'%02d' in format_:
+            record.full = format_ % (
+                type_, record.strength / 100) + record.full
+        else:
+            record.full = format_ % type_ + record.full
+        return True
 
 class CBash_NamesTweak_Body(DynamicNamedTweak, CBash_MultiTweakItem):
     """Names tweaker for armor and clothes."""
@@ -180,54 +170,43 @@ def __init__(self):
 
 class NamesTweak_Potions(_ANamesTweak_Potions, _AMultiTweakItem_Names):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchBlock = patchFile.ALCH
-        id_records = patchBlock.id_records
-        for record in modFile.ALCH.getActiveRecords():
-            if mapper(record.fid) in id_records: continue
-            record = record.getTypeCopy(mapper)
-            patchBlock.setRecord(record)
-
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        format_ = self.choiceValues[self.chosen][0]
-        hostileEffects = patchFile.getMgefHostiles()
-        keep = patchFile.getKeeper()
-        reOldLabel = self.__class__.reOldLabel
-        reOldEnd = self.__class__.reOldEnd
-        mgef_school = patchFile.getMgefSchool()
-        for record in patchFile.ALCH.records:
-            if not record.full: continue
-            school = 6 #--Default to 6 (U: unknown)
-            for index,effect in enumerate(record.effects):
-                effectId = effect.name
-                if index == 0:
-                    if effect.scriptEffect:
-                        school = effect.scriptEffect.school
-                    else:
-                        school = mgef_school.get(effectId,6)
-                #--Non-hostile effect?
+    scan_skips_patched = True
+
+    def wants_record(self, record):
+        return True
+
+    def prepare_for_tweaking(self, patchFile):
+        self._hostile_effects = patchFile.getMgefHostiles()
+        self._mgef_school = patchFile.getMgefSchool()
+
+    def tweak_record(self, record):
+        if not record.full: return False
+        school = 6 #--Default to 6 (U: unknown)
+        for index,effect in enumerate(record.effects):
+            effectId = effect.name
+            if index == 0:
                 if effect.scriptEffect:
-                    if not effect.scriptEffect.flags.hostile:
-                        isPoison = False
-                        break
-                elif effectId not in hostileEffects:
+                    school = effect.scriptEffect.school
+                else:
+                    school = self._mgef_school.get(effectId,6)
+            #--Non-hostile effect?
+            if effect.scriptEffect:
+                if not effect.scriptEffect.flags.hostile:
                     isPoison = False
                     break
-            else:
-                isPoison = True
-            full = reOldLabel.sub(u'',record.full) #--Remove existing label
-            full = reOldEnd.sub(u'',full)
-            if record.flags.isFood:
-                record.full = u'.'+full
-            else:
-                label = (u'X' if isPoison else u'') + u'ACDIMRU'[school]
-                record.full = format_ % label + full
-            keep(record.fid)
-            count[record.fid[0]] += 1
-        self._patchLog(log, count)
+            elif effectId not in self._hostile_effects:
+                isPoison = False
+                break
+        else:
+            isPoison = True
+        full = self.reOldLabel.sub(u'',record.full) #--Remove existing label
+        full = self.reOldEnd.sub(u'',full)
+        if record.flags.isFood:
+            record.full = u'.'+full
+        else:
+            label = (u'X' if isPoison else u'') + u'ACDIMRU'[school]
+            record.full = self.choiceValues[self.chosen][0] % label + full
+        return True
 
 class CBash_NamesTweak_Potions(_ANamesTweak_Potions, CBash_MultiTweakItem):
 
@@ -298,57 +277,41 @@ def save_tweak_config(self, configs):
 class NamesTweak_Scrolls(_ANamesTweak_Scrolls, _AMultiTweakItem_Names):
     tweak_read_classes = 'BOOK','ENCH',
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        #--Scroll Enchantments
-        if self.magicFormat:
-            patchBlock = patchFile.ENCH
-            id_records = patchBlock.id_records
-            for record in modFile.ENCH.getActiveRecords():
-                if mapper(record.fid) in id_records: continue
-                if record.itemType == 0:
-                    record = record.getTypeCopy(mapper)
-                    patchBlock.setRecord(record)
-        #--Books
-        patchBlock = patchFile.BOOK
-        id_records = patchBlock.id_records
-        for record in modFile.BOOK.getActiveRecords():
-            if mapper(record.fid) in id_records: continue
-            if record.flags.isScroll and not record.flags.isFixed:
-                record = record.getTypeCopy(mapper)
-                patchBlock.setRecord(record)
-
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
-        reOldLabel = self.__class__.reOldLabel
-        orderFormat, magicFormat = self.orderFormat, self.magicFormat
-        keep = patchFile.getKeeper()
-        id_ench = patchFile.ENCH.id_records
-        mgef_school = patchFile.getMgefSchool()
-        for record in patchFile.BOOK.records:
-            if not record.full or not record.flags.isScroll or \
-                    record.flags.isFixed: continue
-            #--Magic label
-            isEnchanted = bool(record.enchantment)
-            if magicFormat and isEnchanted:
-                school = 6 #--Default to 6 (U: unknown)
-                enchantment = id_ench.get(record.enchantment)
-                if enchantment and enchantment.effects:
-                    effect = enchantment.effects[0]
-                    effectId = effect.name
-                    if effect.scriptEffect:
-                        school = effect.scriptEffect.school
-                    else:
-                        school = mgef_school.get(effectId,6)
-                record.full = reOldLabel.sub(u'',record.full) #--Remove
-                # existing label
-                record.full = magicFormat % 'ACDIMRU'[school] + record.full
-            #--Ordering
-            record.full = orderFormat[isEnchanted] + record.full
-            keep(record.fid)
-            count[record.fid[0]] += 1
-        self._patchLog(log, count)
+    scan_skips_patched = True
+    pooled_reads = 'ENCH', # the enchantments of the scrolls
+
+    def wants_record(self, record):
+        if record.recType == 'ENCH': #--Scroll Enchantments
+            return self.magicFormat and record.itemType == 0
+        return record.flags.isScroll and not record.flags.isFixed
+
+    def prepare_for_tweaking(self, patchFile):
+        self._id_ench = patchFile.ENCH.id_records
+        self._mgef_school = patchFile.getMgefSchool()
+
+    def tweak_record(self, record):
+        if record.recType != 'BOOK': return False
+        if not record.full or not record.flags.isScroll or \
+                record.flags.isFixed: return False
+        #--Magic label
+        isEnchanted = bool(record.enchantment)
+        magicFormat = self.magicFormat
+        if magicFormat and isEnchanted:
+            school = 6 #--Default to 6 (U: unknown)
+            enchantment = self._id_ench.get(record.enchantment)
+            if enchantment and enchantment.effects:
+                effect = enchantment.effects[0]
+                effectId = effect.name
+                if effect.scriptEffect:
+                    school = effect.scriptEffect.school
+                else:
+                    school = self._mgef_school.get(effectId,6)
+            record.full = self.reOldLabel.sub(u'',record.full) #--Remove
+            # existing label
+            record.full = magicFormat % 'ACDIMRU'[school] + record.full
+        #--Ordering
+        record.full = self.orderFormat[isEnchanted] + record.full
+        return True
 
 class CBash_NamesTweak_Scrolls(_ANamesTweak_Scrolls, CBash_MultiTweakItem):
     """Names tweaker for scrolls."""
@@ -420,47 +383,36 @@ def __init__(self):
 
 class NamesTweak_Spells(_ANamesTweak_Spells, _AMultiTweakItem_Names):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        patchBlock = patchFile.SPEL
-        id_records = patchBlock.id_records
-        for record in modFile.SPEL.getActiveRecords():
-            if mapper(record.fid) in id_records: continue
-            if record.spellType == 0:
-                record = record.getTypeCopy(mapper)
-                patchBlock.setRecord(record)
-
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
+    scan_skips_patched = True
+
+    def wants_record(self, record):
+        return record.spellType == 0
+
+    def prepare_for_tweaking(self, patchFile):
+        self._mgef_school = patchFile.getMgefSchool()
+
+    def tweak_record(self, record):
+        if record.spellType != 0 or not record.full: return False
         format_ = self.choiceValues[self.chosen][0]
-        removeTags = u'%s' not in format_
-        showLevel = u'%d' in format_
-        keep = patchFile.getKeeper()
-        reOldLabel = self.__class__.reOldLabel
-        mgef_school = patchFile.getMgefSchool()
-        for record in patchFile.SPEL.records:
-            if record.spellType != 0 or not record.full: continue
-            school = 6 #--Default to 6 (U: unknown)
-            if record.effects:
-                effect = record.effects[0]
-                effectId = effect.name
-                if effect.scriptEffect:
-                    school = effect.scriptEffect.school
-                else:
-                    school = mgef_school.get(effectId,6)
-            newFull = reOldLabel.sub(u'',record.full) #--Remove existing label
-            if not removeTags:
-                if showLevel:
-                    newFull = format_ % (
-                        u'ACDIMRU'[school], record.level) + newFull
-                else:
-                    newFull = format_ % u'ACDIMRU'[school] + newFull
-            if newFull != record.full:
-                record.full = newFull
-                keep(record.fid)
-                count[record.fid[0]] += 1
-        self._patchLog(log, count)
+        school = 6 #--Default to 6 (U: unknown)
+        if record.effects:
+            effect = record.effects[0]
+            effectId = effect.name
+            if effect.scriptEffect:
+                school = effect.scriptEffect.school
+            else:
+                school = self._mgef_school.get(effectId,6)
+        newFull = self.reOldLabel.sub(u'',record.full) #--Remove existing label
+        if u'%s' in format_:
+            if u'%d' in format_:
+                newFull = format_ % (
+                    u'ACDIMRU'[school], record.level) + newFull
+            else:
+                newFull = format_ % u'ACDIMRU'[school] + newFull
+        if newFull != record.full:
+            record.full = newFull
+            return True
+        return False
 
 class CBash_NamesTweak_Spells(_ANamesTweak_Spells, CBash_MultiTweakItem):
 
@@ -526,43 +478,24 @@ def __init__(self):
 class NamesTweak_Weapons(_ANamesTweak_Weapons, _AMultiTweakItem_Names):
 
     #--Patch Phase ------------------------------------------------------------
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        for blockType in ('AMMO','WEAP'):
-            modBlock = getattr(modFile,blockType)
-            patchBlock = getattr(patchFile,blockType)
-            id_records = patchBlock.id_records
-            for record in modBlock.getActiveRecords():
-                if mapper(record.fid) not in id_records:
-                    record = record.getTypeCopy(mapper)
-                    patchBlock.setRecord(record)
-
-    def buildPatch(self,log,progress,patchFile):
-        """Edits patch file as desired. Will write to log."""
-        count = Counter()
+    scan_skips_patched = True
+
+    def wants_record(self, record):
+        return True
+
+    def tweak_record(self, record):
+        if not record.full: return False
         format_ = self.choiceValues[self.chosen][0]
-        showStat = u'%02d' in format_
-        keep = patchFile.getKeeper()
-        for record in patchFile.AMMO.records:
-            if not record.full: continue
-            if record.full[0] in u'+-=.()[]': continue
-            if showStat:
-                record.full = format_ % (u'A',record.damage) + record.full
-            else:
-                record.full = format_ % u'A' + record.full
-            keep(record.fid)
-            count[record.fid[0]] += 1
-        for record in patchFile.WEAP.records:
-            if not record.full: continue
-            if showStat:
-                record.full = format_ % (
-                    u'CDEFGB'[record.weaponType], record.damage) + record.full
-            else:
-                record.full = format_ % u'CDEFGB'[
-                    record.weaponType] + record.full
-            keep(record.fid)
-            count[record.fid[0]] += 1
-        self._patchLog(log, count)
+        if record.recType == 'AMMO':
+            if record.full[0] in u'+-=.()[]': return False
+            type_ = u'A'
+        else:
+            type_ = u'CDEFGB'[record.weaponType]
+        if u'%02d' in format_:
+            record.full = format_ % (type_, record.damage) + record.full
+        else:
+            record.full = format_ % type_ + record.full
+        return True
 
 class CBash_NamesTweak_Weapons(_ANamesTweak_Weapons, CBash_MultiTweakItem):
 
@@ -613,118 +546,108 @@ def __init__(self, reMatch, reReplace, label, tweak_tip, key, choices):
 
 class TextReplacer(_ATextReplacer, _AMultiTweakItem_Names):
 
-    def scanModFile(self,modFile,progress,patchFile):
-        mapper = modFile.getLongMapper()
-        for blockType in self.tweak_read_classes:
-            if blockType not in modFile.tops: continue
-            modBlock = getattr(modFile,blockType)
-            patchBlock = getattr(patchFile,blockType)
-            id_records = patchBlock.id_records
-            for record in modBlock.getActiveRecords():
-                if mapper(record.fid) not in id_records:
-                    record = record.getTypeCopy(mapper)
-                    patchBlock.setRecord(record)
-
-    def buildPatch(self,log,progress,patchFile):
-        count = Counter()
-        keep = patchFile.getKeeper()
-        reMatch = re.compile(self.reMatch)
+    scan_skips_patched = True
+
+    def wants_record(self, record):
+        return True
+
+    def prepare_for_tweaking(self, patchFile):
+        self._re_match = re.compile(self.reMatch)
+
+    def tweak_record(self, record):
+        type_ = record.recType
+        reMatch = self._re_match
         reReplace = self.reReplace
-        for type_ in self.tweak_read_classes:
-            if type_ not in patchFile.tops: continue
-            for record in patchFile.tops[type_].records:
-                changed = False
-                if hasattr(record, 'full'):
-                    changed = reMatch.search(record.full or u'')
-                if not changed:
-                    if hasattr(record, 'effects'):
-                        Effects = record.effects
-                        for effect in Effects:
-                            try:
-                                changed = reMatch.search(
-                                    effect.scriptEffect.full or u'')
-                            except AttributeError:
-                                continue
-                            if changed: break
-                if not changed:
-                    if hasattr(record, 'text'):
-                        changed = reMatch.search(record.text or u'')
-                if not changed:
-                    if hasattr(record, 'description'):
-                        changed = reMatch.search(record.description or u'')
+        changed = False
+        if hasattr(record, 'full'):
+            changed = reMatch.search(record.full or u'')
+        if not changed:
+            if hasattr(record, 'effects'):
+                Effects = record.effects
+                for effect in Effects:
+                    try:
+                        changed = reMatch.search(
+                            effect.scriptEffect.full or u'')
+                    except AttributeError:
+                        continue
+                    if changed: break
+        if not changed:
+            if hasattr(record, 'text'):
+                changed = reMatch.search(record.text or u'')
+        if not changed:
+            if hasattr(record, 'description'):
+                changed = reMatch.search(record.description or u'')
+        if not changed:
+            if type_ == 'GMST' and record.eid[0] == u's':
+                changed = reMatch.search(record.value or u'')
+        if not changed:
+            if hasattr(record, 'stages'):
+                Stages = record.stages
+                for stage in Stages:
+                    for entry in stage.entries:
+                        changed = reMatch.search(entry.text or u'')
+                        if changed: break
+        if not changed:
+            if type_ == 'SKIL':
+                changed = reMatch.search(record.apprentice or u'')
                 if not changed:
-                    if type_ == 'GMST' and record.eid[0] == u's':
-                        changed = reMatch.search(record.value or u'')
+                    changed = reMatch.search(record.journeyman or u'')
                 if not changed:
-                    if hasattr(record, 'stages'):
-                        Stages = record.stages
-                        for stage in Stages:
-                            for entry in stage.entries:
-                                changed = reMatch.search(entry.text or u'')
-                                if changed: break
+                    changed = reMatch.search(record.expert or u'')
                 if not changed:
-                    if type_ == 'SKIL':
-                        changed = reMatch.search(record.apprentice or u'')
-                        if not changed:
-                            changed = reMatch.search(record.journeyman or u'')
-                        if not changed:
-                            changed = reMatch.search(record.expert or u'')
-                        if not changed:
-                            changed = reMatch.search(record.master or u'')
-                if changed:
-                    if hasattr(record, 'full'):
-                        newString = record.full
-                        if record:
-                            record.full = reMatch.sub(reReplace, newString)
-                    if hasattr(record, 'effects'):
-                        Effects = record.effects
-                        for effect in Effects:
-                            try:
-                                newString = effect.scriptEffect.full
-                            except AttributeError:
-                                continue
-                            if newString:
-                                effect.scriptEffect.full = reMatch.sub(
-                                    reReplace, newString)
-                    if hasattr(record, 'text'):
-                        newString = record.text
-                        if newString:
-                            record.text = reMatch.sub(reReplace, newString)
-                    if hasattr(record, 'description'):
-                        newString = record.description
-                        if newString:
-                            record.description = reMatch.sub(reReplace,
-                                                             newString)
-                    if type_ == 'GMST' and record.eid[0] == u's':
-                        newString = record.value
-                        if newString:
-                            record.value = reMatch.sub(reReplace, newString)
-                    if hasattr(record, 'stages'):
-                        Stages = record.stages
-                        for stage in Stages:
-                            for entry in stage.entries:
-                                newString = entry.text
-                                if newString:
-                                    entry.text = reMatch.sub(reReplace,
-                                                             newString)
-                    if type_ == 'SKIL':
-                        newString = record.apprentice
-                        if newString:
-                            record.apprentice = reMatch.sub(reReplace,
-                                                            newString)
-                        newString = record.journeyman
-                        if newString:
-                            record.journeyman = reMatch.sub(reReplace,
-                                                            newString)
-                        newString = record.expert
-                        if newString:
-                            record.expert = reMatch.sub(reReplace, newString)
-                        newString = record.master
+                    changed = reMatch.search(record.master or u'')
+        if changed:
+            if hasattr(record, 'full'):
+                newString = record.full
+                if record:
+                    record.full = reMatch.sub(reReplace, newString)
+            if hasattr(record, 'effects'):
+                Effects = record.effects
+                for effect in Effects:
+                    try:
+                        newString = effect.scriptEffect.full
+                    except AttributeError:
+                        continue
+                    if newString:
+                        effect.scriptEffect.full = reMatch.sub(
+                            reReplace, newString)
+            if hasattr(record, 'text'):
+                newString = record.text
+                if newString:
+                    record.text = reMatch.sub(reReplace, newString)
+            if hasattr(record, 'description'):
+                newString = record.description
+                if newString:
+                    record.description = reMatch.sub(reReplace,
+                                                     newString)
+            if type_ == 'GMST' and record.eid[0] == u's':
+                newString = record.value
+                if newString:
+                    record.value = reMatch.sub(reReplace, newString)
+            if hasattr(record, 'stages'):
+                Stages = record.stages
+                for stage in Stages:
+                    for entry in stage.entries:
+                        newString = entry.text
                         if newString:
-                            record.master = reMatch.sub(reReplace, newString)
-                    keep(record.fid)
-                    count[record.fid[0]] += 1
-        self._patchLog(log, count)
+                            entry.text = reMatch.sub(reReplace,
+                                                     newString)
+            if type_ == 'SKIL':
+                newString = record.apprentice
+                if newString:
+                    record.apprentice = reMatch.sub(reReplace,
+                                                    newString)
+                newString = record.journeyman
+                if newString:
+                    record.journeyman = reMatch.sub(reReplace,
+                                                    newString)
+                newString = record.expert
+                if newString:
+                    record.expert = reMatch.sub(reReplace, newString)
+                newString = record.master
+                if newString:
+                    record.master = reMatch.sub(reReplace, newString)
+        return bool(changed)
 
 class CBash_TextReplacer(_ATextReplacer, CBash_MultiTweakItem):
     tweak_read_classes = (b'CELLS',) + _ATextReplacer.tweak_read_classes
@@ -39,7 +39,6 @@
 from ...brec import MreRecord, MelObject, strFid
 from ...cint import ValidateDict, FormID
 from ...exception import BoltError
-from ...mod_files import ModFile, LoadFactory
 from ...patcher.base import AMultiTweakItem, AListPatcher, AMultiTweaker
 from .base import MultiTweakItem, CBash_MultiTweakItem, SpecialPatcher, \
     ListPatcher, CBash_ListPatcher, CBash_MultiTweaker
@@ -124,7 +123,7 @@ def apply(self,modFile,record,bashTags):
         else:
             return
 
-        oldValues = tuple(map(record.__getattribute__, self.attrs))
+        oldValues = tuple([getattr(record, a) for a in self.attrs])
         if oldValues != newValues:
             override = record.CopyAsOverride(self.patchFile)
             if override:
@@ -663,18 +662,16 @@ def __init__(self, p_name, p_file, p_sources, enabled_tweaks):
     def initData(self,progress):
         """Get data from source files."""
         if not self.isActive or not self.srcs: return
-        loadFactory = LoadFactory(False,MreRecord.type_class['RACE'])
+        read_classes = (MreRecord.type_class['RACE'],)
+        load_plugin = self.patchFile.plugin_cache.load_plugin
         progress.setFull(len(self.srcs))
-        cachedMasters = {}
         for index,srcMod in enumerate(self.srcs):
             if srcMod not in bosh.modInfos: continue
             srcInfo = bosh.modInfos[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
-            srcFile.load(True)
+            srcFile = load_plugin(srcMod, read_classes)
             masters = srcInfo.get_masters()
             bashTags = srcInfo.getBashTags()
             if 'RACE' not in srcFile.tops: continue
-            srcFile.convertToLongFids(('RACE',))
             self.tempRaceData = {} #so as not to carry anything over!
             if u'R.ChangeSpells' in bashTags and u'R.AddSpells' in bashTags:
                 raise BoltError(
@@ -743,15 +740,8 @@ def initData(self,progress):
             for master in masters:
                 if not master in bosh.modInfos: continue  # or break
                 # filter mods
-                if master in cachedMasters:
-                    masterFile = cachedMasters[master]
-                else:
-                    masterInfo = bosh.modInfos[master]
-                    masterFile = ModFile(masterInfo,loadFactory)
-                    masterFile.load(True)
-                    if 'RACE' not in masterFile.tops: continue
-                    masterFile.convertToLongFids(('RACE',))
-                    cachedMasters[master] = masterFile
+                masterFile = load_plugin(master, read_classes)
+                if 'RACE' not in masterFile.tops: continue
                 for race in masterFile.RACE.getActiveRecords():
                     if race.fid not in self.tempRaceData: continue
                     tempRaceData = self.tempRaceData[race.fid]
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import sys
+import types
+
+import pytest
+
+from .. import barg, bolt, bosh, bush
+from .. import bash as bash_main
+from ..bolt import GPath
+
+# Helper functions ------------------------------------------------------------
+class _Initialization(object):
+    """Stands in for the initialization module, which main imports."""
+    @staticmethod
+    def init_dirs(bashIni_, personal, localAppData, game_info):
+        return GPath(u'Oblivion.ini'), [u'Some warning']
+
+class _Cli(object):
+    """Stands in for patcher_cli, whose patch builds need all of basher.
+    Records the builds it was asked for and what _build_patch printed."""
+    def __init__(self):
+        self.builds = []
+        self.printed = []
+        self.build_error = None
+
+    def build_patch(self, patch_name, lo_path, config_path=None,
+                    report_path=None):
+        self.builds.append((patch_name, lo_path, config_path, report_path))
+        if self.build_error: raise self.build_error
+        return {u'total_seconds': 1.5}
+
+@pytest.fixture()
+def cli(tmpdir, monkeypatch):
+    """Sets things up so that _build_patch finds Oblivion in tmpdir and
+    builds patches with a fake patcher_cli, and captures what it prints."""
+    monkeypatch.chdir(tmpdir) # no bash.ini
+    monkeypatch.setattr(bush, u'detect_and_set_game',
+                        lambda *args: (None, None))
+    monkeypatch.setattr(bush.game, u'gamePath', GPath(tmpdir.strpath))
+    monkeypatch.setattr(bash_main, u'initialization', _Initialization(),
+                        raising=False)
+    monkeypatch.setattr(bosh, u'initBosh', lambda *args: None)
+    monkeypatch.setattr(bolt, u'CBash', 0)
+    fake_cli = _Cli()
+    basher_name = bash_main.__name__.rpartition(u'.')[0] + u'.basher'
+    fake_basher = types.ModuleType(str(basher_name))
+    fake_basher.patcher_cli = fake_cli
+    monkeypatch.setitem(sys.modules, basher_name, fake_basher)
+    monkeypatch.setattr(bash_main, u'print', fake_cli.printed.append,
+                        raising=False)
+    return fake_cli
+
+def _parse(*args):
+    """Parses the specified command line arguments like Wrye Bash.py does."""
+    old_argv = sys.argv
+    sys.argv = [u'Wrye Bash.py'] + list(args)
+    try:
+        return barg.parse()
+    finally:
+        sys.argv = old_argv
+
+def _build(*args):
+    return bash_main._build_patch(_parse(
+        u'--build-patch', u'Bashed Patch, 0.esp', u'--load-order',
+        u'/lo.txt', *args))
+
+# Tests -----------------------------------------------------------------------
+def test_parse():
+    opts = _parse(u'--build-patch', u'Bashed Patch, 0.esp', u'--game',
+                  u'Oblivion', u'--data-dir', u'/Oblivion/Data',
+                  u'--load-order', u'/lo.txt', u'--patch-config',
+                  u'/config.dat', u'--timing-report', u'/report.json')
+    assert opts.buildPatch == u'Bashed Patch, 0.esp'
+    assert opts.game == u'Oblivion'
+    assert opts.dataPath == u'/Oblivion/Data'
+    assert opts.loadOrder == u'/lo.txt'
+    assert opts.patchConfig == u'/config.dat'
+    assert opts.timingReport == u'/report.json'
+    assert not _parse().buildPatch
+
+def test_build_patch(cli):
+    assert _build(u'--timing-report', u'/report.json') == 0
+    assert cli.builds == [(GPath(u'Bashed Patch, 0.esp'), GPath(u'/lo.txt'),
+                           None, GPath(u'/report.json'))]
+    assert cli.printed == [u'Built Bashed Patch, 0.esp in 1.500 seconds.']
+    assert bolt.CBash == 1 # Python mode
+    assert _build(u'--patch-config', u'/config.dat', u'--game',
+                  u'oblivion') == 0
+    assert cli.builds[1][2:] == (GPath(u'/config.dat'), None)
+
+def test_build_patch_data_dir(cli, tmpdir):
+    data_dir = tmpdir.join(u'Data').strpath
+    assert _build(u'--data-dir', data_dir) == 0
+    assert _build(u'--data-dir', tmpdir.join(u'Other', u'Data').strpath) == 1
+    assert cli.printed[-1] == (u'No known game in the path specified via '
+        u'--data-dir: %s' % tmpdir.join(u'Other', u'Data').strpath)
+    assert len(cli.builds) == 1
+
+@pytest.mark.parametrize(u'args, message', [
+    ((u'--game', u'Skyrim'), u'Found Oblivion in %s instead of Skyrim.'),
+    ((), u'Could not determine which game to manage. Please use the '
+         u'--data-dir argument to specify the Data directory.'),
+])
+def test_build_patch_wrong_game(cli, tmpdir, monkeypatch, args, message):
+    if not args:
+        monkeypatch.setattr(bush, u'detect_and_set_game',
+                            lambda *args_: ([], {}))
+    assert _build(*args) == 1
+    if u'%s' in message:
+        message %= tmpdir.join(u'Data').strpath
+    assert cli.printed == [message]
+    assert not cli.builds
+
+def test_build_patch_not_supported(cli, monkeypatch):
+    monkeypatch.setattr(bush.game.Esp, u'canBash', False)
+    assert _build() == 1
+    assert cli.printed == [u'Bashed Patches are not supported for Oblivion.']
+    assert not cli.builds
+
+def test_build_patch_error(cli):
+    """Anything the build raises is printed and fails the build."""
+    cli.build_error = RuntimeError(u'Patcher exploded')
+    assert _build() == 1
+    assert cli.printed[0] == u'Failed to build Bashed Patch, 0.esp:'
+    assert u'RuntimeError: Patcher exploded' in cli.printed[1]
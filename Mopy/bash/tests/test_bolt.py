@@ -21,9 +21,21 @@
 #  https://github.com/wrye-bash
 #
 # =============================================================================
+import collections
+import cPickle
+import os
+import random
+import struct
+import threading
+import time
 from collections import OrderedDict
+
+import pytest
+
+from .. import bolt
 from ..bolt import LowerDict, DefaultLowerDict, OrderedLowerDict, decode, \
-    encode, getbestencoding
+    encode, getbestencoding, SizeCrcTable, PickleDict, GPath, StringTable, \
+    Progress, DataTable, ordered_thread_map
 
 def test_getbestencoding():
     """Tests getbestencoding. Keep this one small, we don't want to test
@@ -338,3 +350,467 @@ def test_keys(self):
         a = self.dict_type([(u'sape', 4139), (u'guido', 4127),
                             (u'jack', 4098)])
         assert a.keys() == [u'sape', u'guido', u'jack']
+
+class TestSizeCrcTable(object):
+    """Checks SizeCrcTable against a plain dict of the lowercase keys."""
+
+    @staticmethod
+    def _random_ops(table, model, ncols, num_ops, seed):
+        """Apply num_ops random sets, overwrites and deletes to both table
+        and model, with keys in random case."""
+        rng = random.Random(seed)
+        names = [u'Meshes\\Armor\\%d.nif' % i for i in xrange(300)] + [
+            u'Textures\\Äpfel\\%d.dds' % i for i in xrange(300)]
+        for _i in xrange(num_ops):
+            name = rng.choice(names)
+            key = u''.join(c.upper() if rng.random() < 0.5 else c
+                           for c in name)
+            if rng.random() < 0.3 and name.lower() in model:
+                del table[key]
+                del model[name.lower()]
+            else:
+                value = (rng.randint(0, 2 ** 40), rng.randint(0, 2 ** 32 - 1),
+                         rng.randint(0, 2 ** 31))[:ncols]
+                table[key] = value
+                model[name.lower()] = value
+
+    @staticmethod
+    def _assert_matches(table, model):
+        assert len(table) == len(model)
+        assert bool(table) == bool(model)
+        assert sorted(k.lower() for k in table) == sorted(model)
+        assert sorted((k.lower(), v) for k, v in table.iteritems()) == \
+            sorted(model.iteritems())
+        assert sorted(table.values()) == sorted(model.values())
+        for key, value in model.iteritems():
+            assert key in table
+            assert key.upper() in table
+            assert table[key.upper()] == value
+            assert table.get(key) == value
+        assert u'missing' not in table
+        assert table.get(u'missing', 0) == 0
+
+    def test_mapping(self):
+        for ncols in (2, 3):
+            table, model = SizeCrcTable(ncols), {}
+            self._assert_matches(table, model)
+            self._random_ops(table, model, ncols, 5000, ncols)
+            self._assert_matches(table, model)
+            # deleting most keys shrinks the table, then refill it
+            for key in list(model)[:len(model) - 5]:
+                del table[key.upper()]
+                del model[key]
+            self._assert_matches(table, model)
+            self._random_ops(table, model, ncols, 1000, ncols + 10)
+            self._assert_matches(table, model)
+
+    def test_keys_keep_case(self):
+        table = SizeCrcTable(mapping={u'Meshes\\A.nif': (1, 2, 3)})
+        table[u'MESHES\\a.NIF'] = (4, 5, 6)
+        assert table.keys() == [u'Meshes\\A.nif']
+        assert table[u'meshes\\a.nif'] == (4, 5, 6)
+
+    def test_dict_api(self):
+        table = SizeCrcTable(2, {u'a': (1, 2), u'B': (3, 4)})
+        assert table == LowerDict({u'A': (1, 2), u'b': (3, 4)})
+        assert table != LowerDict({u'a': (1, 2)})
+        assert table != LowerDict({u'a': (1, 2), u'b': (3, 5)})
+        assert table.setdefault(u'A', (0, 0)) == (1, 2)
+        assert table.setdefault(u'c', (5, 6)) == (5, 6)
+        assert table.pop(u'b') == (3, 4)
+        assert table.pop(u'b', None) is None
+        with pytest.raises(KeyError):
+            table.pop(u'b')
+        with pytest.raises(KeyError):
+            del table[u'b']
+        table_copy = table.copy()
+        table_copy[u'd'] = (7, 8)
+        assert u'd' not in table
+        assert table == SizeCrcTable(2, {u'A': (1, 2), u'C': (5, 6)})
+        table.clear()
+        assert not table
+        assert table == {}
+
+    def test_pickle_round_trip(self):
+        for ncols in (2, 3):
+            table, model = SizeCrcTable(ncols), {}
+            self._random_ops(table, model, ncols, 3000, ncols)
+            for proto in (0, 2):
+                loaded = cPickle.loads(cPickle.dumps(table, proto))
+                self._assert_matches(loaded, model)
+                assert loaded == table
+                # the loaded table can still be changed
+                self._random_ops(loaded, model, ncols, 500, proto)
+                self._assert_matches(loaded, model)
+                model = {k.lower(): v for k, v in table.iteritems()}
+
+    def test_pickle_other_hashes(self):
+        """Tables pickled by a process with other string hashes (hash
+        randomization, 32 vs 64 bit) rebuild their index when loaded."""
+        table, model = SizeCrcTable(3), {}
+        self._random_ops(table, model, 3, 2000, 42)
+        state = list(table.__getstate__())
+        state[1] += 1 # the hash check of the pickling process
+        state[5] = b'\0' * len(state[5]) # its hashes
+        loaded = SizeCrcTable.__new__(SizeCrcTable)
+        loaded.__setstate__(tuple(state))
+        self._assert_matches(loaded, model)
+
+class TestPickleDictJournal(object):
+    """Checks that journaled PickleDicts load what was saved, whichever of
+    save and save_keys saved it."""
+
+    @staticmethod
+    def _pickle_dict(tmpdir):
+        return PickleDict(GPath(unicode(tmpdir.join(u'test.dat'))),
+                          journaled=True)
+
+    def _loaded(self, tmpdir):
+        pickle_dict = self._pickle_dict(tmpdir)
+        assert pickle_dict.load() == 1
+        return pickle_dict
+
+    def test_replay_after_save(self, tmpdir):
+        pickle_dict = self._pickle_dict(tmpdir)
+        pickle_dict.data.update({u'a': 1, u'b': [2], u'c': 3})
+        pickle_dict.save()
+        pickle_dict.data[u'a'] = 10
+        pickle_dict.data[u'd'] = {u'e': 4}
+        del pickle_dict.data[u'c']
+        pickle_dict.vdata[u'version'] = 2
+        assert pickle_dict.save_keys({u'a', u'c', u'd'})
+        assert pickle_dict.journal.exists()
+        pickle_dict.data[u'b'].append(5)
+        assert pickle_dict.save_keys({u'b'})
+        loaded = self._loaded(tmpdir)
+        assert loaded.data == {u'a': 10, u'b': [2, 5], u'd': {u'e': 4}}
+        assert loaded.vdata[u'version'] == 2
+        # appending to a replayed journal works too
+        loaded.data[u'a'] = 20
+        assert loaded.save_keys({u'a'})
+        assert self._loaded(tmpdir).data[u'a'] == 20
+
+    def test_save_keys_without_pickle(self, tmpdir):
+        """With no pickle file to journal changes to, save_keys saves all of
+        data."""
+        pickle_dict = self._pickle_dict(tmpdir)
+        pickle_dict.data.update({u'a': 1, u'b': 2})
+        assert pickle_dict.save_keys({u'a'})
+        assert not pickle_dict.journal.exists()
+        assert self._loaded(tmpdir).data == {u'a': 1, u'b': 2}
+
+    def test_truncated_journal_tail(self, tmpdir):
+        """A batch cut short, e.g. by a crash, is ignored - and overwritten
+        by the next batch."""
+        pickle_dict = self._pickle_dict(tmpdir)
+        pickle_dict.data[u'a'] = 1
+        pickle_dict.save()
+        pickle_dict.data[u'a'] = 2
+        pickle_dict.save_keys({u'a'})
+        valid_size = pickle_dict.journal.size
+        pickle_dict.data[u'a'] = 3
+        pickle_dict.save_keys({u'a'})
+        # cut in the data of the last batch, then in its head
+        for cut_size in (pickle_dict.journal.size - 1, valid_size + 4):
+            with pickle_dict.journal.open(u'r+b') as out:
+                out.truncate(cut_size)
+            assert self._loaded(tmpdir).data[u'a'] == 2
+        # a corrupt (not just short) batch is ignored as well, even if it
+        # still unpickles - here to a = 7
+        with pickle_dict.journal.open(u'r+b') as out:
+            out.truncate(valid_size)
+            out.seek(0)
+            journal = out.read()
+            out.seek(journal.rindex(b'K\x02')) # pickled 2, protocol 2
+            out.write(b'K\x07')
+        loaded = self._loaded(tmpdir)
+        assert loaded.data[u'a'] == 1
+        loaded.data[u'b'] = 4
+        loaded.save_keys({u'b'})
+        assert loaded.journal.size < valid_size * 2
+        assert self._loaded(tmpdir).data == {u'a': 1, u'b': 4}
+
+    def test_stale_journal(self, tmpdir):
+        """Batches tagged with another generation of the pickle file are
+        ignored - e.g. if we crash before a save deletes the journal, or load
+        the backup file."""
+        pickle_dict = self._pickle_dict(tmpdir)
+        pickle_dict.data[u'a'] = 1
+        pickle_dict.save()
+        pickle_dict.data[u'a'] = 2
+        pickle_dict.save_keys({u'a'})
+        old_journal = pickle_dict.journal.open(u'rb').read()
+        pickle_dict.data[u'a'] = 3
+        pickle_dict.save() # the first generation is now the backup
+        assert not pickle_dict.journal.exists()
+        with pickle_dict.journal.open(u'wb') as out:
+            out.write(old_journal)
+        assert self._loaded(tmpdir).data[u'a'] == 3
+        # the backup is the generation the journal belongs to
+        pickle_dict.path.remove()
+        backup_dict = self._pickle_dict(tmpdir)
+        assert backup_dict.load() == 2
+        assert backup_dict.data[u'a'] == 2
+
+    def test_compaction(self, tmpdir, monkeypatch):
+        """Once the journal outgrows the pickle file, save_keys saves all of
+        data and deletes the journal."""
+        monkeypatch.setattr(PickleDict, u'_min_journal_size', 0)
+        pickle_dict = self._pickle_dict(tmpdir)
+        pickle_dict.data.update((u'key%d' % i, i) for i in xrange(100))
+        pickle_dict.save()
+        pickle_size = pickle_dict.path.size
+        saves = journal_size = 0
+        while True:
+            pickle_dict.data[u'key0'] = saves = saves + 1
+            pickle_dict.data[u'big'] = u'x' * 100 * saves
+            pickle_dict.save_keys({u'key0', u'big'})
+            assert self._loaded(tmpdir).data[u'key0'] == saves
+            if not pickle_dict.journal.exists(): break
+            journal_size = pickle_dict.journal.size
+        # the journal only got merged once it outgrew the pickle file
+        assert journal_size > pickle_size
+        assert pickle_dict.path.size > pickle_size
+        loaded = self._loaded(tmpdir)
+        assert loaded.data[u'big'] == u'x' * 100 * saves
+        assert len(loaded.data) == 101
+
+    def test_data_table_edited_in_place(self, tmpdir):
+        """Rows edited in place are only saved if hasChanged is set - which
+        must then save all rows, not just the ones journaled so far."""
+        table = DataTable(self._pickle_dict(tmpdir))
+        table.setItem(u'a.esp', u'installer', u'a.7z')
+        table.setItem(u'b.esp', u'installer', u'b.7z')
+        table.save()
+        table.setItem(u'a.esp', u'installer', u'c.7z')
+        table.data[u'b.esp'][u'installer'] = u'c.7z'
+        table.hasChanged = True
+        table.save()
+        assert not table.hasChanged
+        assert self._loaded(tmpdir).data == {
+            u'a.esp': {u'installer': u'c.7z'},
+            u'b.esp': {u'installer': u'c.7z'}}
+        # back to journaling the changed rows
+        table.setItem(u'a.esp', u'installer', u'd.7z')
+        table.save()
+        assert table.dictFile.journal.exists()
+        assert self._loaded(tmpdir).data[u'a.esp'] == {u'installer': u'd.7z'}
+
+class TestStringTable(object):
+    """Checks reading strings files, using files written by _write_strings.
+    Their extensions are lowercase, as Path.cext is only lowercase on
+    Windows."""
+
+    @pytest.fixture(autouse=True)
+    def _empty_cache(self, monkeypatch):
+        monkeypatch.setattr(bolt, u'_strings_files',
+                            collections.OrderedDict())
+
+    @staticmethod
+    def _write_strings(file_path, strings, formatted, encoding=u'utf-8',
+                       cut_size=None):
+        """Writes a strings file mapping the ids of strings to their values,
+        in the format of its extension - length prefixed if formatted. If
+        cut_size is given, only that many bytes of it are written."""
+        directory, data = [], b''
+        for string_id, string_value in sorted(strings.iteritems()):
+            directory.append(struct.pack(u'<2I', string_id, len(data)))
+            encoded = string_value.encode(encoding) + b'\0'
+            if formatted: encoded = struct.pack(u'<I', len(encoded)) + encoded
+            data += encoded
+        contents = struct.pack(u'<2I', len(strings), len(data)) + b''.join(
+            directory) + data
+        with open(file_path, u'wb') as out:
+            out.write(contents[:cut_size])
+        return GPath(file_path)
+
+    @staticmethod
+    def _load(*strings_paths, **kwargs):
+        string_table = StringTable()
+        for strings_path in strings_paths:
+            string_table.loadFile(strings_path, Progress(), **kwargs)
+        return string_table
+
+    _test_strings = {1: u'Iron Sword', 0x10: u'', 0x800: u'Épée de fer',
+                     0xFFFFFFFF: u'Меч'}
+
+    @pytest.mark.parametrize(u'strings_ext', [
+        u'.strings', u'.dlstrings', u'.ilstrings'])
+    def test_lookup(self, tmpdir, strings_ext):
+        strings_path = self._write_strings(
+            unicode(tmpdir.join(u'Test_English' + strings_ext)),
+            self._test_strings, strings_ext != u'.strings')
+        string_table = self._load(strings_path)
+        assert len(string_table) == len(self._test_strings)
+        assert set(string_table) == set(self._test_strings)
+        assert dict(string_table.items()) == self._test_strings
+        for string_id, string_value in self._test_strings.iteritems():
+            assert string_id in string_table
+            assert string_table[string_id] == string_value
+            assert string_table.get(string_id) == string_value
+        assert 2 not in string_table
+        assert string_table.get(2, u'default') == u'default'
+        with pytest.raises(KeyError):
+            string_table[2]
+        string_table.clear()
+        assert not string_table
+        assert string_table.get(1) is None
+
+    def test_backup_encoding(self, tmpdir):
+        """Strings that are not UTF-8 are decoded with the encoding of the
+        language."""
+        strings_path = self._write_strings(
+            unicode(tmpdir.join(u'Test_Russian.strings')),
+            {1: u'Меч', 2: u'Sword'}, False, encoding=u'cp1251')
+        string_table = self._load(strings_path, lang=u'Russian')
+        assert string_table[1] == u'Меч'
+        assert string_table[2] == u'Sword'
+
+    def test_later_files_take_precedence(self, tmpdir):
+        first_path = self._write_strings(
+            unicode(tmpdir.join(u'Test_English.strings')),
+            {1: u'first', 2: u'only first'}, False)
+        second_path = self._write_strings(
+            unicode(tmpdir.join(u'Test_English.dlstrings')),
+            {1: u'second', 3: u'only second'}, True)
+        string_table = self._load(first_path, second_path)
+        assert dict(string_table.items()) == {
+            1: u'second', 2: u'only first', 3: u'only second'}
+        assert len(string_table) == 3
+        assert self._load(second_path, first_path)[1] == u'first'
+
+    def test_cache_invalidation(self, tmpdir):
+        """Files are only parsed again once their size or modification time
+        changes."""
+        strings_path = self._write_strings(
+            unicode(tmpdir.join(u'Test_English.strings')), {1: u'old'}, False)
+        assert self._load(strings_path)[1] == u'old'
+        cached = bolt._strings_files[strings_path]
+        assert self._load(strings_path)[1] == u'old'
+        assert bolt._strings_files[strings_path] is cached # not parsed again
+        old_mtime = strings_path.mtime
+        # same size, new mtime
+        self._write_strings(strings_path.s, {1: u'new'}, False)
+        os.utime(strings_path.s, (old_mtime + 10, old_mtime + 10))
+        assert self._load(strings_path)[1] == u'new'
+        # new size, same mtime
+        self._write_strings(strings_path.s, {1: u'newer'}, False)
+        os.utime(strings_path.s, (old_mtime + 10, old_mtime + 10))
+        assert self._load(strings_path)[1] == u'newer'
+        # the encoding to fall back to is part of the key too
+        assert bolt._strings_files[strings_path] is not cached
+        cached = bolt._strings_files[strings_path]
+        self._load(strings_path, lang=u'Russian')
+        assert bolt._strings_files[strings_path] is not cached
+        # a file that is gone loads no strings
+        strings_path.remove()
+        assert not self._load(strings_path)
+
+    def test_cache_limit(self, tmpdir, monkeypatch):
+        """Once the cached files get too big, the least recently used ones
+        are dropped, but tables that loaded them can still use them."""
+        paths = [self._write_strings(
+            unicode(tmpdir.join(u'Test%d_English.strings' % i)),
+            {1: u'value %d' % i}, False) for i in range(3)]
+        monkeypatch.setattr(bolt, u'_strings_files_limit',
+                            paths[0].size * 2)
+        first_table = self._load(paths[0])
+        self._load(paths[1])
+        self._load(paths[0]) # now the most recently used one
+        self._load(paths[2])
+        assert list(bolt._strings_files) == [paths[0], paths[2]]
+        assert first_table[1] == u'value 0'
+        # a file too big for the cache is still cached, on its own
+        monkeypatch.setattr(bolt, u'_strings_files_limit', 1)
+        assert self._load(paths[1])[1] == u'value 1'
+        assert list(bolt._strings_files) == [paths[1]]
+
+    @pytest.mark.parametrize(u'formatted', [False, True])
+    def test_truncated_files(self, tmpdir, formatted):
+        strings_path = GPath(unicode(tmpdir.join(u'Test_English%s' % (
+            u'.dlstrings' if formatted else u'.strings'))))
+        strings = {1: u'Iron Sword', 2: u'Steel Sword'}
+        full_size = self._write_strings(strings_path.s, strings,
+                                        formatted).size
+        directory_end = 8 + 8 * len(strings)
+        # too small for the header, or the directory - nothing is loaded
+        for cut_size in (0, 7, directory_end - 1):
+            self._write_strings(strings_path.s, strings, formatted,
+                                cut_size=cut_size)
+            assert not self._load(strings_path)
+        # cut in the last string - the strings before it still load, and it
+        # is cut short
+        self._write_strings(strings_path.s, strings, formatted,
+                            cut_size=full_size - 3)
+        string_table = self._load(strings_path)
+        assert string_table[1] == u'Iron Sword'
+        assert string_table[2] == u'Steel Swo'
+        if formatted: # cut in the length prefix of the last string
+            self._write_strings(strings_path.s, strings, formatted,
+                                cut_size=directory_end + 4 + 11 + 2)
+            string_table = self._load(strings_path)
+            assert string_table[1] == u'Iron Sword'
+            assert string_table.get(2) is None
+
+class TestOrderedThreadMap(object):
+    """Checks that ordered_thread_map yields in order whatever order the
+    threads finish in, and stops them when the consumer stops."""
+
+    @staticmethod
+    def _slow_square(item):
+        time.sleep(random.random() / 200)
+        return item * item
+
+    def test_order(self):
+        for num_threads in (1, 3, 20):
+            assert list(ordered_thread_map(
+                self._slow_square, xrange(30), num_threads)) == [
+                i * i for i in xrange(30)]
+        assert list(ordered_thread_map(self._slow_square, [], 3)) == []
+
+    def test_exception_at_its_item(self):
+        def _fail_on_5(item):
+            if item == 5: raise ValueError(item)
+            return item
+        consumed = []
+        with pytest.raises(ValueError):
+            for result in ordered_thread_map(_fail_on_5, xrange(10), 3):
+                consumed.append(result)
+        assert consumed == range(5)
+
+    def test_max_ahead(self):
+        """No more than max_ahead results are calculated ahead of the
+        consumer."""
+        started = []
+        def _record(item):
+            started.append(item)
+            return item
+        for result in ordered_thread_map(_record, xrange(30), 4,
+                                         max_ahead=5):
+            time.sleep(0.002)
+            assert len(started) <= result + 1 + 5
+
+    def test_wait_callback_and_discard(self):
+        """wait_callback is called while waiting and may abort - the results
+        calculated ahead are then discarded, and no more are started."""
+        release = threading.Event()
+        started = []
+        def _wait_for_release(item):
+            started.append(item)
+            if item == 1: release.wait()
+            return item
+        waits, discarded = [], []
+        def _wait():
+            waits.append(True)
+            if len(waits) == 2:
+                release.set() # let the threads finish
+                raise ValueError
+        results = ordered_thread_map(_wait_for_release, xrange(100), 3,
+            max_ahead=3, wait_callback=_wait, discard=discarded.append)
+        assert next(results) == 0
+        with pytest.raises(ValueError):
+            next(results)
+        assert len(waits) == 2
+        assert len(started) <= 4
+        assert 1 in discarded
+        assert set(discarded) <= set(started) - {0}
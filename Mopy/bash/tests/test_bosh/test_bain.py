@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import collections
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+from ... import bass, bolt
+from ...bolt import GPath, Progress
+from ...bosh import bain, change_journal
+
+# Helper functions ------------------------------------------------------------
+@pytest.fixture()
+def bain_dirs(tmpdir, monkeypatch):
+    """Point the Data, Bash Mod Data and Bash Installers folders to a temp
+    dir - all on the same volume."""
+    root = GPath(tmpdir.strpath.decode(u'utf-8'))
+    for key, dir_name in ((u'mods', u'Data'), (u'modsBash', u'Bash Mod Data'),
+                          (u'installers', u'Bash Installers')):
+        dir_path = root.join(dir_name)
+        dir_path.makedirs()
+        monkeypatch.setitem(bass.dirs, key, dir_path)
+    monkeypatch.setitem(bass.inisettings, u'ExtractProcesses', 3)
+    return root
+
+class _MainThreadProgress(Progress):
+    """Records the states it is updated with - failing if that is done from
+    any thread but the main one, as a progress dialog would."""
+    def __init__(self):
+        Progress.__init__(self)
+        self.states = []
+        self._main_thread = threading.current_thread()
+
+    def _do_progress(self, state, message):
+        assert threading.current_thread() is self._main_thread
+        self.states.append((state, message))
+
+class _StagedInstaller(object):
+    """Stands in for an installer - stage_install makes a staging dir and
+    reports its progress from the thread it runs in."""
+    def __init__(self, archive):
+        self.archive = archive
+        self.threads = set()
+        self._stage_time = 0.0
+
+    def files_to_install(self, destFiles):
+        return {dest: dest for dest in destFiles}
+
+    def stage_install(self, dest_src, staging_root, progress=None):
+        self.threads.add(threading.current_thread())
+        for state in xrange(4):
+            progress(state / 4.0, self.archive)
+            time.sleep(self._stage_time / 4 or random.random() / 100)
+        return GPath(tempfile.mkdtemp(prefix=bain._STAGING_PREFIX,
+                                      dir=staging_root.s))
+
+def _stage_installs(installers, progress):
+    installers_data = bain.InstallersData.__new__(bain.InstallersData)
+    return installers_data._stage_installs(
+        [(installer, {u'%s.esp' % installer.archive})
+         for installer in installers], progress)
+
+# Tests -----------------------------------------------------------------------
+def test_stage_installs(bain_dirs):
+    """Archives are staged in background threads, in order, in Bash Mod Data
+    - as it is on the same volume as the Data folder - and progress is only
+    updated from the main thread."""
+    installers = [_StagedInstaller(u'Installer %d' % i) for i in xrange(8)]
+    # long enough for the installs to wait for it
+    installers[0]._stage_time = 0.4
+    progress = _MainThreadProgress().setFull(len(installers))
+    staged_dirs = []
+    for installer, (staged_installer, destFiles, (dest_src, staging_dir)) in \
+            zip(installers, _stage_installs(installers, progress)):
+        assert staged_installer is installer
+        assert dest_src == {u'%s.esp' % installer.archive: destFiles.pop()}
+        assert staging_dir.head == bass.dirs[u'modsBash']
+        staged_dirs.append(staging_dir)
+        time.sleep(0.02) # installing
+    assert all(installer.threads and threading.current_thread() not in
+               installer.threads for installer in installers)
+    assert len(set(staged_dirs)) == len(installers)
+    # the progress of the threads got through to the main thread
+    assert len({state for state, message in progress.states
+                if message == u'Installer 0'}) > 1
+
+def test_stage_installs_stopped_early(bain_dirs):
+    """The staging dirs of the archives staged ahead of an aborted install
+    are removed."""
+    installers = [_StagedInstaller(u'Installer %d' % i) for i in xrange(8)]
+    stage_results = _stage_installs(installers, _MainThreadProgress())
+    _installer, _destFiles, (_dest_src, staging_dir) = next(stage_results)
+    bain.Installer._rm_staging_dir(staging_dir)
+    stage_results.close()
+    assert not bass.dirs[u'modsBash'].list()
+
+def test_sweep_staging_dirs(bain_dirs):
+    """Staging dirs left behind by an earlier run are removed on startup -
+    and nothing else is."""
+    mods_bash = bass.dirs[u'modsBash']
+    leftover = mods_bash.join(u'wryebash_staging_abc')
+    leftover.join(u'Textures').makedirs()
+    with leftover.join(u'Textures', u'a.dds').open(u'wb') as out:
+        out.write(b'DDS ')
+    with (leftover + u'.txt').open(u'wb') as out:
+        out.write(b'Textures\\a.dds')
+    mods_bash.join(u'Kept').makedirs()
+    bain.Installer._sweep_staging_dirs()
+    assert mods_bash.list() == [GPath(u'Kept')]
+
+def test_rename_files(bain_dirs):
+    """Files are renamed into place, creating their folders - those that
+    can't be are left to the caller."""
+    staging_root = bass.dirs[u'modsBash']
+    data_dir = bass.dirs[u'mods']
+    assert bain._same_volume(staging_root.s, data_dir.s)
+    assert bain.InstallersData._staging_root() == staging_root
+    sources = [staging_root.join(u'a.esp'), staging_root.join(u'b.dds'),
+               staging_root.join(u'missing.esp')]
+    for src in sources[:2]:
+        with src.open(u'wb') as out:
+            out.write(src.stail.encode(u'utf-8'))
+    dests = [data_dir.join(u'a.esp'), data_dir.join(u'Textures', u'b.dds'),
+             data_dir.join(u'missing.esp')]
+    assert bain._rename_files(sources, dests) == ([sources[2]], [dests[2]])
+    for src, dest in zip(sources[:2], dests):
+        assert not src.exists()
+        with dest.open(u'rb') as ins:
+            assert ins.read() == src.stail.encode(u'utf-8')
+
+_LISTING = b'''Path = %s
+Type = 7z
+Solid = +
+Method = LZMA2:24
+
+Path = Data
+Size = 0
+Attributes = D
+CRC = 
+Method = 
+
+Path = Data\\a.esp
+Size = 5
+Attributes = A
+CRC = 0000ABCD
+Method = LZMA2:24
+
+Path = Data\\b.dds
+Size = 7
+Attributes = A
+CRC = 12345678
+Method = LZMA2:24
+'''
+
+def test_prefetch_listings(bain_dirs, monkeypatch):
+    """Archives are listed in background threads, in order - with None for
+    the ones that could not be listed."""
+    threads = set()
+    def _prefetch_listing(archive_path):
+        threads.add(threading.current_thread())
+        time.sleep(random.random() / 100)
+        if archive_path.stail == u'Bad.7z': raise OSError
+        return archive_path.s, _LISTING % archive_path.s
+    monkeypatch.setattr(bain.InstallerArchive, u'prefetch_listing',
+                        staticmethod(_prefetch_listing))
+    archives = [GPath(u'Archive %d.7z' % i) for i in xrange(6)]
+    archives.insert(3, GPath(u'Bad.7z'))
+    installers_dir = bass.dirs[u'installers']
+    assert list(bain.InstallersData._prefetch_listings(
+        archives, Progress())) == [
+        None if a.s == u'Bad.7z' else (installers_dir.join(a).s,
+                                       _LISTING % installers_dir.join(a).s)
+        for a in archives]
+    assert threads and threading.current_thread() not in threads
+
+def test_refresh_source_from_listing(bain_dirs, monkeypatch):
+    """A prefetched listing is used (once) instead of listing the archive
+    again."""
+    def _no_7z(archive_path):
+        raise AssertionError(u'listed %s again' % archive_path)
+    monkeypatch.setattr(bain, u'archive_listing', _no_7z)
+    archive = GPath(u'Test.7z')
+    archive_path = bass.dirs[u'installers'].join(archive)
+    with archive_path.open(u'wb') as out:
+        out.write(b'7z')
+    installer = bain.InstallerArchive(archive)
+    monkeypatch.setattr(bain.InstallerArchive, u'_listings', {
+        archive_path: (archive_path.s, _LISTING % archive_path.s)})
+    installer._refreshSource(Progress(), False)
+    assert installer.fileSizeCrcs == [(u'Data\\a.esp', 5, 0xABCD),
+                                      (u'Data\\b.dds', 7, 0x12345678)]
+    assert installer.isSolid
+    assert installer.crc == 0xABCD + 0x12345678
+    assert not bain.InstallerArchive._listings
+
+@pytest.fixture()
+def data_scan(bain_dirs, monkeypatch):
+    """An InstallersData that scans the temp Data folder using a fresh CRC
+    cache and change journal."""
+    from ... import bosh
+    from ...bosh.change_journal import make_change_journal
+    from ...bosh.crc_cache import CrcCache
+    settings = dict.fromkeys([u'bash.installers.allowOBSEPlugins',
+        u'bash.installers.skipDocs', u'bash.installers.skipImages',
+        u'bash.installers.skipDistantLOD',
+        u'bash.installers.skipLandscapeLODMeshes',
+        u'bash.installers.skipScreenshots',
+        u'bash.installers.skipLandscapeLODTextures',
+        u'bash.installers.skipLandscapeLODNormals'], False)
+    settings[u'bash.installers.autoRefreshBethsoft'] = True
+    settings[u'bash.installers.removeEmptyDirs'] = True # i.e. keep them
+    monkeypatch.setattr(bass, u'settings', settings)
+    monkeypatch.setitem(bass.inisettings, u'CrcThreads', 2)
+    monkeypatch.setattr(bosh, u'crcCache', CrcCache(
+        bass.dirs[u'mods'], bass.dirs[u'modsBash'].join(u'CRC Cache.dat')))
+    journal = make_change_journal()
+    monkeypatch.setattr(bosh, u'changeJournal', journal)
+    installers_data = bain.InstallersData.__new__(bain.InstallersData)
+    installers_data.data_sizeCrcDate = bolt.LowerDict()
+    installers_data._journal_skips_state = None
+    installers_data._InstallersData__clean_overridden_after_load = False
+    yield installers_data
+    if journal is not None and not journal._broken: journal._close()
+
+def _rel_paths(*rel_paths):
+    """Returns the sorted Data relative paths, with the separators of the
+    OS."""
+    return sorted(p.replace(u'\\', os.sep) for p in rel_paths)
+
+def _data_files(*rel_paths):
+    data_dir = bass.dirs[u'mods']
+    for rel_path in _rel_paths(*rel_paths):
+        data_dir.join(rel_path).head.makedirs()
+        with data_dir.join(rel_path).open(u'wb') as out:
+            out.write(rel_path.encode(u'utf-8'))
+
+@pytest.mark.skipif(not sys.platform.startswith(u'linux'),
+                    reason=u'the change journal needs inotify here')
+def test_rescan_data_dirs(data_scan, monkeypatch):
+    """Once the Data folder was walked only the directories that changed are
+    rescanned - and the CRCs of the files deleted from them are dropped from
+    the CRC cache. If the change journal overflows, Data is walked again."""
+    from ... import bosh
+    _data_files(u'meshes\\a.nif', u'meshes\\b.nif', u'textures\\c.dds',
+                u'sound\\d.wav')
+    walks = []
+    walk_data_dir = data_scan._walk_data_dir
+    def _walk_data_dir(*args):
+        walks.append(args)
+        return walk_data_dir(*args)
+    monkeypatch.setattr(data_scan, u'_walk_data_dir', _walk_data_dir)
+    assert data_scan._refresh_from_data_dir(Progress())
+    assert len(walks) == 1
+    assert sorted(bosh.crcCache._load()) == _rel_paths(u'meshes\\a.nif',
+        u'meshes\\b.nif', u'sound\\d.wav', u'textures\\c.dds')
+    assert not data_scan._refresh_from_data_dir(Progress())
+    bass.dirs[u'mods'].join(u'meshes', u'b.nif').remove()
+    _data_files(u'meshes\\e.nif')
+    assert data_scan._refresh_from_data_dir(Progress())
+    assert len(walks) == 1
+    assert sorted(data_scan.data_sizeCrcDate) == sorted(
+        bosh.crcCache._load()) == _rel_paths(u'meshes\\a.nif',
+        u'meshes\\e.nif', u'sound\\d.wav', u'textures\\c.dds')
+    bosh.changeJournal._record(-1, change_journal._IN_Q_OVERFLOW, b'')
+    bass.dirs[u'mods'].join(u'sound', u'd.wav').remove()
+    assert data_scan._refresh_from_data_dir(Progress())
+    assert len(walks) == 2
+    assert sorted(bosh.crcCache._load()) == _rel_paths(u'meshes\\a.nif',
+        u'meshes\\e.nif', u'textures\\c.dds')
+
+class _OwningInstaller(object):
+    """Stands in for an installer - just the attributes the ownership index
+    and bain_anneal look at."""
+    def __init__(self, archive, order, rng):
+        self.archive = archive
+        self.order = order
+        self.is_active = rng.random() < 0.7
+        self.underrides, self.missingFiles = set(), set()
+        self.dirty_sizeCrc = {}
+        self.refresh_files(rng)
+
+    def refresh_files(self, rng):
+        """Replaces ci_dest_sizeCrc, as refreshDataSizeCrc does."""
+        self.ci_dest_sizeCrc = bolt.SizeCrcTable(2, (
+            (u'%s\\file%d.nif' % (rng.choice([u'Meshes', u'meshes']), f),
+             (1, rng.randint(0, 2))) for f in rng.sample(xrange(40), 12)))
+
+def _check_ownership(ownership, installers):
+    """Checks the index against the owners and norms found by looking at
+    each installer, as BAIN did before it had an index."""
+    all_dests = {d.lower() for i in installers for d in i.ci_dest_sizeCrc}
+    all_dests.add(u'meshes\\missing.nif')
+    for dest in all_dests:
+        owners = [(i, i.ci_dest_sizeCrc[dest]) for i in sorted(
+            installers, key=lambda i: i.order) if dest in i.ci_dest_sizeCrc]
+        assert [(i, sizeCrc) for i, _ci_dest, sizeCrc in
+                ownership.get_owners(dest.upper())] == owners
+        active = [o for o in owners if o[0].is_active]
+        norm = ownership.get_norm(dest)
+        assert (norm[0], norm[2]) == active[-1] if active else norm is None
+    assert len(list(ownership.iter_norm())) == len(
+        {d.lower() for i in installers if i.is_active
+         for d in i.ci_dest_sizeCrc})
+
+def test_ownership_index():
+    """After any sequence of refreshes, (de)activations, reorders, additions
+    and removals of installers the index matches the installers."""
+    rng = random.Random(11)
+    installers = [_OwningInstaller(u'%d' % i, i, rng) for i in xrange(8)]
+    ownership = bain._OwnershipIndex()
+    for step in xrange(200):
+        action = rng.randint(0, 5)
+        if action == 0:
+            rng.choice(installers).refresh_files(rng)
+        elif action == 1:
+            installer = rng.choice(installers)
+            installer.is_active = not installer.is_active
+        elif action == 2:
+            orders = [i.order for i in installers]
+            rng.shuffle(orders)
+            for installer, order in zip(installers, orders):
+                installer.order = order
+        elif action == 3 and len(installers) > 2:
+            installers.remove(rng.choice(installers))
+        elif action == 4:
+            installers.append(_OwningInstaller(
+                u'new %d' % step, max(i.order for i in installers) + 1, rng))
+        ownership.sync(installers)
+        _check_ownership(ownership, installers)
+
+def test_ownership_index_edited_table():
+    """A table edited in place instead of replaced is caught if its size
+    changed."""
+    rng = random.Random(12)
+    installers = [_OwningInstaller(u'%d' % i, i, rng) for i in xrange(4)]
+    ownership = bain._OwnershipIndex()
+    ownership.sync(installers)
+    dest_sizeCrc = installers[1].ci_dest_sizeCrc
+    del dest_sizeCrc[next(iter(dest_sizeCrc))]
+    dest_sizeCrc[u'meshes\\added.nif'] = (1, 3)
+    dest_sizeCrc[u'meshes\\added2.nif'] = (1, 3)
+    ownership.sync(installers)
+    _check_ownership(ownership, installers)
+
+def test_anneal_matches_restore(monkeypatch):
+    """bain_anneal, which only looks at the owners of the files to remove,
+    restores and cedes the same files as going through all installers with
+    __restore did."""
+    rng = random.Random(13)
+    installers_data = bain.InstallersData.__new__(bain.InstallersData)
+    installers = [_OwningInstaller(u'%d' % i, i, rng) for i in xrange(10)]
+    installers_data.data = {GPath(i.archive): i for i in installers}
+    installers_data._ownership = bain._OwnershipIndex()
+    all_dests = sorted({d for i in installers for d in i.ci_dest_sizeCrc})
+    installers_data.data_sizeCrcDate = bolt.SizeCrcTable(3, (
+        (d, (1, rng.randint(0, 2), 0)) for d in rng.sample(all_dests, 30)))
+    for installer in installers:
+        installer.underrides.update(rng.sample(all_dests, 5))
+        installer.missingFiles.update(rng.sample(all_dests, 3))
+        installer.dirty_sizeCrc.update((d, (1, 0)) for d in rng.sample(
+            all_dests, 2))
+    # what it looked like before the index
+    removes = set()
+    for installer in installers:
+        removes |= installer.underrides
+        if installer.is_active:
+            removes |= installer.missingFiles
+            removes |= set(installer.dirty_sizeCrc)
+    restores = bolt.LowerDict()
+    cede_ownership = collections.defaultdict(set)
+    for installer in installers_data.sorted_values(reverse=True):
+        if installer.is_active:
+            installers_data._InstallersData__restore(
+                installer, removes, restores, cede_ownership)
+    results = []
+    monkeypatch.setattr(installers_data, u'_remove_restore',
+                        lambda *args: results.append(args))
+    installers_data.bain_anneal(None, [False, False])
+    annealed_removes, annealed_restores, _refresh_ui, annealed_cede = \
+        results[0][:4]
+    assert annealed_removes == removes
+    assert dict(annealed_restores) == dict(restores)
+    assert annealed_cede == cede_ownership
+    assert restores and cede_ownership and removes # all cases were hit
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import os
+import random
+
+import pytest
+
+from ... import bass
+from ...bolt import GPath
+from ...bosh import bsa_files
+from ...bosh.dds_files import DDSFile, mk_dxgi_fmt, _DDSPF_A8R8G8B8, \
+    _DDSPF_DXT1, _DDSPF_DXT5, _DDSPF_DXT10
+
+# Helper functions ------------------------------------------------------------
+@pytest.fixture(autouse=True)
+def _bsa_threads(monkeypatch):
+    """Packs in a few threads, so that the writers have to keep the records
+    in order."""
+    monkeypatch.setitem(bass.inisettings, u'BsaThreads', 3)
+
+def _make_assets(src_dir, asset_datas):
+    """Writes each of the (asset path, data) pairs to a loose file in
+    src_dir, returning the assets dict write_bsa takes."""
+    assets = {}
+    for i, (asset_path, data) in enumerate(asset_datas):
+        src_path = os.path.join(src_dir, u'%d%s' % (
+            i, os.path.splitext(asset_path)[1]))
+        with open(src_path, u'wb') as out:
+            out.write(data)
+        assets[asset_path] = src_path
+    return assets
+
+def _random_assets(src_dir):
+    """Assets of all kinds and sizes - empty, compressible and not,
+    incompressible sounds - in several folders."""
+    rng = random.Random(16)
+    asset_datas = []
+    for i in xrange(200):
+        folder = rng.choice([u'meshes\\armor', u'textures\\clutter\\food',
+                             u'sound\\fx', u'interface'])
+        ext = rng.choice([u'.nif', u'.dds', u'.wav', u'.txt', u'.kf'])
+        if rng.random() < 0.6:
+            data = b'wrye bash' * rng.randint(0, 2000)
+        else:
+            data = bytes(bytearray(rng.getrandbits(8) for _i in
+                                   xrange(rng.randint(0, 3000))))
+        asset_datas.append((u'%s\\file%d%s' % (folder, i, ext), data))
+    return _make_assets(src_dir, asset_datas)
+
+def _read_file(file_path):
+    with open(file_path, u'rb') as ins:
+        return ins.read()
+
+def _check_round_trip(bsa_type, bsa_path, assets, out_dir):
+    """Reads back the archive at bsa_path - its names, records and, by
+    extracting all of it, its data - and checks they match assets."""
+    assert bsa_type(bsa_path, load_cache=True).assets == frozenset(
+        os.path.normcase(a) for a in assets)
+    loaded = bsa_type(bsa_path)
+    loaded._load_bsa()
+    assert sorted(u'%s\\%s' % (folder, f) for folder, bsa_folder
+                  in loaded.bsa_folders.iteritems()
+                  for f in bsa_folder.folder_assets) == sorted(assets)
+    bsa_type(bsa_path).extract_assets(list(assets), out_dir)
+    for asset_path, src_path in assets.iteritems():
+        extracted = os.path.join(out_dir, *asset_path.split(u'\\'))
+        assert _read_file(extracted) == _read_file(src_path), asset_path
+
+# Tests -----------------------------------------------------------------------
+@pytest.mark.parametrize(u'bsa_type', [
+    bsa_files.BSA, bsa_files.OblivionBsa, bsa_files.SkyrimSeBsa,
+    bsa_files.BA2])
+@pytest.mark.parametrize(u'compress', [True, False])
+def test_write_read_round_trip(tmpdir, bsa_type, compress):
+    """Packs loose files, then reads them back from the archive."""
+    tmp_dir = unicode(tmpdir)
+    src_dir = os.path.join(tmp_dir, u'src')
+    os.makedirs(src_dir)
+    assets = _random_assets(src_dir)
+    bsa_path = os.path.join(tmp_dir, u'test%s' % (
+        u'.ba2' if bsa_type is bsa_files.BA2 else u'.bsa'))
+    bsa_type.write_bsa(bsa_path, assets, compress=compress)
+    assert not GPath(bsa_path).temp.exists()
+    _check_round_trip(bsa_type, bsa_path, assets,
+                      os.path.join(tmp_dir, u'out'))
+
+@pytest.mark.parametrize(u'bsa_type', [bsa_files.BSA, bsa_files.OblivionBsa])
+def test_written_hashes(tmpdir, bsa_type):
+    """The hashes written to BSAs match the ones calculated from the names,
+    so BSA Alteration has nothing to undo."""
+    tmp_dir = unicode(tmpdir)
+    src_dir = os.path.join(tmp_dir, u'src')
+    os.makedirs(src_dir)
+    bsa_path = os.path.join(tmp_dir, u'test.bsa')
+    bsa_type.write_bsa(bsa_path, _random_assets(src_dir))
+    loaded = bsa_type(bsa_path)
+    loaded._load_bsa()
+    for folder, bsa_folder in loaded.bsa_folders.iteritems():
+        assert bsa_folder.folder_record.record_hash == \
+            bsa_type.calculate_folder_hash(folder)
+        for file_name, file_record in bsa_folder.folder_assets.iteritems():
+            assert file_record.record_hash == bsa_type.calculate_hash(
+                file_name)
+    if bsa_type is bsa_files.OblivionBsa:
+        assert loaded.undo_alterations() == 0
+
+def _dds_data(width, height, num_mips, ddspf, dxgi_index=None):
+    """Returns the contents of a DDS file with the specified dimensions and
+    format - a DX10 one if dxgi_index is given."""
+    dds_file = DDSFile(u'')
+    dds_header = dds_file.dds_header
+    dds_header.dw_width, dds_header.dw_height = width, height
+    dds_header.dw_mip_map_count = num_mips
+    dds_header.ddspf = ddspf
+    if dxgi_index is None:
+        dxgi_fmt = dds_file.get_dxgi_format()
+    else:
+        dxgi_fmt = mk_dxgi_fmt(dxgi_index)
+        dds_file.dds_dxt10.dxgi_format = dxgi_fmt
+        dds_file.dds_dxt10.resource_dimension = 3 # 2D texture
+        dds_file.dds_dxt10.array_size = 1
+    contents_size = sum(dxgi_fmt.slice_pitch(max(width >> m, 1),
+                                             max(height >> m, 1))
+                        for m in xrange(num_mips))
+    rng = random.Random(width)
+    dds_file.dds_contents = bytes(bytearray(
+        rng.getrandbits(8) for _i in xrange(contents_size // 2))) + \
+        b'\0' * (contents_size - contents_size // 2)
+    return dds_file.dump_file()
+
+@pytest.mark.parametrize(u'compress', [True, False])
+def test_write_read_dx10_round_trip(tmpdir, compress):
+    """Packs textures of several formats and sizes into a texture BA2, then
+    reads them back - big textures are split into several chunks."""
+    tmp_dir = unicode(tmpdir)
+    src_dir = os.path.join(tmp_dir, u'src')
+    os.makedirs(src_dir)
+    assets = _make_assets(src_dir, [
+        (u'textures\\armor\\big_d.dds', _dds_data(2048, 1024, 12,
+                                                  _DDSPF_DXT1)),
+        (u'textures\\armor\\small_n.dds', _dds_data(64, 64, 7, _DDSPF_DXT5)),
+        (u'textures\\rgba.dds', _dds_data(512, 512, 10, _DDSPF_A8R8G8B8)),
+        (u'textures\\bc7.dds', _dds_data(1024, 1024, 11, _DDSPF_DXT10,
+                                         dxgi_index=98)), # BC7_UNORM
+    ])
+    bsa_path = os.path.join(tmp_dir, u'test - textures.ba2')
+    bsa_files.BA2.write_bsa(bsa_path, assets, compress=compress, dx10=True)
+    out_dir = os.path.join(tmp_dir, u'out')
+    bsa_files.BA2(bsa_path).extract_assets(list(assets), out_dir)
+    for asset_path, src_path in assets.iteritems():
+        src_dds, extracted_dds = DDSFile(GPath(src_path)), DDSFile(GPath(
+            os.path.join(out_dir, *asset_path.split(u'\\'))))
+        src_dds.load_file()
+        extracted_dds.load_file()
+        assert extracted_dds.dds_contents == src_dds.dds_contents, asset_path
+        assert extracted_dds.dds_header.dw_width == \
+            src_dds.dds_header.dw_width
+        assert extracted_dds.dds_header.dw_mip_map_count == \
+            src_dds.dds_header.dw_mip_map_count
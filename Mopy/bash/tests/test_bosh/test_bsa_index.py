@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import os
+
+import pytest
+
+from ... import bass
+from ...bolt import GPath
+from ...bosh import bsa_files
+from ...bosh.bsa_index import BsaIndex
+from .test_bsa_files import _make_assets, _random_assets, _read_file
+
+_BSA_TYPES = [bsa_files.BSA, bsa_files.OblivionBsa, bsa_files.SkyrimSeBsa,
+              bsa_files.BA2]
+
+# Helper functions ------------------------------------------------------------
+@pytest.fixture(autouse=True)
+def _bsa_threads(monkeypatch):
+    monkeypatch.setitem(bass.inisettings, u'BsaThreads', 3)
+
+def _bsa_ext(bsa_type):
+    return u'.ba2' if bsa_type is bsa_files.BA2 else u'.bsa'
+
+def _indexed_type(bsa_type, bsa_index):
+    """Returns a subclass of bsa_type that gets its index from bsa_index,
+    like the BSAInfos of bosh do."""
+    class _Indexed(bsa_type):
+        def _get_index(self):
+            return bsa_index.get_index(self)
+    return _Indexed
+
+@pytest.fixture
+def bsa_dir(tmpdir):
+    tmp_dir = unicode(tmpdir)
+    os.makedirs(os.path.join(tmp_dir, u'src'))
+    return tmp_dir
+
+def _no_reads(bsa_type, monkeypatch):
+    """Makes reading the index of bsa_type fail, so that only cached indices
+    can be used."""
+    def _fail(self): raise AssertionError(u'read the index of %s' % self)
+    monkeypatch.setattr(bsa_type, u'_read_index', _fail)
+
+# Tests -----------------------------------------------------------------------
+@pytest.mark.parametrize(u'bsa_type', _BSA_TYPES)
+def test_cached_index(bsa_dir, bsa_type, monkeypatch):
+    """The cached index is the one read_index returns and is used as long as
+    the archive does not change - after a save and reload too."""
+    bsa_path = os.path.join(bsa_dir, u'test%s' % _bsa_ext(bsa_type))
+    bsa_type.write_bsa(bsa_path, _random_assets(os.path.join(bsa_dir,
+                                                             u'src')))
+    cache_path = GPath(os.path.join(bsa_dir, u'BSA Index.dat'))
+    bsa_index = BsaIndex(cache_path)
+    read_index = bsa_type(bsa_path).read_index()
+    assert bsa_index.get_index(bsa_type(bsa_path)) == read_index
+    bsa_index.save()
+    _no_reads(bsa_type, monkeypatch)
+    assert bsa_index.get_index(bsa_type(bsa_path)) == read_index
+    assert BsaIndex(cache_path).get_index(bsa_type(bsa_path)) == read_index
+
+@pytest.mark.parametrize(u'bsa_type', _BSA_TYPES)
+def test_extract_from_cached_index(bsa_dir, bsa_type, monkeypatch):
+    """_read_wanted_records finds the records of some of the assets of an
+    archive using its cached index."""
+    assets = _random_assets(os.path.join(bsa_dir, u'src'))
+    bsa_path = os.path.join(bsa_dir, u'test%s' % _bsa_ext(bsa_type))
+    bsa_type.write_bsa(bsa_path, assets)
+    bsa_index = BsaIndex(GPath(os.path.join(bsa_dir, u'BSA Index.dat')))
+    indexed_type = _indexed_type(bsa_type, bsa_index)
+    bsa_index.get_index(indexed_type(bsa_path))
+    _no_reads(bsa_type, monkeypatch)
+    wanted = sorted(assets)[::7]
+    out_dir = os.path.join(bsa_dir, u'out')
+    indexed_type(bsa_path).extract_assets(wanted, out_dir)
+    for asset_path in wanted:
+        extracted = os.path.join(out_dir, *asset_path.split(u'\\'))
+        assert _read_file(extracted) == _read_file(assets[asset_path])
+    extracted_files = {os.path.join(root, f) for root, _dirs, files
+                       in os.walk(out_dir) for f in files}
+    assert len(extracted_files) == len(wanted)
+    assert indexed_type(bsa_path).assets == frozenset(
+        os.path.normcase(a) for a in assets)
+
+@pytest.mark.parametrize(u'bsa_type', _BSA_TYPES)
+def test_replaced_archive_same_size_and_mtime(bsa_dir, bsa_type):
+    """An archive replaced by one of the same size whose mtime was reset to
+    the one of the old archive - as Bash does for BSAs - gets a new index."""
+    src_dir = os.path.join(bsa_dir, u'src')
+    bsa_path = os.path.join(bsa_dir, u'test%s' % _bsa_ext(bsa_type))
+    data = [b'wrye bash %d' % i * 50 for i in xrange(10)]
+    bsa_type.write_bsa(bsa_path, _make_assets(src_dir, [
+        (u'meshes\\old%d.nif' % i, d) for i, d in enumerate(data)]))
+    os.utime(bsa_path, (1136070000, 1136070000)) # like ResetBSATimestamps
+    old_stat = os.stat(bsa_path)
+    bsa_index = BsaIndex(GPath(os.path.join(bsa_dir, u'BSA Index.dat')))
+    old_index = bsa_index.get_index(bsa_type(bsa_path))
+    bsa_type.write_bsa(bsa_path, _make_assets(src_dir, [
+        (u'meshes\\new%d.nif' % i, d) for i, d in enumerate(data)]))
+    os.utime(bsa_path, (1136070000, 1136070000))
+    new_stat = os.stat(bsa_path)
+    assert (new_stat.st_size, new_stat.st_mtime) == (
+        old_stat.st_size, old_stat.st_mtime)
+    new_index = bsa_index.get_index(bsa_type(bsa_path))
+    assert new_index != old_index
+    assert new_index == bsa_type(bsa_path).read_index()
+    assert u'new0.nif' in new_index[0]
+
+def test_retain_and_missing(bsa_dir):
+    """retain drops the indices of all other archives, and so does asking
+    for the index of an archive that was deleted."""
+    src_dir = os.path.join(bsa_dir, u'src')
+    bsa_paths = [os.path.join(bsa_dir, u'test%d.bsa' % i) for i in xrange(3)]
+    for i, bsa_path in enumerate(bsa_paths):
+        bsa_files.BSA.write_bsa(bsa_path, _make_assets(src_dir, [
+            (u'meshes\\foo%d.nif' % i, b'foo')]))
+    cache_path = GPath(os.path.join(bsa_dir, u'BSA Index.dat'))
+    bsa_index = BsaIndex(cache_path)
+    for bsa_path in bsa_paths:
+        bsa_index.get_index(bsa_files.BSA(bsa_path))
+    bsa_index.retain(p.upper() for p in bsa_paths[1:])
+    bsa_index.save()
+    bsa_index = BsaIndex(cache_path)
+    assert sorted(bsa_index._load()) == [p.lower() for p in bsa_paths[1:]]
+    os.remove(bsa_paths[1])
+    with pytest.raises(IOError):
+        bsa_index.get_index(bsa_files.BSA(bsa_paths[1]))
+    assert sorted(bsa_index._load()) == [bsa_paths[2].lower()]
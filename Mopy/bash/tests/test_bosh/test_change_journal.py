@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import os
+import shutil
+import sys
+
+import pytest
+
+from ...bosh import change_journal
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith(u'linux'),
+                                reason=u'inotify is only available on Linux')
+
+# Helper functions ------------------------------------------------------------
+@pytest.fixture
+def journal():
+    """An inotify journal, closed once the test is done."""
+    inotify_journal = change_journal.make_change_journal()
+    assert isinstance(inotify_journal, change_journal._InotifyJournal)
+    yield inotify_journal
+    if not inotify_journal._broken: inotify_journal._close()
+
+@pytest.fixture
+def root(tmpdir):
+    """A tree with a couple of directories and files to watch."""
+    root_dir = tmpdir.strpath.decode(u'utf-8')
+    for dir_path in (u'meshes', os.path.join(u'textures', u'armor')):
+        os.makedirs(os.path.join(root_dir, dir_path))
+    for file_path in (u'a.esp', os.path.join(u'meshes', u'b.nif'),
+                      os.path.join(u'textures', u'armor', u'c.dds')):
+        _write(os.path.join(root_dir, file_path))
+    return root_dir
+
+def _write(file_path, data=b'data'):
+    with open(file_path, u'wb') as out:
+        out.write(data)
+
+def _walk(journal, root):
+    """Walks root the way the consumers do the first time, returning the
+    directories found."""
+    assert journal.dirty_dirs(u'test', root) is None
+    found = [d for d, _sDirs, _sFiles in journal.walk(root)]
+    journal.mark_clean(u'test', root)
+    return found
+
+def _dirty(journal, root):
+    """Returns the directories that changed under root (relative to it) and
+    marks them clean."""
+    dirty = journal.dirty_dirs(u'test', root)
+    journal.mark_clean(u'test', root)
+    if dirty is None: return None
+    return {os.path.relpath(d, root): deep for d, deep in dirty.iteritems()}
+
+# Tests -----------------------------------------------------------------------
+def test_walk_then_nothing_changed(journal, root):
+    """The first time a consumer asks it has to walk the root, after that it
+    is told nothing changed - until something does."""
+    assert len(_walk(journal, root)) == 4
+    assert _dirty(journal, root) == {}
+    assert _dirty(journal, root) == {}
+
+def test_create_and_modify_files(journal, root):
+    _walk(journal, root)
+    _write(os.path.join(root, u'textures', u'armor', u'new.dds'))
+    assert _dirty(journal, root) == {os.path.join(u'textures', u'armor'):
+                                     False}
+    _write(os.path.join(root, u'meshes', u'b.nif'), b'changed')
+    _write(os.path.join(root, u'a.esp'), b'changed')
+    assert _dirty(journal, root) == {u'meshes': False, u'.': False}
+    assert _dirty(journal, root) == {}
+
+def test_create_directory(journal, root):
+    """New directories are rescanned whole and watched from then on."""
+    _walk(journal, root)
+    new_dir = os.path.join(root, u'meshes', u'new')
+    os.makedirs(os.path.join(new_dir, u'sub'))
+    assert _dirty(journal, root) == {u'meshes': False,
+                                     os.path.join(u'meshes', u'new'): True}
+    _write(os.path.join(new_dir, u'sub', u'd.nif'))
+    assert _dirty(journal, root) == {
+        os.path.join(u'meshes', u'new', u'sub'): False}
+
+def test_delete(journal, root):
+    _walk(journal, root)
+    os.remove(os.path.join(root, u'meshes', u'b.nif'))
+    assert _dirty(journal, root) == {u'meshes': False}
+    shutil.rmtree(os.path.join(root, u'textures'))
+    dirty = _dirty(journal, root)
+    assert dirty[u'.'] is False
+    assert dirty[u'textures'] is True
+    assert _dirty(journal, root) == {}
+
+def test_move_within_and_out(journal, root):
+    """Directories moved within the root are rescanned at both ends and stay
+    watched, ones moved out of it are not watched anymore."""
+    _walk(journal, root)
+    os.rename(os.path.join(root, u'textures', u'armor'),
+              os.path.join(root, u'meshes', u'armor'))
+    assert _dirty(journal, root) == {
+        u'textures': False, os.path.join(u'textures', u'armor'): True,
+        u'meshes': False, os.path.join(u'meshes', u'armor'): True}
+    _write(os.path.join(root, u'meshes', u'armor', u'e.dds'))
+    assert _dirty(journal, root) == {os.path.join(u'meshes', u'armor'):
+                                     False}
+    outside = root + u'_outside'
+    os.rename(os.path.join(root, u'meshes'), outside)
+    try:
+        assert _dirty(journal, root) == {u'.': False, u'meshes': True}
+        _write(os.path.join(outside, u'armor', u'f.dds'))
+        _write(os.path.join(outside, u'g.nif'))
+        assert _dirty(journal, root) == {}
+        assert not [p for p in journal._path_wds if p.startswith(outside)]
+    finally:
+        shutil.rmtree(outside)
+
+def test_overflow_falls_back_to_walk(journal, root):
+    """If the event queue of the OS overflows the consumers have to walk
+    their roots again - after which the journal is trusted again."""
+    _walk(journal, root)
+    _write(os.path.join(root, u'meshes', u'h.nif'))
+    journal._record(-1, change_journal._IN_Q_OVERFLOW, b'')
+    _walk(journal, root)
+    assert _dirty(journal, root) == {}
+    _write(os.path.join(root, u'meshes', u'i.nif'))
+    assert _dirty(journal, root) == {u'meshes': False}
+
+def test_consumers_are_independent(journal, root):
+    """Each consumer keeps its own dirty directories."""
+    _walk(journal, root)
+    assert journal.dirty_dirs(u'other', root) is None
+    list(journal.walk(root))
+    journal.mark_clean(u'other', root)
+    _write(os.path.join(root, u'meshes', u'j.nif'))
+    assert _dirty(journal, root) == {u'meshes': False}
+    assert journal.dirty_dirs(u'other', root) == {
+        os.path.join(root, u'meshes'): False}
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import os
+import random
+
+import pytest
+
+from ... import bass
+from ...bolt import GPath, Progress
+from ...bosh import crc_cache
+from ...exception import CancelError
+
+# Helper functions ------------------------------------------------------------
+@pytest.fixture(autouse=True)
+def _crc_threads(monkeypatch):
+    """Small blocks and a few threads, so files are read in several blocks by
+    several threads."""
+    monkeypatch.setitem(bass.inisettings, u'CrcThreads', 3)
+    monkeypatch.setattr(crc_cache, u'_BLOCK_SIZE', 1024)
+
+@pytest.fixture
+def data_dir(tmpdir):
+    data_path = GPath(tmpdir.strpath.decode(u'utf-8')).join(u'Data')
+    data_path.join(u'meshes').makedirs()
+    return data_path
+
+def _write(file_path, data):
+    with open(u'%s' % file_path, u'wb') as out:
+        out.write(data)
+
+def _random_files(dir_path, num_files, max_size=10000):
+    """Writes files of random sizes (empty ones too) to dir_path, returning
+    their absolute paths."""
+    rng = random.Random(num_files)
+    file_paths = []
+    for i in xrange(num_files):
+        file_path = dir_path.join(u'file%d.bin' % i).s
+        _write(file_path, bytes(bytearray(
+            rng.getrandbits(8) for _i in xrange(rng.randint(0, max_size)))))
+        file_paths.append(file_path)
+    return file_paths
+
+class _CountingCalc(object):
+    """Wraps _calc_crc, recording the files whose CRCs got calculated."""
+    def __init__(self, monkeypatch):
+        self.calculated = []
+        self._calc_crc = crc_cache._calc_crc
+        monkeypatch.setattr(crc_cache, u'_calc_crc', self)
+
+    def __call__(self, abs_path, blocks_read, cancelled):
+        self.calculated.append(abs_path)
+        return self._calc_crc(abs_path, blocks_read, cancelled)
+
+    def pop(self):
+        calculated, self.calculated = self.calculated, []
+        return sorted(calculated)
+
+def _crc_cache(data_dir):
+    return crc_cache.CrcCache(data_dir,
+                              data_dir.head.join(u'CRC Cache.dat'))
+
+# Tests -----------------------------------------------------------------------
+def test_calc_crcs(data_dir):
+    """The CRCs match the ones of Path.crc, files that can't be read are
+    left out and the progress gets to the total size of the files."""
+    file_paths = _random_files(data_dir, 40)
+    missing = data_dir.join(u'missing.bin').s
+    progress = Progress()
+    path_sizes = {p: os.path.getsize(p) for p in file_paths}
+    path_sizes[missing] = 100
+    path_crcs = crc_cache.calc_crcs(path_sizes, progress, u'CRCs\n')
+    assert path_crcs == {p: GPath(p).crc for p in file_paths}
+    assert progress.state == sum(path_sizes.itervalues()) - 100 + len(
+        path_sizes)
+    assert crc_cache.calc_crcs({}) == {}
+
+def test_cache_hits_and_misses(data_dir, monkeypatch):
+    """A cached CRC is used until the size, mtime or inode of its file
+    change, or recalculate is passed."""
+    calc = _CountingCalc(monkeypatch)
+    file_paths = _random_files(data_dir.join(u'meshes'), 5)
+    cache = _crc_cache(data_dir)
+    expected = {p: GPath(p).crc for p in file_paths}
+    assert cache.get_crcs(file_paths) == expected
+    assert calc.pop() == sorted(file_paths)
+    assert cache.get_crcs(file_paths) == expected
+    assert calc.pop() == []
+    # size
+    _write(file_paths[0], b'new size')
+    expected[file_paths[0]] = GPath(file_paths[0]).crc
+    # mtime only - same data, so the same CRC
+    os.utime(file_paths[1], (1000000000, 1000000000))
+    # inode only - replaced by a file with the same size and mtime
+    st = os.stat(file_paths[2])
+    replacement = data_dir.join(u'replacement.bin').s
+    with open(file_paths[2], u'rb') as ins: data = bytearray(ins.read())
+    data[0:1] = b'x' if data[0:1] != b'x' else b'y'
+    _write(replacement, bytes(data))
+    os.utime(replacement, (st.st_atime, st.st_mtime))
+    os.rename(replacement, file_paths[2])
+    assert os.stat(file_paths[2]).st_size == st.st_size
+    assert int(os.stat(file_paths[2]).st_mtime) == int(st.st_mtime)
+    expected[file_paths[2]] = GPath(file_paths[2]).crc
+    assert cache.get_crcs(file_paths) == expected
+    assert calc.pop() == sorted(file_paths[:3])
+    assert cache.get_crcs(file_paths, recalculate=True) == expected
+    assert calc.pop() == sorted(file_paths)
+
+def test_save_load_and_outside_files(data_dir, monkeypatch):
+    """Cached CRCs survive a save and load, files outside of Data are never
+    cached and deleted files are dropped from the cache."""
+    calc = _CountingCalc(monkeypatch)
+    file_paths = _random_files(data_dir.join(u'meshes'), 3)
+    outside_paths = _random_files(data_dir.head, 2)
+    cache = _crc_cache(data_dir)
+    cache.get_crcs(file_paths + outside_paths)
+    cache.save()
+    calc.pop()
+    cache = _crc_cache(data_dir)
+    assert cache.get_crcs(file_paths + outside_paths) == {
+        p: GPath(p).crc for p in file_paths + outside_paths}
+    assert calc.pop() == sorted(outside_paths)
+    assert cache.get_crc(GPath(file_paths[0])) == GPath(file_paths[0]).crc
+    assert calc.pop() == []
+    os.remove(file_paths[0])
+    assert cache.get_crcs(file_paths) == {
+        p: GPath(p).crc for p in file_paths[1:]}
+    assert sorted(cache._load()) == [os.path.join(
+        u'meshes', os.path.basename(p)).lower() for p in file_paths[1:]]
+
+def test_retain(data_dir):
+    """retain drops the CRCs of all files not kept - or, if only some
+    directories were rescanned, of the files in them that were not kept."""
+    file_paths = _random_files(data_dir.join(u'meshes'), 4) + \
+        _random_files(data_dir, 2)
+    cache = _crc_cache(data_dir)
+    cache.get_crcs(file_paths)
+    rel_paths = [p[len(data_dir.s) + 1:] for p in file_paths]
+    cache.retain([rel_paths[0]], rescanned=lambda k: k.startswith(
+        u'meshes' + os.sep))
+    assert sorted(cache._load()) == sorted(
+        p.lower() for p in [rel_paths[0]] + rel_paths[4:])
+    cache.retain(p.upper() for p in rel_paths[4:5])
+    assert sorted(cache._load()) == [rel_paths[4].lower()]
+    assert cache._changed
+
+def test_cancel(data_dir, monkeypatch):
+    """A CancelError raised by the progress while waiting on the threads
+    stops them from reading the rest of the files and is passed on."""
+    file_paths = _random_files(data_dir, 12)
+    results = []
+    calls = []
+    class _CancelledProgress(Progress):
+        def _do_progress(self, state, message):
+            calls.append(state)
+            if len(calls) > 1: raise CancelError() # while waiting
+    real_calc_crc = crc_cache._calc_crc
+    def _calc_crc(abs_path, blocks_read, cancelled):
+        cancelled.wait(5) # still reading when it gets cancelled
+        results.append(real_calc_crc(abs_path, blocks_read, cancelled))
+        return results[-1]
+    monkeypatch.setattr(crc_cache, u'_calc_crc', _calc_crc)
+    with pytest.raises(CancelError):
+        crc_cache.calc_crcs({p: os.path.getsize(p) for p in file_paths},
+                            _CancelledProgress())
+    # the files being read stopped after a block, the rest were not read
+    assert results == [None] * 3
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import collections
+import os
+
+import pytest
+
+from ... import bass, bosh
+from ...bolt import GPath
+from ...ini_files import GameIni
+
+# Sections none of the default tweaks touch
+_target_lines = [u'[Test General]', u'a=1', u'b=2', u'[Test Display]', u'c=3']
+_tweak_lines = {
+    u'Tweak A.ini': [u'[Test General]', u'a=1'],
+    u'Tweak B.ini': [u'[Test General]', u'b=5'],
+    u'Tweak C.ini': [u'[Test Display]', u'c=3'],
+    u'Tweak New.ini': [u'[Test Audio]', u'x=1'],
+}
+
+class _IniEnv(object):
+    """Writes a target ini and some tweaks and sets up the INIInfos for
+    them. Files get increasing mtimes, so every write is noticed."""
+
+    def __init__(self, tmpdir, monkeypatch):
+        self._mtime = 1000000
+        tweaks_dir = tmpdir.join(u'tweaks')
+        tweaks_dir.ensure(dir=True)
+        self.tweaks_dir = GPath(unicode(tweaks_dir))
+        self.target_path = GPath(unicode(tmpdir.join(u'Oblivion.ini')))
+        self.write(self.target_path, _target_lines)
+        for tweak_name, tweak_lines in _tweak_lines.iteritems():
+            self.write(self.tweaks_dir.join(tweak_name), tweak_lines)
+        monkeypatch.setitem(bass.dirs, u'ini_tweaks', self.tweaks_dir)
+        monkeypatch.setitem(bass.dirs, u'modsBash',
+                            GPath(unicode(tmpdir.join(u'Bash'))))
+        monkeypatch.setattr(bass, u'settings', {
+            u'bash.ini.choices': collections.OrderedDict(
+                [(u'Oblivion.ini', self.target_path)]),
+            u'bash.ini.choice': 0, u'bash.ini.allowNewLines': False})
+        target_ini = GameIni(self.target_path, u'cp1252')
+        monkeypatch.setattr(bosh, u'oblivionIni', target_ini)
+        monkeypatch.setattr(bosh, u'gameInis', [target_ini])
+        self.infos = bosh.INIInfos()
+        monkeypatch.setattr(bosh, u'iniInfos', self.infos)
+        self.infos.refresh()
+
+    def write(self, ini_path, lines):
+        with open(ini_path.s, u'wb') as out:
+            out.write(u'\r\n'.join(lines + [u'']).encode(u'cp1252'))
+        self._mtime += 10
+        os.utime(ini_path.s, (self._mtime, self._mtime))
+
+    def edit_target(self, lines):
+        self.write(self.target_path, lines)
+        self.infos.refresh()
+
+    def statuses(self):
+        return {n.s: i.tweak_status for n, i in self.infos.iteritems()}
+
+    def reset_tweaks(self):
+        """The names of the tweaks whose status is not computed."""
+        return {n.s for n, i in self.infos.iteritems() if i._status is None}
+
+    def check_statuses(self):
+        """The statuses left in place are the ones a full recomputation
+        gives."""
+        statuses = self.statuses()
+        for ini_info in self.infos.itervalues(): ini_info.reset_status()
+        assert self.statuses() == statuses
+
+@pytest.fixture
+def ini_env(tmpdir, monkeypatch):
+    return _IniEnv(tmpdir, monkeypatch)
+
+def test_reset_changed_settings(ini_env):
+    """Only the tweaks containing settings that changed in the target are
+    reset."""
+    statuses = ini_env.statuses()
+    assert statuses[u'Tweak A.ini'] == 20
+    assert statuses[u'Tweak B.ini'] == 0
+    assert statuses[u'Tweak New.ini'] == -10
+    ini_env.edit_target([u'[Test General]', u'a=9', u'b=2', u'[Test Display]',
+                         u'c=3'])
+    assert ini_env.reset_tweaks() == {u'Tweak A.ini'}
+    assert ini_env.statuses()[u'Tweak A.ini'] == 0
+    ini_env.check_statuses()
+
+def test_reset_added_and_removed_keys(ini_env):
+    ini_env.statuses()
+    # a new section and setting
+    ini_env.edit_target(_target_lines + [u'[Test Audio]', u'x=1'])
+    assert ini_env.reset_tweaks() == {u'Tweak New.ini'}
+    assert ini_env.statuses()[u'Tweak New.ini'] == 20
+    ini_env.check_statuses()
+    # a removed section
+    ini_env.edit_target(_target_lines[:3] + [u'[Test Audio]', u'x=1'])
+    assert ini_env.reset_tweaks() == {u'Tweak C.ini'}
+    assert ini_env.statuses()[u'Tweak C.ini'] == -10
+    ini_env.check_statuses()
+
+def test_reset_changed_tweak(ini_env):
+    """The index follows the tweaks when they change."""
+    ini_env.statuses()
+    ini_env.edit_target(_target_lines + [u'[Test Audio]', u'x=1']) # index
+    ini_env.statuses()
+    ini_env.write(ini_env.tweaks_dir.join(u'Tweak C.ini'),
+                  [u'[Test General]', u'b=2'])
+    ini_env.infos.refresh()
+    assert ini_env.reset_tweaks() == {u'Tweak C.ini'}
+    assert ini_env.statuses()[u'Tweak C.ini'] == 20
+    ini_env.edit_target([u'[Test General]', u'a=1', u'b=5',
+                         u'[Test Display]', u'c=3', u'[Test Audio]', u'x=1'])
+    assert ini_env.reset_tweaks() == {u'Tweak B.ini', u'Tweak C.ini'}
+    ini_env.check_statuses()
+    # and when they are deleted
+    ini_env.tweaks_dir.join(u'Tweak B.ini').remove()
+    ini_env.infos.refresh()
+    ini_env.edit_target(_target_lines + [u'[Test Audio]', u'x=1'])
+    assert ini_env.reset_tweaks() == {u'Tweak C.ini'}
+    ini_env.check_statuses()
+
+def test_reset_all_after_reread(ini_env):
+    """If the statuses were computed against settings of the target we did
+    not snapshot, the next change resets all of them."""
+    ini_env.statuses()
+    target_ini = ini_env.infos.ini
+    ini_env.write(ini_env.target_path,
+                  _target_lines + [u'[Test Audio]', u'x=1'])
+    target_ini.do_update() # reread behind the back of refresh
+    target_ini.updated = False
+    ini_env.infos[GPath(u'Tweak B.ini')].reset_status()
+    ini_env.statuses()
+    ini_env.edit_target(_target_lines + [u'[Test Audio]', u'x=2'])
+    assert ini_env.reset_tweaks() == set(ini_env.statuses())
+    ini_env.check_statuses()
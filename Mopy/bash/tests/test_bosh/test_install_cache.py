@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import itertools
+import os
+import shutil
+import zlib
+
+import pytest
+
+from ...bolt import GPath
+from ...bosh import install_cache
+from ...bosh.install_cache import InstallCache
+
+# Helper functions ------------------------------------------------------------
+class _Env(object):
+    """Extracted files, a Data folder and the cache, in a temp dir."""
+    def __init__(self, root):
+        self.root = root
+        self.unpack_dir = os.path.join(root, u'unpack')
+        self.data_dir = os.path.join(root, u'Data')
+
+    def make_cache(self, max_size=1000, hard_links=False):
+        return InstallCache(GPath(self.root).join(u'Install Cache'),
+                            GPath(self.root).join(u'Install Cache.dat'),
+                            max_size, hard_links)
+
+    def extract(self, rel_path, data):
+        """Write an extracted file, returning its key, source and dest."""
+        src = os.path.join(self.unpack_dir, rel_path)
+        if not os.path.isdir(os.path.dirname(src)):
+            os.makedirs(os.path.dirname(src))
+        with open(src, u'wb') as out:
+            out.write(data)
+        key = (len(data), zlib.crc32(data) & 0xFFFFFFFF)
+        return key, GPath(src), GPath(os.path.join(self.data_dir, rel_path))
+
+    def place(self, cache, *files):
+        return cache.place_files(*[list(x) for x in zip(*files)])
+
+@pytest.fixture()
+def env(tmpdir):
+    return _Env(tmpdir.strpath.decode(u'utf-8'))
+
+@pytest.fixture()
+def clones(monkeypatch):
+    """Pretend the filesystem supports cloning files."""
+    def _clone(src_path, dest_path):
+        shutil.copyfile(src_path, dest_path)
+        return True
+    monkeypatch.setattr(install_cache.env, u'clone_file', _clone)
+
+class _Clock(object):
+    """Stands in for the time module, so that each install is later than the
+    previous one."""
+    def __init__(self):
+        self._ticks = itertools.count(1)
+
+    def time(self):
+        return float(next(self._ticks))
+
+def _read(path):
+    with open(path.s, u'rb') as ins:
+        return ins.read()
+
+# Tests -----------------------------------------------------------------------
+def test_place_files_moves_when_cloning_fails(env):
+    """Files that can be neither cloned nor hard linked are moved to the Data
+    folder and not cached."""
+    cache = env.make_cache()
+    key, src, dest = env.extract(u'a.esp', b'plugin')
+    assert env.place(cache, (key, src, dest)) == ([], [])
+    assert _read(dest) == b'plugin'
+    assert not src.exists()
+    assert cache.cached_keys([key]) == set()
+
+def test_place_files_clones(env, clones):
+    cache = env.make_cache()
+    key, src, dest = env.extract(u'textures\\a.dds', b'texture')
+    assert env.place(cache, (key, src, dest)) == ([], [])
+    assert _read(dest) == b'texture'
+    assert not src.exists()
+    assert cache.cached_keys([key]) == {key}
+    # reinstalling needs no extracted file
+    dest.remove()
+    assert env.place(cache, (key, src, dest)) == ([], [])
+    assert _read(dest) == b'texture'
+
+def test_place_files_copies_cached_files(env, clones, monkeypatch):
+    """Files cached earlier are copied when they can't be cloned anymore."""
+    cache = env.make_cache()
+    key, src, dest = env.extract(u'a.esp', b'plugin')
+    env.place(cache, (key, src, dest))
+    monkeypatch.setattr(install_cache.env, u'clone_file', lambda s, d: False)
+    dest.remove()
+    assert env.place(cache, (key, src, dest)) == ([], [])
+    assert _read(dest) == b'plugin'
+    assert cache.cached_keys([key]) == {key}
+
+def test_place_files_hard_links(env):
+    cache = env.make_cache(hard_links=True)
+    plugin = env.extract(u'a.esp', b'plugin')
+    ini = env.extract(u'a.ini', b'[General]\n')
+    assert env.place(cache, plugin, ini) == ([], [])
+    assert os.stat(plugin[2].s).st_nlink == 2
+    # edited in place, so never hard linked - and not cached either
+    assert os.stat(ini[2].s).st_nlink == 1
+    assert cache.cached_keys([plugin[0], ini[0]]) == {plugin[0]}
+
+def test_edited_hard_link_is_dropped(env):
+    cache = env.make_cache(hard_links=True)
+    key, src, dest = env.extract(u'a.esp', b'plugin')
+    env.place(cache, (key, src, dest))
+    os.utime(dest.s, (1, 1)) # only the mtime changed - still valid
+    assert cache.cached_keys([key]) == {key}
+    with open(dest.s, u'r+b') as out:
+        out.write(b'P')
+    assert cache.cached_keys([key]) == set()
+
+def test_place_files_skips_unknown_crcs(env, clones):
+    """Files listed without a CRC all have 0 for it, so they must not share
+    the cache."""
+    cache = env.make_cache()
+    _key, src, dest = env.extract(u'a.esp', b'aaaa')
+    assert env.place(cache, ((4, 0), src, dest)) == ([(src, dest)], [])
+    assert src.exists()
+    assert cache.cached_keys([(4, 0)]) == set()
+
+def test_place_files_too_big(env, clones):
+    cache = env.make_cache(max_size=3)
+    key, src, dest = env.extract(u'a.esp', b'plugin')
+    assert env.place(cache, (key, src, dest)) == ([(src, dest)], [])
+    assert cache.cached_keys([key]) == set()
+
+def test_eviction(env, clones, monkeypatch):
+    """The least recently installed files are dropped on save until the
+    cache fits its budget - and the index survives a restart."""
+    monkeypatch.setattr(install_cache, u'time', _Clock())
+    cache = env.make_cache(max_size=10)
+    first = env.extract(u'a.esp', b'aaaa')
+    second = env.extract(u'b.esp', b'bbbb')
+    env.place(cache, first)
+    env.place(cache, second)
+    # reinstalling the first makes the second the least recently used
+    env.place(cache, first)
+    third = env.extract(u'c.esp', b'cccc')
+    env.place(cache, third)
+    keys = [first[0], second[0], third[0]]
+    assert cache.cached_keys(keys) == set(keys)
+    cache.save()
+    assert cache.cached_keys(keys) == {first[0], third[0]}
+    reloaded = env.make_cache(max_size=10)
+    assert reloaded.cached_keys(keys) == {first[0], third[0]}
+    cache_files = [f for _dirs, _sub, files in os.walk(
+        os.path.join(env.root, u'Install Cache')) for f in files]
+    assert len(cache_files) == 2
+
+def test_orphans_are_removed(env, clones):
+    """Cached files missing from the index (e.g. after a crash) are deleted
+    and entries with no file are dropped."""
+    cache = env.make_cache()
+    kept = env.extract(u'a.esp', b'aaaa')
+    lost = env.extract(u'b.esp', b'bbbb')
+    env.place(cache, kept, lost)
+    cache.save()
+    os.remove(cache._blob_path(lost[0]))
+    orphan = os.path.join(os.path.dirname(cache._blob_path(kept[0])),
+                          u'orphan')
+    with open(orphan, u'wb') as out:
+        out.write(b'junk')
+    reloaded = env.make_cache()
+    assert reloaded.cached_keys([kept[0], lost[0]]) == {kept[0]}
+    assert not os.path.exists(orphan)
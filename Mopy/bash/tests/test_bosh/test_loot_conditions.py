@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import pytest
+
+from ... import bass, bosh, load_order
+from ...bolt import GPath
+from ...bosh import loot_conditions
+from ...bosh.loot_conditions import ConditionAnd, ConditionFunc, \
+    ConditionNot, reset_eval_context
+
+# Helper functions ------------------------------------------------------------
+class _CrcCache(object):
+    """Stands in for bosh.crcCache, recording the paths it was asked for."""
+    def __init__(self, crcs):
+        self.crcs = crcs
+        self.requested = []
+
+    def get_crc(self, abs_path):
+        self.requested.append(abs_path)
+        try:
+            return self.crcs[abs_path]
+        except KeyError:
+            raise OSError(u'No such file: %s' % abs_path)
+
+@pytest.fixture()
+def data_dir(tmpdir, monkeypatch):
+    """Points the Data folder to a temporary directory and starts each test
+    with a fresh evaluation context and a single active plugin."""
+    data_path = tmpdir.mkdir(u'Data')
+    monkeypatch.setitem(bass.dirs, u'mods', GPath(data_path.strpath))
+    _set_active(monkeypatch, u'A.esp')
+    reset_eval_context()
+    yield data_path
+    reset_eval_context()
+
+def _set_active(monkeypatch, *active):
+    active = tuple(GPath(p) for p in active)
+    monkeypatch.setattr(load_order, u'cached_lord',
+                        load_order.LoadOrder(active, active))
+
+def _count_calls(monkeypatch, func_name):
+    """Wraps the condition function func_name so that its calls get
+    recorded in the returned list."""
+    calls = []
+    wrapped = loot_conditions._function_mapping[func_name]
+    def _counting(eval_context, *func_args):
+        calls.append(func_args)
+        return wrapped(eval_context, *func_args)
+    monkeypatch.setitem(loot_conditions._function_mapping, func_name,
+                        _counting)
+    return calls
+
+# Tests -----------------------------------------------------------------------
+def test_shared_results(data_dir, monkeypatch):
+    """Equal conditions share their result, even when they are different
+    objects or nested in other conditions."""
+    file_calls = _count_calls(monkeypatch, u'file')
+    data_dir.join(u'a.txt').write(u'')
+    assert ConditionFunc(u'file', [u'a.txt']).evaluate()
+    assert ConditionFunc(u'file', [u'a.txt']).evaluate()
+    assert not ConditionNot(ConditionFunc(u'file', [u'a.txt'])).evaluate()
+    assert ConditionAnd(ConditionFunc(u'file', [u'a.txt']),
+                        ConditionFunc(u'file', [u'b.txt'])).evaluate() is False
+    assert file_calls == [(u'a.txt',), (u'b.txt',)]
+    # The memoized result is used even though the file is gone
+    data_dir.join(u'a.txt').remove()
+    assert ConditionFunc(u'file', [u'a.txt']).evaluate()
+    assert len(file_calls) == 2
+
+def test_reset_eval_context(data_dir):
+    """reset_eval_context drops the memoized results."""
+    data_dir.join(u'a.txt').write(u'')
+    file_cond = ConditionFunc(u'file', [u'a.txt'])
+    assert file_cond.evaluate()
+    data_dir.join(u'a.txt').remove()
+    assert file_cond.evaluate()
+    reset_eval_context()
+    assert not file_cond.evaluate()
+
+def test_active_plugins_change(data_dir, monkeypatch):
+    """The context is dropped when the active plugins change, for all
+    conditions, not just the ones checking active plugins."""
+    data_dir.join(u'a.txt').write(u'')
+    file_cond = ConditionFunc(u'file', [u'a.txt'])
+    active_cond = ConditionFunc(u'active', [u'B.esp'])
+    assert file_cond.evaluate()
+    assert not active_cond.evaluate()
+    data_dir.join(u'a.txt').remove()
+    _set_active(monkeypatch, u'A.esp')
+    assert file_cond.evaluate() # same active plugins, context is kept
+    _set_active(monkeypatch, u'A.esp', u'B.esp')
+    assert not file_cond.evaluate()
+    assert active_cond.evaluate()
+
+def test_checksum_crc_cache(data_dir, monkeypatch):
+    """checksum gets CRCs from the shared CRC cache, each only once per
+    context, and treats unreadable files as not matching."""
+    a_path = GPath(data_dir.join(u'a.txt').strpath)
+    crc_cache = _CrcCache({a_path: 0xDEADBEEF})
+    monkeypatch.setattr(bosh, u'crcCache', crc_cache)
+    assert ConditionFunc(u'checksum', [u'a.txt', 0xDEADBEEF]).evaluate()
+    assert not ConditionFunc(u'checksum', [u'a.txt', 0x1234]).evaluate()
+    assert not ConditionFunc(u'checksum', [u'b.txt', 0x1234]).evaluate()
+    assert crc_cache.requested == [a_path, GPath(
+        data_dir.join(u'b.txt').strpath)]
+    reset_eval_context()
+    crc_cache.crcs[a_path] = 0x1234
+    assert ConditionFunc(u'checksum', [u'a.txt', 0x1234]).evaluate()
+    assert len(crc_cache.requested) == 3
+
+def test_checksum_no_crc_cache(data_dir, monkeypatch):
+    """Without a CRC cache, checksum calculates the CRC of the file."""
+    monkeypatch.setattr(bosh, u'crcCache', None, raising=False)
+    data_dir.join(u'a.txt').write(u'abc')
+    a_crc = GPath(data_dir.join(u'a.txt').strpath).crc
+    assert ConditionFunc(u'checksum', [u'a.txt', a_crc]).evaluate()
+    assert not ConditionFunc(u'checksum', [u'a.txt', a_crc + 1]).evaluate()
+    assert not ConditionFunc(u'checksum', [u'b.txt', a_crc]).evaluate()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import io
+import os
+
+import pytest
+
+from ...bolt import GPath
+from ...bosh import loot_parser
+from ...exception import LexerError, ParserError
+
+_test_masterlist = u'''plugins:
+  - name: 'Oblivion.esm'
+    tag:
+      - Actors.ACBS
+      - -NoMerge
+      - name: Delev
+        condition: 'file("a.esp") and not active("b.esp") or many("c.*")'
+      - name: Invent.Remove
+        condition: 'active("a.esp") or checksum("c.esp", DEADBEEF)'
+      - name: -Relev
+        condition: 'version("x.esp", "1.2", >=)'
+    dirty:
+      - crc: 0x1234
+        util: 'TES4Edit'
+  - name: 'Nouveau Modé.esp'
+    tag: [C.Water, -Names]
+  - name: 'Broken.esp'
+    tag:
+      - name: Delev
+        condition: 'file("foo.esp" and'
+'''
+_test_userlist = u'''plugins:
+  - name: 'oblivion.ESM'
+    tag: [Graphics]
+    dirty:
+      - crc: 0x5678
+        util: 'TES4Edit'
+  - name: 'User.esp'
+    tag: [Invent.Add]
+'''
+
+# Helper functions ------------------------------------------------------------
+def _write_list(list_path, list_contents):
+    with io.open(list_path, u'w', encoding=u'utf-8') as out:
+        out.write(list_contents)
+    return GPath(list_path)
+
+def _canonical_tags(tag_set):
+    """Returns the reprs of the tags in tag_set, with their conditions parsed
+    - if they parse, else the condition strings are kept."""
+    tag_reprs = set()
+    for tag in tag_set:
+        if type(getattr(tag, u'tag_condition', None)) is unicode:
+            try:
+                tag.tag_condition = loot_parser._process_condition_string(
+                    tag.tag_condition)
+            except (LexerError, ParserError):
+                pass
+        tag_reprs.add(repr(tag))
+    return tag_reprs
+
+def _canonical_list(parser):
+    """Returns the contents of the list parser loaded as a dict of plugin
+    names to comparable tuples."""
+    canonical = {}
+    for plugin_name in list(parser._cached_masterlist):
+        plugin_entry = parser._get_entry(plugin_name)
+        canonical[plugin_name.lower()] = (
+            plugin_entry.dirty_crcs,
+            _canonical_tags(plugin_entry.tags_added),
+            _canonical_tags(plugin_entry.tags_removed))
+    return canonical
+
+def _load(masterlist_path, userlist_path, snapshot_path):
+    parser = loot_parser.LOOTParser()
+    parser.load_lists(masterlist_path, userlist_path, catch_errors=False,
+                      snapshot_path=snapshot_path)
+    return parser
+
+# Tests -----------------------------------------------------------------------
+def test_snapshot_round_trip(tmpdir):
+    """Lists loaded from a snapshot are the same as the parsed ones."""
+    masterlist_path = _write_list(unicode(tmpdir.join(u'masterlist.yaml')),
+                                  _test_masterlist)
+    userlist_path = _write_list(unicode(tmpdir.join(u'userlist.yaml')),
+                                _test_userlist)
+    snapshot_path = GPath(unicode(tmpdir.join(u'snapshot.dat')))
+    parsed = _load(masterlist_path, userlist_path, None)
+    assert not snapshot_path.exists()
+    parsed_for_snapshot = _load(masterlist_path, userlist_path, snapshot_path)
+    assert snapshot_path.exists()
+    from_snapshot = _load(masterlist_path, userlist_path, snapshot_path)
+    # entries are only rebuilt when they are looked up
+    assert all(type(e) is bytes for e in
+               from_snapshot._cached_masterlist.itervalues())
+    expected = _canonical_list(parsed)
+    assert _canonical_list(parsed_for_snapshot) == expected
+    assert _canonical_list(from_snapshot) == expected
+    # the userlist was merged into the masterlist before snapshotting
+    assert expected[u'oblivion.esm'][0] == {0x1234, 0x5678}
+    assert u'user.esp' in expected
+    assert from_snapshot._get_entry(u'NOUVEAU MODÉ.ESP').tags_removed == {
+        u'Names'}
+    with pytest.raises(KeyError):
+        from_snapshot._get_entry(u'Missing.esp')
+
+def test_snapshot_bad_condition(tmpdir):
+    """Conditions that fail to parse still raise their errors when loaded
+    from a snapshot."""
+    masterlist_path = _write_list(unicode(tmpdir.join(u'masterlist.yaml')),
+                                  _test_masterlist)
+    snapshot_path = GPath(unicode(tmpdir.join(u'snapshot.dat')))
+    for _i in xrange(2): # parse and snapshot, then load the snapshot
+        parser = _load(masterlist_path, None, snapshot_path)
+        with pytest.raises((LexerError, ParserError)):
+            parser.get_plugin_tags(GPath(u'Broken.esp'), catch_errors=False)
+    assert type(parser._cached_masterlist[u'Oblivion.esm']) is bytes
+
+def test_snapshot_invalidation(tmpdir):
+    """A snapshot is not used once one of the lists it was made from
+    changes."""
+    masterlist_path = _write_list(unicode(tmpdir.join(u'masterlist.yaml')),
+                                  _test_masterlist)
+    userlist_path = _write_list(unicode(tmpdir.join(u'userlist.yaml')),
+                                _test_userlist)
+    snapshot_path = GPath(unicode(tmpdir.join(u'snapshot.dat')))
+    _load(masterlist_path, userlist_path, snapshot_path)
+    _write_list(userlist_path.s, _test_userlist + u'''  - name: 'New.esp'
+    tag: [Delev]
+''')
+    reparsed = _load(masterlist_path, userlist_path, snapshot_path)
+    assert not any(type(e) is bytes for e in
+                   reparsed._cached_masterlist.itervalues())
+    assert u'new.esp' in _canonical_list(reparsed)
+    # a new snapshot was stored for the new lists
+    from_snapshot = _load(masterlist_path, userlist_path, snapshot_path)
+    assert _canonical_list(from_snapshot) == _canonical_list(reparsed)
+    # no snapshot at all for the masterlist alone
+    assert u'user.esp' not in _canonical_list(
+        _load(masterlist_path, None, snapshot_path))
+
+_bash_patches = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             u'..', u'..', u'..', u'Bash Patches')
+@pytest.mark.parametrize(u'game_folder', sorted(os.listdir(_bash_patches)))
+def test_snapshot_bundled_taglists(tmpdir, game_folder):
+    """The taglists we ship survive a snapshot round trip."""
+    taglist_path = GPath(os.path.join(_bash_patches, game_folder,
+                                      u'taglist.yaml'))
+    if not taglist_path.exists():
+        pytest.skip(u'%s has no taglist' % game_folder)
+    snapshot_path = GPath(unicode(tmpdir.join(u'snapshot.dat')))
+    _load(taglist_path, None, snapshot_path)
+    assert _canonical_list(_load(taglist_path, None, snapshot_path)) == \
+        _canonical_list(_load(taglist_path, None, None))
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import pytest
+
+from ...bolt import GPath
+from ...bosh import _mergeability
+from ...bosh._mergeability import isPBashMergeable, is_esl_capable, \
+    needs_record_scan
+from ...mod_files import MergeScan
+
+# Helper functions ------------------------------------------------------------
+class _ModInfo(object):
+    """The parts of a ModInfo that the checks that need no loading use."""
+    def __init__(self, mod_name, is_esm=False):
+        self.name = GPath(mod_name)
+        self._is_esm = is_esm
+
+    def has_esm_flag(self): return self._is_esm
+    def isBP(self): return False
+    def hasResources(self): return False, False
+    def isMissingStrings(self): return False
+
+class _ModInfos(dict):
+    def __init__(self, mod_infos, mod_dependents):
+        super(_ModInfos, self).__init__((m.name, m) for m in mod_infos)
+        self._dependents = {GPath(k): [GPath(d) for d in v]
+                            for k, v in mod_dependents.iteritems()}
+        self.mergeable = set()
+
+    def get_dependents(self, mod_name):
+        return self._dependents.get(mod_name, [])
+
+def _merge_scan(**attrs):
+    merge_scan = MergeScan()
+    merge_scan.has_tops = True
+    for attr, value in attrs.iteritems():
+        setattr(merge_scan, attr, value)
+    return merge_scan
+
+@pytest.fixture
+def no_load_checks(monkeypatch):
+    """Counts the runs of the checks that need no loading."""
+    checked = []
+    is_mergeable_no_load = _mergeability._is_mergeable_no_load
+    def _count(mod_info, reasons):
+        checked.append(mod_info.name)
+        return is_mergeable_no_load(mod_info, reasons)
+    monkeypatch.setattr(_mergeability, u'_is_mergeable_no_load', _count)
+    return checked
+
+# Tests -----------------------------------------------------------------------
+@pytest.mark.parametrize(u'merge_scan, reason', [
+    (_merge_scan(), None),
+    (_merge_scan(error=u'Test.esp: Error scanning'),
+     u'Test.esp: Error scanning.'),
+    (_merge_scan(bad_grouping=True), u'Improperly grouped file'),
+    (_merge_scan(tops_skipped={b'GMST', b'GLOB'}),
+     u'Unsupported types: GLOB, GMST.'),
+    (_merge_scan(has_tops=False), u'Empty mod.'),
+    (_merge_scan(new_blocks={b'SPEL', b'BOOK'}),
+     u'New record(s) in block(s): BOOK, SPEL.'),
+    # ESL flagging is checked separately
+    (_merge_scan(has_high_new_fids=True), None),
+])
+def test_pbash_mergeable(merge_scan, reason, no_load_checks):
+    """The reasons isPBashMergeable finds in a MergeScan, and that mods that
+    were scanned since needs_record_scan allowed it are not checked again."""
+    mod_info = _ModInfo(u'Test.esp')
+    mod_infos = _ModInfos([mod_info], {})
+    assert needs_record_scan(mod_info, False)
+    assert isPBashMergeable(mod_info, mod_infos, None,
+                            merge_scan=merge_scan) is (reason is None)
+    assert no_load_checks == [mod_info.name]
+    reasons = []
+    isPBashMergeable(mod_info, mod_infos, reasons, merge_scan=merge_scan)
+    assert len(reasons) == (reason is not None)
+    assert reason is None or reason in reasons[0]
+
+def test_pbash_mergeable_no_load(no_load_checks):
+    """Mods failing the checks that need no loading are not scanned in non
+    verbose mode, but all reasons are gathered in verbose mode."""
+    mod_info = _ModInfo(u'Test.esm', is_esm=True)
+    mod_infos = _ModInfos([mod_info], {})
+    assert not needs_record_scan(mod_info, False)
+    assert needs_record_scan(mod_info, True)
+    reasons = []
+    assert not isPBashMergeable(mod_info, mod_infos, reasons,
+        merge_scan=_merge_scan(new_blocks={b'BOOK'}))
+    assert reasons == [u'Is esm.', u'New record(s) in block(s): BOOK.']
+    assert no_load_checks == [mod_info.name] * 2
+
+def test_pbash_mergeable_dependents():
+    """Masters of mods that are not mergeable are not mergeable either."""
+    mod_infos = _ModInfos([_ModInfo(u'Master.esp'), _ModInfo(u'Merged.esp'),
+                           _ModInfo(u'Plugin.esp')],
+                          {u'Master.esp': [u'Merged.esp', u'Plugin.esp']})
+    mod_infos.mergeable.add(GPath(u'Merged.esp'))
+    reasons = []
+    assert not isPBashMergeable(mod_infos[GPath(u'Master.esp')], mod_infos,
+                                reasons, merge_scan=_merge_scan())
+    assert reasons == [u'Is a master of non-mergeable mod(s): Plugin.esp.']
+    mod_infos.mergeable.add(GPath(u'Plugin.esp'))
+    assert isPBashMergeable(mod_infos[GPath(u'Master.esp')], mod_infos, None,
+                            merge_scan=_merge_scan())
+
+def test_esl_capable():
+    mod_info = _ModInfo(u'Test.esp')
+    assert is_esl_capable(mod_info, None, None, merge_scan=_merge_scan(
+        new_blocks={b'BOOK'}, tops_skipped={b'GMST'}))
+    reasons = []
+    assert not is_esl_capable(mod_info, None, reasons,
+                              merge_scan=_merge_scan(has_high_new_fids=True))
+    assert reasons == [u'New FormIDs greater than 0xFFF.']
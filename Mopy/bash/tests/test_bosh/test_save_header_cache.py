@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import cPickle
+import os
+import struct
+import zlib
+
+import pytest
+
+from ... import bass
+from ...bolt import GPath
+from ...bosh import SaveInfos, FileInfos
+from ...bosh.save_header_cache import SaveHeaderCache
+from ...bosh.save_headers import OblivionSaveHeader, SkyrimSaveHeader
+from ...exception import SaveHeaderError
+
+# Helper functions ------------------------------------------------------------
+def _str8(string):
+    return struct.pack(u'B', len(string)) + string
+
+def _str16(string):
+    return struct.pack(u'H', len(string)) + string
+
+def _pixels(width, height, bytes_per_pixel):
+    return bytearray(i % 251 for i in xrange(
+        width * height * bytes_per_pixel))
+
+def _oblivion_save(masters, width=4, height=2):
+    """Return the bytes of an Oblivion save with the specified masters and a
+    screenshot of the specified size - the pixels are _pixels."""
+    save = b'TES4SAVEGAME'.ljust(34, b'\0')
+    save += struct.pack(u'I', 0x1234).ljust(8, b'\0') # header_size
+    save += _str8(b'Hero\0') + struct.pack(u'H', 7) + _str8(b'Cyrodiil\0')
+    save += struct.pack(u'=fI16sIII', 1.5, 36000, b'\0' * 16,
+                        width * height * 3, width, height)
+    save += bytes(_pixels(width, height, 3))
+    save += struct.pack(u'B', len(masters)) + b''.join(
+        _str8(m) for m in masters)
+    return save + b'\0' * 64 # the rest of the save
+
+def _sse_save(masters, esl_masters, width=4, height=2):
+    """Return the bytes of a zlib compressed Skyrim SE save - its compressed
+    part is mostly random bytes, so that it takes several chunks."""
+    header = struct.pack(u'=3I', 12, 5, 30) # version, saveNumber, pcLevel
+    header = header[:8] + _str16(b'Hero') + header[8:] # pcName after number
+    header += _str16(b'Whiterun') + _str16(b'1.2.3') + _str16(b'NordRace')
+    header += struct.pack(u'=Hff8sIIH', 0, 1.0, 2.0, b'\0' * 8, width, height,
+                          1) # zlib compressed
+    save = b'TESV_SAVEGAME' + struct.pack(u'I', len(header)) + header
+    save += bytes(_pixels(width, height, 4))
+    master_table = struct.pack(u'B', len(masters)) + b''.join(
+        _str16(m) for m in masters)
+    master_table += struct.pack(u'H', len(esl_masters)) + b''.join(
+        _str16(m) for m in esl_masters)
+    decompressed = struct.pack(u'=BI', 78, len(master_table)) + \
+        master_table + os.urandom(300000)
+    compressed = zlib.compress(decompressed)
+    save += struct.pack(u'=II', len(decompressed), len(compressed))
+    return save + compressed
+
+def _write(path, data, mtime=None):
+    with open(path.s, u'wb') as out:
+        out.write(data)
+    if mtime is not None: os.utime(path.s, (mtime, mtime))
+    return path
+
+def _stat(path):
+    return path, path.size, path.mtime
+
+def _assert_same_header(header, expected):
+    assert type(header) is type(expected)
+    assert header.dump_state() == expected.dump_state()
+    assert header.masters == expected.masters
+    assert header.ssData == expected.ssData
+
+@pytest.fixture()
+def saves_dir(tmpdir):
+    return GPath(tmpdir.strpath.decode(u'utf-8'))
+
+class _NoReads(object):
+    """Makes reading save headers fail, to check they come from the
+    cache."""
+    def __init__(self, monkeypatch, header_type):
+        def _load_header(_self, ins):
+            raise AssertionError(u'read %s' % ins.name)
+        monkeypatch.setattr(header_type, u'load_header', _load_header)
+
+# Tests -----------------------------------------------------------------------
+def test_oblivion_header(saves_dir):
+    save_path = _write(saves_dir.join(u'a.ess'),
+                       _oblivion_save([b'Oblivion.esm', b'A.esp']))
+    header = OblivionSaveHeader(save_path)
+    assert header.pcName == u'Hero'
+    assert header.pcLocation == u'Cyrodiil'
+    assert header.pcLevel == 7
+    assert header.masters == [GPath(u'Oblivion.esm'), GPath(u'A.esp')]
+    assert header.ssData == _pixels(4, 2, 3)
+
+def test_sse_light_decompression(saves_dir, monkeypatch):
+    """Only the start of the compressed part is decompressed to read the
+    masters - the whole of it is never read."""
+    save_data = _sse_save([b'Skyrim.esm', b'A.esp'], [b'B.esl'])
+    save_path = _write(saves_dir.join(u'a.ess'), save_data)
+    def _no_full_decompression(*args):
+        raise AssertionError(u'decompressed the whole save')
+    monkeypatch.setattr(SkyrimSaveHeader, u'_sse_decompress_zlib',
+                        staticmethod(_no_full_decompression))
+    header = SkyrimSaveHeader(save_path)
+    assert header.masters == [GPath(u'Skyrim.esm'), GPath(u'A.esp'),
+                              GPath(u'B.esl')]
+    assert header.has_esl_masters
+    assert header.pcName == u'Hero'
+    assert header.gameTicks == (3600 + 2 * 60 + 3) * 1000
+    assert header.ssData == _pixels(4, 2, 4)
+
+def test_sse_light_decompression_corrupt(saves_dir):
+    """Corrupt data past the master table is never decompressed - corrupt
+    data in it raises a SaveHeaderError."""
+    save_data = bytearray(_sse_save([b'Skyrim.esm'], []))
+    save_data[-1000:] = b'\xFF' * 1000
+    save_path = _write(saves_dir.join(u'a.ess'), bytes(save_data))
+    assert SkyrimSaveHeader(save_path).masters == [GPath(u'Skyrim.esm')]
+    # the compressed part starts after the screenshot and its two sizes
+    compressed_start = 17 + struct.unpack_from(u'I', save_data, 13)[0] + \
+                       4 * 2 * 4 + 8
+    save_data[compressed_start:compressed_start + 8] = b'\xFF' * 8
+    _write(save_path, bytes(save_data))
+    with pytest.raises(SaveHeaderError):
+        SkyrimSaveHeader(save_path)
+
+@pytest.mark.parametrize(u'header_type, save_data', [
+    (OblivionSaveHeader, _oblivion_save([b'Oblivion.esm', b'A.esp'])),
+    (SkyrimSaveHeader, _sse_save([b'Skyrim.esm'], [b'B.esl'])),
+])
+def test_state_round_trip(saves_dir, header_type, save_data):
+    """A header created from the dumped state of another is the same, and
+    reads its screenshot lazily - from the path it was created with."""
+    save_path = _write(saves_dir.join(u'a.ess'), save_data)
+    header = header_type(save_path)
+    loaded = header_type.from_state(save_path, header.dump_state())
+    assert not hasattr(loaded, u'_ssData')
+    _assert_same_header(loaded, header)
+    # the state is what the cache pickles
+    state = cPickle.loads(cPickle.dumps(header.dump_state(), 2))
+    _assert_same_header(header_type.from_state(save_path, state), header)
+
+def test_cache_hits_and_misses(saves_dir, monkeypatch):
+    cache_path = saves_dir.join(u'Save Header Cache.dat')
+    save_path = _write(saves_dir.join(u'a.ess'),
+                       _oblivion_save([b'Oblivion.esm']), mtime=1000)
+    cache = SaveHeaderCache(cache_path)
+    header = cache.get_header(OblivionSaveHeader, *_stat(save_path))
+    cache.save()
+    with monkeypatch.context() as m:
+        _NoReads(m, OblivionSaveHeader)
+        reloaded = SaveHeaderCache(cache_path)
+        _assert_same_header(reloaded.get_header(
+            OblivionSaveHeader, *_stat(save_path)), header)
+    # another size or mtime means another save
+    _write(save_path, _oblivion_save([b'Oblivion.esm', b'A.esp']),
+           mtime=1000)
+    assert reloaded.get_header(OblivionSaveHeader,
+                               *_stat(save_path)).masters[1] == u'A.esp'
+    os.utime(save_path.s, (2000, 2000))
+    with monkeypatch.context() as m:
+        _NoReads(m, OblivionSaveHeader)
+        with pytest.raises(AssertionError):
+            reloaded.get_header(OblivionSaveHeader, *_stat(save_path))
+
+def test_cache_version(saves_dir, monkeypatch):
+    """Caches saved by another version of the cache are dropped."""
+    cache_path = saves_dir.join(u'Save Header Cache.dat')
+    save_path = _write(saves_dir.join(u'a.ess'),
+                       _oblivion_save([b'Oblivion.esm']))
+    cache = SaveHeaderCache(cache_path)
+    cache.get_header(OblivionSaveHeader, *_stat(save_path))
+    cache.save()
+    monkeypatch.setattr(SaveHeaderCache, u'_cache_version', 2)
+    _NoReads(monkeypatch, OblivionSaveHeader)
+    with pytest.raises(AssertionError):
+        SaveHeaderCache(cache_path).get_header(OblivionSaveHeader,
+                                               *_stat(save_path))
+
+def test_retain(saves_dir, monkeypatch):
+    """retain drops the saves of a profile that are gone - and keeps those
+    of the other profiles."""
+    cache = SaveHeaderCache(saves_dir.join(u'Save Header Cache.dat'))
+    profile_dir = saves_dir.join(u'Profile')
+    profile_dir.makedirs()
+    saves = [_write(saves_dir.join(u'a.ess'), _oblivion_save([b'A.esp'])),
+             _write(saves_dir.join(u'b.ess'), _oblivion_save([b'B.esp'])),
+             _write(profile_dir.join(u'c.ess'), _oblivion_save([b'C.esp']))]
+    for save_path in saves:
+        cache.get_header(OblivionSaveHeader, *_stat(save_path))
+    cache.retain(saves_dir, [saves[0].s.upper()])
+    _NoReads(monkeypatch, OblivionSaveHeader)
+    for save_path in (saves[0], saves[2]):
+        cache.get_header(OblivionSaveHeader, *_stat(save_path))
+    with pytest.raises(AssertionError):
+        cache.get_header(OblivionSaveHeader, *_stat(saves[1]))
+
+def test_prefetch(saves_dir, monkeypatch):
+    monkeypatch.setitem(bass.inisettings, u'SaveHeaderThreads', 3)
+    cache = SaveHeaderCache(saves_dir.join(u'Save Header Cache.dat'))
+    saves = [_write(saves_dir.join(u'%d.ess' % i),
+                    _oblivion_save([b'%d.esp' % i])) for i in xrange(10)]
+    bad_save = _write(saves_dir.join(u'bad.ess'), b'TES4SAVEGAME')
+    cache.prefetch(OblivionSaveHeader, [_stat(s) for s in saves + [bad_save]])
+    _NoReads(monkeypatch, OblivionSaveHeader)
+    for i, save_path in enumerate(saves):
+        assert cache.get_header(OblivionSaveHeader,
+                                *_stat(save_path)).masters == [u'%d.esp' % i]
+    with pytest.raises(AssertionError): # not cached, read again
+        cache.get_header(OblivionSaveHeader, *_stat(bad_save))
+
+class _SaveInfo(object):
+    """Stands in for a SaveInfo - all the rename needs."""
+    def __init__(self, abs_path, header):
+        self.abs_path = abs_path
+        self.header = header
+        self._co_saves = {}
+
+def test_rename_reads_screenshot_from_new_path(saves_dir, monkeypatch):
+    """A renamed save's cached header reads its screenshot from the save's
+    new path."""
+    save_path = _write(saves_dir.join(u'a.ess'),
+                       _oblivion_save([b'Oblivion.esm']))
+    header = OblivionSaveHeader.from_state(
+        save_path, OblivionSaveHeader(save_path).dump_state())
+    new_path = saves_dir.join(u'b.ess')
+    save_info = _SaveInfo(save_path, header)
+    def _rename(self, old_name, new_name):
+        save_path.moveTo(new_path)
+        save_info.abs_path = new_path
+        self.data = {new_name: save_info}
+    monkeypatch.setattr(FileInfos, u'_rename_operation', _rename)
+    save_infos = SaveInfos.__new__(SaveInfos)
+    save_infos._rename_operation(GPath(u'a.ess'), GPath(u'b.ess'))
+    assert header.ssData == _pixels(4, 2, 3)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+from ...brec.mod_io import TopGrupHeader
+from ...brec.record_groups import MobObjects
+
+# Helper functions ------------------------------------------------------------
+class _Record(object):
+    """Stands in for a record - all MobObjects needs are its fid and eid."""
+    isKeyedByEid = False
+
+    def __init__(self, fid, eid):
+        self.fid = fid
+        self.eid = eid
+
+def _group(*eids):
+    group = MobObjects(TopGrupHeader(0, b'NPC_', 0, 0), None)
+    for index, eid in enumerate(eids):
+        group.setRecord(_Record((u'Test.esp', index), eid))
+    return group
+
+# Tests -----------------------------------------------------------------------
+def test_get_record_by_eid():
+    group = _group(u'A', u'B', u'A')
+    assert group.getRecordByEid(u'A') is group.records[0]
+    assert group.getRecordByEid(u'B') is group.records[1]
+    assert group.getRecordByEid(u'C') is None
+    assert group.getRecordByEid(u'C', default=0) == 0
+    assert _group().getRecordByEid(u'A', default=0) == 0
+
+def test_get_record_by_eid_set_record():
+    """Records added or replaced by setRecord are kept in the index."""
+    group = _group(u'A', u'B')
+    group.getRecordByEid(u'A') # build the index
+    new_record = _Record((u'Test.esp', 2), u'C')
+    group.setRecord(new_record)
+    assert group.getRecordByEid(u'C') is new_record
+    renamed = _Record((u'Test.esp', 0), u'D')
+    group.setRecord(renamed)
+    assert group.getRecordByEid(u'D') is renamed
+    assert group.getRecordByEid(u'A') is None
+    # a later record with the eid of an earlier one does not shadow it
+    group.setRecord(_Record((u'Test.esp', 3), u'B'))
+    assert group.getRecordByEid(u'B') is group.records[1]
+
+def test_get_record_by_eid_renamed_in_place():
+    """Records renamed without telling the group are still found, and the
+    first record with an eid is still the one returned."""
+    group = _group(u'A', u'B', u'C')
+    first, second, third = group.records
+    group.getRecordByEid(u'A') # build the index
+    first.eid = u'D'
+    assert group.getRecordByEid(u'D') is first
+    assert group.getRecordByEid(u'A') is None
+    # renamed away, so the next record with the eid is the first one now
+    second.eid = u'C'
+    assert group.getRecordByEid(u'B') is None
+    assert group.getRecordByEid(u'C') is second
+    second.eid = u'E'
+    assert group.getRecordByEid(u'C') is third
+
+def test_get_record_by_eid_direct_append():
+    """Records appended to records directly are found too."""
+    group = _group(u'A')
+    group.getRecordByEid(u'A') # build the index
+    appended = _Record((u'Test.esp', 1), u'B')
+    group.records.append(appended)
+    assert group.getRecordByEid(u'B') is appended
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import struct
+
+import pytest
+
+from ...bolt import GPath, sio
+from ...brec import FastModReader, ModWriter, MreRecord, RecHeader
+
+# Helper functions ------------------------------------------------------------
+def _new_record(rec_sig, fid=0x800, compressed=False, **attrs):
+    record = MreRecord.type_class[rec_sig](RecHeader(rec_sig, 0, 0, fid, 0))
+    record.flags1.compressed = compressed
+    for attr, value in attrs.iteritems():
+        setattr(record, attr, value)
+    return record
+
+def _item(record, item_fid, count):
+    item = record.getDefault(u'items')
+    item.item, item.count = item_fid, count
+    return item
+
+def _packed(record):
+    """Returns record packed, header and all."""
+    record.setChanged()
+    record.getSize()
+    with ModWriter(sio()) as out:
+        record.dump(out)
+        return out.getvalue()
+
+def _load(rec_data, lazy, strings=None):
+    """Loads the record packed in rec_data, lazily or not."""
+    ins = FastModReader(u'Test.esp', rec_data)
+    ins.lazy_unpack = lazy
+    ins.setStringTable(strings)
+    header = ins.unpackRecHeader()
+    return MreRecord.type_class[header.recType](header, ins, True)
+
+def _records():
+    """Returns records covering plain and compressed records, and records
+    with groups of subrecords and fids."""
+    cont = _new_record(b'CONT', eid=u'Chest', full=u'Chest', weight=2.5,
+                       script=0x01000803, soundOpen=0x801)
+    cont.items = [_item(cont, 0x900, 3), _item(cont, 0x01000901, -1)]
+    return [
+        _new_record(b'BOOK', eid=u'Book', full=u'A Book', text=u'Text',
+                    enchantment=0x802, value=10, weight=1.0),
+        _new_record(b'BOOK', compressed=True, eid=u'Packed', text=u'x' * 50),
+        cont,
+        _new_record(b'NPC_', eid=u'Npc', full=u'Someone', race=0x803,
+                    spells=[0x804, 0x805], level=7),
+    ]
+
+def _attrs(record):
+    """Returns all attributes of record, read via getattr."""
+    return {a: getattr(record, a) for a in record.melSet.getSlotsUsed()}
+
+# Tests -----------------------------------------------------------------------
+@pytest.mark.parametrize(u'record', _records(),
+                         ids=lambda r: r.recType + u'-' + r.eid)
+def test_lazy_matches_eager(record):
+    """Lazily unpacked records end up with the same attributes as eagerly
+    unpacked ones and pack back to the same data."""
+    rec_data = _packed(record)
+    eager, lazy = _load(rec_data, False), _load(rec_data, True)
+    assert eager._lazy_state is None
+    assert lazy._lazy_state is not None
+    assert _attrs(lazy) == _attrs(eager)
+    assert lazy._lazy_state is None # all units unpacked
+    assert _packed(lazy) == _packed(eager) == rec_data
+
+def test_lazy_units():
+    """Only the elements whose attributes are read are unpacked, unchanged
+    records are written back from their raw data."""
+    rec_data = _packed(_records()[2])
+    lazy = _load(rec_data, True)
+    assert lazy.eid == u'Chest'
+    assert len(lazy._lazy_state.unpacked) == 1
+    assert [i.count for i in lazy.items] == [3, -1]
+    assert len(lazy._lazy_state.unpacked) == 2
+    with ModWriter(sio()) as out:
+        lazy.dump(out)
+        assert out.getvalue() == rec_data
+
+def test_lazy_set_before_unpacking():
+    """Attributes set before their elements are unpacked keep the values
+    set, which are packed when the record is dumped."""
+    lazy = _load(_packed(_records()[0]), True)
+    lazy.full = u'Renamed'
+    lazy.value = 20
+    assert lazy.full == u'Renamed'
+    assert lazy.text == u'Text'
+    reloaded = _load(_packed(lazy), False)
+    assert (reloaded.full, reloaded.value, reloaded.weight) == (
+        u'Renamed', 20, 1.0)
+    assert _attrs(reloaded) == _attrs(lazy)
+
+def test_lazy_fids():
+    """Fids of units that are still packed are converted as they get
+    unpacked."""
+    master, mod = GPath(u'Master.esm'), GPath(u'Test.esp')
+    long_fids = {0: master, 1: mod}
+    mapper = lambda fid: fid and (long_fids[fid >> 24], fid & 0xFFFFFF)
+    eager, lazy = [_load(_packed(_records()[2]), l) for l in (False, True)]
+    for record in eager, lazy:
+        record.convertFids(mapper, True)
+    assert lazy.script == (mod, 0x803)
+    assert [i.item for i in lazy.items] == [(master, 0x900), (mod, 0x901)]
+    assert _attrs(lazy) == _attrs(eager)
+
+def test_lazy_strings():
+    """Localized strings are looked up in the string table of the plugin,
+    shared by all of its lazily unpacked records, when unpacked."""
+    record = _new_record(b'BOOK', eid=u'Book')
+    rec_data = _packed(record)
+    # FULL holding a string ID instead of a string
+    rec_data = rec_data[:4] + struct.pack(u'I', len(rec_data) - 20 + 10) + \
+        rec_data[8:] + struct.pack(u'=4sHI', b'FULL', 4, 42)
+    strings = {42: u'Lookup'}
+    lazy, other = _load(rec_data, True, strings), _load(rec_data, True,
+                                                        strings)
+    assert lazy._lazy_state.strings is other._lazy_state.strings is strings
+    strings[42] = u'Changed'
+    assert lazy.full == other.full == u'Changed'
+    assert _load(rec_data, False, strings).full == u'Changed'
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import random
+
+import pytest
+
+from ..ini_files import IniFile, _INI_DELETED, _INI_EMPTY, _INI_OTHER, \
+    _INI_SECTION, _INI_SETTING
+
+def _tokenize_with_regexes(line):
+    """What IniFile._tokenize_line replaced - classifying the line by running
+    the regexes of IniFile over it."""
+    ma_deleted = IniFile.reDeletedSetting.match(line)
+    stripped = IniFile.reComment.sub(u'', line).strip()
+    ma_section = IniFile.reSection.match(stripped)
+    ma_setting = IniFile.reSetting.match(stripped)
+    if ma_section: return _INI_SECTION, ma_section.group(1), None
+    if ma_setting:
+        return _INI_SETTING, ma_setting.group(1), ma_setting.group(2).strip()
+    if ma_deleted: return _INI_DELETED, ma_deleted.group(1), None
+    if stripped: return _INI_OTHER, None, None
+    return _INI_EMPTY, None, None
+
+@pytest.mark.parametrize(u'line', [
+    u'', u'\n', u'\r\n', u'   \t', u';', u'; a comment', u'  ;[General]',
+    u'[General]', u'[General]\r\n', u'  [ Display ]  ', u'[General] ; c',
+    u'[]', u'[ ]', u'[[x]]', u'[General', u'General]',
+    u'bFull Screen=1', u'bFull Screen = 1 \r\n', u'sName=Foo ; comment',
+    u'sName=', u'sName==x', u'=1', u' =1', u'a=b=c', u'SIntroSequence=',
+    u'sLanguage=ENGLISH;', u'fDefaultFOV=75.0000\n', u'uGridsToLoad = 5',
+    u';-bDeleted', u';-bDeleted=1', u';- bDeleted ; why', u';-',
+    u';-=1', u';- ', u';-_x', u';-éé=1', u' ;-bNotDeleted',
+    u'just some text', u'Clé=Valeur', u'[Général]', u'\xa0=1',
+])
+def test_tokenize_line(line):
+    assert IniFile._tokenize_line(line) == _tokenize_with_regexes(line)
+
+def test_tokenize_random_lines():
+    """Lines built from the characters the regexes care about."""
+    chars = [u'a', u'B', u'_', u'1', u' ', u'\t', u'=', u';', u'-', u'[',
+             u']', u'é', u'\r', u'.', u'\xa0', u'\xb2']
+    rng = random.Random(25)
+    for _i in xrange(20000):
+        line = u''.join(rng.choice(chars) for _j in
+                        xrange(rng.randint(0, 10)))
+        if rng.random() < 0.3: line = u';-' + line
+        if rng.random() < 0.3: line = u'[' + line
+        if rng.random() < 0.3: line += u']'
+        if rng.random() < 0.3: line += u'\n'
+        assert IniFile._tokenize_line(line) == _tokenize_with_regexes(line), \
+            repr(line)
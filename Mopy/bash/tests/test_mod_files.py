@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import cPickle as pickle
+import multiprocessing
+import os
+import struct
+import zlib
+from collections import OrderedDict
+
+import pytest
+
+from .. import bass, mod_files
+from ..bolt import GPath
+from ..brec import MreRecord, RecHeader, RecordHeader, TopGrupHeader
+from ..mod_files import LoadFactory, MergeScan, ModFile, ModHeaderReader, \
+    PluginCache, PluginPrefetcher, RecordIndex
+
+# Helper functions ------------------------------------------------------------
+@pytest.fixture(autouse=True)
+def _record_indices(tmpdir, monkeypatch):
+    """Stores record indices in tmpdir and starts with none in memory."""
+    monkeypatch.setitem(bass.dirs, u'modsBash',
+                        GPath(tmpdir.join(u'Bash Mod Data').strpath))
+    monkeypatch.setattr(RecordIndex, u'_cache', OrderedDict())
+
+def _subrecord(sub_sig, sub_data):
+    if len(sub_data) > 0xFFFF:
+        return struct.pack(u'=4sHI4sH', b'XXXX', 4, len(sub_data), sub_sig,
+                           0) + sub_data
+    return struct.pack(u'=4sH', sub_sig, len(sub_data)) + sub_data
+
+def _record(rec_sig, fid, flags1=0, *subrecords):
+    """Returns a packed record, compressed if flags1 says so."""
+    rec_data = b''.join(subrecords)
+    if flags1 & 0x00040000:
+        rec_data = struct.pack(u'I', len(rec_data)) + zlib.compress(rec_data)
+    return RecHeader(rec_sig, len(rec_data), flags1, fid, 0).pack_head() + \
+           rec_data
+
+def _top_group(top_sig, *records):
+    grup_data = b''.join(records)
+    return TopGrupHeader(RecordHeader.rec_header_size + len(grup_data),
+                         top_sig).pack_head() + grup_data
+
+class _Flags(object):
+    hasStrings = False
+
+class _Header(object):
+    def __init__(self, masters):
+        self.masters = [GPath(m) for m in masters]
+        self.flags1 = _Flags()
+
+class _ModInfo(object):
+    """The parts of a ModInfo that RecordIndex and ModHeaderReader use."""
+    def __init__(self, mod_path, masters):
+        self.name = GPath(os.path.basename(mod_path))
+        self.abs_path = GPath(mod_path)
+        self.header = _Header(masters)
+        mod_stat = os.stat(mod_path)
+        self.size, self.mtime = mod_stat.st_size, int(mod_stat.st_mtime)
+
+    def calculate_crc(self):
+        with open(self.abs_path.s, u'rb') as ins:
+            return zlib.crc32(ins.read()) & 0xFFFFFFFF, False
+
+    def getPath(self): return self.abs_path
+
+def _plugin(tmpdir, mod_name, masters, *blocks):
+    """Writes a plugin out of the specified top groups (or stray records),
+    returning its _ModInfo."""
+    mod_path = tmpdir.join(mod_name).strpath
+    with open(mod_path, u'wb') as out:
+        out.write(_record(b'TES4', 0, 0,
+            _subrecord(b'HEDR', struct.pack(u'=f2I', 0.8, 0, 0x800)),
+            *(_subrecord(b'MAST', m.encode(u'ascii') + b'\0') +
+              _subrecord(b'DATA', b'\0' * 8) for m in masters)))
+        for block in blocks:
+            out.write(block)
+    return _ModInfo(mod_path, masters)
+
+def _merge_scan(mod_info, top_types=(b'BOOK', b'SPEL')):
+    """Scans mod_info, as if it was loaded for the specified top types."""
+    merge_scan = MergeScan()
+    merge_scan.scan_index(RecordIndex.for_plugin(mod_info), set(top_types),
+                          set(top_types), len(mod_info.header.masters))
+    return merge_scan
+
+def _results(merge_scan):
+    return {a: getattr(merge_scan, a) for a in MergeScan.__slots__}
+
+# Tests -----------------------------------------------------------------------
+def test_merge_scan_new_records(tmpdir):
+    """Overrides are not new records, new records mark their top group unless
+    deleted or ignored, high object indices of new records are noticed even
+    in top groups that are not loaded."""
+    mod_info = _plugin(tmpdir, u'Test.esp', [u'Master.esm'],
+        _top_group(b'BOOK', _record(b'BOOK', 0x00012345),
+                   _record(b'BOOK', 0x01000800)),
+        _top_group(b'SPEL', _record(b'SPEL', 0x01000801, flags1=0x20),
+                   _record(b'SPEL', 0x01000802, flags1=0x1000)))
+    merge_scan = _merge_scan(mod_info)
+    assert _results(merge_scan) == {
+        u'error': None, u'bad_grouping': False, u'tops_skipped': set(),
+        u'has_tops': True, u'new_blocks': {b'BOOK'},
+        u'has_high_new_fids': False}
+    mod_info = _plugin(tmpdir, u'Test.esp', [u'Master.esm'],
+        _top_group(b'BOOK', _record(b'BOOK', 0x00012345)),
+        _top_group(b'GMST', _record(b'GMST', 0x01001000)))
+    merge_scan = _merge_scan(mod_info)
+    assert merge_scan.tops_skipped == {b'GMST'}
+    assert not merge_scan.new_blocks
+    assert merge_scan.has_high_new_fids
+
+def test_merge_scan_no_masters(tmpdir):
+    """Without masters, every record is new."""
+    mod_info = _plugin(tmpdir, u'Test.esp', [],
+        _top_group(b'BOOK', _record(b'BOOK', 0x00000FFF)))
+    merge_scan = _merge_scan(mod_info)
+    assert merge_scan.new_blocks == {b'BOOK'}
+    assert not merge_scan.has_high_new_fids
+
+def test_merge_scan_skipped_and_empty(tmpdir):
+    mod_info = _plugin(tmpdir, u'Test.esp', [u'Master.esm'],
+        _top_group(b'GMST', _record(b'GMST', 0x01000800)),
+        _top_group(b'GLOB'))
+    merge_scan = _merge_scan(mod_info)
+    assert merge_scan.tops_skipped == {b'GMST', b'GLOB'}
+    assert not merge_scan.has_tops
+    assert not merge_scan.new_blocks
+    assert not _merge_scan(_plugin(tmpdir, u'Empty.esp', [])).has_tops
+
+def test_merge_scan_bad_grouping(tmpdir):
+    """Records outside of top groups mean the plugin is improperly
+    grouped."""
+    mod_info = _plugin(tmpdir, u'Test.esp', [u'Master.esm'],
+        _top_group(b'BOOK', _record(b'BOOK', 0x00012345)),
+        _record(b'BOOK', 0x01000800))
+    assert _merge_scan(mod_info).bad_grouping
+
+@pytest.mark.parametrize(u'workers', [0, 2])
+def test_scan_for_merging(tmpdir, workers):
+    """scan_for_merging returns the same scans, serially or with a pool of
+    workers, and reports plugins that fail to index as errors."""
+    mod_infos = [
+        _plugin(tmpdir, u'New.esp', [u'Master.esm'],
+                _top_group(b'BOOK', _record(b'BOOK', 0x01000800))),
+        _plugin(tmpdir, u'Override.esp', [u'Master.esm'],
+                _top_group(b'SPEL', _record(b'SPEL', 0x00000800)),
+                _top_group(b'GMST', _record(b'GMST', 0x01001000))),
+        _plugin(tmpdir, u'Stray.esp', [], _record(b'BOOK', 0x800)),
+        _plugin(tmpdir, u'Truncated.esp', [],
+                _top_group(b'BOOK', _record(b'BOOK', 0x800))[:-4]),
+    ]
+    load_factory = LoadFactory(False, b'BOOK', b'SPEL')
+    merge_scans = ModHeaderReader.scan_for_merging(mod_infos, load_factory,
+                                                   workers)
+    assert sorted(merge_scans) == [m.name for m in mod_infos]
+    for mod_info in mod_infos[:3]:
+        RecordIndex._cache.clear()
+        assert _results(merge_scans[mod_info.name]) == _results(
+            _merge_scan(mod_info))
+    assert merge_scans[GPath(u'New.esp')].new_blocks == {b'BOOK'}
+    assert merge_scans[GPath(u'Override.esp')].tops_skipped == {b'GMST'}
+    assert merge_scans[GPath(u'Stray.esp')].bad_grouping
+    assert merge_scans[GPath(u'Truncated.esp')].error
+
+def test_record_index(tmpdir):
+    """The index has the headers, offsets and enclosing GRUPs of all records
+    and GRUPs, and the EDIDs of the records - wherever the EDID is, even in
+    compressed records."""
+    edid = lambda eid: _subrecord(b'EDID', eid + b'\0')
+    full = _subrecord(b'FULL', b'Book\0')
+    mod_info = _plugin(tmpdir, u'Test.esp', [],
+        _top_group(b'BOOK', _record(b'BOOK', 0x800, 0, edid(b'First'), full),
+                   _record(b'BOOK', 0x801, 0x20),
+                   _record(b'BOOK', 0x802, 0, full, edid(b'Second')),
+                   _record(b'BOOK', 0x803, 0x00040000, edid(b'Packed'),
+                           full),
+                   _record(b'BOOK', 0x804, 0x00040000, full,
+                           edid(b'Packed Second')),
+                   _record(b'BOOK', 0x805, 0, _subrecord(b'DESC', b'x' *
+                           0x10000), edid(b'After XXXX')),
+                   _record(b'BOOK', 0x806, 0, full)),
+        _top_group(b'SPEL'))
+    rec_index = RecordIndex.for_plugin(mod_info)
+    assert len(rec_index) == 10
+    assert [rec_index.get_sig(r) for r in xrange(10)] == [b'TES4', b'GRUP'] \
+        + [b'BOOK'] * 7 + [b'GRUP']
+    assert [rec_index.get_parent(r) for r in xrange(10)] == [-1, -1] + \
+        [1] * 7 + [-1]
+    assert list(rec_index.iter_record_rows()) == [0] + range(2, 9)
+    assert [rec_index.get_grup_label(r) for r in (1, 9)] == [b'BOOK',
+                                                              b'SPEL']
+    assert [rec_index.get_fid(r) for r in xrange(2, 9)] == range(0x800, 0x807)
+    assert rec_index.get_flags1(3) == 0x20
+    assert [rec_index.get_eid(r) for r in xrange(2, 9)] == [
+        u'First', u'', u'Second', u'Packed', u'Packed Second', u'After XXXX',
+        u'']
+    with open(mod_info.abs_path.s, u'rb') as ins:
+        plugin_data = ins.read()
+    for row in xrange(len(rec_index)):
+        header = rec_index.get_header(row)
+        offset = rec_index.get_offset(row)
+        assert plugin_data[offset:offset + RecordHeader.rec_header_size] == \
+               header.pack_head()
+
+def test_record_index_persistence(tmpdir, monkeypatch):
+    """Indices are loaded from disk while the plugin's size, modification
+    time and CRC match, else (or if the stored index is unreadable) they are
+    rebuilt and saved again."""
+    mod_info = _plugin(tmpdir, u'Test.esp', [],
+        _top_group(b'BOOK', _record(b'BOOK', 0x800, 0,
+                                    _subrecord(b'EDID', b'Book\0'))))
+    built = []
+    build = RecordIndex._build
+    def _count_builds(self, mod_name, mod_path):
+        built.append(mod_name)
+        return build(self, mod_name, mod_path)
+    monkeypatch.setattr(RecordIndex, u'_build', _count_builds)
+    rec_index = RecordIndex.for_plugin(mod_info)
+    index_path = RecordIndex.index_path(mod_info)
+    assert index_path.exists()
+    assert RecordIndex.for_plugin(mod_info) is rec_index # in memory
+    RecordIndex._cache.clear()
+    loaded = RecordIndex.for_plugin(mod_info)
+    assert loaded is not rec_index
+    assert [loaded.get_eid(r) for r in xrange(len(loaded))] == [u'', u'',
+                                                                 u'Book']
+    assert built == [mod_info.name]
+    # A changed plugin - with the same size and modification time
+    mod_info = _plugin(tmpdir, u'Test.esp', [],
+        _top_group(b'BOOK', _record(b'BOOK', 0x800, 0,
+                                    _subrecord(b'EDID', b'Tome\0'))))
+    os.utime(mod_info.abs_path.s, (loaded._index_key[2],) * 2)
+    mod_info = _ModInfo(mod_info.abs_path.s, [])
+    assert RecordIndex.index_key(mod_info)[:3] == loaded._index_key[:3]
+    assert RecordIndex.for_plugin(mod_info).get_eid(2) == u'Tome'
+    assert len(built) == 2
+    RecordIndex._cache.clear()
+    assert RecordIndex.for_plugin(mod_info).get_eid(2) == u'Tome'
+    assert len(built) == 2
+    RecordIndex._cache.clear()
+    with open(index_path.s, u'r+b') as out:
+        out.truncate(20)
+    assert RecordIndex.for_plugin(mod_info).get_eid(2) == u'Tome'
+    assert len(built) == 3
+    RecordIndex._cache.clear()
+    RecordIndex.for_plugin(mod_info)
+    assert len(built) == 3
+
+def _book_plugins(tmpdir, *mod_names):
+    """Writes plugins with a book and a spell each, returning a dict mapping
+    their names to their _ModInfos."""
+    mod_infos = {}
+    for i, mod_name in enumerate(mod_names):
+        edid = _subrecord(b'EDID', mod_name.encode(u'ascii') + b'\0')
+        mod_info = mod_infos[GPath(mod_name)] = _plugin(tmpdir, mod_name,
+            [u'Master.esm'], _top_group(b'BOOK', _record(
+                b'BOOK', 0x00000800 + i, 0, edid,
+                _subrecord(b'FULL', b'Book %u\0' % i))),
+            _top_group(b'SPEL', _record(b'SPEL', 0x01000800, 0, edid)))
+        mod_info.name = GPath(mod_name)
+    return mod_infos
+
+def _rec_classes():
+    return [MreRecord.type_class[b'BOOK'], MreRecord.type_class[b'SPEL']]
+
+def _loaded(mod_file):
+    """Returns what mod_file holds - its record types and records, with their
+    fids and some of their attributes."""
+    return {top_sig: [(r.fid, r.eid, getattr(r, u'full', None)) for r in
+                      top.getActiveRecords()]
+            for top_sig, top in mod_file.tops.iteritems()}
+
+def test_worker_state(monkeypatch):
+    """Freshly spawned workers are set up with the directories and ini
+    settings of the main process."""
+    worker_state = pickle.loads(pickle.dumps(mod_files._worker_state(), -1))
+    bash_dirs, ini_settings = dict(bass.dirs), dict(bass.inisettings)
+    monkeypatch.setattr(mod_files, u'dirs', {})
+    monkeypatch.setattr(bass, u'inisettings', {})
+    mod_files._init_plugin_worker(worker_state)
+    assert mod_files.dirs == bash_dirs
+    assert bass.inisettings == ini_settings
+
+@pytest.mark.parametrize(u'serial', [False, True])
+def test_plugin_prefetcher(tmpdir, monkeypatch, serial):
+    """The prefetcher returns plugins as loaded in the main process, in
+    order, or nothing if it could not start its workers."""
+    if serial:
+        def _no_pool(*args, **kwargs): raise OSError
+        monkeypatch.setattr(multiprocessing, u'Pool', _no_pool)
+    mod_infos = _book_plugins(tmpdir, u'A.esp', u'B.esp', u'C.esp',
+                              u'D.esp')
+    mod_names = sorted(mod_infos)
+    prefetcher = PluginPrefetcher(mod_infos, mod_names, _rec_classes, 1)
+    try:
+        prefetched = [prefetcher.get_plugin(m) for m in mod_names[:2]]
+        # Plugins requested out of order are dropped
+        prefetched.append(prefetcher.get_plugin(mod_names[3]))
+        assert prefetcher.get_plugin(mod_names[2]) is None
+    finally:
+        prefetcher.close()
+    if serial:
+        assert prefetched == [None] * 3
+        return
+    for mod_name, mod_file in zip(mod_names[:2] + mod_names[3:], prefetched):
+        assert mod_file.fileInfo is mod_infos[mod_name]
+        assert mod_file.longFids
+        loaded = ModFile(mod_infos[mod_name], LoadFactory(False,
+                                                          *_rec_classes()))
+        loaded.load(True)
+        loaded.convertToLongFids()
+        assert _loaded(mod_file) == _loaded(loaded)
+        assert sorted(mod_file.tops) == [b'BOOK', b'SPEL']
+
+def test_plugin_prefetcher_cached(tmpdir):
+    """Only the top groups the plugin cache does not hold are prefetched."""
+    mod_infos = _book_plugins(tmpdir, u'A.esp', u'B.esp')
+    mod_names = sorted(mod_infos)
+    plugin_cache = PluginCache(mod_infos, 2 ** 20)
+    # The cache loads all types requested so far, so load B.esp first
+    plugin_cache.load_plugin(mod_names[1], _rec_classes()[:1])
+    plugin_cache.load_plugin(mod_names[0], _rec_classes())
+    prefetcher = PluginPrefetcher(mod_infos, mod_names, _rec_classes, 1,
+                                  plugin_cache)
+    try:
+        assert prefetcher.get_plugin(mod_names[0]) is None
+        mod_file = prefetcher.get_plugin(mod_names[1])
+    finally:
+        prefetcher.close()
+    assert sorted(mod_file.tops) == [b'SPEL']
+    plugin_cache.add_plugin(mod_file)
+    assert not plugin_cache.missing_classes(mod_names[1], _rec_classes())
+
+def test_plugin_cache_bytes_parsed(tmpdir):
+    """Only the top groups the cache actually parses count as parsed - not
+    the ones it serves from memory or gets handed via add_plugin."""
+    mod_infos = _book_plugins(tmpdir, u'A.esp', u'B.esp')
+    mod_names = sorted(mod_infos)
+    loaded = ModFile(mod_infos[mod_names[0]], LoadFactory(False,
+                                                          *_rec_classes()))
+    loaded.load(True)
+    book_size, spel_size = loaded.BOOK.size, loaded.SPEL.size
+    plugin_cache = PluginCache(mod_infos, 2 ** 20)
+    plugin_cache.load_plugin(mod_names[0], _rec_classes()[:1])
+    assert plugin_cache.bytes_parsed == book_size
+    plugin_cache.load_plugin(mod_names[0], _rec_classes()[:1])
+    assert plugin_cache.bytes_parsed == book_size
+    plugin_cache.load_plugin(mod_names[0], _rec_classes())
+    assert plugin_cache.bytes_parsed == book_size + spel_size
+    prefetched = ModFile(mod_infos[mod_names[1]], LoadFactory(
+        False, *_rec_classes()))
+    prefetched.load(True)
+    prefetched.convertToLongFids()
+    plugin_cache.add_plugin(prefetched)
+    plugin_cache.load_plugin(mod_names[1], _rec_classes())
+    assert plugin_cache.bytes_parsed == book_size + spel_size
+
+def test_plugin_cache_eviction(tmpdir):
+    """Once the cached top groups exceed the budget, the least recently used
+    ones are dropped - but never the ones just loaded."""
+    mod_infos = _book_plugins(tmpdir, u'A.esp', u'B.esp', u'C.esp')
+    mod_names = sorted(mod_infos)
+    loaded = ModFile(mod_infos[mod_names[0]], LoadFactory(False,
+                                                          *_rec_classes()))
+    loaded.load(True)
+    plugin_size = sum(PluginCache._estimated_size(t) for t in
+                      loaded.tops.itervalues())
+    assert plugin_size > sum(t.size for t in loaded.tops.itervalues()) * 4
+    plugin_cache = PluginCache(mod_infos, plugin_size * 2)
+    for mod_name in mod_names[:2]:
+        plugin_cache.load_plugin(mod_name, _rec_classes())
+    assert plugin_cache.cached_size == plugin_size * 2
+    plugin_cache.load_plugin(mod_names[0], _rec_classes()) # most recent now
+    plugin_cache.load_plugin(mod_names[2], _rec_classes())
+    assert plugin_cache.cached_size == plugin_size * 2
+    assert not plugin_cache.missing_classes(mod_names[0], _rec_classes())
+    assert plugin_cache.missing_classes(mod_names[1], _rec_classes()) == \
+        _rec_classes()
+    # B.esp has to be parsed again, evicting A.esp this time
+    bytes_parsed = plugin_cache.bytes_parsed
+    plugin_cache.load_plugin(mod_names[1], _rec_classes())
+    assert plugin_cache.bytes_parsed == bytes_parsed * 4 // 3
+    assert plugin_cache.missing_classes(mod_names[0], _rec_classes()) == \
+        _rec_classes()
+    # Groups that don't fit the budget on their own are still returned
+    plugin_cache = PluginCache(mod_infos, 0)
+    mod_file = plugin_cache.load_plugin(mod_names[1], _rec_classes())
+    assert _loaded(mod_file) == _loaded(plugin_cache.load_plugin(
+        mod_names[1], _rec_classes()))
+    assert not plugin_cache.cached_size
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import pytest
+
+from ... import load_order
+from ...bolt import GPath, Progress
+from ...brec import MreRecord, RecHeader
+from ...mod_files import LoadFactory, ModFile
+from ...patcher.patchers.base import MultiTweakItem
+from ...patcher.patchers.multitweak_names import NamesTweaker, \
+    NamesTweak_Scrolls, NamesTweak_Spells, TextReplacer
+
+# Helper functions ------------------------------------------------------------
+@pytest.fixture(autouse=True)
+def _load_order(monkeypatch):
+    """The logs list the plugins in load order - no load order here."""
+    monkeypatch.setattr(load_order, u'get_ordered', sorted)
+
+class _FileInfo(object):
+    def __init__(self, file_name):
+        self.name = GPath(file_name)
+
+def _load_factory():
+    return LoadFactory(True, *(MreRecord.type_class[s] for s in
+                               (b'BOOK', b'ENCH', b'SPEL')))
+
+class _PatchFile(ModFile):
+    """Stands in for a PatchFile - just what MultiTweaker and the names
+    tweaks use."""
+    def __init__(self):
+        ModFile.__init__(self, _FileInfo(u'Bashed Patch, 0.esp'),
+                         _load_factory())
+        self.keepIds = set()
+        self.bodyTags = u'ARGHTCCPBS'
+
+    def getKeeper(self):
+        return self.keepIds.add
+
+class _Log(object):
+    def __init__(self):
+        self.lines = []
+
+    def setHeader(self, header, *args):
+        self.lines.append(header)
+
+    def __call__(self, msg):
+        self.lines.append(msg)
+
+def _record(sig, fid, **attrs):
+    record = MreRecord.type_class[sig](RecHeader(sig, 0, 0, fid, 0))
+    for attr, value in attrs.iteritems():
+        setattr(record, attr, value)
+    return record
+
+def _effects(record, *effect_ids):
+    effects = []
+    for effect_id in effect_ids:
+        effect = record.getDefault(u'effects')
+        effect.name = effect_id
+        effects.append(effect)
+    return effects
+
+def _scroll(fid, full, enchantment=None):
+    book = _record(b'BOOK', fid, full=full, enchantment=enchantment)
+    book.flags.isScroll = True
+    return book
+
+def _enchantment(fid, *effect_ids):
+    ench = _record(b'ENCH', fid, itemType=0, full=None)
+    ench.effects = _effects(ench, *effect_ids)
+    return ench
+
+def _spell(fid, full, spell_type, *effect_ids):
+    spell = _record(b'SPEL', fid, full=full, spellType=spell_type, level=0)
+    spell.effects = _effects(spell, *effect_ids)
+    return spell
+
+def _mod(file_name, masters, records):
+    mod_file = ModFile(_FileInfo(file_name), _load_factory())
+    mod_file.tes4.masters = [GPath(m) for m in masters]
+    for record in records:
+        getattr(mod_file, record.recType).setRecord(record)
+    return mod_file
+
+def _mods():
+    """A plugin and one overriding some of its records - with names for the
+    text replacers, scrolls and spells."""
+    return [
+        _mod(u'Base.esp', [], [
+            _enchantment(0x800, b'FIDG'), _enchantment(0x801, b'REHE'),
+            _scroll(0x810, u'Dwarven Fire', enchantment=0x800),
+            _scroll(0x811, u'Note about Staffs'),
+            _scroll(0x812, u'Healing Scroll', enchantment=0x801),
+            _record(b'BOOK', 0x813, full=u'Dwarven History'),
+            _spell(0x820, u'Dwarven Fire', 0, b'FIDG'),
+            _spell(0x821, u'Curse of the Dwarfs', 1, b'REHE'),
+            _spell(0x822, u'Mend Staffs', 0, b'REHE', b'FIDG'),
+        ]),
+        _mod(u'Override.esp', [u'Base.esp'], [
+            _scroll(0x810, u'Dwarven Fire Mk2', enchantment=0x800),
+            _enchantment(0x801, b'FIDG'),
+            _spell(0x01000830, u'Staffs of the Dwarfs', 0, b'FIDG'),
+        ]),
+    ]
+
+def _names_tweaks(*tweak_types):
+    """Returns the names tweaks of the specified types, enabled and
+    configured, in the order of the Names Tweaker."""
+    tweaks = []
+    for tweak in NamesTweaker.tweak_instances():
+        if type(tweak) not in tweak_types: continue
+        tweak.isEnabled = True
+        if isinstance(tweak, NamesTweak_Scrolls):
+            tweak.chosen = 2 # ~D. Fire Ball
+        elif isinstance(tweak, NamesTweak_Spells):
+            tweak.chosen = 3 # D. Fire Ball
+        tweak.save_tweak_config({})
+        tweaks.append(tweak)
+    return tweaks
+
+def _patch(tweaks, pooled):
+    """Builds a patch out of _mods with the specified tweaks - all of them
+    at once or, if pooled is False, each in its own pass, as before they
+    were pooled. Returns the patch records (with their short fids and
+    data), the kept fids and the log."""
+    patch_file = _PatchFile()
+    tweakers = [NamesTweaker(u'Tweak Names', patch_file, tweaks)] if \
+        pooled else [NamesTweaker(u'Tweak Names', patch_file, [t])
+                     for t in tweaks]
+    for mod_file in _mods():
+        for tweaker in tweakers:
+            tweaker.scanModFile(mod_file, Progress())
+    log = _Log()
+    for tweaker in tweakers:
+        tweaker._tweak_pooled(tweaker.enabled_tweaks, log) if not pooled \
+            else tweaker.buildPatch(log, Progress())
+    patch_file.tes4.masters = [GPath(u'Base.esp'), GPath(u'Override.esp')]
+    short_mapper = patch_file.getShortMapper()
+    patch_records = {}
+    for rec_sig, top in patch_file.tops.iteritems():
+        patch_records[rec_sig] = []
+        for record in top.records:
+            record = record.getTypeCopy()
+            record.convertFids(short_mapper, False)
+            record.setChanged()
+            record.getSize()
+            patch_records[rec_sig].append((record.fid, record.full,
+                                           record.data))
+    return patch_records, patch_file.keepIds, log.lines[pooled:]
+
+class _EnchantmentSwapper(MultiTweakItem):
+    """Makes all enchantments restore health. Like the text replacers, it
+    walks books before enchantments - so if it were pooled with the scrolls
+    tweak after it, the latter would label the books before their
+    enchantments are swapped."""
+    tweak_read_classes = b'BOOK', b'ENCH',
+    tweak_name = u'Swap Enchantments'
+
+    def __init__(self):
+        super(_EnchantmentSwapper, self).__init__(u'swap')
+        self.logMsg = u'* Swapped: %d'
+
+    def wants_record(self, record):
+        return record.recType == b'ENCH'
+
+    def tweak_record(self, record):
+        if record.recType != b'ENCH' or record.effects[0].name == b'REHE':
+            return False
+        record.effects[0].name = b'REHE'
+        return True
+
+# Tests -----------------------------------------------------------------------
+def test_pooled_matches_per_tweak_passes():
+    """Pooling the tweaks copies the same records to the patch, makes the
+    same edits and logs the same counts for each tweak as giving each tweak
+    its own scan and build pass."""
+    tweaks = _names_tweaks(NamesTweak_Scrolls, NamesTweak_Spells,
+                           TextReplacer)
+    assert len(tweaks) == 5
+    per_tweak = _patch(tweaks, pooled=False)
+    assert _patch(tweaks, pooled=True) == per_tweak
+    patch_records, kept, log_lines = per_tweak
+    fulls = {full for sig_records in patch_records.itervalues()
+             for _fid, full, _data in sig_records}
+    assert u'~D. Dwemer Fire' in fulls
+    assert u'R. Mend Staves' in fulls
+    assert u'Curse of the Dwarves' in fulls
+    assert kept and u'* Spells: 3' in log_lines
+
+@pytest.mark.parametrize(u'swapper_first', [True, False])
+def test_pooled_reads(swapper_first):
+    """A tweak reading records of types another tweak edits sees the edits
+    of the tweaks enabled before it, and only those, like it did in its own
+    pass."""
+    scrolls = _names_tweaks(NamesTweak_Scrolls)
+    swapper = _EnchantmentSwapper()
+    tweaks = [swapper] + scrolls if swapper_first else scrolls + [swapper]
+    per_tweak = _patch(tweaks, pooled=False)
+    assert _patch(tweaks, pooled=True) == per_tweak
+    books = {fid: full for fid, full, _data in per_tweak[0][b'BOOK']}
+    assert books[0x810] == (u'~R. Dwarven Fire' if swapper_first else
+                            u'~D. Dwarven Fire')
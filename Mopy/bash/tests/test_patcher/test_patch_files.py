@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+import os
+
+import pytest
+
+from ... import bass, bosh, load_order
+from ...bolt import GPath, Progress
+from ...brec import MreRecord
+from ...mod_files import LoadFactory, ModFile
+from ...patcher import patch_files
+from ...patcher.patch_files import PatchManifest, ProfiledPatchFile
+from .. import test_mod_files
+from ..test_mod_files import _record, _subrecord, _top_group
+
+# Helper functions ------------------------------------------------------------
+class _ModInfo(test_mod_files._ModInfo):
+    """The parts of a ModInfo that PatchManifest uses."""
+    def __init__(self, mod_path, masters, tags=(), localized=False):
+        super(_ModInfo, self).__init__(mod_path, masters)
+        self.header.version = 1.0
+        self.header.flags1.hasStrings = localized
+        self.dir = GPath(os.path.dirname(mod_path))
+        self._tags = set(tags)
+
+    def getBashTags(self): return self._tags
+    def get_masters(self): return self.header.masters
+
+    def _string_files_paths(self, lang):
+        return [os.path.join(u'Strings', u'%s_%s%s' % (
+            self.name.sbody, lang, ext)) for ext in (
+            u'.STRINGS', u'.DLSTRINGS', u'.ILSTRINGS')]
+
+    def _extra_bsas(self): return []
+
+class _Patcher(object):
+    def __init__(self, *srcs):
+        self.isActive = True
+        self.srcs = [GPath(s) for s in srcs]
+
+class _PatchFile(object):
+    """The parts of a PatchFile that PatchManifest uses."""
+    def __init__(self, patch_info, mod_infos, merged):
+        self.fileInfo = patch_info
+        self.p_file_minfos = mod_infos
+        self.allMods = self.loadMods = sorted(mod_infos)
+        self.mergeSet = {GPath(m) for m in merged}
+        self.readFactory = LoadFactory(False, b'BOOK')
+
+class _IniFile(object):
+    def get_ini_language(self): return u'English'
+
+class _Setup(object):
+    """Plugins, a patch built from them, and what PatchManifest needs to
+    know about them."""
+    def __init__(self, tmpdir):
+        self.tmpdir = tmpdir
+        self.mod_infos = {}
+        for mod_name in (u'Merged.esp', u'Scanned.esp', u'Source.esp',
+                         u'Localized.esp'):
+            self.write_plugin(mod_name)
+        self.strings_dir = tmpdir.join(u'Strings')
+        self.strings_dir.ensure(dir=True)
+        for ext in (u'.STRINGS', u'.DLSTRINGS', u'.ILSTRINGS'):
+            self.strings_dir.join(u'Localized_English' + ext).write(b'0')
+        self.patches_dir = tmpdir.join(u'Patches')
+        self.patches_dir.join(u'Names.csv').write(u'"Name"', ensure=True)
+        self.patch_file = _PatchFile(self.write_plugin(u'Bashed Patch, 0.esp',
+            store=False), self.mod_infos, [u'Merged.esp'])
+        self.patchers = [_Patcher(u'Source.esp', u'Names.csv')]
+        self.configs = {u'Import Names': {u'isEnabled': True}}
+
+    def write_plugin(self, mod_name, book_name=b'Book', gmst_value=1,
+                     store=True, **kwargs):
+        """(Re)writes the specified plugin with a BOOK and a GMST top group,
+        with records holding book_name and gmst_value."""
+        mod_path = self.tmpdir.join(mod_name).strpath
+        test_mod_files._plugin(self.tmpdir, mod_name, [],
+            _top_group(b'BOOK', _record(b'BOOK', 0x800, 0,
+                _subrecord(b'FULL', book_name + b'\0'))),
+            _top_group(b'GMST', _record(b'GMST', 0x801, 0,
+                _subrecord(b'DATA', b'%c' % gmst_value))))
+        if mod_name == u'Localized.esp': kwargs[u'localized'] = True
+        mod_info = _ModInfo(mod_path, [], **kwargs)
+        if store: self.mod_infos[mod_info.name] = mod_info
+        return mod_info
+
+    def manifest(self):
+        return PatchManifest(self.patch_file, self.patchers, self.configs)
+
+@pytest.fixture
+def setup(tmpdir, monkeypatch):
+    monkeypatch.setitem(bass.dirs, u'modsBash',
+                        GPath(tmpdir.join(u'Bash Mod Data').strpath))
+    monkeypatch.setattr(bosh, u'oblivionIni', _IniFile(), raising=False)
+    setup = _Setup(tmpdir)
+    monkeypatch.setattr(patch_files, u'getPatchesPath',
+                        lambda n: GPath(setup.patches_dir.strpath).join(n))
+    return setup
+
+def _set_load_order(setup, mod_names):
+    setup.patch_file.allMods = setup.patch_file.loadMods = [
+        GPath(m) for m in mod_names]
+
+def _add_plugin(setup):
+    setup.write_plugin(u'New.esp')
+    _set_load_order(setup, sorted(setup.mod_infos))
+
+def _touch_strings(setup):
+    setup.strings_dir.join(u'Localized_English.DLSTRINGS').write(b'01')
+
+# Tests -----------------------------------------------------------------------
+def test_manifest_up_to_date(setup):
+    """A patch is only up to date once its manifest has been saved, and then
+    stays so while nothing changes - or only top groups of scanned plugins
+    that the patch did not read."""
+    manifest = setup.manifest()
+    assert not manifest.is_up_to_date()
+    manifest.save(u'The log')
+    manifest = setup.manifest()
+    assert manifest.is_up_to_date()
+    assert u'The log' in manifest.stored_log
+    setup.write_plugin(u'Scanned.esp', gmst_value=2)
+    manifest = setup.manifest()
+    assert manifest.is_up_to_date()
+    manifest.save_reused()
+    assert setup.manifest().is_up_to_date()
+
+@pytest.mark.parametrize(u'change', [
+    # plugin CRCs
+    lambda s: s.write_plugin(u'Merged.esp', gmst_value=2),
+    lambda s: s.write_plugin(u'Source.esp', gmst_value=2),
+    lambda s: s.write_plugin(u'Scanned.esp', book_name=b'Tome'),
+    # what the patch depends on besides the records of a plugin
+    lambda s: s.write_plugin(u'Scanned.esp', tags=[u'Names']),
+    # load order, plugins added to or removed from it
+    lambda s: _set_load_order(s, s.patch_file.loadMods[::-1]),
+    lambda s: _set_load_order(s, s.patch_file.loadMods[1:]),
+    _add_plugin,
+    # patcher configs and their text sources
+    lambda s: s.configs[u'Import Names'].update(isEnabled=False),
+    lambda s: s.patches_dir.join(u'Names.csv').write(u'"Name","Other"'),
+    # STRINGS files
+    _touch_strings,
+    # the patch itself
+    lambda s: s.write_plugin(u'Bashed Patch, 0.esp', gmst_value=2,
+                             store=False),
+], ids=[u'merged', u'source', u'scanned-read-top', u'tags', u'load-order',
+        u'removed', u'added', u'config', u'text-source', u'strings',
+        u'patch'])
+def test_manifest_rebuild(setup, change):
+    """Each of the inputs of the patch forces a rebuild."""
+    setup.manifest().save(u'The log')
+    change(setup)
+    assert not setup.manifest().is_up_to_date()
+
+class _ModInfos(dict):
+    """The parts of ModInfos that a PatchFile scanning plugins uses."""
+    masterName = GPath(u'Oblivion.esm')
+
+def test_profiled_bytes_parsed(setup, monkeypatch):
+    """Only the bytes of the top groups a build parsed count - not the ones
+    served from the plugin cache, e.g. because a patcher read them first."""
+    mod_infos = _ModInfos(setup.mod_infos)
+    monkeypatch.setattr(bosh, u'modInfos', mod_infos, raising=False)
+    patch_name = setup.patch_file.fileInfo.name
+    lord = sorted(mod_infos) + [patch_name]
+    monkeypatch.setattr(load_order, u'cached_lord',
+                        load_order.LoadOrder(lord, lord))
+    monkeypatch.setitem(bass.inisettings, u'PatchPluginCacheSize', 1)
+    monkeypatch.setitem(bass.inisettings, u'PatchLoadWorkers', 0)
+    patch_file = ProfiledPatchFile(setup.patch_file.fileInfo)
+    patch_file.set_mergeable_mods([GPath(u'Merged.esp')])
+    book_class, gmst_class = (MreRecord.type_class[b'BOOK'],
+                              MreRecord.type_class[b'GMST'])
+    patch_file.readFactory = LoadFactory(False, book_class)
+    patch_file.loadFactory = LoadFactory(True, book_class)
+    patch_file.mergeFactory = LoadFactory(False, book_class, gmst_class)
+    patch_file.init_patchers_data([], Progress())
+    # Like a patcher that reads the books of Source.esp in initData
+    patch_file.plugin_cache.load_plugin(GPath(u'Source.esp'), [book_class])
+    patch_file.run_phase(patch_file.scanLoadMods, Progress())
+    def _top_size(mod_name, top_sig):
+        loaded = ModFile(mod_infos[GPath(mod_name)],
+                         LoadFactory(False, top_sig))
+        loaded.load(True)
+        return loaded.tops[top_sig].size
+    book_size, gmst_size = _top_size(u'Source.esp', b'BOOK'), _top_size(
+        u'Source.esp', b'GMST')
+    report = patch_file.get_report()
+    # Once Merged.esp got merged, the GMSTs of later plugins are read too
+    assert {p[u'plugin']: p[u'bytes'] for p in report[u'plugins']} == {
+        u'Localized.esp': book_size, u'Merged.esp': book_size + gmst_size,
+        u'Scanned.esp': book_size + gmst_size, u'Source.esp': gmst_size}
+    assert report[u'bytes_parsed'] == 4 * book_size + 3 * gmst_size
@@ -0,0 +1,146 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash; if not, write to the Free Software Foundation,
+#  Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+
+"""
+This script benchmarks the record lookup and replacement methods of MobObjects
+(setRecord, updateRecords, keepRecords and getRecordByEid) on top groups of
+increasing size, up to 100k records by default. The time per operation should
+stay flat as the groups grow. Pass --linear to also time the old list.index
+based setRecord for comparison.
+"""
+
+from __future__ import absolute_import, division, print_function
+import argparse
+import os
+import sys
+import timeit
+
+SCRIPTS_PATH = os.path.dirname(os.path.abspath(__file__))
+MOPY_PATH = os.path.abspath(os.path.join(SCRIPTS_PATH, u'..', u'Mopy'))
+sys.path.append(MOPY_PATH)
+
+from bash.bolt import GPath
+from bash.brec import MobObjects, TopGrupHeader
+
+_PLUGIN = GPath(u'Bench.esp')
+
+class _Flags(object):
+    __slots__ = (u'ignored',)
+
+    def __init__(self):
+        self.ignored = False
+
+class _BenchRecord(object):
+    """Stands in for a real record - only has what MobObjects needs."""
+    __slots__ = (u'fid', u'eid', u'flags1')
+    isKeyedByEid = False
+
+    def __init__(self, fid):
+        self.fid = fid
+        self.eid = u'Bench%06X' % fid[1]
+        self.flags1 = _Flags()
+
+    def getTypeCopy(self, mapper=None):
+        return _BenchRecord(self.fid)
+
+def _make_block(num_records):
+    block = MobObjects(TopGrupHeader(0, b'NPC_', 0, 0), None)
+    for i in xrange(num_records):
+        block.setRecord(_BenchRecord((_PLUGIN, 0x800 + i)))
+    return block
+
+def _linear_set_record(block, record):
+    """setRecord as it used to be, replacing records via list.index."""
+    if record.fid in block.id_records:
+        old_record = block.id_records[record.fid]
+        block.records[block.records.index(old_record)] = record
+    else:
+        block.records.append(record)
+    block.id_records[record.fid] = record
+
+def _time_per_op(func, num_ops, repeat):
+    """Returns the best time per operation in microseconds."""
+    return min(timeit.repeat(func, number=1, repeat=repeat)) / num_ops * 1e6
+
+def _bench(num_records, num_ops, repeat, linear):
+    block = _make_block(num_records)
+    # Pick records from the whole group, so that linear scans are not cheap
+    step = max(num_records // num_ops, 1)
+    fids = [(_PLUGIN, 0x800 + i) for i in xrange(0, num_records, step)]
+    fids = fids[:num_ops]
+    new_records = [_BenchRecord(f) for f in fids]
+    eids = [r.eid for r in new_records]
+    src_block = MobObjects(TopGrupHeader(0, b'NPC_', 0, 0), None)
+    for r in new_records: src_block.setRecord(r)
+    keep_ids = set(fids)
+    results = {}
+    def set_records():
+        for r in new_records: block.setRecord(r)
+    results[u'setRecord'] = _time_per_op(set_records, len(fids), repeat)
+    def update_records():
+        block.updateRecords(src_block, lambda f: f, set())
+    results[u'updateRecords'] = _time_per_op(update_records, len(fids),
+                                             repeat)
+    def get_by_eid():
+        for e in eids: block.getRecordByEid(e)
+    block.getRecordByEid(eids[0]) # build the eid index outside the timing
+    results[u'getRecordByEid'] = _time_per_op(get_by_eid, len(eids), repeat)
+    if linear:
+        def linear_set_records():
+            for r in new_records: _linear_set_record(block, r)
+        results[u'setRecord (linear)'] = _time_per_op(linear_set_records,
+                                                      len(fids), repeat)
+    def keep_records():
+        _make_block(num_records).keepRecords(keep_ids)
+    # keepRecords is a single pass, so report it per record in the group -
+    # subtract the cost of building the group to not skew the numbers
+    build = _time_per_op(lambda: _make_block(num_records), num_records, 1)
+    results[u'keepRecords'] = max(_time_per_op(
+        keep_records, num_records, 1) - build, 0.0)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(u'-s', u'--sizes', type=int, nargs=u'+',
+                        default=[1000, 10000, 100000],
+                        help=u'Top group sizes to benchmark.')
+    parser.add_argument(u'-n', u'--ops', type=int, default=1000,
+                        help=u'Number of operations timed per size.')
+    parser.add_argument(u'-r', u'--repeat', type=int, default=3,
+                        help=u'Number of repetitions, the best one counts.')
+    parser.add_argument(u'-l', u'--linear', action=u'store_true',
+                        help=u'Also time the old linear setRecord.')
+    args = parser.parse_args()
+    rows = [(size, _bench(size, args.ops, args.repeat, args.linear))
+            for size in args.sizes]
+    names = sorted(rows[0][1])
+    print(u'%-20s' % u'usec/op' + u''.join(u'%12d' % s for s, _r in rows))
+    for name in names:
+        print(u'%-20s' % name + u''.join(u'%12.3f' % r[name]
+                                         for _s, r in rows))
+
+if __name__ == u'__main__':
+    main()